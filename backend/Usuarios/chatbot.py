@@ -1,13 +1,8 @@
-import openai
-from dotenv import load_dotenv
-import os
+from services.llm_cliente import completar
 
-load_dotenv()  # Cargar API Key desde el archivo .env
-
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-def obtener_respuesta(mensaje_usuario):
-    respuesta = openai.ChatCompletion.create(
+async def obtener_respuesta(mensaje_usuario):
+    respuesta = await completar(
+        "chatbot",
         model="gpt-3.5-turbo",
         messages=[
             {"role": "system", "content": "Eres un asistente virtual que ayuda a levantar requerimientos de software."},
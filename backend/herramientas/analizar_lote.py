@@ -0,0 +1,74 @@
+# backend/herramientas/analizar_lote.py
+"""
+Analiza un archivo de requerimientos en lote (services.lote_requerimientos).
+
+La entrada es un texto por línea, o JSONL con {"texto": ...}. Los resultados
+se escriben como NDJSON en --salida (los servicios imprimen su log en
+stdout), en el orden en que terminan; cada línea lleva el "indice" del texto.
+
+Uso (desde backend/):
+    python -m herramientas.analizar_lote requerimientos.txt --concurrencia 8
+    python -m herramientas.analizar_lote requerimientos.jsonl --salida analisis.ndjson
+    python -m herramientas.analizar_lote requerimientos.txt --falso   # contra el proveedor falso
+"""
+import sys
+import json
+import asyncio
+import argparse
+
+from services import lote_requerimientos
+from services.sse import linea_ndjson
+
+
+def _leer_textos(ruta: str):
+    textos = []
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            if linea.startswith("{"):
+                textos.append(json.loads(linea).get("texto", ""))
+            else:
+                textos.append(linea)
+    return textos
+
+
+async def main(args) -> int:
+    textos = _leer_textos(args.entrada)
+    if not textos:
+        print("❌ El archivo no tiene textos")
+        return 1
+
+    resumen = None
+    with open(args.salida, "w", encoding="utf-8") as salida:
+        async for item in lote_requerimientos.analizar_lote(textos, args.concurrencia):
+            if item["tipo"] == "resumen":
+                resumen = item
+            else:
+                salida.write(linea_ndjson(item))
+
+    print(
+        f"📊 {resumen['exitosos']}/{resumen['total']} analizados ({resumen['unicos']} únicos) "
+        f"en {resumen['duracion_ms'] / 1000:.1f}s, concurrencia final {resumen['concurrencia_final']}"
+    )
+    print(f"✅ Resultados en {args.salida}")
+    return 0 if resumen["fallidos"] == 0 else 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analiza requerimientos en lote")
+    parser.add_argument("entrada", help="Un texto por línea o JSONL con {\"texto\": ...}")
+    parser.add_argument("--salida", default="analisis_lote.ndjson")
+    parser.add_argument("--concurrencia", type=int, default=lote_requerimientos.LOTE_CONCURRENCIA)
+    parser.add_argument("--falso", action="store_true", help="Usar el proveedor falso en un puerto local")
+    parser.add_argument("--puerto", type=int, default=8089)
+    args = parser.parse_args()
+
+    if args.falso:
+        from herramientas import proveedor_falso
+        from services.llm_cliente import configurar_proveedor
+        proveedor_falso.iniciar_en_hilo({}, args.puerto)
+        configurar_proveedor("falso", base_url=f"http://127.0.0.1:{args.puerto}/v1")
+
+    sys.exit(asyncio.run(main(args)))
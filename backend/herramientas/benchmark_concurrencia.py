@@ -0,0 +1,104 @@
+# backend/herramientas/benchmark_concurrencia.py
+"""
+Benchmark de concurrencia del chat de análisis contra el proveedor falso.
+
+Lanza N llamadas simultáneas a chat_analisis_proyecto mientras un "ticker"
+mide cuánto se retrasa el event loop. Si el loop se bloquea (llamadas
+síncronas al modelo, I/O en el hilo principal) el p95 del retraso se dispara
+y el comando termina con código 1. Se usa el p95 y no el máximo porque el
+servidor falso corre en un hilo del mismo proceso y compite por el GIL.
+
+Uso (desde backend/):
+    python -m herramientas.benchmark_concurrencia --llamadas 200 --latencia lognormal:-0.7,0.4
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+from herramientas import proveedor_falso
+from herramientas.estadisticas import percentil
+from services.llm_cliente import configurar_proveedor
+from services.chat_analisis_service import chat_analisis_proyecto
+
+HISTORIAL_BASE = [
+    {"role": "user", "content": "Necesito una plataforma de reservas para una cadena de hoteles"},
+    {"role": "assistant", "content": "¿Quiénes serán los usuarios finales?"},
+    {"role": "user", "content": "Huéspedes, recepcionistas y administradores"},
+    {"role": "assistant", "content": "¿Tienes restricciones de presupuesto o plazo?"},
+    {"role": "user", "content": "Unos 10000 USD y 3 meses"},
+]
+
+
+async def _ticker(intervalo: float, retrasos: list, detener: asyncio.Event):
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        retrasos.append(time.perf_counter() - inicio - intervalo)
+
+
+async def ejecutar(llamadas: int, intervalo: float) -> dict:
+    # Calentamiento: creación del cliente, tokenizador y conexiones fuera de la medición
+    await chat_analisis_proyecto([dict(m) for m in HISTORIAL_BASE], cliente_id=1)
+
+    retrasos, latencias = [], []
+    detener = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(intervalo, retrasos, detener))
+
+    async def una(i: int):
+        historial = [dict(m) for m in HISTORIAL_BASE]
+        historial[0]["content"] += f" (#{i})"
+        inicio = time.perf_counter()
+        # Un cliente por llamada: el benchmark mide el event loop, no los límites de admisión por cliente
+        resultado = await chat_analisis_proyecto(historial, cliente_id=i + 1)
+        latencias.append(time.perf_counter() - inicio)
+        return resultado
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(una(i) for i in range(llamadas)))
+    total = time.perf_counter() - inicio
+    detener.set()
+    await ticker
+
+    return {
+        "llamadas": llamadas,
+        "exitosas": sum(1 for r in resultados if r["exito"]),
+        "finalizadas": sum(1 for r in resultados if r.get("finalizado")),
+        "duracion_total": total,
+        "latencia_p50": statistics.median(latencias),
+        "latencia_p95": percentil(latencias, 0.95),
+        "retraso_loop_max": max(retrasos) if retrasos else 0.0,
+        "retraso_loop_p95": percentil(retrasos, 0.95) if retrasos else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia contra el proveedor falso")
+    parser.add_argument("--llamadas", type=int, default=100)
+    parser.add_argument("--puerto", type=int, default=8099)
+    parser.add_argument("--intervalo-ticker", type=float, default=0.01)
+    parser.add_argument("--max-retraso-loop", type=float, default=0.05,
+                        help="p95 máximo tolerado del retraso del event loop (segundos)")
+    proveedor_falso.argumentos_configuracion(parser)
+    parser.set_defaults(latencia="uniforme:0.2,0.6")
+    args = parser.parse_args()
+
+    servidor = proveedor_falso.iniciar_en_hilo(proveedor_falso.configuracion_desde_args(args), args.puerto)
+    configurar_proveedor("falso", base_url=f"http://127.0.0.1:{args.puerto}/v1")
+
+    try:
+        resumen = asyncio.run(ejecutar(args.llamadas, args.intervalo_ticker))
+    finally:
+        servidor.should_exit = True
+
+    print(f"📊 {resumen['exitosas']}/{resumen['llamadas']} exitosas ({resumen['finalizadas']} finalizadas) "
+          f"en {resumen['duracion_total']:.2f}s")
+    print(f"⏱️ Latencia p50={resumen['latencia_p50']:.3f}s p95={resumen['latencia_p95']:.3f}s")
+    print(f"🔁 Retraso del event loop: p95={resumen['retraso_loop_p95'] * 1000:.1f}ms "
+          f"máx={resumen['retraso_loop_max'] * 1000:.1f}ms")
+
+    if resumen["retraso_loop_p95"] > args.max_retraso_loop:
+        print("❌ El event loop se bloqueó durante las llamadas al modelo")
+        sys.exit(1)
+    print("✅ El event loop no se bloqueó")
@@ -0,0 +1,106 @@
+# backend/herramientas/benchmark_palabras_clave.py
+"""
+Compara la detección de especialidad por palabras clave de
+AnalizadorRequerimientos: la implementación anterior (una búsqueda de
+subcadena por cada palabra clave, ~170 por mensaje) contra el autómata de
+services.palabras_clave (una pasada por mensaje).
+
+Genera N mensajes sintéticos (frases clave con y sin tildes, mayúsculas y
+relleno), mide mensajes por segundo de cada implementación y de la API en
+lote (detectar_especialidades, que además pasa por el clasificador local) y
+cuenta en cuántos mensajes difieren, con algunos ejemplos. Las diferencias
+esperadas vienen de los límites de palabra ("app" dentro de "happy") y de
+las tildes ("aplicacion movil").
+
+Uso (desde backend/):
+    python -m herramientas.benchmark_palabras_clave --mensajes 20000
+    python -m herramientas.benchmark_palabras_clave --mensajes 5000 --ejemplos 10
+"""
+import time
+import random
+import argparse
+
+from modelos.requerimiento_model import EspecialidadEnum
+from services.analisis_requerimiento import AnalizadorRequerimientos
+
+RELLENO = [
+    "Hola, buenas tardes", "necesitamos", "para nuestra empresa", "lo antes posible",
+    "tenemos un presupuesto limitado", "somos una pyme de Quito", "happy hour",
+    "bien", "gracias de antemano", "con urgencia", "en los próximos meses",
+    "para el área de ventas", "muchas sucursales", "nuestros clientes",
+]
+
+
+def _quitar_tildes(texto: str) -> str:
+    return texto.translate(str.maketrans("áéíóúñÁÉÍÓÚÑ", "aeiounAEIOUN"))
+
+
+def generar_mensajes(cantidad: int, semilla: int = 7):
+    rng = random.Random(semilla)
+    frases = [f for lista in AnalizadorRequerimientos.PALABRAS_CLAVE.values() for f in lista]
+    frases += AnalizadorRequerimientos.PALABRAS_GENERICAS
+    mensajes = []
+    for _ in range(cantidad):
+        partes = rng.sample(RELLENO, rng.randint(2, 5)) + rng.sample(frases, rng.randint(0, 3))
+        rng.shuffle(partes)
+        mensaje = " ".join(partes)
+        if rng.random() < 0.3:
+            mensaje = _quitar_tildes(mensaje)
+        if rng.random() < 0.2:
+            mensaje = mensaje.upper()
+        mensajes.append(mensaje)
+    return mensajes
+
+
+def especialidad_anterior(mensaje: str) -> EspecialidadEnum:
+    """La búsqueda por subcadenas que usaba _detectar_especialidad (sin el clasificador)."""
+    mensaje = mensaje.lower()
+    coincidencias = {}
+    for especialidad, palabras in AnalizadorRequerimientos.PALABRAS_CLAVE.items():
+        count = 0
+        for palabra in palabras:
+            if palabra in mensaje:
+                count += 1
+        if count > 0:
+            coincidencias[especialidad] = count
+    if coincidencias:
+        return max(coincidencias, key=coincidencias.get)
+    if any(word in mensaje for word in AnalizadorRequerimientos.PALABRAS_GENERICAS):
+        return EspecialidadEnum.DESARROLLO_MEDIDA
+    return EspecialidadEnum.OTRO
+
+
+def _medir(nombre: str, funcion, mensajes) -> tuple:
+    inicio = time.perf_counter()
+    resultado = funcion(mensajes)
+    duracion = time.perf_counter() - inicio
+    print(f"{nombre:<32} {duracion:>8.3f}s {len(mensajes) / duracion:>12,.0f} msg/s {duracion / len(mensajes) * 1e6:>8.1f} µs/msg")
+    return resultado, duracion
+
+
+def main(args) -> int:
+    mensajes = generar_mensajes(args.mensajes, args.semilla)
+    print(f"📊 {len(mensajes)} mensajes, {len(AnalizadorRequerimientos._AUTOMATA)} palabras clave\n")
+
+    anteriores, t_anterior = _medir(
+        "Subcadenas (anterior)", lambda ms: [especialidad_anterior(m) for m in ms], mensajes
+    )
+    nuevas, t_automata = _medir(
+        "Autómata", lambda ms: [AnalizadorRequerimientos._especialidad_por_palabras(m) for m in ms], mensajes
+    )
+    _medir("Lote (clasificador + autómata)", AnalizadorRequerimientos.detectar_especialidades, mensajes)
+    print(f"\n⚡ Autómata {t_anterior / t_automata:.1f}x más rápido que las subcadenas")
+
+    diferencias = [(m, a, n) for m, a, n in zip(mensajes, anteriores, nuevas) if a != n]
+    print(f"🔀 Difieren en {len(diferencias)} de {len(mensajes)} mensajes ({len(diferencias) / len(mensajes):.1%})")
+    for mensaje, anterior, nueva in diferencias[:args.ejemplos]:
+        print(f"   {anterior.name} -> {nueva.name}: {mensaje[:90]}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la detección de especialidad por palabras clave")
+    parser.add_argument("--mensajes", type=int, default=20000)
+    parser.add_argument("--semilla", type=int, default=7)
+    parser.add_argument("--ejemplos", type=int, default=5, help="Diferencias de ejemplo a mostrar")
+    raise SystemExit(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+# backend/herramientas/benchmark_ruteo.py
+"""
+Compara políticas de ruteo de modelos (services.enrutador_modelos) contra
+el proveedor falso.
+
+Simula N conversaciones completas del chat de análisis con cada política y
+reporta, por tipo de turno, la latencia media y p95, además del costo
+estimado y las veces que un turno corto tuvo que escalarse. El proveedor
+falso escala la latencia por modelo (--factor-modelos) y cobra tiempo por
+token de salida (--segundos-por-token), así que la diferencia entre un
+modelo rápido con tope corto y el de análisis se ve en los números.
+
+Uso (desde backend/):
+    python -m herramientas.benchmark_ruteo --conversaciones 20 --modelo-rapido gpt-4.1-nano
+    python -m herramientas.benchmark_ruteo --politicas fija,latencia --segundos-por-token 0.002
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from collections import defaultdict
+
+from herramientas import proveedor_falso
+from herramientas.estadisticas import percentil
+from services import enrutador_modelos, metricas
+from services.llm_cliente import configurar_proveedor
+from services.chat_analisis_service import chat_analisis_proyecto
+
+RESPUESTAS_CLIENTE = [
+    "Necesito una plataforma para gestionar las reservas de mis tres restaurantes",
+    "La usarán los clientes desde el celular y el personal desde una tablet",
+    "Debe integrarse con nuestro sistema de facturación y aceptar pagos con tarjeta",
+    "Tenemos unos 8000 USD y queremos lanzarla en tres meses",
+    "Sí, eso es todo, puedes generar el análisis",
+]
+
+
+def _costo_total() -> float:
+    return sum(
+        c["valor"] for c in metricas.snapshot()["contadores"]
+        if c["nombre"] == "llm_costo_usd_total" and c["etiquetas"].get("endpoint") == "chat_analisis"
+    )
+
+
+def _cortes() -> float:
+    return sum(c["valor"] for c in metricas.snapshot()["contadores"] if c["nombre"] == "llm_ruteo_cortes_total")
+
+
+async def conversacion(i: int, latencias: dict) -> bool:
+    historial = []
+    for respuesta in RESPUESTAS_CLIENTE:
+        historial.append({"role": "user", "content": f"{respuesta} (#{i})"})
+        tipo = enrutador_modelos.tipo_turno(historial)
+        inicio = time.perf_counter()
+        resultado = await chat_analisis_proyecto(historial, cliente_id=None)
+        latencias[tipo].append(time.perf_counter() - inicio)
+        if not resultado["exito"]:
+            return False
+        if resultado["finalizado"]:
+            return True
+        historial.append({"role": "assistant", "content": resultado["respuesta"]})
+    return False
+
+
+async def ejecutar(politica: str, conversaciones: int) -> dict:
+    enrutador_modelos.configurar_politica(politica)
+    costo_inicial, cortes_iniciales = _costo_total(), _cortes()
+    latencias = defaultdict(list)
+
+    inicio = time.perf_counter()
+    finalizadas = await asyncio.gather(*(conversacion(i, latencias) for i in range(conversaciones)))
+    return {
+        "politica": politica,
+        "duracion": time.perf_counter() - inicio,
+        "finalizadas": sum(finalizadas),
+        "costo_usd": _costo_total() - costo_inicial,
+        "escalados": int(_cortes() - cortes_iniciales),
+        "por_tipo": {
+            tipo: {"turnos": len(v), "media": statistics.mean(v), "p95": percentil(v, 0.95)}
+            for tipo, v in sorted(latencias.items())
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de políticas de ruteo de modelos")
+    parser.add_argument("--conversaciones", type=int, default=20)
+    parser.add_argument("--politicas", default="fija,por_turno,latencia")
+    parser.add_argument("--modelo-rapido", default="gpt-4.1-nano")
+    parser.add_argument("--modelo-analisis", default=enrutador_modelos.LLM_MODELO_ANALISIS)
+    parser.add_argument("--puerto", type=int, default=8099)
+    proveedor_falso.argumentos_configuracion(parser)
+    parser.set_defaults(latencia="uniforme:0.2,0.4", segundos_por_token=0.001, turnos_finalizar=5)
+    args = parser.parse_args()
+
+    enrutador_modelos.LLM_MODELO_RAPIDO = args.modelo_rapido
+    enrutador_modelos.LLM_MODELO_ANALISIS = args.modelo_analisis
+
+    servidor = proveedor_falso.iniciar_en_hilo(proveedor_falso.configuracion_desde_args(args), args.puerto)
+    configurar_proveedor("falso", base_url=f"http://127.0.0.1:{args.puerto}/v1")
+
+    async def todas():
+        # Un solo event loop: el cliente HTTP del modelo se reutiliza entre políticas
+        return [await ejecutar(p.strip(), args.conversaciones) for p in args.politicas.split(",")]
+
+    try:
+        resultados = asyncio.run(todas())
+    finally:
+        servidor.should_exit = True
+
+    print(f"\n📊 {args.conversaciones} conversaciones por política "
+          f"(rápido={args.modelo_rapido}, análisis={args.modelo_analisis})")
+    for r in resultados:
+        print(f"\n🧭 {r['politica']}: {r['finalizadas']}/{args.conversaciones} finalizadas en {r['duracion']:.2f}s, "
+              f"costo ${r['costo_usd']:.5f}, {r['escalados']} turnos escalados")
+        for tipo, m in r["por_tipo"].items():
+            print(f"   {tipo:<13} {m['turnos']:>4} turnos  media={m['media']:.3f}s  p95={m['p95']:.3f}s")
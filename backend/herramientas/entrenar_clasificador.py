@@ -0,0 +1,96 @@
+# backend/herramientas/entrenar_clasificador.py
+"""
+Entrena el clasificador local de especialidades con los análisis guardados.
+
+Toma los pares (sub-tarea -> especialidad) de AnalisisIA.analisis_completo
+(o de un archivo JSONL {"texto": ..., "especialidad": ...}), mide exactitud
+y cobertura sobre una partición de validación, vuelve a entrenar con todos
+los datos y guarda el modelo en CLASIFICADOR_ESPECIALIDADES_RUTA.
+La API recarga el archivo al reiniciar (o con clasificador_especialidades.recargar()).
+
+Uso (desde backend/):
+    python -m herramientas.entrenar_clasificador
+    python -m herramientas.entrenar_clasificador --jsonl ejemplos.jsonl --umbral 0.7
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from services import clasificador_especialidades as clasificador
+
+
+def _cargar_jsonl(ruta: str):
+    textos, etiquetas = [], []
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            if linea.strip():
+                fila = json.loads(linea)
+                if fila.get("especialidad") in clasificador.ESPECIALIDADES:
+                    textos.append(fila["texto"])
+                    etiquetas.append(fila["especialidad"])
+    return textos, etiquetas
+
+
+def _cargar_bd():
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        return clasificador.ejemplos_de_analisis(db)
+    finally:
+        db.close()
+
+
+def evaluar(modelo, textos, etiquetas, umbral: float) -> dict:
+    resultados = modelo.clasificar_lote(textos)
+    aciertos = np.array([r["especialidad"] == e for r, e in zip(resultados, etiquetas)])
+    seguros = np.array([r["confianza"] >= umbral for r in resultados])
+    return {
+        "exactitud": float(aciertos.mean()) if len(aciertos) else 0.0,
+        "cobertura": float(seguros.mean()) if len(seguros) else 0.0,
+        "exactitud_seguros": float(aciertos[seguros].mean()) if seguros.any() else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrena el clasificador local de especialidades")
+    parser.add_argument("--jsonl", help="Ejemplos desde archivo en vez de la base de datos")
+    parser.add_argument("--salida", default=clasificador.CLASIFICADOR_RUTA)
+    parser.add_argument("--validacion", type=float, default=0.2, help="Fracción reservada para medir")
+    parser.add_argument("--umbral", type=float, default=clasificador.CLASIFICADOR_UMBRAL)
+    parser.add_argument("--epocas", type=int, default=300)
+    parser.add_argument("--min-ejemplos", type=int, default=50)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    textos, etiquetas = _cargar_jsonl(args.jsonl) if args.jsonl else _cargar_bd()
+    print(f"📚 {len(textos)} ejemplos: {dict(Counter(etiquetas).most_common())}")
+    if len(textos) < args.min_ejemplos:
+        print(f"❌ Se necesitan al menos {args.min_ejemplos} ejemplos para entrenar")
+        sys.exit(1)
+
+    indices = list(range(len(textos)))
+    random.Random(args.semilla).shuffle(indices)
+    corte = int(len(indices) * (1 - args.validacion))
+    entrenamiento, validacion = indices[:corte], indices[corte:]
+
+    inicio = time.perf_counter()
+    modelo = clasificador.entrenar(
+        [textos[i] for i in entrenamiento], [etiquetas[i] for i in entrenamiento], epocas=args.epocas
+    )
+    print(f"⏱️ Entrenamiento: {time.perf_counter() - inicio:.2f}s ({modelo.metadatos['terminos']} términos)")
+
+    if validacion:
+        m = evaluar(modelo, [textos[i] for i in validacion], [etiquetas[i] for i in validacion], args.umbral)
+        print(f"📊 Validación ({len(validacion)}): exactitud={m['exactitud']:.3f} "
+              f"cobertura@{args.umbral}={m['cobertura']:.3f} exactitud_seguros={m['exactitud_seguros']:.3f}")
+
+    modelo = clasificador.entrenar(textos, etiquetas, epocas=args.epocas)
+    if validacion:
+        modelo.metadatos["validacion"] = m
+    modelo.guardar(args.salida)
+    print(f"✅ Modelo guardado en {args.salida}")
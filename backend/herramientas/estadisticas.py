@@ -0,0 +1,8 @@
+# backend/herramientas/estadisticas.py
+"""Estadísticas compartidas por los benchmarks y el replay."""
+
+
+def percentil(valores, p: float) -> float:
+    """Percentil `p` (0-1) por rango más cercano; `valores` no puede estar vacío."""
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
@@ -0,0 +1,34 @@
+# backend/herramientas/generar_catalogo_vendedores.py
+"""
+Genera offline el catálogo de criterios de vendedores para la versión
+vigente del prompt (VERSION_PROMPT_VENDEDORES, huella del prompt y sus parámetros).
+
+Uso (desde backend/):
+    python -m herramientas.generar_catalogo_vendedores            # solo faltantes
+    python -m herramientas.generar_catalogo_vendedores --todas    # regenera todo
+"""
+import argparse
+import asyncio
+
+from database import Base, engine
+from services import catalogo_vendedores
+
+
+async def main(todas: bool, concurrencia: int):
+    Base.metadata.create_all(bind=engine, tables=[catalogo_vendedores.CriteriosVendedorCatalogo.__table__])
+    faltantes = catalogo_vendedores.cargar_catalogo()
+    objetivo = catalogo_vendedores.combinaciones() if todas else faltantes
+    if not objetivo:
+        print("✅ El catálogo ya está completo")
+        return
+    resumen = await catalogo_vendedores.generar_catalogo(objetivo, concurrencia)
+    for error in resumen["errores"]:
+        print(f"❌ {error['especialidad']} / {error['complejidad']}: {error['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera el catálogo de criterios de vendedores")
+    parser.add_argument("--todas", action="store_true", help="Regenera también las combinaciones existentes")
+    parser.add_argument("--concurrencia", type=int, default=catalogo_vendedores.CATALOGO_CONCURRENCIA)
+    args = parser.parse_args()
+    asyncio.run(main(args.todas, args.concurrencia))
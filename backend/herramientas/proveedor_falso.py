@@ -0,0 +1,556 @@
+# backend/herramientas/proveedor_falso.py
+"""
+Servidor falso compatible con la API de chat-completions de OpenAI.
+
+Sirve para correr los flujos de IA sin red ni gasto (pruebas offline,
+benchmarks de carga, replay). Responde con plantillas según el prompt:
+
+- chat de análisis (IEEE 830): pregunta de seguimiento o, en modo JSON,
+  proyecto finalizado con 3-8 sub-tareas (WBS), solo el esqueleto si el
+  prompt lo pide, y el detalle de una sub-tarea
+- resumen de historial, analizar_requerimiento, sugerir_vendedores,
+  respaldo del clasificador de especialidades
+- chat de requerimientos: finalizado con código CPC
+- re-análisis del WBS: diff que modifica, agrega y elimina un nodo
+- corrección de un WBS que no cumple el esquema
+
+Opcionalmente lee respuestas guionadas de un archivo JSON:
+    [{"contiene": "texto a buscar", "respuesta": "texto o JSON"}, ...]
+
+Latencia, retardo por token y tasas de error son configurables; con la
+misma semilla, peticiones idénticas producen la misma secuencia de resultados.
+El tiempo de generación crece con los tokens de salida (segundos_por_token)
+y se escala por modelo (factor_modelos), y max_tokens corta la respuesta
+con finish_reason "length", como la API real (benchmarks de ruteo).
+
+Emula el cache de prefijos de OpenAI: los prompts de 1024+ tokens se cachean
+en bloques de 128; si el inicio de una petición coincide byte a byte con uno
+ya visto, usage.prompt_tokens_details.cached_tokens lo refleja y la latencia
+baja en proporción (ahorro_latencia_cache).
+
+Uso (desde backend/):
+    python -m herramientas.proveedor_falso --puerto 8099 --latencia lognormal:-1.2,0.5 --tasa-429 0.05
+    LLM_PROVEEDOR=falso uvicorn main:app
+"""
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ESPECIALIDADES = [
+    "Consultoría en desarrollo de sistemas",
+    "Consultoría en hardware",
+    "Consultoría en software",
+    "Desarrollo de software a medida",
+    "Desarrollo y producción de software empaquetado",
+    "Actualización y adaptación de software",
+    "Servicios de alojamiento de datos (hosting)",
+    "Servicios de procesamiento de datos",
+    "Servicios en la nube (cloud computing)",
+    "Servicios de recuperación ante desastres",
+    "Servicios de ciberseguridad",
+    "Capacitación en TI",
+]
+
+CODIGOS_ESPECIALIDAD = [
+    "CONSULTORIA_DESARROLLO", "CONSULTORIA_HARDWARE", "CONSULTORIA_SOFTWARE",
+    "DESARROLLO_MEDIDA", "SOFTWARE_EMPAQUETADO", "ACTUALIZACION_SOFTWARE",
+    "HOSTING", "PROCESAMIENTO_DATOS", "CLOUD_COMPUTING",
+    "RECUPERACION_DESASTRES", "CIBERSEGURIDAD", "CAPACITACION_TI",
+]
+
+# Especialidades que el modelo real a veces inventa (para probar refinar_subtareas)
+ESPECIALIDADES_INVALIDAS = ["Diseño de interfaz", "Integración de contenido", "Backend"]
+
+PLANTILLAS_SUBTAREAS = [
+    ("Desarrollo del módulo de autenticación y usuarios", "Desarrollo de software a medida"),
+    ("Diseño de la arquitectura y modelo de datos", "Consultoría en desarrollo de sistemas"),
+    ("Desarrollo de la API REST principal", "Desarrollo de software a medida"),
+    ("Configuración de infraestructura cloud", "Servicios en la nube (cloud computing)"),
+    ("Auditoría de seguridad y hardening", "Servicios de ciberseguridad"),
+    ("Migración y procesamiento de datos históricos", "Servicios de procesamiento de datos"),
+    ("Plan de respaldo y recuperación", "Servicios de recuperación ante desastres"),
+    ("Capacitación a usuarios administradores", "Capacitación en TI"),
+    ("Despliegue y alojamiento del sistema", "Servicios de alojamiento de datos (hosting)"),
+    ("Integración con sistemas existentes", "Actualización y adaptación de software"),
+]
+
+PREGUNTAS_ANALISIS = [
+    "¿Quiénes serán los usuarios finales del sistema y qué roles necesitas?",
+    "¿Qué funcionalidades son críticas y cuáles deseables (MoSCoW)?",
+    "¿Tienes restricciones de presupuesto, plazo o tecnologías obligatorias?",
+    "¿Debe integrarse con algún sistema existente?",
+]
+
+
+# ========================================
+# CONFIGURACIÓN
+# ========================================
+
+def configuracion_por_defecto() -> Dict:
+    return {
+        "semilla": 42,
+        "latencia": "fija:0",           # fija:S | uniforme:MIN,MAX | lognormal:MU,SIGMA
+        "retardo_token": 0.0,           # segundos entre fragmentos en streaming
+        "tasa_error": 0.0,              # fracción de respuestas 500
+        "tasa_429": 0.0,                # fracción de respuestas 429
+        "retry_after": 1,               # segundos en la cabecera Retry-After
+        "tasa_especialidad_invalida": 0.0,
+        "tasa_wbs_malformado": 0.0,     # fracción de WBS con números en texto, prioridades y especialidades mal escritas
+        "turnos_finalizar": 3,          # mensajes del cliente antes de finalizar
+        "guion": None,                  # ruta a un JSON con respuestas guionadas
+        "cache_prefijos": True,         # emular el cache de prefijos del proveedor
+        "ahorro_latencia_cache": 0.5,   # fracción de la latencia que se ahorra con todo el prompt cacheado
+        "segundos_por_token": 0.0,      # tiempo de generación por token de salida
+        "factor_modelos": "gpt-4o=2.5,gpt-4o-mini=1,gpt-4.1-nano=0.5",  # multiplica latencia y generación
+    }
+
+
+def _muestrear_latencia(especificacion: str, rng: random.Random) -> float:
+    tipo, _, valores = especificacion.partition(":")
+    numeros = [float(v) for v in valores.split(",") if v]
+    if tipo == "fija":
+        return numeros[0] if numeros else 0.0
+    if tipo == "uniforme":
+        return rng.uniform(numeros[0], numeros[1])
+    if tipo == "lognormal":
+        return rng.lognormvariate(numeros[0], numeros[1])
+    raise ValueError(f"Distribución de latencia desconocida: {especificacion}")
+
+
+def _contar_tokens(texto: str) -> int:
+    return len(texto) // 4 + 1
+
+
+def _factor_modelo(especificacion: str, modelo: str) -> float:
+    """Factor de velocidad del modelo: "gpt-4o=2.5,gpt-4o-mini=1" (gana el prefijo más largo)."""
+    factores = {}
+    for par in (especificacion or "").split(","):
+        if "=" in par:
+            nombre, _, valor = par.partition("=")
+            factores[nombre.strip()] = float(valor)
+    for nombre in sorted(factores, key=len, reverse=True):
+        if modelo.startswith(nombre):
+            return factores[nombre]
+    return 1.0
+
+
+CACHE_BLOQUE_TOKENS = 128
+CACHE_MINIMO_TOKENS = 1024
+CACHE_MAX_BLOQUES = 50000
+
+
+def _huellas_prefijo(modelo: str, mensajes: List[Dict]) -> List[str]:
+    """Huella acumulada del prompt al final de cada bloque completo de 128 tokens (~512 caracteres)."""
+    texto = "".join(f"{m.get('role')}\n{m.get('content') or ''}\n" for m in mensajes)
+    paso = CACHE_BLOQUE_TOKENS * 4
+    acumulada = hashlib.sha256(modelo.encode("utf-8"))
+    huellas = []
+    for inicio in range(0, len(texto) - paso + 1, paso):
+        acumulada.update(texto[inicio:inicio + paso].encode("utf-8"))
+        huellas.append(acumulada.copy().hexdigest())
+    return huellas
+
+
+# ========================================
+# PLANTILLAS DE RESPUESTA
+# ========================================
+
+def _primer_mensaje_cliente(mensajes: List[Dict]) -> str:
+    for m in mensajes:
+        if m.get("role") == "user":
+            return m.get("content") or ""
+    return ""
+
+
+def _titulo(texto: str) -> str:
+    palabras = re.sub(r"\s+", " ", texto).strip().split(" ")[:8]
+    titulo = " ".join(palabras).rstrip(".,;:") or "Proyecto de software"
+    return titulo[:1].upper() + titulo[1:]
+
+
+def _proyecto_finalizado(mensajes: List[Dict], rng: random.Random, config: Dict) -> Dict:
+    titulo = _titulo(_primer_mensaje_cliente(mensajes))
+    n = rng.randint(3, 8)
+    plantillas = rng.sample(PLANTILLAS_SUBTAREAS, n)
+    subtareas = []
+    for i, (titulo_tarea, especialidad) in enumerate(plantillas, 1):
+        if rng.random() < config["tasa_especialidad_invalida"]:
+            especialidad = rng.choice(ESPECIALIDADES_INVALIDAS)
+        subtareas.append({
+            "codigo": f"WBS-1.{i}",
+            "titulo": titulo_tarea,
+            "descripcion": f"{titulo_tarea} para: {titulo}.",
+            "especialidad": especialidad,
+            "requisitos_relacionados": [f"RF-{i:03d}"],
+            "prioridad": rng.choice(["ALTA", "MEDIA", "BAJA"]),
+            "justificacion_prioridad": "Necesario para la entrega del proyecto",
+            "estimacion_horas": rng.choice([8, 12, 16, 20, 24, 32, 40]),
+            "metodo_estimacion": "Planning Poker",
+            "criterios_aceptacion": [f"{titulo_tarea} validado por el cliente"],
+            "dependencias": [f"WBS-1.{i - 1}"] if i > 1 and rng.random() < 0.5 else []
+        })
+    horas = sum(t["estimacion_horas"] for t in subtareas)
+    malformado = rng.random() < config["tasa_wbs_malformado"]
+    if malformado:
+        for t in subtareas:
+            t["estimacion_horas"] = f"{t['estimacion_horas']} horas"
+            t["prioridad"] = t["prioridad"].capitalize()
+            t["especialidad"] = t["especialidad"].lower()
+    return {
+        "finalizado": True,
+        "proyecto": {
+            "titulo": titulo,
+            "historia_usuario": f"Como cliente, necesito {titulo.lower()}, para resolver mi necesidad de negocio",
+            "descripcion_completa": _primer_mensaje_cliente(mensajes)[:500] or titulo,
+            "requisitos_funcionales": [f"RF-{i:03d}: {t['titulo']}" for i, t in enumerate(subtareas, 1)],
+            "requisitos_no_funcionales": ["RNF-001: Tiempo de respuesta < 2 segundos"],
+            "criterios_aceptacion": ["El cliente aprueba cada entregable"],
+            "presupuesto_estimado": f"{horas * 25:,} USD" if malformado else horas * 25,
+            "tiempo_estimado_dias": f"{max(7, horas // 6)} días" if malformado else max(7, horas // 6),
+            "metodologia_estimacion": "Planning Poker",
+            "riesgos_identificados": ["Cambios de alcance durante el desarrollo"],
+            "subtareas": subtareas
+        }
+    }
+
+
+def _respuesta_analisis(mensajes: List[Dict], modo_json: bool, rng: random.Random, config: Dict) -> str:
+    turnos_cliente = sum(1 for m in mensajes if m.get("role") == "user")
+    # Con historial compactado, el resumen cuenta como conversación previa
+    compactado = any(
+        m.get("role") == "system" and "RESUMEN DE LA CONVERSACIÓN PREVIA" in (m.get("content") or "")
+        for m in mensajes
+    )
+    if modo_json and (turnos_cliente >= config["turnos_finalizar"] or compactado):
+        proyecto = _proyecto_finalizado(mensajes, rng, config)
+        # WBS en dos etapas: solo el esqueleto, el detalle llega en otra llamada por sub-tarea
+        if any(m.get("role") == "system" and "FORMATO ESQUELETO" in (m.get("content") or "") for m in mensajes):
+            proyecto["proyecto"]["subtareas"] = [
+                {campo: t[campo] for campo in ("codigo", "titulo", "especialidad", "prioridad", "dependencias")}
+                for t in proyecto["proyecto"]["subtareas"]
+            ]
+        return json.dumps(proyecto, ensure_ascii=False)
+    pregunta = PREGUNTAS_ANALISIS[(turnos_cliente - 1) % len(PREGUNTAS_ANALISIS)]
+    if modo_json:
+        return json.dumps({"finalizado": False, "respuesta": pregunta}, ensure_ascii=False)
+    return f"Entendido. {pregunta}"
+
+
+def _respuesta_resumen(mensajes: List[Dict]) -> str:
+    contenido = mensajes[-1].get("content") or ""
+    clientes = re.findall(r"^CLIENTE: (.*)$", contenido, flags=re.MULTILINE)
+    return json.dumps({
+        "objetivo": _titulo(clientes[0]) if clientes else "",
+        "usuarios_y_roles": [],
+        "requisitos_funcionales": [c[:120] for c in clientes],
+        "requisitos_no_funcionales": [],
+        "restricciones": [],
+        "integraciones": [],
+        "presupuesto": None,
+        "plazo": None,
+        "decisiones": [],
+        "pendientes": []
+    }, ensure_ascii=False)
+
+
+def _respuesta_reanalisis(mensajes: List[Dict], rng: random.Random) -> str:
+    """Diff del WBS: alarga el primer nodo libre, elimina el último y agrega uno con los cambios."""
+    datos = json.loads(mensajes[-1].get("content") or "{}")
+    libres = [n for n in datos.get("wbs", []) if not n.get("bloqueada")]
+    cambios = datos.get("cambios", "")
+    return json.dumps({
+        "modificadas": [
+            {"codigo": libres[0]["codigo"], "estimacion_horas": (libres[0].get("estimacion_horas") or 40) + 8}
+        ] if libres else [],
+        "nuevas": [{
+            "titulo": _titulo(cambios),
+            "descripcion": cambios,
+            "especialidad": rng.choice(ESPECIALIDADES),
+            "prioridad": "MEDIA",
+            "estimacion_horas": 24,
+            "dependencias": []
+        }],
+        "eliminadas": [libres[-1]["codigo"]] if len(libres) > 1 else [],
+        "resumen_cambios": f"Agregué una sub-tarea para: {_titulo(cambios)}"
+    }, ensure_ascii=False)
+
+
+def _respuesta_detalle_subtarea(mensajes: List[Dict], rng: random.Random) -> str:
+    datos = json.loads(mensajes[-1].get("content") or "{}")
+    tarea = datos.get("subtarea") or {}
+    titulo = tarea.get("titulo") or "Sub-tarea"
+    return json.dumps({
+        "descripcion": f"{titulo} para: {(datos.get('proyecto') or {}).get('titulo') or 'el proyecto'}.",
+        "requisitos_relacionados": ["RF-001"],
+        "justificacion_prioridad": "Necesario para la entrega del proyecto",
+        "estimacion_horas": rng.choice([8, 12, 16, 20, 24, 32, 40]),
+        "metodo_estimacion": "Planning Poker",
+        "criterios_aceptacion": [f"{titulo} validado por el cliente"],
+        "riesgos": []
+    }, ensure_ascii=False)
+
+
+def _respuesta_requerimiento(mensajes: List[Dict], rng: random.Random, config: Dict) -> str:
+    turnos_cliente = sum(1 for m in mensajes if m.get("role") == "user")
+    if turnos_cliente < config["turnos_finalizar"]:
+        return "¡Genial! 😊 ¿Cuál es el plazo y el presupuesto aproximado del proyecto?"
+    titulo = _titulo(_primer_mensaje_cliente(mensajes))
+    return json.dumps({
+        "finalizado": True,
+        "requerimiento": {
+            "titulo": titulo,
+            "descripcion": _primer_mensaje_cliente(mensajes),
+            "especialidad": rng.choice(["83131", "83143", "83162", "83111"]),
+            "presupuesto": str(rng.choice([1500, 3000, 8000])),
+            "mensaje": f"Proyecto: {titulo}"
+        }
+    }, ensure_ascii=False)
+
+
+def _respuesta_plantilla(cuerpo: Dict, rng: random.Random, config: Dict) -> str:
+    mensajes = cuerpo.get("messages") or []
+    sistema = (mensajes[0].get("content") or "") if mensajes else ""
+    modo_json = (cuerpo.get("response_format") or {}).get("type") == "json_object"
+
+    if "IEEE 830" in sistema:
+        return _respuesta_analisis(mensajes, modo_json, rng, config)
+    if sistema.startswith("Eres un analista de requisitos"):
+        return _respuesta_resumen(mensajes)
+    if "mantiene el WBS" in sistema:
+        return _respuesta_reanalisis(mensajes, rng)
+    if "validador de JSON" in sistema:
+        # Corrección del WBS: un proyecto válido con el título original, si se puede leer
+        pedido = json.loads(mensajes[-1].get("content") or "{}")
+        original = (pedido.get("respuesta") or {}) if isinstance(pedido.get("respuesta"), dict) else {}
+        titulo = (original.get("proyecto") or {}).get("titulo") or "Proyecto de software"
+        return json.dumps(_proyecto_finalizado([{"role": "user", "content": titulo}], rng, config), ensure_ascii=False)
+    if "detalla UNA sub-tarea" in sistema:
+        return _respuesta_detalle_subtarea(mensajes, rng)
+    if "Conecta Solutions" in sistema:
+        return _respuesta_requerimiento(mensajes, rng, config)
+    if "selección de talento" in sistema:
+        return json.dumps({
+            "experiencia_minima": f"{rng.randint(1, 5)} años",
+            "habilidades_clave": ["Python", "SQL", "Comunicación"],
+            "criterios_evaluacion": ["Portafolio", "Referencias", "Prueba técnica"]
+        }, ensure_ascii=False)
+    if "clasificador de especialidades" in sistema:
+        textos = re.findall(r"^\d+\. ", mensajes[-1].get("content") or "", flags=re.MULTILINE)
+        return json.dumps({"especialidades": [rng.choice(CODIGOS_ESPECIALIDAD) for _ in textos]})
+    if "análisis de proyectos de software" in sistema:
+        return json.dumps({
+            "titulo": "Sistema web a medida",
+            "especialidad": rng.choice(ESPECIALIDADES),
+            "tiempo_estimado": "2-3 meses",
+            "presupuesto_sugerido": "3000-6000 USD",
+            "complejidad": rng.choice(["Baja", "Media", "Alta"]),
+            "tecnologias_sugeridas": ["Python", "React", "PostgreSQL"],
+            "descripcion_tecnica": "Aplicación web con backend REST y base de datos relacional."
+        }, ensure_ascii=False)
+    if modo_json:
+        return json.dumps({"respuesta": "ok"})
+    return "Hola 👋 Soy el asistente de prueba. ¿En qué te ayudo con tu requerimiento?"
+
+
+# ========================================
+# APP
+# ========================================
+
+def crear_app(config: Optional[Dict] = None) -> FastAPI:
+    config = {**configuracion_por_defecto(), **(config or {})}
+    guion = []
+    if config["guion"]:
+        with open(config["guion"], encoding="utf-8") as f:
+            guion = json.load(f)
+
+    intentos: Dict[str, int] = {}
+    lock = threading.Lock()
+    prefijos: "OrderedDict[str, None]" = OrderedDict()
+
+    def tokens_cacheados(cuerpo: Dict) -> int:
+        if not config["cache_prefijos"]:
+            return 0
+        huellas = _huellas_prefijo(cuerpo.get("model", ""), cuerpo.get("messages") or [])
+        with lock:
+            aciertos = 0
+            for huella in huellas:
+                if huella not in prefijos:
+                    break
+                prefijos.move_to_end(huella)
+                aciertos += 1
+            for huella in huellas[aciertos:]:
+                prefijos[huella] = None
+            while len(prefijos) > CACHE_MAX_BLOQUES:
+                prefijos.popitem(last=False)
+        cacheados = aciertos * CACHE_BLOQUE_TOKENS
+        return cacheados if cacheados >= CACHE_MINIMO_TOKENS else 0
+
+    def rng_para(cuerpo: Dict) -> random.Random:
+        # Misma semilla + misma petición + mismo número de intento -> mismo resultado,
+        # sin depender del orden en que lleguen las peticiones concurrentes
+        huella = hashlib.sha256(json.dumps(cuerpo.get("messages"), sort_keys=True).encode("utf-8")).hexdigest()
+        with lock:
+            intentos[huella] = intentos.get(huella, 0) + 1
+            intento = intentos[huella]
+        return random.Random(f"{config['semilla']}:{huella}:{intento}")
+
+    def contenido_para(cuerpo: Dict, rng: random.Random) -> str:
+        mensajes = cuerpo.get("messages") or []
+        texto = "\n".join(m.get("content") or "" for m in mensajes)
+        for regla in guion:
+            if regla["contiene"] in texto:
+                respuesta = regla["respuesta"]
+                return respuesta if isinstance(respuesta, str) else json.dumps(respuesta, ensure_ascii=False)
+        return _respuesta_plantilla(cuerpo, rng, config)
+
+    app = FastAPI(title="Proveedor LLM falso")
+
+    @app.get("/v1/models")
+    async def modelos():
+        return {"object": "list", "data": [
+            {"id": m, "object": "model", "created": 0, "owned_by": "falso"}
+            for m in ("gpt-4o-mini", "gpt-4o", "gpt-4.1-nano", "gpt-3.5-turbo")
+        ]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        cuerpo = await request.json()
+        rng = rng_para(cuerpo)
+        tokens_prompt = sum(_contar_tokens(m.get("content") or "") + 4 for m in cuerpo.get("messages") or [])
+        cacheados = min(tokens_cacheados(cuerpo), tokens_prompt)
+
+        modelo = cuerpo.get("model", "gpt-4o-mini")
+        factor = _factor_modelo(config["factor_modelos"], modelo)
+        latencia = _muestrear_latencia(config["latencia"], rng) * factor
+        await asyncio.sleep(latencia * (1 - config["ahorro_latencia_cache"] * cacheados / tokens_prompt))
+
+        sorteo = rng.random()
+        if sorteo < config["tasa_429"]:
+            return JSONResponse(
+                {"error": {"message": "Rate limit simulado", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"Retry-After": str(config["retry_after"])}
+            )
+        if sorteo < config["tasa_429"] + config["tasa_error"]:
+            return JSONResponse(
+                {"error": {"message": "Error simulado", "type": "server_error"}},
+                status_code=500
+            )
+
+        contenido = contenido_para(cuerpo, rng)
+        fin = "stop"
+        max_tokens = cuerpo.get("max_completion_tokens") or cuerpo.get("max_tokens")
+        if max_tokens and _contar_tokens(contenido) > max_tokens:
+            contenido = contenido[:max_tokens * 4]
+            fin = "length"
+        tokens_respuesta = _contar_tokens(contenido)
+        por_token = config["segundos_por_token"] * factor
+        uso = {
+            "prompt_tokens": tokens_prompt,
+            "completion_tokens": tokens_respuesta,
+            "total_tokens": tokens_prompt + tokens_respuesta,
+            "prompt_tokens_details": {"cached_tokens": cacheados}
+        }
+        identificador = f"chatcmpl-falso-{uuid.uuid4().hex[:12]}"
+        creado = int(time.time())
+
+        if not cuerpo.get("stream"):
+            await asyncio.sleep(por_token * tokens_respuesta)
+            return {
+                "id": identificador,
+                "object": "chat.completion",
+                "created": creado,
+                "model": modelo,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": contenido},
+                    "finish_reason": fin
+                }],
+                "usage": uso
+            }
+
+        incluir_uso = (cuerpo.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: Dict, fin: Optional[str] = None, con_uso: bool = False) -> str:
+            datos = {
+                "id": identificador,
+                "object": "chat.completion.chunk",
+                "created": creado,
+                "model": modelo,
+                "choices": [] if con_uso else [{"index": 0, "delta": delta, "finish_reason": fin}]
+            }
+            if con_uso:
+                datos["usage"] = uso
+            return f"data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+        async def generar():
+            yield chunk({"role": "assistant", "content": ""})
+            for fragmento in re.findall(r"\S+\s*|\s+", contenido):
+                if config["retardo_token"] or por_token:
+                    await asyncio.sleep(config["retardo_token"] + por_token * _contar_tokens(fragmento))
+                yield chunk({"content": fragmento})
+            yield chunk({}, fin=fin)
+            if incluir_uso:
+                yield chunk({}, con_uso=True)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generar(), media_type="text/event-stream")
+
+    return app
+
+
+def iniciar_en_hilo(config: Optional[Dict] = None, puerto: int = 8099) -> "uvicorn.Server":
+    """Levanta el servidor falso en un hilo aparte (benchmarks, replay)."""
+    import uvicorn
+
+    servidor = uvicorn.Server(uvicorn.Config(crear_app(config), host="127.0.0.1", port=puerto, log_level="warning"))
+    hilo = threading.Thread(target=servidor.run, daemon=True)
+    hilo.start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return servidor
+
+
+def argumentos_configuracion(parser: argparse.ArgumentParser):
+    """Opciones comunes a las herramientas que levantan el servidor falso."""
+    defecto = configuracion_por_defecto()
+    parser.add_argument("--semilla", type=int, default=defecto["semilla"])
+    parser.add_argument("--latencia", default=defecto["latencia"], help="fija:S | uniforme:MIN,MAX | lognormal:MU,SIGMA")
+    parser.add_argument("--retardo-token", type=float, default=defecto["retardo_token"])
+    parser.add_argument("--tasa-error", type=float, default=defecto["tasa_error"])
+    parser.add_argument("--tasa-429", type=float, default=defecto["tasa_429"])
+    parser.add_argument("--retry-after", type=float, default=defecto["retry_after"])
+    parser.add_argument("--tasa-especialidad-invalida", type=float, default=defecto["tasa_especialidad_invalida"])
+    parser.add_argument("--tasa-wbs-malformado", type=float, default=defecto["tasa_wbs_malformado"])
+    parser.add_argument("--turnos-finalizar", type=int, default=defecto["turnos_finalizar"])
+    parser.add_argument("--guion", default=None, help="JSON con respuestas guionadas")
+    parser.add_argument("--cache-prefijos", action=argparse.BooleanOptionalAction, default=defecto["cache_prefijos"])
+    parser.add_argument("--ahorro-latencia-cache", type=float, default=defecto["ahorro_latencia_cache"])
+    parser.add_argument("--segundos-por-token", type=float, default=defecto["segundos_por_token"])
+    parser.add_argument("--factor-modelos", default=defecto["factor_modelos"], help="modelo=factor,...")
+
+
+def configuracion_desde_args(args: argparse.Namespace) -> Dict:
+    return {clave: getattr(args, clave) for clave in configuracion_por_defecto()}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor falso compatible con chat-completions")
+    parser.add_argument("--puerto", type=int, default=8099)
+    argumentos_configuracion(parser)
+    args = parser.parse_args()
+    print(f"🧪 Proveedor falso en http://127.0.0.1:{args.puerto}/v1")
+    uvicorn.run(crear_app(configuracion_desde_args(args)), host="127.0.0.1", port=args.puerto, log_level="warning")
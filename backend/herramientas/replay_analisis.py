@@ -0,0 +1,329 @@
+# backend/herramientas/replay_analisis.py
+"""
+Replay de conversaciones de análisis guardadas contra un proveedor (falso o real).
+
+Para medir qué pasa al cambiar SYSTEM_PROMPT_ANALISIS, los modelos o la
+política de ruteo. Cada turno del cliente de las transcripciones guardadas se
+vuelve a enviar a chat_analisis_proyecto con el historial *grabado* hasta ese
+punto (no con las respuestas nuevas), así dos corridas ven exactamente las
+mismas entradas y se pueden comparar turno a turno. El resumen del historial
+se recalcula en cada turno (no se usa el guardado).
+
+Por turno se registra: latencia, tokens, si se esperaba JSON (modo JSON desde
+TURNOS_MODO_JSON mensajes) y si la respuesta lo era, si finalizó, cuántas
+sub-tareas trajo y cómo se mapeó cada especialidad. chat_analisis_proyecto ya
+devuelve el WBS reparado (esquema_wbs), así que se mide lo que hubo que
+reparar: un proyecto con reparaciones locales o corregido por el modelo
+cuenta como JSON no válido, y el origen de cada especialidad sale de las
+reparaciones del validador (exacta, codigo, aproximada, clasificador o
+por_defecto = fallo de mapeo).
+
+La corrida se guarda en --salida; con --baseline se compara contra otra
+corrida (agregados y turnos que cambiaron de resultado).
+
+Uso (desde backend/):
+    python -m herramientas.replay_analisis --limite 20 --exportar sesiones.jsonl
+    python -m herramientas.replay_analisis --sesiones sesiones.jsonl --falso --salida base.json
+    python -m herramientas.replay_analisis --sesiones sesiones.jsonl --prompt prompt_nuevo.txt \\
+        --modelo-analisis gpt-4o --baseline base.json --salida nuevo.json
+"""
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Dict, List, Optional
+
+from herramientas.estadisticas import percentil
+from services import chat_analisis_service, enrutador_modelos
+from services.chat_analisis_service import chat_analisis_proyecto
+from services.json_incremental import extraer_json
+
+ORIGENES_ESPECIALIDAD = ("exacta", "codigo", "aproximada", "clasificador", "por_defecto")
+
+# "subtareas.2.especialidad: 'x' -> DESARROLLO_MEDIDA (por_defecto)" (ValidadorWBS)
+_REPARACION_ESPECIALIDAD = re.compile(r"\.especialidad: .* \((\w+)\)$")
+
+# Métricas agregadas que se comparan contra el baseline (y si subir es mejor)
+METRICAS_COMPARADAS = {
+    "tasa_exito": True,
+    "latencia_media": False,
+    "latencia_p95": False,
+    "tokens_por_turno": False,
+    "tasa_json_valido": True,
+    "tasa_reparacion_local": False,
+    "reparados_por_modelo": False,
+    "finalizados": True,
+    "subtareas_media": None,
+    "tasa_fallo_especialidad": False,
+}
+
+
+# ========================================
+# SESIONES
+# ========================================
+
+def cargar_sesiones_bd(proyecto_ids: Optional[List[int]], limite: int) -> List[Dict]:
+    """Transcripciones de análisis guardadas: [{"proyecto_id", "mensajes": [{"role", "content"}]}]."""
+    from database import SessionLocal
+    from modelos.transcripcion_modelo import TranscripcionAnalisis
+    from services.transcripcion_service import TranscripcionService
+
+    db = SessionLocal()
+    try:
+        if not proyecto_ids:
+            proyecto_ids = [fila.proyecto_id for fila in db.query(TranscripcionAnalisis.proyecto_id)
+                            .order_by(TranscripcionAnalisis.proyecto_id.desc()).limit(limite)]
+        sesiones = []
+        for proyecto_id in proyecto_ids:
+            turnos = TranscripcionService.obtener_turnos(db, proyecto_id)
+            if turnos:
+                sesiones.append({"proyecto_id": proyecto_id, "mensajes": TranscripcionService.historial_openai(turnos)})
+        return sesiones
+    finally:
+        db.close()
+
+
+def cargar_sesiones_archivo(ruta: str) -> List[Dict]:
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+# ========================================
+# REPLAY
+# ========================================
+
+def _mapeo_especialidades(subtareas: List[Dict], reparaciones: List[str]) -> Dict[str, int]:
+    """Origen de cada especialidad: las que el validador no tuvo que reparar llegaron exactas."""
+    conteo = dict.fromkeys(ORIGENES_ESPECIALIDAD, 0)
+    for reparacion in reparaciones:
+        encontrado = _REPARACION_ESPECIALIDAD.search(reparacion)
+        if encontrado and encontrado.group(1) in conteo:
+            conteo[encontrado.group(1)] += 1
+    conteo["exacta"] += max(0, len(subtareas) - sum(conteo.values()))
+    return conteo
+
+
+async def replay_turno(proyecto_id: int, indice: int, historial: List[Dict[str, str]]) -> Dict:
+    inicio = time.perf_counter()
+    resultado = await chat_analisis_proyecto([dict(m) for m in historial], cliente_id=None)
+    registro = {
+        "proyecto_id": proyecto_id,
+        "turno": indice,
+        "tipo": enrutador_modelos.tipo_turno(historial),
+        "latencia": round(time.perf_counter() - inicio, 4),
+        "exito": resultado["exito"],
+        "error": resultado.get("error"),
+        "tokens": resultado.get("tokens_usados", 0),
+        "json_esperado": len(historial) >= enrutador_modelos.TURNOS_MODO_JSON,
+        "finalizado": bool(resultado.get("finalizado")),
+        "subtareas": 0,
+        "mapeo": dict.fromkeys(ORIGENES_ESPECIALIDAD, 0),
+        "reparaciones": resultado.get("reparaciones") or [],
+        "reparado_por_modelo": bool(resultado.get("reparado_por_modelo")),
+    }
+    if resultado.get("finalizado"):
+        subtareas = resultado["proyecto"].get("subtareas") or []
+        # Válido solo si cumplió el esquema tal como llegó
+        registro["json_valido"] = not registro["reparaciones"] and not registro["reparado_por_modelo"]
+        registro["subtareas"] = len(subtareas)
+        registro["mapeo"] = _mapeo_especialidades(subtareas, registro["reparaciones"])
+    else:
+        registro["json_valido"] = resultado["exito"] and extraer_json(resultado.get("respuesta") or "") is not None
+    return registro
+
+
+async def replay(sesiones: List[Dict], concurrencia: int) -> List[Dict]:
+    """Re-ejecuta cada turno del cliente de cada sesión; hasta `concurrencia` sesiones a la vez."""
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def sesion(datos: Dict) -> List[Dict]:
+        async with semaforo:
+            registros = []
+            mensajes = datos["mensajes"]
+            for i, mensaje in enumerate(mensajes):
+                if mensaje["role"] == "user":
+                    registros.append(await replay_turno(datos["proyecto_id"], i, mensajes[:i + 1]))
+            print(f"🔁 Proyecto {datos['proyecto_id']}: {len(registros)} turnos")
+            return registros
+
+    por_sesion = await asyncio.gather(*(sesion(s) for s in sesiones))
+    return [registro for registros in por_sesion for registro in registros]
+
+
+# ========================================
+# REPORTE
+# ========================================
+
+def _tasa(parte: int, total: int) -> float:
+    return round(parte / total, 4) if total else 0.0
+
+
+def agregar(turnos: List[Dict]) -> Dict:
+    exitosos = [t for t in turnos if t["exito"]]
+    con_json = [t for t in exitosos if t["json_esperado"]]
+    finalizados = [t for t in exitosos if t["finalizado"]]
+    mapeo = {origen: sum(t["mapeo"][origen] for t in finalizados) for origen in ORIGENES_ESPECIALIDAD}
+    latencias = [t["latencia"] for t in exitosos] or [0.0]
+
+    por_tipo = {}
+    for tipo in sorted({t["tipo"] for t in exitosos}):
+        valores = [t["latencia"] for t in exitosos if t["tipo"] == tipo]
+        por_tipo[tipo] = {"turnos": len(valores), "media": round(statistics.mean(valores), 4),
+                          "p95": round(percentil(valores, 0.95), 4)}
+
+    return {
+        "turnos": len(turnos),
+        "tasa_exito": _tasa(len(exitosos), len(turnos)),
+        "latencia_media": round(statistics.mean(latencias), 4),
+        "latencia_p95": round(percentil(latencias, 0.95), 4),
+        "latencia_por_tipo": por_tipo,
+        "tokens_total": sum(t["tokens"] for t in exitosos),
+        "tokens_por_turno": round(statistics.mean([t["tokens"] for t in exitosos] or [0]), 1),
+        "tasa_json_valido": _tasa(sum(1 for t in con_json if t["json_valido"]), len(con_json)),
+        "tasa_reparacion_local": _tasa(sum(1 for t in finalizados if t["reparaciones"]), len(finalizados)),
+        "reparados_por_modelo": sum(1 for t in finalizados if t["reparado_por_modelo"]),
+        "finalizados": len(finalizados),
+        "subtareas_media": round(statistics.mean([t["subtareas"] for t in finalizados] or [0]), 2),
+        "mapeo_especialidades": mapeo,
+        "tasa_fallo_especialidad": _tasa(mapeo["por_defecto"], sum(mapeo.values())),
+    }
+
+
+def comparar(actual: Dict, baseline: Dict) -> Dict:
+    """Diferencias de los agregados y turnos que cambiaron de resultado respecto del baseline."""
+    agregados = {}
+    for metrica, subir_es_mejor in METRICAS_COMPARADAS.items():
+        if metrica not in baseline["resumen"]:
+            # Baseline de una versión anterior del harness
+            continue
+        antes, ahora = baseline["resumen"][metrica], actual["resumen"][metrica]
+        delta = ahora - antes
+        veredicto = "="
+        if delta and subir_es_mejor is not None:
+            veredicto = "mejor" if (delta > 0) == subir_es_mejor else "peor"
+        agregados[metrica] = {"baseline": antes, "actual": ahora, "delta": round(delta, 4), "veredicto": veredicto}
+
+    previos = {(t["proyecto_id"], t["turno"]): t for t in baseline["turnos"]}
+    cambios = []
+    for turno in actual["turnos"]:
+        previo = previos.get((turno["proyecto_id"], turno["turno"]))
+        if previo is None:
+            continue
+        diferencias = {
+            campo: {"baseline": previo[campo], "actual": turno[campo]}
+            for campo in ("exito", "json_valido", "finalizado", "subtareas")
+            if previo[campo] != turno[campo]
+        }
+        for campo, valor in (("reparaciones", len), ("reparado_por_modelo", bool)):
+            if valor(previo.get(campo) or 0) != valor(turno[campo]):
+                diferencias[campo] = {"baseline": valor(previo.get(campo) or 0), "actual": valor(turno[campo])}
+        if turno["mapeo"]["por_defecto"] != previo["mapeo"]["por_defecto"]:
+            diferencias["fallos_especialidad"] = {
+                "baseline": previo["mapeo"]["por_defecto"], "actual": turno["mapeo"]["por_defecto"]
+            }
+        if diferencias:
+            cambios.append({"proyecto_id": turno["proyecto_id"], "turno": turno["turno"], "cambios": diferencias})
+
+    return {"agregados": agregados, "turnos_con_cambios": cambios}
+
+
+def imprimir(resumen: Dict, diferencias: Optional[Dict]):
+    print(f"\n📊 {resumen['turnos']} turnos, éxito {resumen['tasa_exito']:.0%}, "
+          f"JSON válido {resumen['tasa_json_valido']:.0%}, {resumen['finalizados']} finalizados "
+          f"(reparados: {resumen['tasa_reparacion_local']:.0%} local, {resumen['reparados_por_modelo']} por el modelo) "
+          f"({resumen['subtareas_media']} sub-tareas de media)")
+    print(f"   latencia media={resumen['latencia_media']:.3f}s p95={resumen['latencia_p95']:.3f}s, "
+          f"{resumen['tokens_por_turno']} tokens/turno")
+    for tipo, m in resumen["latencia_por_tipo"].items():
+        print(f"   {tipo:<13} {m['turnos']:>4} turnos  media={m['media']:.3f}s  p95={m['p95']:.3f}s")
+    print(f"   especialidades: {resumen['mapeo_especialidades']} "
+          f"(fallos de mapeo {resumen['tasa_fallo_especialidad']:.0%})")
+
+    if diferencias:
+        print("\n🆚 Contra el baseline:")
+        for metrica, d in diferencias["agregados"].items():
+            marca = {"mejor": "✅", "peor": "⚠️", "=": "  "}[d["veredicto"]]
+            print(f"   {marca} {metrica:<24} {d['baseline']} → {d['actual']} ({d['delta']:+})")
+        print(f"   {len(diferencias['turnos_con_cambios'])} turnos cambiaron de resultado")
+
+
+async def main(args) -> int:
+    if args.sesiones:
+        sesiones = cargar_sesiones_archivo(args.sesiones)
+    else:
+        ids = [int(p) for p in args.proyectos.split(",")] if args.proyectos else None
+        sesiones = cargar_sesiones_bd(ids, args.limite)
+    if not sesiones:
+        print("❌ No hay conversaciones para reproducir")
+        return 1
+
+    if args.exportar:
+        with open(args.exportar, "w", encoding="utf-8") as f:
+            for sesion in sesiones:
+                f.write(json.dumps(sesion, ensure_ascii=False) + "\n")
+        print(f"✅ {len(sesiones)} sesiones exportadas a {args.exportar}")
+        return 0
+
+    inicio = time.perf_counter()
+    turnos = await replay(sesiones, args.concurrencia)
+    corrida = {
+        "configuracion": {
+            "sesiones": len(sesiones),
+            "politica": enrutador_modelos.politica_activa().nombre,
+            "modelo_analisis": enrutador_modelos.LLM_MODELO_ANALISIS,
+            "modelo_rapido": enrutador_modelos.LLM_MODELO_RAPIDO,
+            "prompt": args.prompt,
+            "duracion": round(time.perf_counter() - inicio, 2),
+        },
+        "resumen": agregar(turnos),
+        "turnos": turnos,
+    }
+
+    diferencias = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            diferencias = comparar(corrida, json.load(f))
+        corrida["comparacion"] = diferencias
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(corrida, f, ensure_ascii=False, indent=2)
+
+    imprimir(corrida["resumen"], diferencias)
+    print(f"✅ Corrida guardada en {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay de conversaciones de análisis guardadas")
+    parser.add_argument("--sesiones", help="JSONL exportado con --exportar (si no, se leen de la BD)")
+    parser.add_argument("--proyectos", help="IDs de proyecto separados por coma")
+    parser.add_argument("--limite", type=int, default=50, help="Últimas N transcripciones de la BD")
+    parser.add_argument("--exportar", help="Solo guardar las sesiones en este JSONL y salir")
+    parser.add_argument("--salida", default="replay_analisis.json")
+    parser.add_argument("--baseline", help="Corrida anterior contra la cual comparar")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Sesiones reproducidas a la vez")
+    parser.add_argument("--prompt", help="Archivo con un SYSTEM_PROMPT_ANALISIS alternativo")
+    parser.add_argument("--politica", default=enrutador_modelos.LLM_POLITICA_RUTEO)
+    parser.add_argument("--modelo-analisis", default=enrutador_modelos.LLM_MODELO_ANALISIS)
+    parser.add_argument("--modelo-rapido", default=enrutador_modelos.LLM_MODELO_RAPIDO)
+    parser.add_argument("--falso", action="store_true", help="Usar el proveedor falso en un puerto local")
+    parser.add_argument("--puerto", type=int, default=8088)
+    args = parser.parse_args()
+
+    if args.prompt:
+        with open(args.prompt, encoding="utf-8") as f:
+            chat_analisis_service.SYSTEM_PROMPT_ANALISIS = f.read()
+    enrutador_modelos.LLM_MODELO_ANALISIS = args.modelo_analisis
+    enrutador_modelos.LLM_MODELO_RAPIDO = args.modelo_rapido
+    enrutador_modelos.configurar_politica(args.politica)
+
+    if args.falso:
+        from herramientas import proveedor_falso
+        from services.llm_cliente import configurar_proveedor
+        proveedor_falso.iniciar_en_hilo({}, args.puerto)
+        configurar_proveedor("falso", base_url=f"http://127.0.0.1:{args.puerto}/v1")
+
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,134 @@
+# backend/herramientas/verificar_resiliencia.py
+"""
+Verifica la política de llm_resiliencia contra el proveedor falso.
+
+Escenarios (cada uno con su propio servidor falso):
+  1. 429 frecuentes con Retry-After  -> todas las llamadas terminan bien con reintentos
+  2. proveedor colgado               -> TiempoAgotado dentro del deadline
+  3. proveedor caído (100% 500)      -> el circuito se abre y las llamadas fallan rápido
+  4. cola de latencia pesada         -> el hedging reduce el p99
+
+Uso (desde backend/):
+    python -m herramientas.verificar_resiliencia
+"""
+import sys
+import time
+import asyncio
+
+from herramientas import proveedor_falso
+from services import llm_resiliencia, metricas
+from services.llm_cliente import completar, configurar_proveedor
+
+MENSAJES = [{"role": "user", "content": "ping"}]
+_puerto = 8110
+
+
+def _servidor(**config):
+    global _puerto
+    _puerto += 1
+    servidor = proveedor_falso.iniciar_en_hilo(config, _puerto)
+    configurar_proveedor("falso", base_url=f"http://127.0.0.1:{_puerto}/v1")
+    return servidor
+
+
+async def _llamar(endpoint: str, contenido: str = "ping"):
+    return await completar(endpoint, model="gpt-4o-mini", messages=[{"role": "user", "content": contenido}])
+
+
+async def escenario_429() -> bool:
+    servidor = _servidor(tasa_429=0.3, retry_after=0.05)
+    llm_resiliencia.POLITICAS["verificar_429"] = {"reintentos": 6}
+    try:
+        resultados = await asyncio.gather(
+            *(_llamar("verificar_429", f"ping {i}") for i in range(50)), return_exceptions=True
+        )
+    finally:
+        servidor.should_exit = True
+    errores = [r for r in resultados if isinstance(r, Exception)]
+    reintentos = metricas.valor_contador("llm_reintentos_total", endpoint="verificar_429", motivo="429")
+    print(f"   50 llamadas, {len(errores)} errores, {reintentos:.0f} reintentos por 429")
+    return not errores and reintentos > 0
+
+
+async def escenario_deadline() -> bool:
+    servidor = _servidor(latencia="fija:5")
+    llm_resiliencia.POLITICAS["verificar_deadline"] = {"timeout": 0.3, "deadline": 1.0}
+    inicio = time.monotonic()
+    try:
+        await _llamar("verificar_deadline")
+        ok = False
+    except llm_resiliencia.TiempoAgotado:
+        ok = True
+    finally:
+        servidor.should_exit = True
+    duracion = time.monotonic() - inicio
+    print(f"   TiempoAgotado={ok} en {duracion:.2f}s (deadline 1.0s)")
+    return ok and duracion < 1.5
+
+
+async def escenario_circuito() -> bool:
+    servidor = _servidor(tasa_error=1.0)
+    llm_resiliencia.POLITICAS["verificar_circuito"] = {"reintentos": 0}
+    fallos = 0
+    try:
+        for _ in range(llm_resiliencia.LLM_CIRCUITO_UMBRAL):
+            try:
+                await _llamar("verificar_circuito")
+            except Exception:
+                fallos += 1
+        inicio = time.monotonic()
+        try:
+            await _llamar("verificar_circuito")
+            abierto = False
+        except llm_resiliencia.CircuitoAbierto:
+            abierto = True
+        rapido = time.monotonic() - inicio
+    finally:
+        servidor.should_exit = True
+    print(f"   {fallos} fallos -> CircuitoAbierto={abierto} en {rapido * 1000:.1f}ms")
+    return abierto and rapido < 0.05
+
+
+async def escenario_hedging() -> bool:
+    # Latencia lognormal con cola larga: mediana ~0.1s, p99 ~1s
+    servidor = _servidor(latencia="lognormal:-2.3,1.0")
+
+    async def medir(endpoint: str) -> float:
+        latencias = []
+        for i in range(300):
+            inicio = time.monotonic()
+            await _llamar(endpoint, f"ping {i}")
+            latencias.append(time.monotonic() - inicio)
+        latencias.sort()
+        return latencias[int(0.99 * (len(latencias) - 1))]
+
+    try:
+        llm_resiliencia.POLITICAS["verificar_sin_hedging"] = {"hedging": False}
+        llm_resiliencia.POLITICAS["verificar_hedging"] = {"hedging": True}
+        p99_sin = await medir("verificar_sin_hedging")
+        p99_con = await medir("verificar_hedging")
+    finally:
+        servidor.should_exit = True
+    lanzados = metricas.valor_contador("llm_hedging_lanzados_total", endpoint="verificar_hedging")
+    print(f"   p99 sin hedging={p99_sin:.3f}s, con hedging={p99_con:.3f}s ({lanzados:.0f} hedges)")
+    return p99_con < p99_sin
+
+
+async def main() -> bool:
+    escenarios = [
+        ("429 con Retry-After", escenario_429),
+        ("Deadline", escenario_deadline),
+        ("Circuit breaker", escenario_circuito),
+        ("Hedging", escenario_hedging),
+    ]
+    todo_ok = True
+    for nombre, escenario in escenarios:
+        print(f"🧪 {nombre}")
+        ok = await escenario()
+        print(f"   {'✅' if ok else '❌'} {nombre}")
+        todo_ok = todo_ok and ok
+    return todo_ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
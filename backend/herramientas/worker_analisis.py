@@ -0,0 +1,40 @@
+# backend/herramientas/worker_analisis.py
+"""
+Proceso dedicado a la cola de análisis (sin servidor web).
+
+Permite correr la API con COLA_ANALISIS_WORKERS=0 y escalar los workers
+por separado; todos coordinan a través de la tabla trabajos_analisis.
+
+Uso (desde backend/):
+    python -m herramientas.worker_analisis --workers 8
+"""
+import argparse
+import asyncio
+
+from database import Base, engine
+import modelos  # noqa: F401  (registra los modelos)
+from services import cola_analisis, llm_telemetria
+
+
+async def main(workers: int):
+    Base.metadata.create_all(bind=engine, tables=[
+        cola_analisis.TrabajoAnalisis.__table__,
+        modelos.TurnoIdempotente.__table__
+    ])
+    tarea_telemetria = llm_telemetria.iniciar_telemetria()
+    tareas = cola_analisis.iniciar_workers(workers)
+    try:
+        await asyncio.gather(*tareas)
+    finally:
+        await cola_analisis.detener_workers(tareas)
+        await llm_telemetria.detener_telemetria(tarea_telemetria)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Workers de la cola de análisis")
+    parser.add_argument("--workers", type=int, default=cola_analisis.COLA_ANALISIS_WORKERS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.workers))
+    except KeyboardInterrupt:
+        print("👋 Workers detenidos")
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -14,12 +16,43 @@ from routers.archivo_router import router as archivo_router
 from routers.chat_analisis_router import router as chat_analisis_router
 from routers.subtarea_router import router as subtarea_router
 from routers.solicitud_router import router as solicitud_router
+from routers.openai_router import router as openai_router
+from routers.metricas_router import router as metricas_router
+
+from services import cache_llm, catalogo_vendedores, llm_telemetria, cola_analisis, admision, llm_cliente, plantillas_wbs
+
+
+# Tareas de arranque/parada de la aplicación
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Conexiones (TLS) al proveedor del modelo abiertas antes del primer request
+    tarea_conexiones = asyncio.create_task(llm_cliente.calentar_conexiones())
+    # Borrar respuestas cacheadas de prompts que cambiaron de versión
+    await cache_llm.purgar_versiones_obsoletas()
+    # Catálogo de criterios de vendedores en memoria (regenera faltantes en segundo plano)
+    tarea_catalogo = await catalogo_vendedores.iniciar_catalogo()
+    # Índice de análisis terminados para sugerir plantillas de WBS
+    await plantillas_wbs.iniciar_indice()
+    # Volcado periódico de la telemetría de llamadas al modelo (tabla uso_llm)
+    tarea_telemetria = llm_telemetria.iniciar_telemetria()
+    # Workers de la cola de análisis (COLA_ANALISIS_WORKERS=0 para no procesarla aquí)
+    workers_analisis = cola_analisis.iniciar_workers()
+    yield
+    await cola_analisis.detener_workers(workers_analisis)
+    if tarea_catalogo and not tarea_catalogo.done():
+        tarea_catalogo.cancel()
+    await llm_telemetria.detener_telemetria(tarea_telemetria)
+    if not tarea_conexiones.done():
+        tarea_conexiones.cancel()
+    await llm_cliente.cerrar_conexiones()
+
 
 # Crear instancia de FastAPI
 app = FastAPI(
     title="Conecta Solutions API",
     description="Plataforma de gestión de proyectos con análisis IA",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Permitir peticiones desde frontend
@@ -31,6 +64,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Identifica por IP a quien llama al modelo sin cliente_id (reparto justo, ver services/admision)
+app.add_middleware(admision.MiddlewareSolicitante)
+
 # Crear tablas en la base de datos
 print("Creando tablas en la base de datos...")
 Base.metadata.create_all(bind=engine)
@@ -46,6 +82,8 @@ app.include_router(chat_router)  # ✅ AGREGAR ESTA LÍNEA
 app.include_router(chat_analisis_router)
 app.include_router(subtarea_router)
 app.include_router(solicitud_router)
+app.include_router(openai_router)
+app.include_router(metricas_router)
 
 # Ruta de prueba
 @app.get("/")
@@ -8,7 +8,15 @@ from .requerimiento_model import Requerimiento, EstadoRequerimiento, Especialida
 from .proyecto_modelo import Proyecto, EstadoProyecto, FaseProyecto, SubTarea, EstadoSubTarea  # 🔥 SubTarea desde aquí
 from .conversacion_chat_modelo import ConversacionChat, TipoConversacion, EmisorMensaje
 from .analisis_ia_modelo import AnalisisIA
+from .transcripcion_modelo import TranscripcionAnalisis
+from .resumen_analisis_modelo import ResumenAnalisis
 from .mensaje_modelo import MensajeChat
+from .cache_llm_modelo import RespuestaLLMCache
+from .mejora_analisis_modelo import MejoraAnalisis
+from .catalogo_vendedores_modelo import CriteriosVendedorCatalogo
+from .uso_llm_modelo import UsoLLM
+from .trabajo_analisis_modelo import TrabajoAnalisis, EstadoTrabajo, OrigenTrabajo
+from .turno_idempotente_modelo import TurnoIdempotente
 # from .archivo_modelo import Archivo  # 🔥 COMENTADO si no existe
 
 __all__ = [
@@ -38,10 +46,24 @@ __all__ = [
     "ConversacionChat",
     "TipoConversacion",
     "EmisorMensaje",
+    "TranscripcionAnalisis",
+    "ResumenAnalisis",
+    "TrabajoAnalisis",
+    "EstadoTrabajo",
+    "OrigenTrabajo",
+    "TurnoIdempotente",
     
     # Análisis IA
     "AnalisisIA",
     
     # Mensajes
     "MensajeChat",
+    
+    # Cache de respuestas IA
+    "RespuestaLLMCache",
+    "CriteriosVendedorCatalogo",
+    "MejoraAnalisis",
+    
+    # Telemetría IA
+    "UsoLLM",
 ]
\ No newline at end of file
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from database import Base
+from datetime import datetime
+
+class RespuestaLLMCache(Base):
+    """
+    Nivel persistente de la cache de respuestas del modelo.
+    `clave` = sha256(plantilla, versión, entrada normalizada, parámetros).
+    Leer no escribe: los aciertos se cuentan en las métricas.
+    """
+    __tablename__ = "cache_respuestas_llm"
+
+    clave = Column(String(64), primary_key=True)
+    plantilla = Column(String(100), nullable=False, index=True)
+    version = Column(String(20), nullable=False)
+    modelo = Column(String(100), nullable=False)
+    respuesta = Column(JSON, nullable=False)
+    tokens = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expira_en = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<RespuestaLLMCache(plantilla='{self.plantilla}', version='{self.version}')>"
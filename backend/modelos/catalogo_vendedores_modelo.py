@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, UniqueConstraint
+from database import Base
+from datetime import datetime
+
+class CriteriosVendedorCatalogo(Base):
+    """
+    Criterios de selección de vendedores precalculados para cada
+    combinación (especialidad, complejidad) y versión del prompt.
+    """
+    __tablename__ = "catalogo_criterios_vendedor"
+    __table_args__ = (
+        UniqueConstraint("especialidad", "complejidad", "version", name="uq_catalogo_criterios"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    especialidad = Column(String(100), nullable=False)
+    complejidad = Column(String(20), nullable=False)
+    version = Column(String(20), nullable=False, index=True)
+    sugerencias = Column(JSON, nullable=False)
+    tokens = Column(Integer, default=0, nullable=False)
+    generado_en = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CriteriosVendedorCatalogo(especialidad='{self.especialidad}', complejidad='{self.complejidad}', version='{self.version}')>"
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, DateTime, JSON
+from database import Base
+from datetime import datetime
+
+class MejoraAnalisis(Base):
+    """
+    Análisis del modelo que llegó después del plazo (services.analisis_con_plazo).
+    Se guarda en la base para que GET /analizar-requerimiento/mejora/{analisis_id}
+    lo encuentre desde cualquier worker, no solo desde el que hizo la llamada.
+    `estado`: "pendiente", "lista" o "fallida".
+    """
+    __tablename__ = "mejoras_analisis"
+
+    analisis_id = Column(String(32), primary_key=True)
+    estado = Column(String(20), nullable=False)
+    resultado = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expira_en = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<MejoraAnalisis(analisis_id='{self.analisis_id}', estado='{self.estado}')>"
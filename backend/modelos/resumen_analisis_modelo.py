@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, JSON
+from database import Base
+from datetime import datetime
+
+class ResumenAnalisis(Base):
+    """
+    Resumen estructurado y acumulativo de los turnos más antiguos de la
+    conversación de análisis. `turnos_resumidos` indica cuántos mensajes
+    (desde el inicio) ya están incorporados en `resumen`.
+    """
+    __tablename__ = "resumenes_analisis"
+
+    proyecto_id = Column(Integer, ForeignKey("proyectos.id", ondelete="CASCADE"), primary_key=True)
+    resumen = Column(JSON, nullable=False)
+    turnos_resumidos = Column(Integer, default=0, nullable=False)
+    tokens_resumen = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ResumenAnalisis(proyecto_id={self.proyecto_id}, turnos_resumidos={self.turnos_resumidos})>"
@@ -0,0 +1,54 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, JSON, Index
+from database import Base
+from datetime import datetime
+import enum
+
+class EstadoTrabajo(str, enum.Enum):
+    PENDIENTE = "PENDIENTE"
+    EN_PROCESO = "EN_PROCESO"
+    COMPLETADO = "COMPLETADO"
+    FALLIDO = "FALLIDO"
+
+class OrigenTrabajo(str, enum.Enum):
+    COLA = "COLA"          # encolado con /continuar/trabajo, lo procesa un worker
+    DIRECTO = "DIRECTO"    # turno de un endpoint síncrono o de streaming, lo ejecuta el propio request
+
+class TrabajoAnalisis(Base):
+    """
+    Fila (en Postgres) de turnos del chat de análisis, en orden por proyecto.
+    Los de origen COLA los reclama un worker con SELECT ... FOR UPDATE SKIP
+    LOCKED, llama al modelo, persiste el turno y deja la respuesta del endpoint
+    en `resultado`; si el worker muere, vuelven a reclamarse al vencer
+    `bloqueado_hasta`. Los DIRECTO solo guardan el lugar y el resultado de un
+    turno que ejecuta el request (ver services.coordinacion_turnos); si su
+    proceso muere, al vencer `bloqueado_hasta` dejan de contar en la fila.
+    """
+    __tablename__ = "trabajos_analisis"
+
+    id = Column(Integer, primary_key=True, index=True)
+    proyecto_id = Column(Integer, ForeignKey("proyectos.id", ondelete="CASCADE"), nullable=False)
+    cliente_id = Column(Integer, nullable=False)
+    mensaje = Column(Text, nullable=False)
+    origen = Column(Enum(OrigenTrabajo), default=OrigenTrabajo.COLA, nullable=False)
+    clave_cliente = Column(String(150), nullable=True)  # Idempotency-Key
+    estado = Column(Enum(EstadoTrabajo), default=EstadoTrabajo.PENDIENTE, nullable=False)
+    intentos = Column(Integer, default=0, nullable=False)
+    max_intentos = Column(Integer, default=3, nullable=False)
+    resultado = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    codigo_http = Column(Integer, nullable=True)
+    worker = Column(String(100), nullable=True)
+    disponible_en = Column(DateTime, default=datetime.utcnow, nullable=False)
+    bloqueado_hasta = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    iniciado_en = Column(DateTime, nullable=True)
+    terminado_en = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_trabajos_analisis_estado_disponible", "estado", "disponible_en"),
+        Index("ix_trabajos_analisis_proyecto_estado", "proyecto_id", "estado"),
+        Index("ix_trabajos_analisis_proyecto_clave", "proyecto_id", "clave_cliente"),
+    )
+
+    def __repr__(self):
+        return f"<TrabajoAnalisis(id={self.id}, proyecto_id={self.proyecto_id}, estado='{self.estado}')>"
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, LargeBinary, DateTime, ForeignKey, JSON
+from database import Base
+from datetime import datetime
+
+class TranscripcionAnalisis(Base):
+    """
+    Transcripción comprimida (solo-anexar) de la conversación de análisis IA
+    de un proyecto. Cada turno es un bloque zlib independiente dentro de
+    `datos`; `indice` guarda por turno: desplazamiento, longitud, emisor,
+    timestamp y metadatos.
+    """
+    __tablename__ = "transcripciones_analisis"
+
+    proyecto_id = Column(Integer, ForeignKey("proyectos.id", ondelete="CASCADE"), primary_key=True)
+    cliente_id = Column(Integer, ForeignKey("usuarios.id", ondelete="CASCADE"), nullable=False)
+    formato = Column(Integer, default=1, nullable=False)
+    datos = Column(LargeBinary, nullable=False, default=b"")
+    indice = Column(JSON, nullable=False, default=list)
+    total_turnos = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TranscripcionAnalisis(proyecto_id={self.proyecto_id}, turnos={self.total_turnos})>"
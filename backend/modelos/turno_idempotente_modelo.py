@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from database import Base
+from datetime import datetime
+
+class TurnoIdempotente(Base):
+    """
+    Respuesta guardada de un turno del chat de análisis, por clave de idempotencia.
+    Un reintento del mismo turno (doble clic, reintento del frontend) devuelve
+    esta respuesta en vez de volver a llamar al modelo.
+    `huella` es el hash del mensaje: la misma clave con otro mensaje es un error.
+    """
+    __tablename__ = "turnos_idempotentes"
+
+    clave = Column(String(200), primary_key=True)
+    proyecto_id = Column(Integer, ForeignKey("proyectos.id", ondelete="CASCADE"), nullable=False, index=True)
+    huella = Column(String(64), nullable=False)
+    respuesta = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<TurnoIdempotente(clave='{self.clave}', proyecto_id={self.proyecto_id})>"
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Index
+from database import Base
+from datetime import datetime
+
+class UsoLLM(Base):
+    """
+    Una fila por llamada al modelo: latencia, tokens (prompt, completion y
+    prompt cacheado), costo estimado, modelo y endpoint. Base de los
+    rollups por cliente/día y de los presupuestos de tokens.
+    """
+    __tablename__ = "uso_llm"
+
+    id = Column(Integer, primary_key=True, index=True)
+    endpoint = Column(String(100), nullable=False, index=True)
+    modelo = Column(String(100), nullable=True)
+    cliente_id = Column(Integer, nullable=True)
+    proyecto_id = Column(Integer, nullable=True, index=True)
+    tokens_prompt = Column(Integer, default=0, nullable=False)
+    tokens_completion = Column(Integer, default=0, nullable=False)
+    tokens_cacheados = Column(Integer, default=0, nullable=False)
+    total_tokens = Column(Integer, default=0, nullable=False)
+    costo_usd = Column(Float, default=0.0, nullable=False)
+    latencia_ms = Column(Integer, nullable=False)
+    streaming = Column(Boolean, default=False, nullable=False)
+    exito = Column(Boolean, default=True, nullable=False)
+    error = Column(String(200), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_uso_llm_cliente_fecha", "cliente_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<UsoLLM(endpoint='{self.endpoint}', cliente_id={self.cliente_id}, total_tokens={self.total_tokens})>"
@@ -1,21 +1,27 @@
 # backend/routers/chat_analisis_router.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-from datetime import datetime
+from anyio import from_thread
+import asyncio
 
-from database import get_db
+from database import get_db, SessionLocal
 from services.chat_analisis_service import (
     chat_analisis_proyecto,
-    refinar_subtareas,
-    generar_resumen_ejecutivo,
+    chat_analisis_proyecto_stream,
     ESPECIALIDADES_DETALLADAS
 )
 from modelos.proyecto_modelo import Proyecto, FaseProyecto
-from modelos.proyecto_modelo import SubTarea, EstadoSubTarea
-from modelos.conversacion_chat_modelo import ConversacionChat, EmisorMensaje, TipoConversacion
-from modelos.analisis_ia_modelo import AnalisisIA
+from modelos.proyecto_modelo import SubTarea
+from modelos.conversacion_chat_modelo import EmisorMensaje
+from services.transcripcion_service import TranscripcionService
+from services.turno_analisis_service import cargar_turno, guardar_turno
+from services.sse import evento_sse, CABECERAS_SSE
+from services import cola_analisis, coordinacion_turnos, reanalisis_service
+from services.llm_cliente import cabeceras_reintento
 
 router = APIRouter(
     prefix="/chat-analisis",
@@ -42,6 +48,10 @@ class ContinuarAnalisisRequest(BaseModel):
     proyecto_id: int
     mensaje: str
 
+class ReanalizarRequest(BaseModel):
+    proyecto_id: int
+    cambios: str  # cambios de alcance en lenguaje natural
+
 class PublicarProyectoRequest(BaseModel):
     proyecto_id: int
 
@@ -73,51 +83,60 @@ def iniciar_analisis(
         
         print(f"✅ Proyecto {nuevo_proyecto.id} creado en fase ANÁLISIS")
         
-        mensaje_cliente = ConversacionChat(
-            proyecto_id=nuevo_proyecto.id,
-            cliente_id=data.cliente_id,
-            tipo=TipoConversacion.ANALISIS,
-            mensaje=data.mensaje_inicial,
-            emisor=EmisorMensaje.CLIENTE
-        )
-        db.add(mensaje_cliente)
+        TranscripcionService.agregar_turnos(db, nuevo_proyecto.id, data.cliente_id, [
+            {"emisor": EmisorMensaje.CLIENTE, "mensaje": data.mensaje_inicial}
+        ])
         db.commit()
         
         historial = [
             {"role": "user", "content": data.mensaje_inicial}
         ]
         
-        resultado = chat_analisis_proyecto(historial, data.cliente_id)
+        # El endpoint corre en el threadpool; la llamada al modelo se ejecuta en el event loop
+        resultado = from_thread.run(
+            chat_analisis_proyecto, historial, data.cliente_id, None, nuevo_proyecto.id
+        )
         
         if not resultado["exito"]:
-            raise HTTPException(status_code=500, detail=resultado.get("error", "Error en análisis"))
+            raise HTTPException(
+                status_code=resultado.get("codigo_http", 500),
+                detail=resultado.get("error", "Error en análisis"),
+                headers=cabeceras_reintento(resultado)
+            )
         
-        mensaje_ia = ConversacionChat(
-            proyecto_id=nuevo_proyecto.id,
-            cliente_id=data.cliente_id,
-            tipo=TipoConversacion.ANALISIS,
-            mensaje=resultado["respuesta"],
-            emisor=EmisorMensaje.IA,
-            metadatos={
-                "tokens_usados": resultado.get("tokens_usados"),
-                "costo": resultado.get("costo_estimado")
+        TranscripcionService.agregar_turnos(db, nuevo_proyecto.id, data.cliente_id, [
+            {
+                "emisor": EmisorMensaje.IA,
+                "mensaje": resultado["respuesta"],
+                "metadatos": {
+                    "tokens_usados": resultado.get("tokens_usados"),
+                    "costo": resultado.get("costo_estimado")
+                }
             }
-        )
-        db.add(mensaje_ia)
+        ])
         db.commit()
         
         print(f"💬 Conversación iniciada - {resultado.get('tokens_usados')} tokens")
         
-        return {
+        respuesta = {
             "exito": True,
             "proyecto_id": nuevo_proyecto.id,
             "respuesta_ia": resultado["respuesta"],
             "finalizado": False,
             "tokens_usados": resultado.get("tokens_usados")
         }
+        # WBS de un proyecto terminado parecido, como punto de partida (plantillas_wbs)
+        if resultado.get("plantilla"):
+            respuesta["plantilla_sugerida"] = resultado["plantilla"]
+        return respuesta
         
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
+        if 'nuevo_proyecto' in locals() and nuevo_proyecto.id:
+            TranscripcionService.invalidar(nuevo_proyecto.id)
         print(f"❌ Error iniciando análisis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -125,146 +144,273 @@ def iniciar_analisis(
 @router.post("/continuar")
 def continuar_analisis(
     data: ContinuarAnalisisRequest,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     Continúa el análisis de un proyecto existente.
+    Turnos idénticos simultáneos comparten una llamada al modelo (también entre
+    workers), uno distinto mientras otro está en curso espera su lugar en la
+    fila del proyecto (409 con Retry-After solo si la espera se agota) y un
+    reintento con la misma Idempotency-Key devuelve la respuesta guardada
+    (ver services.coordinacion_turnos).
     """
-    try:
-        proyecto = db.query(Proyecto).filter(Proyecto.id == data.proyecto_id).first()
-        if not proyecto:
-            raise HTTPException(status_code=404, detail="Proyecto no encontrado")
-        
-        if proyecto.fase != FaseProyecto.ANALISIS:
-            raise HTTPException(status_code=400, detail="El proyecto ya no está en fase de análisis")
-        
-        mensajes_db = db.query(ConversacionChat).filter(
-            ConversacionChat.proyecto_id == data.proyecto_id,
-            ConversacionChat.tipo == TipoConversacion.ANALISIS
-        ).order_by(ConversacionChat.timestamp).all()
+    def turno(claves):
+        proyecto, historial, resumen_previo = cargar_turno(db, data.proyecto_id, data.mensaje)
+        coordinacion_turnos.soltar_conexion(db)
         
-        historial = []
-        for msg in mensajes_db:
-            role = "user" if msg.emisor == EmisorMensaje.CLIENTE else "assistant"
-            historial.append({"role": role, "content": msg.mensaje})
-        
-        historial.append({"role": "user", "content": data.mensaje})
+        print(f"💬 Continuando análisis - {len(historial)} mensajes en historial")
         
-        mensaje_cliente = ConversacionChat(
-            proyecto_id=proyecto.id,
-            cliente_id=proyecto.cliente_id,
-            tipo=TipoConversacion.ANALISIS,
-            mensaje=data.mensaje,
-            emisor=EmisorMensaje.CLIENTE
+        resultado = from_thread.run(
+            chat_analisis_proyecto, historial, proyecto.cliente_id, resumen_previo, proyecto.id
         )
-        db.add(mensaje_cliente)
         
-        print(f"💬 Continuando análisis - {len(historial)} mensajes en historial")
+        if not resultado["exito"]:
+            raise HTTPException(
+                status_code=resultado.get("codigo_http", 500), detail=resultado.get("error"),
+                headers=cabeceras_reintento(resultado)
+            )
         
-        resultado = chat_analisis_proyecto(historial, proyecto.cliente_id)
+        return guardar_turno(db, proyecto, data.mensaje, resultado, claves)
+    
+    try:
+        return coordinacion_turnos.ejecutar_unico(db, data.proyecto_id, data.mensaje, idempotency_key, turno)
         
-        if not resultado["exito"]:
-            raise HTTPException(status_code=500, detail=resultado.get("error"))
+    except HTTPException:
+        db.rollback()
+        TranscripcionService.invalidar(data.proyecto_id)
+        raise
+    except Exception as e:
+        db.rollback()
+        TranscripcionService.invalidar(data.proyecto_id)
+        print(f"❌ Error continuando análisis: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/reanalizar")
+def reanalizar_proyecto(
+    data: ReanalizarRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Re-análisis incremental: envía al modelo el WBS vigente y los cambios de
+    alcance, y aplica como diff solo los nodos modificados, nuevos y
+    eliminados (las sub-tareas ya asignadas no se tocan). Registra una nueva
+    versión de AnalisisIA. Misma fila e idempotencia que /continuar.
+    """
+    if not data.cambios or not data.cambios.strip():
+        raise HTTPException(status_code=400, detail="Debe describir los cambios de alcance")
+    
+    # Prefijo: que no comparta claves de idempotencia con un turno de chat idéntico
+    mensaje = f"[reanalisis] {data.cambios}"
+    
+    def turno(claves):
+        wbs = reanalisis_service.cargar_wbs(db, data.proyecto_id)
+        mensaje_usuario = reanalisis_service.mensaje_wbs(wbs, data.cambios)
+        coordinacion_turnos.soltar_conexion(db)
         
-        mensaje_ia = ConversacionChat(
-            proyecto_id=proyecto.id,
-            cliente_id=proyecto.cliente_id,
-            tipo=TipoConversacion.ANALISIS,
-            mensaje=resultado["respuesta"],
-            emisor=EmisorMensaje.IA,
-            metadatos={
-                "tokens_usados": resultado.get("tokens_usados"),
-                "finalizado": resultado.get("finalizado")
-            }
+        resultado = from_thread.run(
+            reanalisis_service.pedir_cambios, mensaje_usuario, wbs["proyecto"].cliente_id, data.proyecto_id
         )
-        db.add(mensaje_ia)
         
-        # Si finalizó, crear sub-tareas y análisis
-        if resultado.get("finalizado"):
-            proyecto_data = resultado["proyecto"]
-            
-            refinado = refinar_subtareas(proyecto_data)
-            if not refinado["exito"]:
-                raise HTTPException(status_code=500, detail="Error refinando sub-tareas")
-            
-            proyecto_data = refinado["proyecto"]
-            
-            # Actualizar proyecto
-            proyecto.titulo = proyecto_data["titulo"]
-            proyecto.descripcion = proyecto_data["descripcion_completa"]
-            proyecto.historia_usuario = proyecto_data["historia_usuario"]
-            proyecto.criterios_aceptacion = proyecto_data["criterios_aceptacion"]
-            proyecto.presupuesto = float(proyecto_data["presupuesto_estimado"])
-            proyecto.total_subtareas = len(proyecto_data["subtareas"])
-            proyecto.fase = FaseProyecto.ANALISIS
-            
-            # Crear análisis IA
-            analisis = AnalisisIA(
-                proyecto_id=proyecto.id,
-                version=1,
-                analisis_completo=proyecto_data,
-                especialidades_detectadas=[t["especialidad"] for t in proyecto_data["subtareas"]],
-                presupuesto_estimado=float(proyecto_data["presupuesto_estimado"]),
-                tiempo_estimado_dias=proyecto_data["tiempo_estimado_dias"],
-                completado=True
+        if not resultado["exito"]:
+            raise HTTPException(
+                status_code=resultado.get("codigo_http", 500), detail=resultado.get("error"),
+                headers=cabeceras_reintento(resultado)
             )
-            db.add(analisis)
-            
-            # Crear sub-tareas con códigos únicos
-            for i, tarea_data in enumerate(proyecto_data["subtareas"]):
-                prioridad = tarea_data.get("prioridad", "MEDIA").upper()
-                if prioridad not in ["ALTA", "MEDIA", "BAJA"]:
-                    prioridad = "MEDIA"
-                
-                codigo_unico = f"P{proyecto.id}-TASK-{(i+1):03d}"
-                
-                subtarea = SubTarea(
-                    proyecto_id=proyecto.id,
-                    codigo=codigo_unico,
-                    titulo=tarea_data["titulo"],
-                    descripcion=tarea_data["descripcion"],
-                    especialidad=tarea_data["especialidad"],
-                    estado=EstadoSubTarea.PENDIENTE,
-                    prioridad=prioridad,
-                    estimacion_horas=tarea_data["estimacion_horas"]
-                )
-                db.add(subtarea)
-            
-            db.commit()
-            db.refresh(proyecto)
-            
-            print(f"✅ Análisis completado - {len(proyecto_data['subtareas'])} sub-tareas creadas")
-            
-            resumen = generar_resumen_ejecutivo(proyecto_data)
-            
-            return {
-                "exito": True,
-                "respuesta_ia": resultado["respuesta"],
-                "finalizado": True,
-                "proyecto_id": proyecto.id,
-                "proyecto": proyecto_data,
-                "resumen": resumen,
-                "tokens_usados": resultado.get("tokens_usados")
-            }
         
-        else:
-            db.commit()
-            
-            return {
-                "exito": True,
-                "respuesta_ia": resultado["respuesta"],
-                "finalizado": False,
-                "tokens_usados": resultado.get("tokens_usados")
-            }
+        return reanalisis_service.aplicar_cambios(db, wbs, data.cambios, resultado, mensaje, claves)
+    
+    try:
+        return coordinacion_turnos.ejecutar_unico(db, data.proyecto_id, mensaje, idempotency_key, turno)
         
     except HTTPException:
+        db.rollback()
+        TranscripcionService.invalidar(data.proyecto_id)
         raise
     except Exception as e:
         db.rollback()
-        print(f"❌ Error continuando análisis: {e}")
+        TranscripcionService.invalidar(data.proyecto_id)
+        print(f"❌ Error en re-análisis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/continuar/stream")
+async def continuar_analisis_stream(
+    data: ContinuarAnalisisRequest,
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    Igual que /continuar pero envía la respuesta de la IA como server-sent events:
+    `inicio`, `token` por cada fragmento y `fin` con el mismo cuerpo que /continuar
+    (una vez persistido el turno). Los fallos llegan como evento `error`.
+    Si el análisis finaliza llegan además `finalizado` (en cuanto el modelo lo
+    indica) y `subtarea` por cada sub-tarea ya validada, antes del `fin`.
+    Con el WBS en dos etapas, las sub-tareas llegan como esqueleto y luego
+    `detalle` con cada una completa a medida que termina su llamada.
+    `reinicio` indica que la respuesta se cortó y se repite con el modelo de
+    análisis: hay que descartar los tokens y sub-tareas recibidos hasta ahí.
+    Un turno repetido o idéntico a uno en curso recibe solo el evento `fin`.
+    La espera en la fila del proyecto ocurre antes de abrir el stream.
+    """
+    lugar = await run_in_threadpool(coordinacion_turnos.entrar, data.proyecto_id, data.mensaje, idempotency_key)
+    if not lugar.lider:
+        async def compartido():
+            try:
+                yield evento_sse("fin", await lugar.esperar_resultado_async())
+            except Exception as e:
+                detalle = e.detail if isinstance(e, HTTPException) else str(e)
+                yield evento_sse("error", {"detail": detalle})
+        
+        return StreamingResponse(compartido(), media_type="text/event-stream", headers=CABECERAS_SSE)
+    
+    # Sesión y lugar propios: deben vivir hasta que termine el stream
+    db = SessionLocal()
+    try:
+        await lugar.esperar_lugar_async()
+        claves, guardada = await run_in_threadpool(
+            coordinacion_turnos.preparar_turno, db, data.proyecto_id, data.mensaje, idempotency_key
+        )
+        if guardada is None:
+            proyecto, historial, resumen_previo = await run_in_threadpool(cargar_turno, db, data.proyecto_id, data.mensaje)
+            await run_in_threadpool(coordinacion_turnos.soltar_conexion, db)
+    except BaseException as e:
+        await run_in_threadpool(lugar.terminar, None, e)
+        await run_in_threadpool(db.close)
+        raise
+    
+    if guardada is not None:
+        await run_in_threadpool(lugar.terminar, guardada)
+        await run_in_threadpool(db.close)
+        
+        async def repetido():
+            yield evento_sse("fin", guardada)
+        
+        return StreamingResponse(repetido(), media_type="text/event-stream", headers=CABECERAS_SSE)
+    
+    print(f"💬 Continuando análisis (stream) - {len(historial)} mensajes en historial")
+    
+    async def eventos():
+        try:
+            async for evento in chat_analisis_proyecto_stream(
+                historial, proyecto.cliente_id, resumen_previo, proyecto.id
+            ):
+                if evento["tipo"] == "token":
+                    yield evento_sse("token", {"contenido": evento["contenido"]})
+                elif evento["tipo"] == "inicio":
+                    yield evento_sse("inicio", {"proyecto_id": data.proyecto_id, "json": evento["json"]})
+                elif evento["tipo"] == "finalizado":
+                    yield evento_sse("finalizado", {"proyecto_id": data.proyecto_id})
+                elif evento["tipo"] == "subtarea":
+                    yield evento_sse("subtarea", {"indice": evento["indice"], "subtarea": evento["subtarea"]})
+                elif evento["tipo"] == "detalle":
+                    yield evento_sse("detalle", {"indice": evento["indice"], "subtarea": evento["subtarea"]})
+                elif evento["tipo"] == "reinicio":
+                    yield evento_sse("reinicio", {"proyecto_id": data.proyecto_id})
+                else:
+                    resultado = evento["resultado"]
+                    if not resultado["exito"]:
+                        codigo = resultado.get("codigo_http", 500)
+                        await run_in_threadpool(lugar.terminar, None, HTTPException(
+                            status_code=codigo, detail=resultado.get("error"), headers=cabeceras_reintento(resultado)
+                        ))
+                        yield evento_sse("error", {
+                            "detail": resultado.get("error"), "codigo": codigo, "reintentar_en": resultado.get("reintentar_en")
+                        })
+                        return
+                    respuesta = await run_in_threadpool(guardar_turno, db, proyecto, data.mensaje, resultado, claves)
+                    await run_in_threadpool(lugar.terminar, respuesta)
+                    yield evento_sse("fin", respuesta)
+        except Exception as e:
+            await run_in_threadpool(db.rollback)
+            await run_in_threadpool(lugar.terminar, None, e)
+            TranscripcionService.invalidar(data.proyecto_id)
+            print(f"❌ Error continuando análisis (stream): {e}")
+            detalle = e.detail if isinstance(e, HTTPException) else str(e)
+            yield evento_sse("error", {"detail": detalle})
+        finally:
+            # Si el cliente cortó el stream, los turnos que esperaban este no quedan colgados
+            await run_in_threadpool(
+                lugar.terminar, None, HTTPException(status_code=503, detail="El turno se interrumpió antes de terminar")
+            )
+            await run_in_threadpool(db.close)
+    
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=CABECERAS_SSE)
+
+
+@router.post("/continuar/trabajo", status_code=202)
+def continuar_analisis_trabajo(
+    data: ContinuarAnalisisRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Encola el turno como trabajo y responde de inmediato con su id.
+    El resultado (mismo cuerpo que /continuar) se obtiene con
+    GET /trabajos/{id} o en vivo con GET /trabajos/{id}/eventos.
+    Un reintento con la misma Idempotency-Key devuelve el mismo trabajo.
+    """
+    trabajo = cola_analisis.encolar(db, data.proyecto_id, data.mensaje, idempotency_key)
+    return {
+        "exito": True,
+        "trabajo_id": trabajo.id,
+        "estado": trabajo.estado.value,
+        "url_estado": f"/chat-analisis/trabajos/{trabajo.id}",
+        "url_eventos": f"/chat-analisis/trabajos/{trabajo.id}/eventos"
+    }
+
+
+@router.get("/trabajos/{trabajo_id}")
+def obtener_trabajo(trabajo_id: int):
+    """
+    Estado de un trabajo de análisis; cuando está COMPLETADO trae el resultado.
+    """
+    trabajo = cola_analisis.obtener(trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return {"exito": True, **trabajo}
+
+
+@router.get("/trabajos/{trabajo_id}/eventos")
+async def eventos_trabajo(trabajo_id: int):
+    """
+    Server-sent events de un trabajo: `estado`, `inicio`, `token` (si el worker
+    corre en este proceso), `reintento`, y al final `fin` o `error`.
+    """
+    cola = cola_analisis.suscribir(trabajo_id)
+    trabajo = await run_in_threadpool(cola_analisis.obtener, trabajo_id)
+    if trabajo is None:
+        cola_analisis.desuscribir(trabajo_id, cola)
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    
+    async def eventos():
+        actual = trabajo
+        try:
+            while True:
+                if actual["estado"] == "COMPLETADO":
+                    yield evento_sse("fin", actual["resultado"])
+                    return
+                if actual["estado"] == "FALLIDO":
+                    yield evento_sse("error", {"detail": actual["error"], "codigo": actual["codigo_http"]})
+                    return
+                yield evento_sse("estado", {"trabajo_id": trabajo_id, "estado": actual["estado"]})
+                
+                try:
+                    while True:
+                        evento, datos = await asyncio.wait_for(cola.get(), cola_analisis.COLA_INTERVALO_SEGUNDOS * 2)
+                        yield evento_sse(evento, datos)
+                        if evento in ("fin", "error"):
+                            return
+                except asyncio.TimeoutError:
+                    # Sin eventos locales: el worker puede estar en otro proceso
+                    actual = await run_in_threadpool(cola_analisis.obtener, trabajo_id)
+        finally:
+            cola_analisis.desuscribir(trabajo_id, cola)
+    
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=CABECERAS_SSE)
+
+
 @router.post("/publicar")
 def publicar_proyecto(
     data: PublicarProyectoRequest,
@@ -316,23 +462,21 @@ def obtener_historial_conversacion(
     Obtiene todo el historial de conversación.
     """
     try:
-        mensajes = db.query(ConversacionChat).filter(
-            ConversacionChat.proyecto_id == proyecto_id,
-            ConversacionChat.tipo == TipoConversacion.ANALISIS
-        ).order_by(ConversacionChat.timestamp).all()
+        turnos = TranscripcionService.obtener_turnos(db, proyecto_id)
+        db.commit()  # persiste la migración de filas antiguas, si la hubo
         
         return {
             "exito": True,
-            "total_mensajes": len(mensajes),
+            "total_mensajes": len(turnos),
             "mensajes": [
                 {
-                    "id": m.id,
-                    "emisor": m.emisor,
-                    "mensaje": m.mensaje,
-                    "timestamp": m.timestamp,
-                    "metadatos": m.metadatos
+                    "id": i + 1,
+                    "emisor": t["emisor"],
+                    "mensaje": t["mensaje"],
+                    "timestamp": t["timestamp"],
+                    "metadatos": t["metadatos"]
                 }
-                for m in mensajes
+                for i, t in enumerate(turnos)
             ]
         }
         
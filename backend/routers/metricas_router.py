@@ -0,0 +1,91 @@
+# backend/routers/metricas_router.py
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+
+from database import get_db
+from services import metricas, llm_resiliencia, llm_telemetria
+
+router = APIRouter(prefix="/metricas", tags=["Métricas"])
+
+
+@router.get("", response_class=PlainTextResponse)
+def exportar_metricas():
+    """
+    Métricas del proceso en formato de texto de Prometheus.
+    """
+    return metricas.formato_prometheus()
+
+
+@router.get("/json")
+def exportar_metricas_json():
+    """
+    Las mismas métricas en JSON (para depurar).
+    """
+    return metricas.snapshot()
+
+
+@router.get("/llm")
+def estado_llm():
+    """
+    Estado del circuit breaker y p95 de latencia por endpoint del modelo.
+    """
+    return llm_resiliencia.estado()
+
+
+@router.get("/uso")
+def uso_llm(
+    agrupar: str = "dia",
+    cliente_id: Optional[int] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Tokens, costo y latencia de las llamadas al modelo agrupados por
+    cliente, dia, endpoint, modelo o cliente_dia.
+    """
+    if agrupar not in llm_telemetria.AGRUPACIONES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"agrupar debe ser uno de: {', '.join(llm_telemetria.AGRUPACIONES)}"
+        )
+    llm_telemetria.volcar_pendientes()
+    return {
+        "exito": True,
+        "agrupar": agrupar,
+        "filas": llm_telemetria.resumen_uso(db, agrupar, cliente_id, desde, hasta)
+    }
+
+
+@router.get("/cache-prompts")
+def cache_prompts(
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Tasa de aciertos del cache de prompts del proveedor por endpoint, con el
+    costo de entrada ahorrado y la latencia / primer token con y sin cache.
+    """
+    llm_telemetria.volcar_pendientes()
+    return {"exito": True, "endpoints": llm_telemetria.reporte_cache(db, desde, hasta)}
+
+
+@router.get("/uso/cliente/{cliente_id}")
+async def presupuesto_cliente(cliente_id: int):
+    """
+    Consumo de tokens del día y estado del presupuesto de un cliente.
+    """
+    consumidos = await llm_telemetria.consumo_del_dia(cliente_id)
+    return {
+        "exito": True,
+        "cliente_id": cliente_id,
+        "tokens_hoy": consumidos,
+        "presupuesto_suave": llm_telemetria.PRESUPUESTO_TOKENS_SUAVE,
+        "presupuesto_duro": llm_telemetria.PRESUPUESTO_TOKENS_DURO,
+        "estado": llm_telemetria.estado_presupuesto(consumidos)
+    }
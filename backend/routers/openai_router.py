@@ -1,14 +1,24 @@
 # backend/routers/openai_router.py
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from services.openai_service import analizar_requerimiento, sugerir_vendedores, chat_requerimiento  # 🔥 AGREGAR AQUÍ
-from typing import List
+from services.openai_service import sugerir_vendedores, chat_requerimiento  # 🔥 AGREGAR AQUÍ
+from services.openai_service import chat_requerimiento_stream
+from services.sse import evento_sse, linea_ndjson, CABECERAS_SSE
+from services import cache_llm, lote_requerimientos, analisis_con_plazo
+from services.llm_cliente import cabeceras_reintento
+from typing import List, Optional
 
 router = APIRouter(prefix="/api/openai", tags=["OpenAI"])
 
 class RequerimientoAnalisis(BaseModel):
     texto: str
 
+class LoteRequerimientos(BaseModel):
+    textos: List[str]
+    concurrencia: Optional[int] = None  # por defecto LOTE_CONCURRENCIA (tope LOTE_CONCURRENCIA_MAX)
+
 class VendedorSugerencia(BaseModel):
     especialidad: str
     complejidad: str
@@ -19,31 +29,63 @@ class MensajeChat(BaseModel):
 
 class ChatRequest(BaseModel):
     mensajes: List[MensajeChat]
+    cliente_id: Optional[int] = None  # para aplicar su presupuesto de tokens
 
 @router.post("/analizar-requerimiento")
 async def analizar_req(req: RequerimientoAnalisis):
     """
     Analiza un requerimiento usando OpenAI
+    Si el modelo no responde en ANALISIS_PLAZO_SEGUNDOS la respuesta trae el
+    análisis local con "provisional": true y un "analisis_id" para consultar
+    el definitivo en /analizar-requerimiento/mejora/{analisis_id}.
     """
     if not req.texto or len(req.texto) < 10:
         raise HTTPException(status_code=400, detail="El texto debe tener al menos 10 caracteres")
     
-    resultado = analizar_requerimiento(req.texto)
+    return await analisis_con_plazo.analizar_con_plazo(req.texto)
+
+
+@router.get("/analizar-requerimiento/mejora/{analisis_id}")
+async def mejora_analisis(analisis_id: str):
+    """Análisis definitivo de una respuesta provisional: estado "pendiente", "lista" o "fallida"."""
+    mejora = await run_in_threadpool(analisis_con_plazo.obtener_mejora, analisis_id)
+    if mejora is None:
+        raise HTTPException(status_code=404, detail="Análisis no encontrado o expirado")
+    return mejora
+
+@router.post("/analizar-requerimientos/lote")
+async def analizar_req_lote(lote: LoteRequerimientos):
+    """
+    Analiza varios requerimientos y devuelve NDJSON: una línea
+    {"tipo": "item", "indice", "exito", ...} por texto, a medida que terminan,
+    y una línea final {"tipo": "resumen", ...}. Un texto que falla no corta el lote.
+    """
+    if not lote.textos:
+        raise HTTPException(status_code=400, detail="Debe enviar al menos un texto")
+    if len(lote.textos) > lote_requerimientos.LOTE_MAX_TEXTOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {lote_requerimientos.LOTE_MAX_TEXTOS} textos por lote"
+        )
     
-    if not resultado["exito"]:
-        raise HTTPException(status_code=500, detail=resultado["error"])
+    async def lineas():
+        async for item in lote_requerimientos.analizar_lote(lote.textos, lote.concurrencia):
+            yield linea_ndjson(item)
     
-    return resultado
+    return StreamingResponse(lineas(), media_type="application/x-ndjson", headers=CABECERAS_SSE)
 
 @router.post("/sugerir-vendedores")
 async def sugerir_vend(sug: VendedorSugerencia):
     """
     Sugiere criterios para seleccionar vendedores
     """
-    resultado = sugerir_vendedores(sug.especialidad, sug.complejidad)
+    resultado = await sugerir_vendedores(sug.especialidad, sug.complejidad)
     
     if not resultado["exito"]:
-        raise HTTPException(status_code=500, detail=resultado["error"])
+        raise HTTPException(
+            status_code=resultado.get("codigo_http", 500), detail=resultado["error"],
+            headers=cabeceras_reintento(resultado)
+        )
     
     return resultado
 
@@ -61,9 +103,60 @@ async def chat_req(req: ChatRequest):
         for msg in req.mensajes
     ]
     
-    resultado = chat_requerimiento(mensajes_openai)  # 🔥 GUIÓN BAJO, NO GUIÓN
+    resultado = await chat_requerimiento(mensajes_openai, req.cliente_id)  # 🔥 GUIÓN BAJO, NO GUIÓN
     
     if not resultado["exito"]:
-        raise HTTPException(status_code=500, detail=resultado["error"])
+        raise HTTPException(
+            status_code=resultado.get("codigo_http", 500), detail=resultado["error"],
+            headers=cabeceras_reintento(resultado)
+        )
+    
+    return resultado
+
+@router.get("/cache/metricas")
+def metricas_cache():
+    """
+    Tasa de aciertos y tokens ahorrados de la cache de respuestas
+    """
+    return {"exito": True, "plantillas": cache_llm.estadisticas()}
+
+@router.delete("/cache")
+async def invalidar_cache(plantilla: Optional[str] = None, solo_obsoletas: bool = False):
+    """
+    Invalida la cache de respuestas (de una plantilla o de todas)
+    """
+    borradas = await cache_llm.invalidar_plantilla(plantilla, solo_obsoletas)
+    return {"exito": True, "entradas_borradas": borradas}
+
+
+@router.post("/chat-requerimiento/stream")
+async def chat_req_stream(req: ChatRequest):
+    """
+    Igual que /chat-requerimiento pero envía la respuesta como server-sent events:
+    `token` por cada fragmento, `finalizado` en cuanto el requerimiento se
+    cierra y `fin` con el resultado completo.
+    """
+    if not req.mensajes:
+        raise HTTPException(status_code=400, detail="Debe enviar al menos un mensaje")
+    
+    mensajes_openai = [
+        {"role": msg.role, "content": msg.content}
+        for msg in req.mensajes
+    ]
+    
+    async def eventos():
+        async for evento in chat_requerimiento_stream(mensajes_openai, req.cliente_id):
+            if evento["tipo"] == "token":
+                yield evento_sse("token", {"contenido": evento["contenido"]})
+            elif evento["tipo"] == "finalizado":
+                yield evento_sse("finalizado", {})
+            elif evento["resultado"]["exito"]:
+                yield evento_sse("fin", evento["resultado"])
+            else:
+                yield evento_sse("error", {
+                    "detail": evento["resultado"]["error"],
+                    "codigo": evento["resultado"].get("codigo_http", 500),
+                    "reintentar_en": evento["resultado"].get("reintentar_en")
+                })
     
-    return resultado
\ No newline at end of file
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=CABECERAS_SSE)
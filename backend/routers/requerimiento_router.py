@@ -8,7 +8,9 @@ from modelos.usuario_modelo import UsuarioDB
 from Vendedores.vendedor_modelo import Vendedor
 from pydantic import BaseModel
 from datetime import datetime
+from anyio import from_thread
 from services.openai_service import convertir_codigo_a_nombre
+from services import analisis_con_plazo
 
 
 router = APIRouter(
@@ -129,6 +131,8 @@ class RequerimientoResponse(BaseModel):
     especialidad: str
     estado: str
     fecha_creacion: datetime
+    analisis_provisional: Optional[bool] = None  # 🔥 análisis local mientras llega el del modelo
+    analisis_id: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -178,20 +182,38 @@ def agregar_nombres_a_requerimientos(requerimientos: List[Requerimiento], db: Se
 
 @router.post("/crear", response_model=RequerimientoResponse)
 def crear_requerimiento(req: RequerimientoCreate, db: Session = Depends(get_db)):
-    """Crea un nuevo requerimiento"""
+    """
+    Crea un nuevo requerimiento ya analizado.
+    Si el modelo no responde a tiempo (ANALISIS_PLAZO_SEGUNDOS) se guarda con
+    el análisis local y se actualiza solo cuando llega el del modelo.
+    """
+    # El endpoint corre en el threadpool; el análisis se ejecuta en el event loop
+    resultado = from_thread.run(analisis_con_plazo.analizar_con_plazo, req.mensaje)
+    campos = analisis_con_plazo.campos_requerimiento(resultado["analisis"], req.mensaje)
     
     nuevo_req = Requerimiento(
         cliente_id=req.cliente_id,
-        titulo="Nuevo requerimiento",
+        titulo=campos["titulo"],
         mensaje=req.mensaje,
-        descripcion=None,
-        especialidad=EspecialidadEnum.OTRO,
+        descripcion=campos["descripcion"],
+        especialidad=campos["especialidad"],
         estado=EstadoRequerimiento.PENDIENTE
     )
     db.add(nuevo_req)
     db.commit()
     db.refresh(nuevo_req)
-    return nuevo_req
+    
+    if resultado.get("analisis_id"):
+        from_thread.run_sync(
+            analisis_con_plazo.suscribir_mejora,
+            resultado["analisis_id"],
+            analisis_con_plazo.mejorar_requerimiento(nuevo_req.id, nuevo_req.titulo, nuevo_req.descripcion)
+        )
+    
+    respuesta = RequerimientoResponse.model_validate(nuevo_req)
+    respuesta.analisis_provisional = resultado["provisional"]
+    respuesta.analisis_id = resultado.get("analisis_id")
+    return respuesta
 
 
 @router.get("/cliente/{cliente_id}")
@@ -0,0 +1,246 @@
+# backend/services/admision.py
+"""
+Admisión de llamadas al modelo: reparto justo entre clientes.
+
+Sin esto, un cliente con varias sesiones de análisis abiertas (o un script
+contra /api/openai/chat-requerimiento) agota el rate limit del proveedor y
+las LLM_MAX_CONCURRENCIA llamadas simultáneas para todos los demás.
+
+Cada llamada pasa por dos etapas (ver llm_cliente.completar):
+
+1. reservar(): token buckets por cliente, uno de solicitudes por minuto
+   (ADMISION_RPM_CLIENTE) y otro de tokens por minuto (ADMISION_TPM_CLIENTE).
+   Se reservan los tokens estimados (prompt + max_tokens) y al terminar se
+   ajusta con el uso real. Si el cliente tiene que esperar más de
+   ADMISION_ESPERA_MAX_SEGUNDOS se rechaza en el acto (AdmisionRechazada ->
+   429 con Retry-After) en vez de ocupar un hilo esperando.
+2. turno(): cola justa ponderada (self-clocked fair queueing) por los cupos
+   de concurrencia. Cada solicitud recibe una marca F = max(V, F_cliente) +
+   costo / peso y se atiende primero la de menor marca: un cliente con muchas
+   solicitudes en cola no adelanta a uno que llega con una sola. Los pesos
+   se configuran con ADMISION_PESOS="7=2,ip:10.0.0.5=0.5".
+
+El cliente es cliente_id si la llamada lo trae; si no, la IP de la petición
+HTTP (MiddlewareSolicitante) o "anonimo".
+"""
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from services import metricas
+
+# Máximo de llamadas simultáneas al modelo (compartido por todos los servicios)
+LLM_MAX_CONCURRENCIA = int(os.getenv("LLM_MAX_CONCURRENCIA", "16"))
+ADMISION_ESPERA_MAX_SEGUNDOS = float(os.getenv("ADMISION_ESPERA_MAX_SEGUNDOS", "20"))
+ADMISION_RPM_CLIENTE = float(os.getenv("ADMISION_RPM_CLIENTE", "60"))
+ADMISION_TPM_CLIENTE = float(os.getenv("ADMISION_TPM_CLIENTE", "100000"))
+ADMISION_PESOS = os.getenv("ADMISION_PESOS", "")
+ADMISION_MAX_CLIENTES = 10000
+
+solicitante: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("solicitante", default=None)
+
+
+class AdmisionRechazada(Exception):
+    """La llamada esperaría demasiado por el límite del cliente o por un cupo."""
+
+    def __init__(self, cliente: str, motivo: str, reintentar_en: float):
+        self.cliente = cliente
+        self.motivo = motivo
+        self.reintentar_en = reintentar_en
+        super().__init__(f"Demasiadas solicitudes ({motivo}): reintentar en {math.ceil(reintentar_en)}s")
+
+
+class MiddlewareSolicitante:
+    """Middleware ASGI: identifica por IP las llamadas al modelo que no traen cliente_id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope.get("client"):
+            solicitante.set(f"ip:{scope['client'][0]}")
+        await self.app(scope, receive, send)
+
+
+def clave_cliente(cliente_id: Optional[int]) -> str:
+    if cliente_id is not None:
+        return str(cliente_id)
+    return solicitante.get() or "anonimo"
+
+
+def _leer_pesos(especificacion: str) -> Dict[str, float]:
+    pesos = {}
+    for par in especificacion.split(","):
+        if "=" in par:
+            cliente, _, peso = par.rpartition("=")
+            pesos[cliente.strip()] = max(float(peso), 0.01)
+    return pesos
+
+
+_pesos = _leer_pesos(ADMISION_PESOS)
+
+
+def estimar_tokens(parametros: Dict) -> int:
+    """Tokens que reserva una llamada: prompt aproximado (4 caracteres por token) + max_tokens."""
+    caracteres = sum(len(m.get("content") or "") for m in parametros.get("messages") or [])
+    return caracteres // 4 + int(parametros.get("max_tokens") or parametros.get("max_completion_tokens") or 500)
+
+
+# ========================================
+# TOKEN BUCKETS POR CLIENTE
+# ========================================
+
+class _Cubeta:
+    """Token bucket que puede quedar en negativo (las reservas se pagan esperando)."""
+
+    def __init__(self, por_minuto: float):
+        self.capacidad = por_minuto
+        self.por_segundo = por_minuto / 60
+        self.disponible = por_minuto
+        self.actualizado = time.monotonic()
+
+    def _recargar(self, ahora: float):
+        self.disponible = min(self.capacidad, self.disponible + (ahora - self.actualizado) * self.por_segundo)
+        self.actualizado = ahora
+
+    def espera(self, cantidad: float, ahora: float) -> float:
+        self._recargar(ahora)
+        faltan = min(cantidad, self.capacidad) - self.disponible
+        return max(0.0, faltan / self.por_segundo)
+
+    def tomar(self, cantidad: float):
+        self.disponible -= cantidad
+
+
+_cubetas: Dict[str, tuple] = {}
+
+
+def _cubetas_de(cliente: str) -> tuple:
+    cubetas = _cubetas.get(cliente)
+    if cubetas is None:
+        if len(_cubetas) >= ADMISION_MAX_CLIENTES:
+            # Las cubetas llenas (clientes inactivos) no aportan nada: se descartan
+            ahora = time.monotonic()
+            for otro in [c for c, (s, t) in _cubetas.items() if s.espera(s.capacidad, ahora) == 0 and t.espera(t.capacidad, ahora) == 0]:
+                del _cubetas[otro]
+        cubetas = _cubetas[cliente] = (_Cubeta(ADMISION_RPM_CLIENTE), _Cubeta(ADMISION_TPM_CLIENTE))
+    return cubetas
+
+
+class Reserva:
+    """Lo que un cliente tomó de sus cubetas para una llamada; se ajusta con el uso real."""
+
+    def __init__(self, cliente: str, tokens: int, limite: float):
+        self.cliente = cliente
+        self.tokens = tokens
+        self.limite = limite
+
+    def ajustar(self, tokens_reales: int):
+        _, tokens = _cubetas_de(self.cliente)
+        tokens.tomar(tokens_reales - self.tokens)
+        self.tokens = tokens_reales
+
+
+async def reservar(cliente: str, tokens: int, endpoint: str) -> Reserva:
+    """Toma 1 solicitud y `tokens` de las cubetas del cliente, esperando si hace falta."""
+    inicio = time.monotonic()
+    solicitudes, cubeta_tokens = _cubetas_de(cliente)
+    espera_solicitud = solicitudes.espera(1, inicio)
+    espera_tokens = cubeta_tokens.espera(tokens, inicio)
+    espera = max(espera_solicitud, espera_tokens)
+
+    if espera > ADMISION_ESPERA_MAX_SEGUNDOS:
+        motivo = "solicitudes" if espera_solicitud >= espera_tokens else "tokens"
+        metricas.incrementar("admision_rechazos_total", motivo=motivo, endpoint=endpoint)
+        print(f"⛔ Admisión: cliente {cliente} sobre su límite de {motivo} ({endpoint}), reintentar en {espera:.0f}s")
+        raise AdmisionRechazada(cliente, motivo, espera)
+
+    solicitudes.tomar(1)
+    cubeta_tokens.tomar(tokens)
+    reserva = Reserva(cliente, tokens, inicio + ADMISION_ESPERA_MAX_SEGUNDOS)
+    if espera > 0:
+        metricas.incrementar("admision_frenadas_total", endpoint=endpoint)
+        try:
+            await asyncio.sleep(espera)
+        except asyncio.CancelledError:
+            solicitudes.tomar(-1)
+            reserva.ajustar(0)
+            raise
+    return reserva
+
+
+# ========================================
+# COLA JUSTA PONDERADA (cupos de concurrencia)
+# ========================================
+
+_libres = LLM_MAX_CONCURRENCIA
+_cola: list = []                       # heap de (marca, orden, cliente, futuro)
+_marcas: Dict[str, float] = {}         # última marca F asignada a cada cliente
+_virtual = 0.0                         # V: marca de la última solicitud atendida
+_orden = itertools.count()
+
+
+def _publicar_profundidad():
+    metricas.fijar("admision_cola_profundidad", sum(1 for *_, f in _cola if not f.done()))
+    metricas.fijar("admision_cupos_libres", _libres)
+
+
+def _despachar():
+    """Entrega los cupos libres a las solicitudes de menor marca."""
+    global _libres, _virtual
+    while _libres > 0 and _cola:
+        marca, _, _, futuro = heapq.heappop(_cola)
+        if futuro.done():
+            continue
+        _libres -= 1
+        _virtual = marca
+        futuro.set_result(None)
+    _publicar_profundidad()
+
+
+@asynccontextmanager
+async def turno(reserva: Reserva, endpoint: str):
+    """Espera un cupo de concurrencia en la cola justa; lo libera al salir."""
+    global _libres
+    inicio = time.monotonic()
+    cliente = reserva.cliente
+    peso = _pesos.get(cliente, 1.0)
+    marca = max(_virtual, _marcas.get(cliente, 0.0)) + max(reserva.tokens, 1) / peso
+    _marcas[cliente] = marca
+    if len(_marcas) > ADMISION_MAX_CLIENTES:
+        for otro in [c for c, m in _marcas.items() if m <= _virtual]:
+            del _marcas[otro]
+
+    futuro = asyncio.get_running_loop().create_future()
+    heapq.heappush(_cola, (marca, next(_orden), cliente, futuro))
+    _despachar()
+
+    try:
+        # La espera en las cubetas cuenta para el mismo máximo
+        await asyncio.wait_for(asyncio.shield(futuro), max(0.0, reserva.limite - inicio))
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        if futuro.done() and not futuro.cancelled():
+            # El cupo llegó justo al vencer la espera: se devuelve
+            _libres += 1
+        futuro.cancel()
+        _despachar()
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        espera = time.monotonic() - inicio
+        metricas.observar("admision_espera_segundos", espera, resultado="rechazada")
+        metricas.incrementar("admision_rechazos_total", motivo="cola", endpoint=endpoint)
+        print(f"⛔ Admisión: cliente {cliente} sin cupo tras {espera:.1f}s ({endpoint})")
+        raise AdmisionRechazada(cliente, "cola", max(1.0, ADMISION_ESPERA_MAX_SEGUNDOS / 2))
+
+    metricas.observar("admision_espera_segundos", time.monotonic() - inicio, resultado="admitida")
+    try:
+        yield
+    finally:
+        _libres += 1
+        _despachar()
@@ -0,0 +1,245 @@
+# backend/services/analisis_con_plazo.py
+"""
+Análisis de requerimientos con plazo de latencia.
+
+La llamada al modelo (openai_service.analizar_requerimiento) compite contra
+ANALISIS_PLAZO_SEGUNDOS. Si el modelo responde a tiempo se devuelve su
+análisis; si no (o si falla), se responde en el acto con el analizador local
+(AnalizadorRequerimientos: clasificador + palabras clave) marcado como
+"provisional". La llamada al modelo sigue en segundo plano y, al terminar,
+deja el análisis definitivo en la tabla mejoras_analisis (`obtener_mejora`
+lo encuentra desde cualquier worker) y avisa a quienes se suscribieron con
+`suscribir_mejora` (p. ej. el Requerimiento guardado con el análisis
+provisional se actualiza con `mejorar_requerimiento`). Los suscriptores son
+del proceso que hizo la llamada; uno que llega cuando ya terminó lee el
+resultado de la tabla.
+
+Como el resultado del modelo queda en cache_llm, volver a pedir el análisis
+del mismo texto después de la mejora ya no espera.
+"""
+import os
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from database import SessionLocal
+from modelos.mejora_analisis_modelo import MejoraAnalisis
+from modelos.requerimiento_model import Requerimiento, EspecialidadEnum
+from services import metricas
+from services.analisis_requerimiento import AnalizadorRequerimientos
+from services.chat_analisis_service import resolver_especialidad
+from services.clasificador_especialidades import clasificar_lote
+from services.openai_service import analizar_requerimiento
+
+ANALISIS_PLAZO_SEGUNDOS = float(os.getenv("ANALISIS_PLAZO_SEGUNDOS", "4"))
+ANALISIS_MEJORAS_TTL_SEGUNDOS = 900
+
+# Suscriptores de las mejoras que este proceso sigue esperando
+_suscriptores: Dict[str, List[Callable[[Dict], Awaitable[None]]]] = {}
+# Referencias fuertes a las llamadas que siguen en segundo plano
+_en_curso: set = set()
+
+
+def analisis_local(texto: str) -> Dict:
+    """Análisis heurístico con la misma forma que el del modelo (campos que no estima en None)."""
+    local = AnalizadorRequerimientos.analizar_mensaje(texto)
+    return {
+        "especialidad": local["especialidad"].value,
+        "titulo": local["titulo"],
+        "descripcion_tecnica": local["descripcion"].strip(),
+        "tiempo_estimado": None,
+        "presupuesto_sugerido": None,
+        "complejidad": None,
+        "tecnologias_sugeridas": []
+    }
+
+
+def _guardar_mejora(analisis_id: str, estado: str, resultado: Optional[Dict] = None):
+    db = SessionLocal()
+    try:
+        ahora = datetime.utcnow()
+        if estado == "pendiente":
+            db.query(MejoraAnalisis).filter(MejoraAnalisis.expira_en <= ahora).delete(synchronize_session=False)
+        db.merge(MejoraAnalisis(
+            analisis_id=analisis_id,
+            estado=estado,
+            resultado=resultado,
+            expira_en=ahora + timedelta(seconds=ANALISIS_MEJORAS_TTL_SEGUNDOS)
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def obtener_mejora(analisis_id: str) -> Optional[Dict]:
+    db = SessionLocal()
+    try:
+        mejora = db.query(MejoraAnalisis).filter(
+            MejoraAnalisis.analisis_id == analisis_id,
+            MejoraAnalisis.expira_en > datetime.utcnow()
+        ).first()
+        if mejora is None:
+            return None
+        return {"analisis_id": analisis_id, "estado": mejora.estado, "resultado": mejora.resultado}
+    finally:
+        db.close()
+
+
+def _en_segundo_plano(corrutina):
+    tarea = asyncio.create_task(corrutina)
+    _en_curso.add(tarea)
+    tarea.add_done_callback(_en_curso.discard)
+
+
+async def _avisar(analisis_id: str, al_mejorar: Callable[[Dict], Awaitable[None]], resultado: Dict):
+    try:
+        await al_mejorar(resultado)
+    except Exception as e:
+        print(f"❌ Error aplicando la mejora del análisis {analisis_id}: {e}")
+
+
+async def _avisar_si_lista(analisis_id: str, al_mejorar: Callable[[Dict], Awaitable[None]]):
+    mejora = await asyncio.to_thread(obtener_mejora, analisis_id)
+    if mejora is not None and mejora["estado"] == "lista":
+        await _avisar(analisis_id, al_mejorar, mejora["resultado"])
+
+
+def suscribir_mejora(analisis_id: str, al_mejorar: Callable[[Dict], Awaitable[None]]):
+    """
+    `al_mejorar(resultado)` se ejecuta cuando llega el análisis del modelo (o
+    enseguida si ya llegó). Se llama desde el event loop; los endpoints
+    síncronos usan from_thread.run_sync.
+    """
+    suscriptores = _suscriptores.get(analisis_id)
+    if suscriptores is not None:
+        suscriptores.append(al_mejorar)
+    else:
+        # Ya terminó: se aplica si quedó lista
+        _en_segundo_plano(_avisar_si_lista(analisis_id, al_mejorar))
+
+
+async def _esperar_mejora(analisis_id: str, tarea: asyncio.Task):
+    inicio = time.monotonic()
+    try:
+        resultado = await tarea
+    except Exception as e:
+        resultado = {"exito": False, "error": str(e)}
+
+    exito = resultado.get("exito", False)
+    estado = "lista" if exito else "fallida"
+    try:
+        # Primero la tabla: un suscriptor que llegue después de sacar la lista la lee de ahí
+        await asyncio.to_thread(_guardar_mejora, analisis_id, estado, resultado)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar la mejora del análisis {analisis_id}: {e}")
+    suscriptores = _suscriptores.pop(analisis_id, [])
+    metricas.incrementar("analisis_mejoras_total", resultado=estado)
+    print(f"{'⬆️' if exito else '❌'} Análisis {analisis_id}: el modelo "
+          f"{'respondió' if exito else 'falló'} {time.monotonic() - inicio:.1f}s después del plazo")
+
+    if exito:
+        for al_mejorar in suscriptores:
+            await _avisar(analisis_id, al_mejorar, resultado)
+
+
+async def analizar_con_plazo(texto: str, plazo: Optional[float] = None) -> Dict:
+    """
+    Analiza `texto` con el modelo, o con el analizador local si el modelo no
+    responde en `plazo` segundos (ANALISIS_PLAZO_SEGUNDOS por defecto).
+
+    Devuelve el dict de analizar_requerimiento con "provisional" y "origen"
+    ("modelo" o "local"). Si la respuesta es provisional y el modelo sigue
+    trabajando, trae "analisis_id" para consultar o suscribirse a la mejora.
+    """
+    plazo = ANALISIS_PLAZO_SEGUNDOS if plazo is None else plazo
+    inicio = time.monotonic()
+    tarea = asyncio.ensure_future(analizar_requerimiento(texto))
+    hechas, _ = await asyncio.wait({tarea}, timeout=plazo)
+
+    if hechas:
+        resultado = tarea.result()
+        if resultado["exito"]:
+            metricas.incrementar("analisis_plazo_total", resultado="modelo")
+            metricas.observar("analisis_plazo_segundos", time.monotonic() - inicio, origen="modelo")
+            return {**resultado, "provisional": False, "origen": "modelo"}
+        # El modelo falló antes del plazo: no hay mejora que esperar
+        motivo, analisis_id = "error", None
+        print(f"⚠️ Análisis con el modelo falló ({resultado.get('error')}): se usa el analizador local")
+    else:
+        motivo, analisis_id = "plazo", uuid.uuid4().hex
+        _suscriptores[analisis_id] = []
+        try:
+            await asyncio.to_thread(_guardar_mejora, analisis_id, "pendiente")
+        except Exception as e:
+            print(f"⚠️ No se pudo registrar la mejora del análisis {analisis_id}: {e}")
+        _en_segundo_plano(_esperar_mejora(analisis_id, tarea))
+        print(f"⏰ El modelo no respondió en {plazo:.1f}s: análisis local provisional ({analisis_id})")
+
+    analisis = await asyncio.to_thread(analisis_local, texto)
+    metricas.incrementar("analisis_plazo_total", resultado=f"local_{motivo}")
+    metricas.observar("analisis_plazo_segundos", time.monotonic() - inicio, origen="local")
+    return {
+        "exito": True,
+        "analisis": analisis,
+        "provisional": True,
+        "origen": "local",
+        "analisis_id": analisis_id,
+        "tokens_usados": 0,
+        "costo_aproximado": "$0.000000"
+    }
+
+
+# ========================================
+# REQUERIMIENTOS
+# ========================================
+
+def campos_requerimiento(analisis: Dict, texto: str) -> Dict:
+    """Título, descripción y especialidad de un Requerimiento a partir de un análisis (local o del modelo)."""
+    nombre = str(analisis.get("especialidad") or "")
+    if nombre in EspecialidadEnum._value2member_map_:
+        especialidad = EspecialidadEnum(nombre)
+    else:
+        # El modelo escribe la especialidad libremente: mismo mapeo que las sub-tareas
+        codigo, _ = resolver_especialidad(nombre, clasificar_lote([texto])[0])
+        especialidad = EspecialidadEnum[codigo]
+    return {
+        "titulo": analisis.get("titulo") or AnalizadorRequerimientos.generar_titulo(texto),
+        "descripcion": analisis.get("descripcion_tecnica"),
+        "especialidad": especialidad
+    }
+
+
+def _aplicar_mejora(
+    requerimiento_id: int,
+    titulo_provisional: str,
+    descripcion_provisional: Optional[str],
+    resultado: Dict
+):
+    db = SessionLocal()
+    try:
+        req = db.query(Requerimiento).filter(Requerimiento.id == requerimiento_id).first()
+        # Si alguien ya lo editó (o se asignó) no se pisa
+        if req is None or req.vendedor_id or req.descripcion != descripcion_provisional:
+            print(f"ℹ️ Requerimiento {requerimiento_id} cambió desde el análisis provisional: no se actualiza")
+            return
+        campos = campos_requerimiento(resultado["analisis"], req.mensaje)
+        req.descripcion = campos["descripcion"]
+        req.especialidad = campos["especialidad"]
+        # El título se edita aparte de la descripción: solo se reemplaza si sigue siendo el heurístico
+        if req.titulo == titulo_provisional:
+            req.titulo = campos["titulo"]
+        db.commit()
+        print(f"⬆️ Requerimiento {requerimiento_id} actualizado con el análisis del modelo")
+    finally:
+        db.close()
+
+
+def mejorar_requerimiento(requerimiento_id: int, titulo_provisional: str, descripcion_provisional: Optional[str]):
+    """Callback para suscribir_mejora: reemplaza el análisis provisional guardado en el Requerimiento."""
+    async def al_mejorar(resultado: Dict):
+        await asyncio.to_thread(
+            _aplicar_mejora, requerimiento_id, titulo_provisional, descripcion_provisional, resultado
+        )
+    return al_mejorar
@@ -1,5 +1,9 @@
 # services/analisis_requerimiento.py
+from typing import List
+
 from modelos.requerimiento_model import EspecialidadEnum
+from services.clasificador_especialidades import clasificar_lote
+from services.palabras_clave import AutomataPalabrasClave
 
 class AnalizadorRequerimientos:
     """
@@ -87,6 +91,12 @@ class AnalizadorRequerimientos:
         ]
     }
     
+    # Si ninguna especialidad coincide, estas palabras indican desarrollo a medida
+    PALABRAS_GENERICAS = ["sistema", "aplicación", "software", "desarrollo", "programa"]
+    
+    # Todas las palabras clave en un solo autómata (una pasada por mensaje, ver palabras_clave)
+    _AUTOMATA = AutomataPalabrasClave({**PALABRAS_CLAVE, None: PALABRAS_GENERICAS})
+    
     @classmethod
     def analizar_mensaje(cls, mensaje: str) -> dict:
         """
@@ -101,7 +111,7 @@ class AnalizadorRequerimientos:
         especialidad = cls._detectar_especialidad(mensaje_lower)
         
         # Generar título (primeras 50 caracteres del mensaje o menos)
-        titulo = cls._generar_titulo(mensaje)
+        titulo = cls.generar_titulo(mensaje)
         
         # Generar descripción
         descripcion = cls._generar_descripcion(mensaje, especialidad)
@@ -114,32 +124,42 @@ class AnalizadorRequerimientos:
     
     @classmethod
     def _detectar_especialidad(cls, mensaje: str) -> EspecialidadEnum:
-        """Detecta la especialidad basándose en palabras clave"""
-        
-        # Contar coincidencias por especialidad
-        coincidencias = {}
-        
-        for especialidad, palabras in cls.PALABRAS_CLAVE.items():
-            count = 0
-            for palabra in palabras:
-                if palabra in mensaje:
-                    count += 1
-            if count > 0:
-                coincidencias[especialidad] = count
+        """Detecta la especialidad: clasificador local si está seguro, si no palabras clave"""
+        return cls.detectar_especialidades([mensaje])[0]
+    
+    @classmethod
+    def detectar_especialidades(cls, mensajes: List[str]) -> List[EspecialidadEnum]:
+        """
+        Especialidad de varios mensajes de una vez: el clasificador local
+        corre una sola vez para todo el lote y las palabras clave se buscan
+        con el autómata solo en los mensajes donde no está seguro.
+        """
+        predicciones = clasificar_lote(mensajes)
+        return [
+            EspecialidadEnum[prediccion["especialidad"]] if prediccion["confiable"]
+            else cls._especialidad_por_palabras(mensaje)
+            for mensaje, prediccion in zip(mensajes, predicciones)
+        ]
+    
+    @classmethod
+    def _especialidad_por_palabras(cls, mensaje: str) -> EspecialidadEnum:
+        # Frases clave distintas encontradas por especialidad (None = palabras genéricas)
+        coincidencias = cls._AUTOMATA.contar(mensaje)
+        genericas = coincidencias.pop(None, 0)
         
-        # Si hay coincidencias, retornar la de mayor puntaje
+        # Si hay coincidencias, retornar la de mayor puntaje (empate: la primera en PALABRAS_CLAVE)
         if coincidencias:
-            return max(coincidencias, key=coincidencias.get)
+            return max(cls.PALABRAS_CLAVE, key=lambda e: coincidencias.get(e, 0))
         
         # Si no hay coincidencias claras, intentar detectar por contexto general
-        if any(word in mensaje for word in ["sistema", "aplicación", "software", "desarrollo", "programa"]):
+        if genericas:
             return EspecialidadEnum.DESARROLLO_MEDIDA
         
         # Si no se puede determinar, retornar OTRO
         return EspecialidadEnum.OTRO
     
     @classmethod
-    def _generar_titulo(cls, mensaje: str) -> str:
+    def generar_titulo(cls, mensaje: str) -> str:
         """Genera un título descriptivo del requerimiento"""
         # Tomar las primeras palabras del mensaje
         palabras = mensaje.split()[:8]  # Máximo 8 palabras
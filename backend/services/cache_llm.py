@@ -0,0 +1,283 @@
+# backend/services/cache_llm.py
+"""
+Cache de respuestas del modelo direccionada por contenido.
+
+clave = sha256(plantilla, versión de la plantilla, entrada normalizada, parámetros)
+
+Dos niveles: LRU en memoria (por proceso) y tabla cache_respuestas_llm
+(compartida entre workers). Solo se guardan resultados con "exito": True.
+La versión de cada plantilla es la huella de los textos del prompt y de los
+parámetros de la llamada (modelo, temperatura, ...), así que cualquier
+cambio en ellos cambia la clave; las entradas viejas dejan de coincidir y se
+purgan al arrancar o con invalidar_plantilla().
+"""
+import os
+import json
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from database import SessionLocal
+from modelos.cache_llm_modelo import RespuestaLLMCache
+from services import metricas
+
+CACHE_LLM_MAX_MEMORIA = int(os.getenv("CACHE_LLM_MAX_MEMORIA", "1024"))
+CACHE_LLM_TTL_SEGUNDOS = int(os.getenv("CACHE_LLM_TTL_SEGUNDOS", str(7 * 24 * 3600)))
+CACHE_LLM_PERSISTENTE = os.getenv("CACHE_LLM_PERSISTENTE", "1") == "1"
+
+# plantilla -> versión vigente (lo registran los servicios al importarse)
+_versiones: Dict[str, str] = {}
+
+
+def huella(textos: Iterable[str], parametros: Dict) -> str:
+    """Hash corto de los textos del prompt y los parámetros de la llamada."""
+    contenido = json.dumps({"textos": list(textos), "parametros": parametros}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:16]
+
+
+def registrar_plantilla(plantilla: str, textos: Iterable[str], parametros: Dict) -> str:
+    """
+    Registra una plantilla cacheada con los textos fijos de su prompt y los
+    mismos parámetros que se envían al modelo. Devuelve la versión vigente.
+    """
+    version = huella(textos, parametros)
+    _versiones[plantilla] = version
+    return version
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza la entrada para que variaciones triviales compartan clave."""
+    texto = unicodedata.normalize("NFC", texto or "")
+    return " ".join(texto.split()).casefold()
+
+
+def calcular_clave(plantilla: str, entrada, parametros: Dict) -> str:
+    contenido = json.dumps({
+        "plantilla": plantilla,
+        "version": _versiones.get(plantilla, "0"),
+        "entrada": entrada,
+        "parametros": parametros
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+# ========================================
+# NIVEL 1: LRU EN MEMORIA
+# ========================================
+
+class _LRU:
+    def __init__(self, capacidad: int):
+        self.capacidad = capacidad
+        self._datos: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: str):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return None
+            valor, expira_en, plantilla = item
+            if expira_en < datetime.utcnow():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave: str, valor, expira_en: datetime, plantilla: str):
+        with self._lock:
+            self._datos[clave] = (valor, expira_en, plantilla)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def eliminar_plantilla(self, plantilla: str) -> int:
+        with self._lock:
+            claves = [c for c, item in self._datos.items() if item[2] == plantilla]
+            for c in claves:
+                del self._datos[c]
+            return len(claves)
+
+
+_memoria = _LRU(CACHE_LLM_MAX_MEMORIA)
+
+
+# ========================================
+# NIVEL 2: TABLA cache_respuestas_llm
+# ========================================
+
+def _leer_persistente(clave: str) -> Optional[tuple]:
+    db = SessionLocal()
+    try:
+        fila = db.query(RespuestaLLMCache).filter(
+            RespuestaLLMCache.clave == clave,
+            RespuestaLLMCache.expira_en > datetime.utcnow()
+        ).first()
+        if fila is None:
+            return None
+        # Sin escrituras en la lectura: los aciertos se cuentan en las métricas
+        return fila.respuesta, fila.expira_en
+    finally:
+        db.close()
+
+
+def _guardar_persistente(clave: str, plantilla: str, modelo: str, valor: Dict, tokens: int, expira_en: datetime):
+    db = SessionLocal()
+    try:
+        db.merge(RespuestaLLMCache(
+            clave=clave,
+            plantilla=plantilla,
+            version=_versiones.get(plantilla, "0"),
+            modelo=modelo,
+            respuesta=valor,
+            tokens=tokens,
+            created_at=datetime.utcnow(),
+            expira_en=expira_en
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _purgar_persistente(plantilla: Optional[str], solo_obsoletas: bool) -> int:
+    db = SessionLocal()
+    try:
+        query = db.query(RespuestaLLMCache)
+        if plantilla:
+            query = query.filter(RespuestaLLMCache.plantilla == plantilla)
+            if solo_obsoletas:
+                query = query.filter(RespuestaLLMCache.version != _versiones.get(plantilla, "0"))
+        borradas = query.delete(synchronize_session=False)
+        expiradas = db.query(RespuestaLLMCache).filter(
+            RespuestaLLMCache.expira_en <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return borradas + expiradas
+    finally:
+        db.close()
+
+
+# ========================================
+# API
+# ========================================
+
+_en_vuelo: Dict[str, asyncio.Future] = {}
+
+
+async def obtener_o_calcular(
+    plantilla: str,
+    entrada,
+    parametros: Dict,
+    calcular: Callable[[], Awaitable[Dict]],
+    ttl_segundos: Optional[int] = None
+) -> Dict:
+    """
+    Devuelve la respuesta cacheada para (plantilla, entrada, parámetros)
+    o ejecuta `calcular()` y la guarda si tuvo éxito. `parametros` son los
+    mismos que `calcular()` envía al modelo (incluido "model"). Peticiones
+    idénticas concurrentes comparten una sola llamada al modelo.
+    """
+    clave = calcular_clave(plantilla, entrada, parametros)
+
+    valor = _memoria.obtener(clave)
+    if valor is not None:
+        return _acierto(plantilla, "memoria", valor)
+
+    if CACHE_LLM_PERSISTENTE:
+        try:
+            fila = await asyncio.to_thread(_leer_persistente, clave)
+        except Exception as e:
+            print(f"⚠️ Cache persistente no disponible: {e}")
+            fila = None
+        if fila is not None:
+            valor, expira_en = fila
+            _memoria.guardar(clave, valor, expira_en, plantilla)
+            return _acierto(plantilla, "persistente", valor)
+
+    if clave in _en_vuelo:
+        valor = await asyncio.shield(_en_vuelo[clave])
+        return _acierto(plantilla, "en_vuelo", valor) if valor.get("exito") else valor
+
+    futuro = asyncio.get_running_loop().create_future()
+    _en_vuelo[clave] = futuro
+    try:
+        metricas.incrementar("cache_llm_fallos_total", plantilla=plantilla)
+        valor = await calcular()
+        futuro.set_result(valor)
+    except asyncio.CancelledError:
+        futuro.cancel()
+        raise
+    except Exception as e:
+        futuro.set_exception(e)
+        futuro.exception()  # evita el aviso "exception was never retrieved"
+        raise
+    finally:
+        del _en_vuelo[clave]
+
+    if valor.get("exito"):
+        expira_en = datetime.utcnow() + timedelta(seconds=ttl_segundos or CACHE_LLM_TTL_SEGUNDOS)
+        _memoria.guardar(clave, valor, expira_en, plantilla)
+        if CACHE_LLM_PERSISTENTE:
+            try:
+                await asyncio.to_thread(
+                    _guardar_persistente, clave, plantilla, parametros.get("model", ""), valor,
+                    valor.get("tokens_usados") or 0, expira_en
+                )
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar en cache persistente: {e}")
+    return valor
+
+
+def _acierto(plantilla: str, nivel: str, valor: Dict) -> Dict:
+    metricas.incrementar("cache_llm_aciertos_total", plantilla=plantilla, nivel=nivel)
+    metricas.incrementar("cache_llm_tokens_ahorrados_total", valor.get("tokens_usados") or 0, plantilla=plantilla)
+    return {**valor, "desde_cache": True}
+
+
+async def invalidar_plantilla(plantilla: Optional[str] = None, solo_obsoletas: bool = False) -> int:
+    """
+    Borra entradas de una plantilla (o de todas). Con solo_obsoletas=True
+    borra únicamente las de versiones distintas a la vigente.
+    """
+    borradas = 0
+    if plantilla and not solo_obsoletas:
+        borradas += _memoria.eliminar_plantilla(plantilla)
+    elif plantilla is None:
+        for p in list(_versiones):
+            borradas += _memoria.eliminar_plantilla(p)
+    if CACHE_LLM_PERSISTENTE:
+        borradas += await asyncio.to_thread(_purgar_persistente, plantilla, solo_obsoletas)
+    print(f"🧹 Cache LLM invalidada ({plantilla or 'todas'}): {borradas} entradas")
+    return borradas
+
+
+async def purgar_versiones_obsoletas():
+    """Se ejecuta al arrancar: elimina respuestas de prompts que ya cambiaron."""
+    for plantilla in list(_versiones):
+        try:
+            await invalidar_plantilla(plantilla, solo_obsoletas=True)
+        except Exception as e:
+            print(f"⚠️ No se pudo purgar la cache de {plantilla}: {e}")
+
+
+def estadisticas() -> Dict:
+    """Tasa de aciertos y tokens ahorrados por plantilla."""
+    resultado = {}
+    for plantilla, version in _versiones.items():
+        aciertos = sum(
+            metricas.valor_contador("cache_llm_aciertos_total", plantilla=plantilla, nivel=nivel)
+            for nivel in ("memoria", "persistente", "en_vuelo")
+        )
+        fallos = metricas.valor_contador("cache_llm_fallos_total", plantilla=plantilla)
+        total = aciertos + fallos
+        resultado[plantilla] = {
+            "version": version,
+            "aciertos": aciertos,
+            "fallos": fallos,
+            "tasa_aciertos": round(aciertos / total, 4) if total else 0.0,
+            "tokens_ahorrados": metricas.valor_contador("cache_llm_tokens_ahorrados_total", plantilla=plantilla)
+        }
+    return resultado
@@ -0,0 +1,228 @@
+# backend/services/catalogo_vendedores.py
+"""
+Catálogo precalculado de criterios de selección de vendedores.
+
+sugerir_vendedores solo tiene 12 especialidades x 3 complejidades, así que
+todas las combinaciones se generan offline (herramientas.generar_catalogo_vendedores)
+y se sirven desde memoria. Si al arrancar faltan filas para la versión vigente
+del prompt, se regeneran en segundo plano; con varios workers solo lo hace el
+que toma el candado (pg_try_advisory_lock), los demás siguen sin esperar.
+"""
+import os
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from database import SessionLocal, engine
+from modelos.catalogo_vendedores_modelo import CriteriosVendedorCatalogo
+from modelos.requerimiento_model import EspecialidadEnum
+from services.texto import plegar
+
+CATALOGO_CONCURRENCIA = int(os.getenv("CATALOGO_CONCURRENCIA", "4"))
+
+ESPECIALIDADES = [e.value for e in EspecialidadEnum if e != EspecialidadEnum.OTRO]
+COMPLEJIDADES = ["Baja", "Media", "Alta"]
+
+# Primer entero de pg_try_advisory_lock(int, int): separa este candado de otros usos
+_CLASE_CANDADO = 31001
+
+# Códigos CPC usados por el chat de requerimientos (ver CODIGO_A_ESPECIALIDAD)
+_CODIGOS_CPC = {
+    "83111": EspecialidadEnum.CONSULTORIA_DESARROLLO,
+    "83112": EspecialidadEnum.CONSULTORIA_HARDWARE,
+    "83113": EspecialidadEnum.CONSULTORIA_SOFTWARE,
+    "83131": EspecialidadEnum.DESARROLLO_MEDIDA,
+    "83132": EspecialidadEnum.SOFTWARE_EMPAQUETADO,
+    "83133": EspecialidadEnum.ACTUALIZACION_SOFTWARE,
+    "83141": EspecialidadEnum.HOSTING,
+    "83142": EspecialidadEnum.PROCESAMIENTO_DATOS,
+    "83143": EspecialidadEnum.CLOUD_COMPUTING,
+    "83161": EspecialidadEnum.RECUPERACION_DESASTRES,
+    "83162": EspecialidadEnum.CIBERSEGURIDAD,
+    "83163": EspecialidadEnum.CAPACITACION_TI,
+}
+
+# (especialidad, complejidad) -> sugerencias, solo de la versión vigente
+_catalogo: Dict[Tuple[str, str], Dict] = {}
+_version_cargada: Optional[str] = None
+
+
+_ESPECIALIDAD_POR_ALIAS = {}
+for _esp in EspecialidadEnum:
+    if _esp == EspecialidadEnum.OTRO:
+        continue
+    _ESPECIALIDAD_POR_ALIAS[plegar(_esp.value)] = _esp.value
+    _ESPECIALIDAD_POR_ALIAS[plegar(_esp.name)] = _esp.value
+for _codigo, _esp in _CODIGOS_CPC.items():
+    _ESPECIALIDAD_POR_ALIAS[_codigo] = _esp.value
+
+_COMPLEJIDAD_POR_ALIAS = {plegar(c): c for c in COMPLEJIDADES}
+
+
+def normalizar_combinacion(especialidad: str, complejidad: str) -> Optional[Tuple[str, str]]:
+    """
+    Acepta nombre, código interno (DESARROLLO_MEDIDA) o código CPC (83131).
+    Devuelve la clave canónica o None si la combinación no está en el catálogo.
+    """
+    esp = _ESPECIALIDAD_POR_ALIAS.get(plegar(especialidad))
+    comp = _COMPLEJIDAD_POR_ALIAS.get(plegar(complejidad))
+    if esp is None or comp is None:
+        return None
+    return esp, comp
+
+
+def buscar(especialidad: str, complejidad: str) -> Optional[Dict]:
+    """Lookup en memoria (microsegundos). None si no está precalculado."""
+    clave = normalizar_combinacion(especialidad, complejidad)
+    if clave is None:
+        return None
+    return _catalogo.get(clave)
+
+
+def combinaciones() -> List[Tuple[str, str]]:
+    return [(e, c) for e in ESPECIALIDADES for c in COMPLEJIDADES]
+
+
+def _version_vigente() -> str:
+    from services.openai_service import VERSION_PROMPT_VENDEDORES
+    return VERSION_PROMPT_VENDEDORES
+
+
+# ========================================
+# CARGA Y GENERACIÓN
+# ========================================
+
+def cargar_catalogo() -> List[Tuple[str, str]]:
+    """Carga en memoria las filas de la versión vigente. Devuelve las combinaciones faltantes."""
+    global _catalogo, _version_cargada
+    version = _version_vigente()
+    db = SessionLocal()
+    try:
+        filas = db.query(CriteriosVendedorCatalogo).filter(
+            CriteriosVendedorCatalogo.version == version
+        ).all()
+        _catalogo = {(f.especialidad, f.complejidad): f.sugerencias for f in filas}
+        _version_cargada = version
+    finally:
+        db.close()
+
+    faltantes = [c for c in combinaciones() if c not in _catalogo]
+    print(f"📚 Catálogo de criterios v{version}: {len(_catalogo)} combinaciones, {len(faltantes)} faltantes")
+    return faltantes
+
+
+def _guardar_fila(especialidad: str, complejidad: str, version: str, sugerencias: Dict, tokens: int):
+    db = SessionLocal()
+    try:
+        fila = db.query(CriteriosVendedorCatalogo).filter(
+            CriteriosVendedorCatalogo.especialidad == especialidad,
+            CriteriosVendedorCatalogo.complejidad == complejidad,
+            CriteriosVendedorCatalogo.version == version
+        ).first()
+        if fila is None:
+            fila = CriteriosVendedorCatalogo(
+                especialidad=especialidad,
+                complejidad=complejidad,
+                version=version
+            )
+            db.add(fila)
+        fila.sugerencias = sugerencias
+        fila.tokens = tokens
+        fila.generado_en = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def generar_catalogo(
+    combinaciones_objetivo: Optional[List[Tuple[str, str]]] = None,
+    concurrencia: int = CATALOGO_CONCURRENCIA
+) -> Dict:
+    """
+    Genera (con el modelo) y guarda los criterios de las combinaciones indicadas
+    (por defecto, todas). Devuelve un resumen con generadas y errores.
+    """
+    from services.openai_service import sugerir_vendedores_sin_cache
+
+    version = _version_vigente()
+    objetivo = combinaciones_objetivo if combinaciones_objetivo is not None else combinaciones()
+    limite = asyncio.Semaphore(concurrencia)
+    generadas, errores = 0, []
+
+    async def generar(especialidad: str, complejidad: str):
+        nonlocal generadas
+        async with limite:
+            resultado = await sugerir_vendedores_sin_cache(especialidad, complejidad)
+        if not resultado["exito"]:
+            errores.append({"especialidad": especialidad, "complejidad": complejidad, "error": resultado["error"]})
+            return
+        await asyncio.to_thread(
+            _guardar_fila, especialidad, complejidad, version,
+            resultado["sugerencias"], resultado.get("tokens_usados") or 0
+        )
+        if _version_cargada == version:
+            _catalogo[(especialidad, complejidad)] = resultado["sugerencias"]
+        generadas += 1
+
+    await asyncio.gather(*(generar(e, c) for e, c in objetivo))
+    print(f"📚 Catálogo de criterios v{version}: {generadas} generadas, {len(errores)} errores")
+    return {"version": version, "generadas": generadas, "errores": errores}
+
+
+def _tomar_candado(version: str):
+    """Conexión con el candado de generación de `version`, o None si otro worker lo tiene."""
+    conexion = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        tomado = conexion.execute(text("SELECT pg_try_advisory_lock(:clase, hashtext(:version))"),
+                                  {"clase": _CLASE_CANDADO, "version": version}).scalar()
+    except Exception:
+        conexion.close()
+        raise
+    if not tomado:
+        conexion.close()
+        return None
+    return conexion
+
+
+def _soltar_candado(conexion, version: str):
+    try:
+        conexion.execute(text("SELECT pg_advisory_unlock(:clase, hashtext(:version))"),
+                         {"clase": _CLASE_CANDADO, "version": version})
+    finally:
+        conexion.close()
+
+
+async def _regenerar_faltantes() -> Optional[Dict]:
+    version = _version_vigente()
+    try:
+        conexion = await asyncio.to_thread(_tomar_candado, version)
+    except Exception as e:
+        print(f"⚠️ No se pudo tomar el candado del catálogo de criterios: {e}")
+        return None
+    if conexion is None:
+        print(f"📚 Otro worker regenera el catálogo de criterios v{version}")
+        return None
+    try:
+        # Releer con el candado tomado: otro worker pudo completarlo mientras tanto
+        faltantes = await asyncio.to_thread(cargar_catalogo)
+        return await generar_catalogo(faltantes) if faltantes else None
+    finally:
+        await asyncio.to_thread(_soltar_candado, conexion, version)
+
+
+async def iniciar_catalogo() -> Optional[asyncio.Task]:
+    """
+    Arranque de la app: carga el catálogo y, si faltan combinaciones
+    (p. ej. porque cambió la versión del prompt), las regenera en segundo
+    plano. Entre varios workers solo uno regenera.
+    """
+    try:
+        faltantes = await asyncio.to_thread(cargar_catalogo)
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar el catálogo de criterios: {e}")
+        return None
+    if not faltantes:
+        return None
+    return asyncio.create_task(_regenerar_faltantes())
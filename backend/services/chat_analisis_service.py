@@ -1,11 +1,19 @@
 # backend/services/chat_analisis_service.py
-import os
 import json
-from openai import OpenAI
-from typing import List, Dict
-
-# Configuración de OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import time
+from typing import List, Dict, Optional, AsyncIterator, Tuple
+
+from services.llm_cliente import completar, completar_stream, codigo_http_error, reintentar_en_error
+from services.historial_service import compactar_historial
+from services.clasificador_especialidades import clasificar_lote, texto_de_tarea
+from services.json_incremental import LectorJSONIncremental
+from services.plantillas_wbs import buscar_plantilla, mensaje_plantilla, plantilla_publica, aplicar_detalle_plantilla
+from services.esquema_wbs import ValidadorWBS, SYSTEM_PROMPT_REPARACION, WBS_REPARACION_MAX_TOKENS
+from services import metricas
+from services.enrutador_modelos import elegir_ruta, registrar_resultado, debe_escalar, TURNOS_MODO_JSON
+from services.enriquecimiento_wbs import (
+    INSTRUCCION_ESQUELETO, WBS_EN_DOS_ETAPAS, enriquecer_proyecto, enriquecer_a_medida
+)
 
 # ========================================
 # MAPEO DE ESPECIALIDADES
@@ -28,6 +36,12 @@ ESPECIALIDADES_DETALLADAS = {
 
 ESPECIALIDADES_VALIDAS = list(ESPECIALIDADES_DETALLADAS.keys())
 
+# 🔥 MAPEO: Nombre completo → Código interno
+NOMBRE_A_CODIGO = {nombre: codigo for codigo, nombre in ESPECIALIDADES_DETALLADAS.items()}
+
+# Esquema del proyecto final (compilado una vez) y reparación local
+VALIDADOR_WBS = ValidadorWBS(ESPECIALIDADES_DETALLADAS)
+
 # 🔥 ESPECIALIDADES DISPONIBLES (con nombres completos para la IA)
 ESPECIALIDADES_PROMPT = """
 ESPECIALIDADES VÁLIDAS (usa EXACTAMENTE estos nombres):
@@ -243,99 +257,408 @@ Prioridades válidas: ALTA, MEDIA, BAJA
 # FUNCIÓN PRINCIPAL
 # ========================================
 
-def chat_analisis_proyecto(
+def _preparar_llamada(
+    mensajes_historial: List[Dict[str, str]],
+    mensajes_enviados: List[Dict[str, str]],
+    decision: Dict,
+    plantilla: Optional[Dict] = None
+) -> Dict:
+    """
+    Arma los parámetros de chat.completions para un turno de análisis.
+    `mensajes_enviados` es el historial ya compactado (resumen + turnos recientes)
+    y `decision` la ruta elegida por enrutador_modelos (modelo y tope de tokens).
+    Con WBS_EN_DOS_ETAPAS el proyecto final se pide en formato esqueleto
+    (ver enriquecimiento_wbs). `plantilla` es un proyecto terminado parecido
+    (plantillas_wbs) que se agrega como ejemplo después del historial: se
+    vuelve a elegir en cada turno y, si fuera antes, cambiaría el prefijo
+    que el proveedor tiene en cache.
+    """
+    mensajes_completos = [
+        {"role": "system", "content": SYSTEM_PROMPT_ANALISIS}
+    ]
+    if WBS_EN_DOS_ETAPAS:
+        mensajes_completos.append({"role": "system", "content": INSTRUCCION_ESQUELETO})
+    mensajes_completos += mensajes_enviados
+    if plantilla:
+        mensajes_completos.append({"role": "system", "content": mensaje_plantilla(plantilla)})
+    
+    # 🔥 FORZAR JSON MODE después de 4 mensajes
+    usar_json_mode = len(mensajes_historial) >= TURNOS_MODO_JSON
+    
+    return {
+        "model": decision["modelo"],
+        "messages": mensajes_completos,
+        "temperature": 0.7,
+        "max_tokens": decision["max_tokens"],
+        "response_format": {"type": "json_object"} if usar_json_mode else None
+    }
+
+
+def _procesar_respuesta(respuesta_texto: str, tokens: int, datos: Optional[Dict] = None) -> Dict:
+    """
+    Interpreta el texto devuelto por el modelo (conversación o proyecto finalizado).
+    `datos` es el JSON ya armado por el lector incremental, si lo hubo.
+    El proyecto se valida contra el esquema y se repara localmente (esquema_wbs);
+    si ni así es válido, el resultado trae "wbs_invalido" para _reparar_con_modelo.
+    """
+    print(f"📥 Respuesta recibida: {tokens} tokens")
+    print(f"📄 Contenido (primeros 200 chars): {respuesta_texto[:200]}...")
+    
+    interpretacion = VALIDADOR_WBS.interpretar(respuesta_texto, datos)
+    estado = interpretacion["estado"]
+    
+    if estado in ("valido", "reparado"):
+        proyecto = interpretacion["datos"]["proyecto"]
+        print(f"🎉 Análisis FINALIZADO: {proyecto.get('titulo', 'Sin título')} ({estado})")
+        print(f"📋 Sub-tareas: {len(proyecto['subtareas'])}")
+        
+        # 🔥 IMPRIMIR ESPECIALIDADES GENERADAS
+        for i, tarea in enumerate(proyecto['subtareas']):
+            print(f"   {i+1}. {tarea.get('titulo')}: '{tarea.get('especialidad')}'")
+        
+        resultado = {
+            "exito": True,
+            "respuesta": "✨ ¡Perfecto! He analizado tu proyecto y lo he descompuesto en tareas específicas.",
+            "finalizado": True,
+            "proyecto": proyecto,
+            "tokens_usados": tokens,
+            "costo_estimado": tokens * 0.00015 / 1000
+        }
+        if interpretacion["reparaciones"]:
+            resultado["reparaciones"] = interpretacion["reparaciones"]
+        return resultado
+    
+    if estado == "conversacion":
+        print("ℹ️ Análisis NO finalizado (continuando conversación)")
+    
+    # 🔥 Respuesta normal (conversación continúa)
+    resultado = {
+        "exito": True,
+        "respuesta": respuesta_texto,
+        "finalizado": False,
+        "tokens_usados": tokens,
+        "costo_estimado": tokens * 0.00015 / 1000
+    }
+    if estado == "invalido":
+        resultado["wbs_invalido"] = {"datos": interpretacion["datos"], "errores": interpretacion["errores"]}
+    return resultado
+
+
+async def _reparar_con_modelo(
+    resultado: Dict,
+    respuesta_texto: str,
+    decision: Dict,
+    cliente_id: Optional[int],
+    proyecto_id: Optional[int]
+) -> Dict:
+    """
+    Segunda llamada, solo cuando la reparación local no alcanzó: se le pasan
+    al modelo la respuesta y los errores del esquema para que la corrija.
+    Si la corrección tampoco es válida queda la respuesta original.
+    """
+    invalido = resultado.pop("wbs_invalido", None)
+    if invalido is None:
+        return resultado
+    
+    print(f"🔁 Pidiendo al modelo que corrija el WBS ({len(invalido['errores'])} errores)")
+    metricas.incrementar("wbs_reparacion_modelo_total")
+    try:
+        response = await completar(
+            "reparacion_wbs",
+            cliente_id=cliente_id,
+            proyecto_id=proyecto_id,
+            model=decision["modelo"],
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT_REPARACION},
+                {"role": "user", "content": json.dumps({
+                    "errores": invalido["errores"],
+                    "respuesta": invalido["datos"] if invalido["datos"] is not None else respuesta_texto
+                }, ensure_ascii=False)}
+            ],
+            temperature=0,
+            max_tokens=WBS_REPARACION_MAX_TOKENS,
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        print(f"❌ Error pidiendo la corrección del WBS: {e}")
+        return resultado
+    
+    tokens = resultado["tokens_usados"] + response.usage.total_tokens
+    corregido = _procesar_respuesta(response.choices[0].message.content or "", tokens)
+    if not corregido["finalizado"]:
+        print("⚠️ La corrección del modelo tampoco cumple el esquema")
+        resultado["tokens_usados"] = tokens
+        resultado["costo_estimado"] = tokens * 0.00015 / 1000
+        return resultado
+    corregido["reparado_por_modelo"] = True
+    return corregido
+
+
+def _respuesta_error(e: Exception) -> Dict:
+    print(f"❌ Error en chat_analisis_proyecto: {e}")
+    import traceback
+    traceback.print_exc()
+    
+    return {
+        "exito": False,
+        "error": str(e),
+        "codigo_http": codigo_http_error(e),
+        "reintentar_en": reintentar_en_error(e),
+        "respuesta": "Lo siento, hubo un error procesando tu mensaje. Por favor intenta de nuevo.",
+        "finalizado": False,
+        "tokens_usados": 0,
+        "costo_estimado": 0
+    }
+
+
+def _sumar_enriquecimiento(resultado: Dict, resumen: Dict) -> Dict:
+    """Suma al resultado los tokens de las llamadas de detalle del WBS."""
+    resultado["tokens_usados"] += resumen["tokens"]
+    resultado["costo_estimado"] = resultado["tokens_usados"] * 0.00015 / 1000
+    resultado["enriquecimiento"] = resumen
+    return resultado
+
+
+def _con_resumen(resultado: Dict, compactacion: Dict) -> Dict:
+    """Adjunta el resumen actualizado para que el router lo persista."""
+    if compactacion["actualizado"]:
+        resultado["resumen_historial"] = {
+            "resumen": compactacion["resumen"],
+            "turnos_resumidos": compactacion["turnos_resumidos"]
+        }
+    return resultado
+
+
+async def chat_analisis_proyecto(
     mensajes_historial: List[Dict[str, str]],
-    cliente_id: int
+    cliente_id: int,
+    resumen_previo: Optional[Dict] = None,
+    proyecto_id: Optional[int] = None
 ) -> Dict:
     """
     Gestiona la conversación con OpenAI para analizar un proyecto.
+    Los turnos antiguos se envían como resumen (ver historial_service);
+    si el resumen cambia, el resultado incluye "resumen_historial".
+    Si un proyecto terminado se parece a lo que pide el cliente
+    (plantillas_wbs), su WBS va al prompt y el resultado trae "plantilla".
     """
     try:
-        # Preparar mensajes
-        mensajes_completos = [
-            {"role": "system", "content": SYSTEM_PROMPT_ANALISIS}
-        ] + mensajes_historial
+        compactacion = await compactar_historial(
+            mensajes_historial, resumen_previo, cliente_id=cliente_id, proyecto_id=proyecto_id
+        )
+        decision = elegir_ruta(mensajes_historial)
+        plantilla = buscar_plantilla(mensajes_historial, proyecto_id, cliente_id)
+        tokens = 0
+        
+        print(f"📤 Enviando {len(compactacion['mensajes'])} de {len(mensajes_historial)} mensajes a OpenAI...")
+        
+        while True:
+            parametros = _preparar_llamada(mensajes_historial, compactacion["mensajes"], decision, plantilla)
+            
+            # Llamada a OpenAI
+            inicio = time.monotonic()
+            response = await completar("chat_analisis", cliente_id=cliente_id, proyecto_id=proyecto_id, **parametros)
+            corte = response.choices[0].finish_reason
+            registrar_resultado(decision, time.monotonic() - inicio, cortado=corte == "length")
+            tokens += response.usage.total_tokens
+            
+            if not debe_escalar(decision, corte):
+                break
+            decision = elegir_ruta(mensajes_historial, escalado=True)
+        
+        respuesta_texto = response.choices[0].message.content.strip()
+        resultado = _procesar_respuesta(respuesta_texto, tokens)
+        resultado = await _reparar_con_modelo(resultado, respuesta_texto, decision, cliente_id, proyecto_id)
         
-        print(f"📤 Enviando {len(mensajes_historial)} mensajes a OpenAI...")
+        # Segunda etapa: detalle de cada sub-tarea en paralelo (lo que no trae ya la plantilla)
+        if resultado["finalizado"] and WBS_EN_DOS_ETAPAS:
+            aplicar_detalle_plantilla(resultado["proyecto"].get("subtareas"), plantilla)
+            resumen = await enriquecer_proyecto(
+                resultado["proyecto"], decision["modelo"], cliente_id=cliente_id, proyecto_id=proyecto_id
+            )
+            _sumar_enriquecimiento(resultado, resumen)
         
-        # 🔥 FORZAR JSON MODE después de 4 mensajes
-        usar_json_mode = len(mensajes_historial) >= 4
+        if plantilla:
+            resultado["plantilla"] = plantilla_publica(plantilla)
+        return _con_resumen(resultado, compactacion)
         
-        # Llamada a OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=mensajes_completos,
-            temperature=0.7,
-            max_tokens=2000,
-            response_format={"type": "json_object"} if usar_json_mode else None
+    except Exception as e:
+        return _respuesta_error(e)
+
+
+async def chat_analisis_proyecto_stream(
+    mensajes_historial: List[Dict[str, str]],
+    cliente_id: int,
+    resumen_previo: Optional[Dict] = None,
+    proyecto_id: Optional[int] = None
+) -> AsyncIterator[Dict]:
+    """
+    Variante en streaming de chat_analisis_proyecto.
+    Emite {"tipo": "inicio"}, luego {"tipo": "token", "contenido": ...} por cada
+    fragmento recibido y al final {"tipo": "fin", "resultado": <dict>} con el
+    mismo formato que devuelve chat_analisis_proyecto.
+    
+    La respuesta se lee con un lector JSON incremental: apenas el modelo
+    escribe "finalizado": true se emite {"tipo": "finalizado"} y cada sub-tarea
+    se refina en cuanto se cierra su objeto ({"tipo": "subtarea", "indice",
+    "subtarea"}). Así el WBS llega ya validado al final del stream
+    (resultado["subtareas_refinadas"]) y guardar_turno no vuelve a refinarlo.
+    
+    Si la ruta de conversación (enrutador_modelos) corta la respuesta por el
+    tope de tokens, se emite {"tipo": "reinicio"} y el turno se repite con la
+    ruta de finalización: el cliente descarta lo recibido hasta ese momento.
+    
+    Con WBS_EN_DOS_ETAPAS las sub-tareas llegan como esqueleto y, antes del
+    "fin", se emite {"tipo": "detalle", "indice", "subtarea"} a medida que
+    termina la llamada de detalle de cada una (enriquecimiento_wbs).
+    """
+    try:
+        compactacion = await compactar_historial(
+            mensajes_historial, resumen_previo, cliente_id=cliente_id, proyecto_id=proyecto_id
         )
+        decision = elegir_ruta(mensajes_historial)
+        plantilla = buscar_plantilla(mensajes_historial, proyecto_id, cliente_id)
+        parametros = _preparar_llamada(mensajes_historial, compactacion["mensajes"], decision, plantilla)
         
-        respuesta_texto = response.choices[0].message.content.strip()
-        tokens = response.usage.total_tokens
+        print(f"📤 Enviando {len(compactacion['mensajes'])} de {len(mensajes_historial)} mensajes a OpenAI (stream)...")
         
-        print(f"📥 Respuesta recibida: {tokens} tokens")
-        print(f"📄 Contenido (primeros 200 chars): {respuesta_texto[:200]}...")
+        yield {"tipo": "inicio", "json": parametros["response_format"] is not None}
         
-        # 🔥 INTENTAR PARSEAR JSON
-        try:
-            datos = json.loads(respuesta_texto)
-            print(f"✅ JSON parseado correctamente")
-            print(f"🔍 Keys en JSON: {list(datos.keys())}")
+        tokens = 0
+        while True:
+            lector = LectorJSONIncremental(valores=[("finalizado",)], arreglos=[("proyecto", "subtareas")])
+            finalizado = False
+            refinadas = []
+            codigos_vistos = set()
             
-            # Verificar si finalizó
-            if datos.get("finalizado") == True or datos.get("finalizado") == "true":
-                print(f"🎉 Análisis FINALIZADO detectado")
-                
-                if "proyecto" in datos and datos["proyecto"]:
-                    proyecto = datos["proyecto"]
-                    print(f"✅ Proyecto encontrado: {proyecto.get('titulo', 'Sin título')}")
-                    print(f"📋 Sub-tareas: {len(proyecto.get('subtareas', []))}")
+            partes = []
+            corte = None
+            inicio = time.monotonic()
+            async for chunk in completar_stream("chat_analisis", cliente_id=cliente_id, proyecto_id=proyecto_id, **parametros):
+                if chunk.usage:
+                    tokens += chunk.usage.total_tokens
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    corte = chunk.choices[0].finish_reason
+                if chunk.choices and chunk.choices[0].delta.content:
+                    fragmento = chunk.choices[0].delta.content
+                    partes.append(fragmento)
+                    yield {"tipo": "token", "contenido": fragmento}
                     
-                    # 🔥 IMPRIMIR ESPECIALIDADES GENERADAS
-                    for i, tarea in enumerate(proyecto.get('subtareas', [])):
-                        print(f"   {i+1}. {tarea.get('titulo')}: '{tarea.get('especialidad')}'")
-                    
-                    return {
-                        "exito": True,
-                        "respuesta": "✨ ¡Perfecto! He analizado tu proyecto y lo he descompuesto en tareas específicas.",
-                        "finalizado": True,
-                        "proyecto": proyecto,
-                        "tokens_usados": tokens,
-                        "costo_estimado": tokens * 0.00015 / 1000
-                    }
-                else:
-                    print(f"⚠️ JSON indica finalizado=true pero falta el proyecto")
-            else:
-                print(f"ℹ️ Análisis NO finalizado (continuando conversación)")
-                
-        except json.JSONDecodeError as e:
-            print(f"⚠️ No es JSON válido (probablemente conversación normal): {e}")
-            # No es JSON, es conversación normal
-        except Exception as e:
-            print(f"❌ Error parseando JSON: {e}")
+                    for evento in lector.alimentar(fragmento):
+                        if evento["tipo"] == "valor":
+                            finalizado = evento["valor"] is True or evento["valor"] == "true"
+                            if finalizado:
+                                print(f"🎉 Finalizado detectado en el stream (fragmento {len(partes)})")
+                                yield {"tipo": "finalizado"}
+                        elif finalizado and isinstance(evento["valor"], dict) and evento["indice"] == len(refinadas):
+                            tarea = evento["valor"]
+                            # El lector entrega una copia: sin repararla, refinar_subtarea
+                            # taparía lo que VALIDADOR_WBS arregla en el WBS completo
+                            VALIDADOR_WBS.reparar_subtarea(tarea, evento["indice"])
+                            # Antes de refinar: la estimación por defecto taparía las horas de la plantilla
+                            aplicar_detalle_plantilla([tarea], plantilla)
+                            prediccion = clasificar_lote([texto_de_tarea(tarea)])[0]
+                            refinadas.append(refinar_subtarea(tarea, evento["indice"], prediccion, codigos_vistos))
+                            yield {"tipo": "subtarea", "indice": evento["indice"], "subtarea": tarea}
+            
+            registrar_resultado(decision, time.monotonic() - inicio, cortado=corte == "length")
+            
+            if not debe_escalar(decision, corte):
+                break
+            # La respuesta se cortó en la ruta corta: se descarta lo enviado y se repite completa
+            decision = elegir_ruta(mensajes_historial, escalado=True)
+            parametros = _preparar_llamada(mensajes_historial, compactacion["mensajes"], decision, plantilla)
+            yield {"tipo": "reinicio"}
         
-        # 🔥 Respuesta normal (conversación continúa)
-        return {
-            "exito": True,
-            "respuesta": respuesta_texto,
-            "finalizado": False,
-            "tokens_usados": tokens,
-            "costo_estimado": tokens * 0.00015 / 1000
-        }
+        datos = lector.documento()
+        respuesta_texto = "".join(partes).strip()
+        resultado = _procesar_respuesta(respuesta_texto, tokens, datos)
+        resultado = await _reparar_con_modelo(resultado, respuesta_texto, decision, cliente_id, proyecto_id)
         
-    except Exception as e:
-        print(f"❌ Error en chat_analisis_proyecto: {e}")
-        import traceback
-        traceback.print_exc()
+        # El WBS ya se refinó mientras llegaba: se usa tal cual si llegó completo
+        subtareas = (resultado.get("proyecto") or {}).get("subtareas")
+        if resultado["finalizado"] and isinstance(subtareas, list) and len(subtareas) == len(refinadas):
+            resultado["proyecto"]["subtareas"] = refinadas
+            resultado["subtareas_refinadas"] = True
         
-        return {
-            "exito": False,
-            "error": str(e),
-            "respuesta": "Lo siento, hubo un error procesando tu mensaje. Por favor intenta de nuevo.",
-            "finalizado": False,
-            "tokens_usados": 0,
-            "costo_estimado": 0
-        }
+        if resultado["finalizado"] and WBS_EN_DOS_ETAPAS:
+            aplicar_detalle_plantilla(resultado["proyecto"].get("subtareas"), plantilla)
+            resumen = {}
+            async for evento in enriquecer_a_medida(
+                resultado["proyecto"], decision["modelo"], cliente_id=cliente_id,
+                proyecto_id=proyecto_id, resumen=resumen
+            ):
+                yield {"tipo": "detalle", "indice": evento["indice"], "subtarea": evento["subtarea"]}
+            _sumar_enriquecimiento(resultado, resumen)
+        
+        if plantilla:
+            resultado["plantilla"] = plantilla_publica(plantilla)
+        yield {"tipo": "fin", "resultado": _con_resumen(resultado, compactacion)}
+        
+    except Exception as e:
+        yield {"tipo": "fin", "resultado": _respuesta_error(e)}
+
+
+def resolver_especialidad(especialidad_nombre: str, prediccion: Dict) -> Tuple[str, str]:
+    """
+    Convierte la especialidad que escribió el modelo a un código interno.
+    Devuelve (código, origen) con origen "exacta", "parcial", "clasificador"
+    o "por_defecto" (no se pudo mapear y se usa DESARROLLO_MEDIDA).
+    """
+    # Buscar en el mapeo (coincidencia exacta o parcial)
+    especialidad_codigo = None
+    origen = "por_defecto"
+    for nombre, codigo in NOMBRE_A_CODIGO.items():
+        if nombre.lower() == especialidad_nombre.lower() or codigo == especialidad_nombre:
+            # Coincidencia exacta
+            return codigo, "exacta"
+        elif nombre.lower() in especialidad_nombre.lower() or especialidad_nombre.lower() in nombre.lower():
+            # Coincidencia parcial
+            especialidad_codigo = codigo
+            origen = "parcial"
+    
+    # Sin coincidencia exacta: el clasificador local manda si está seguro
+    if prediccion["confiable"]:
+        return prediccion["especialidad"], "clasificador"
+    
+    # Si no encontró match, usar DESARROLLO_MEDIDA por defecto
+    return especialidad_codigo or "DESARROLLO_MEDIDA", origen
+
+
+def refinar_subtarea(tarea: Dict, i: int, prediccion: Dict, codigos_vistos: set) -> Dict:
+    """Valida y corrige una sub-tarea (código único, especialidad, prioridad, estimación)."""
+    # Código único
+    codigo = tarea.get("codigo", f"TASK-{str(i+1).zfill(3)}")
+    if codigo in codigos_vistos:
+        codigo = f"TASK-{str(i+1).zfill(3)}"
+    codigos_vistos.add(codigo)
+    tarea["codigo"] = codigo
+    
+    # 🔥 CONVERTIR ESPECIALIDAD: Nombre → Código
+    especialidad_nombre = tarea.get("especialidad", "")
+    especialidad_codigo, origen = resolver_especialidad(especialidad_nombre, prediccion)
+    
+    if origen == "clasificador":
+        print(f"🧠 Sub-tarea {i+1}: clasificador → {especialidad_codigo} ({prediccion['confianza']:.2f})")
+    elif origen == "por_defecto":
+        print(f"⚠️ Especialidad no encontrada: '{especialidad_nombre}' - usando DESARROLLO_MEDIDA")
+    
+    tarea["especialidad"] = especialidad_codigo
+    print(f"✅ Sub-tarea {i+1}: '{especialidad_nombre}' → {especialidad_codigo}")
+    
+    # Validar prioridad
+    if tarea.get("prioridad") not in ["ALTA", "MEDIA", "BAJA"]:
+        tarea["prioridad"] = "MEDIA"
+    
+    # Validar estimación
+    if not isinstance(tarea.get("estimacion_horas"), (int, float)) or tarea["estimacion_horas"] <= 0:
+        tarea["estimacion_horas"] = 40
+    
+    # Validar dependencias
+    if not isinstance(tarea.get("dependencias"), list):
+        tarea["dependencias"] = []
+    
+    return tarea
 
 
 def refinar_subtareas(proyecto_data: Dict) -> Dict:
@@ -344,63 +667,11 @@ def refinar_subtareas(proyecto_data: Dict) -> Dict:
         subtareas = proyecto_data.get("subtareas", [])
         codigos_vistos = set()
         
-        # 🔥 MAPEO: Nombre completo → Código interno
-        NOMBRE_A_CODIGO = {
-            "Consultoría en desarrollo de sistemas": "CONSULTORIA_DESARROLLO",
-            "Consultoría en hardware": "CONSULTORIA_HARDWARE",
-            "Consultoría en software": "CONSULTORIA_SOFTWARE",
-            "Desarrollo de software a medida": "DESARROLLO_MEDIDA",
-            "Desarrollo y producción de software empaquetado": "SOFTWARE_EMPAQUETADO",
-            "Actualización y adaptación de software": "ACTUALIZACION_SOFTWARE",
-            "Servicios de alojamiento de datos (hosting)": "HOSTING",
-            "Servicios de procesamiento de datos": "PROCESAMIENTO_DATOS",
-            "Servicios en la nube (cloud computing)": "CLOUD_COMPUTING",
-            "Servicios de recuperación ante desastres": "RECUPERACION_DESASTRES",
-            "Servicios de ciberseguridad": "CIBERSEGURIDAD",
-            "Capacitación en TI": "CAPACITACION_TI"
-        }
+        # Clasificador local (un solo lote): decide cuando el nombre que dio el modelo no es exacto
+        predicciones = clasificar_lote([texto_de_tarea(t) for t in subtareas])
         
         for i, tarea in enumerate(subtareas):
-            # Código único
-            codigo = tarea.get("codigo", f"TASK-{str(i+1).zfill(3)}")
-            if codigo in codigos_vistos:
-                codigo = f"TASK-{str(i+1).zfill(3)}"
-            codigos_vistos.add(codigo)
-            tarea["codigo"] = codigo
-            
-            # 🔥 CONVERTIR ESPECIALIDAD: Nombre → Código
-            especialidad_nombre = tarea.get("especialidad", "")
-            
-            # Buscar en el mapeo (coincidencia exacta o parcial)
-            especialidad_codigo = None
-            for nombre, codigo in NOMBRE_A_CODIGO.items():
-                if nombre.lower() == especialidad_nombre.lower():
-                    # Coincidencia exacta
-                    especialidad_codigo = codigo
-                    break
-                elif nombre.lower() in especialidad_nombre.lower() or especialidad_nombre.lower() in nombre.lower():
-                    # Coincidencia parcial
-                    especialidad_codigo = codigo
-            
-            # Si no encontró match, usar DESARROLLO_MEDIDA por defecto
-            if not especialidad_codigo:
-                print(f"⚠️ Especialidad no encontrada: '{especialidad_nombre}' - usando DESARROLLO_MEDIDA")
-                especialidad_codigo = "DESARROLLO_MEDIDA"
-            
-            tarea["especialidad"] = especialidad_codigo
-            print(f"✅ Sub-tarea {i+1}: '{especialidad_nombre}' → {especialidad_codigo}")
-            
-            # Validar prioridad
-            if tarea.get("prioridad") not in ["ALTA", "MEDIA", "BAJA"]:
-                tarea["prioridad"] = "MEDIA"
-            
-            # Validar estimación
-            if not isinstance(tarea.get("estimacion_horas"), (int, float)) or tarea["estimacion_horas"] <= 0:
-                tarea["estimacion_horas"] = 40
-            
-            # Validar dependencias
-            if not isinstance(tarea.get("dependencias"), list):
-                tarea["dependencias"] = []
+            refinar_subtarea(tarea, i, predicciones[i], codigos_vistos)
         
         proyecto_data["subtareas"] = subtareas
         
@@ -0,0 +1,316 @@
+# backend/services/clasificador_especialidades.py
+"""
+Clasificador local de especialidades (texto de una tarea -> código de especialidad).
+
+TF-IDF de palabras y bigramas + regresión logística multinomial, todo en
+NumPy. Se entrena con los pares (sub-tarea -> especialidad) que ya guarda
+AnalisisIA.analisis_completo (ver herramientas.entrenar_clasificador) y se
+guarda en un .npz. Clasifica un lote en microsegundos por texto;
+clasificar_con_respaldo consulta al modelo de lenguaje (una sola llamada
+por lote) solo con los textos cuya confianza queda bajo CLASIFICADOR_UMBRAL.
+
+Sin archivo entrenado, clasificar_lote devuelve confianza 0 para todo y
+los flujos siguen como antes.
+"""
+import os
+import re
+import json
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from modelos.requerimiento_model import EspecialidadEnum
+from services import metricas
+from services.llm_cliente import completar
+from services.texto import plegar
+
+CLASIFICADOR_RUTA = os.getenv(
+    "CLASIFICADOR_ESPECIALIDADES_RUTA",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "datos", "clasificador_especialidades.npz")
+)
+CLASIFICADOR_UMBRAL = float(os.getenv("CLASIFICADOR_UMBRAL", "0.6"))
+
+# Código interno de cada especialidad -> nombre
+ESPECIALIDADES = {e.name: e.value for e in EspecialidadEnum if e is not EspecialidadEnum.OTRO}
+
+_STOPWORDS = {
+    "de", "la", "el", "los", "las", "en", "y", "a", "para", "con", "del", "por",
+    "un", "una", "que", "se", "al", "o", "su", "sus", "como", "es", "lo", "mas",
+    "the", "and", "of", "to", "for", "in",
+}
+
+
+def terminos(texto: str) -> List[str]:
+    palabras = [p for p in re.findall(r"[a-z0-9]+", plegar(texto)) if len(p) > 1 and p not in _STOPWORDS]
+    return palabras + [f"{a} {b}" for a, b in zip(palabras, palabras[1:])]
+
+
+def texto_de_tarea(tarea: Dict) -> str:
+    return f"{tarea.get('titulo', '')}. {tarea.get('descripcion', '')}"
+
+
+class ModeloEspecialidades:
+    """Vocabulario + idf + pesos de la regresión logística."""
+
+    def __init__(self, vocabulario: Dict[str, int], idf: np.ndarray, pesos: np.ndarray,
+                 sesgo: np.ndarray, clases: List[str], metadatos: Optional[Dict] = None):
+        self.vocabulario = vocabulario
+        self.idf = idf
+        self.pesos = pesos
+        self.sesgo = sesgo
+        self.clases = clases
+        self.metadatos = metadatos or {}
+
+    # ---------- vectorización (matriz dispersa CSR en arreglos NumPy) ----------
+
+    def vectorizar(self, textos: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Devuelve (filas, columnas, valores) de la matriz TF-IDF con filas normalizadas (L2)."""
+        filas, columnas, valores = [], [], []
+        for i, texto in enumerate(textos):
+            conteo = Counter(t for t in terminos(texto) if t in self.vocabulario)
+            if not conteo:
+                continue
+            cols = np.fromiter((self.vocabulario[t] for t in conteo), dtype=np.int64, count=len(conteo))
+            tf = 1.0 + np.log(np.fromiter(conteo.values(), dtype=np.float64, count=len(conteo)))
+            vals = tf * self.idf[cols]
+            vals /= np.linalg.norm(vals)
+            filas.append(np.full(len(cols), i, dtype=np.int64))
+            columnas.append(cols)
+            valores.append(vals)
+        if not filas:
+            vacio = np.zeros(0, dtype=np.int64)
+            return vacio, vacio, np.zeros(0)
+        return np.concatenate(filas), np.concatenate(columnas), np.concatenate(valores)
+
+    def _puntajes(self, x: Tuple[np.ndarray, np.ndarray, np.ndarray], n: int) -> np.ndarray:
+        filas, columnas, valores = x
+        puntajes = np.empty((n, len(self.clases)))
+        for k in range(len(self.clases)):
+            puntajes[:, k] = np.bincount(filas, weights=valores * self.pesos[columnas, k], minlength=n)
+        return puntajes + self.sesgo
+
+    def probabilidades(self, textos: List[str]) -> np.ndarray:
+        return _softmax(self._puntajes(self.vectorizar(textos), len(textos)))
+
+    def clasificar_lote(self, textos: List[str]) -> List[Dict]:
+        if not textos:
+            return []
+        probas = self.probabilidades(textos)
+        mejores = probas.argmax(axis=1)
+        return [
+            {"especialidad": self.clases[k], "confianza": float(probas[i, k])}
+            for i, k in enumerate(mejores)
+        ]
+
+    # ---------- persistencia ----------
+
+    def guardar(self, ruta: str = CLASIFICADOR_RUTA):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        terminos_ordenados = sorted(self.vocabulario, key=self.vocabulario.get)
+        np.savez_compressed(
+            ruta,
+            vocabulario=np.array(terminos_ordenados),
+            idf=self.idf,
+            pesos=self.pesos,
+            sesgo=self.sesgo,
+            clases=np.array(self.clases),
+            metadatos=np.array(json.dumps(self.metadatos, ensure_ascii=False))
+        )
+
+    @classmethod
+    def cargar(cls, ruta: str = CLASIFICADOR_RUTA) -> "ModeloEspecialidades":
+        with np.load(ruta, allow_pickle=False) as datos:
+            return cls(
+                vocabulario={t: i for i, t in enumerate(datos["vocabulario"].tolist())},
+                idf=datos["idf"],
+                pesos=datos["pesos"],
+                sesgo=datos["sesgo"],
+                clases=datos["clases"].tolist(),
+                metadatos=json.loads(str(datos["metadatos"]))
+            )
+
+
+def _softmax(puntajes: np.ndarray) -> np.ndarray:
+    exp = np.exp(puntajes - puntajes.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+# ========================================
+# ENTRENAMIENTO
+# ========================================
+
+def entrenar(
+    textos: List[str],
+    etiquetas: List[str],
+    min_df: int = 2,
+    max_terminos: int = 20000,
+    epocas: int = 300,
+    tasa: float = 0.1,
+    l2: float = 1e-4,
+    balancear: bool = True
+) -> ModeloEspecialidades:
+    """
+    Ajusta vocabulario, idf y una regresión logística multinomial con Adam
+    (gradiente de lote completo; el problema es convexo y pequeño).
+    """
+    n = len(textos)
+    df = Counter()
+    for texto in textos:
+        df.update(set(terminos(texto)))
+    frecuentes = [t for t, c in df.most_common(max_terminos) if c >= min_df]
+    vocabulario = {t: i for i, t in enumerate(sorted(frecuentes))}
+    idf = np.array([np.log((1 + n) / (1 + df[t])) + 1.0 for t in sorted(frecuentes)])
+
+    clases = sorted(set(etiquetas))
+    indice = {c: k for k, c in enumerate(clases)}
+    y = np.array([indice[e] for e in etiquetas])
+    objetivo = np.zeros((n, len(clases)))
+    objetivo[np.arange(n), y] = 1.0
+
+    # Clases poco frecuentes pesan más, para que no se las coma DESARROLLO_MEDIDA
+    conteo_clases = np.bincount(y, minlength=len(clases))
+    peso_clase = n / (len(clases) * conteo_clases) if balancear else np.ones(len(clases))
+    peso_fila = peso_clase[y][:, None] / n
+
+    modelo = ModeloEspecialidades(
+        vocabulario, idf, np.zeros((len(vocabulario), len(clases))), np.zeros(len(clases)), clases
+    )
+    x = modelo.vectorizar(textos)
+    filas, columnas, valores = x
+
+    m = [np.zeros_like(modelo.pesos), np.zeros_like(modelo.sesgo)]
+    v = [np.zeros_like(modelo.pesos), np.zeros_like(modelo.sesgo)]
+    b1, b2, eps = 0.9, 0.999, 1e-8
+    for paso in range(1, epocas + 1):
+        error = (_softmax(modelo._puntajes(x, n)) - objetivo) * peso_fila
+        grad_pesos = np.empty_like(modelo.pesos)
+        for k in range(len(clases)):
+            grad_pesos[:, k] = np.bincount(columnas, weights=valores * error[filas, k], minlength=len(vocabulario))
+        grad_pesos += l2 * modelo.pesos
+        gradientes = [grad_pesos, error.sum(axis=0)]
+        for j, (param, grad) in enumerate(zip((modelo.pesos, modelo.sesgo), gradientes)):
+            m[j] = b1 * m[j] + (1 - b1) * grad
+            v[j] = b2 * v[j] + (1 - b2) * grad ** 2
+            param -= tasa * (m[j] / (1 - b1 ** paso)) / (np.sqrt(v[j] / (1 - b2 ** paso)) + eps)
+
+    modelo.metadatos = {
+        "entrenado_en": datetime.utcnow().isoformat(),
+        "ejemplos": n,
+        "terminos": len(vocabulario),
+        "por_clase": {c: int(conteo_clases[k]) for k, c in enumerate(clases)},
+    }
+    return modelo
+
+
+def ejemplos_de_analisis(db) -> Tuple[List[str], List[str]]:
+    """Pares (texto de sub-tarea, código de especialidad) de los AnalisisIA completados."""
+    from modelos.analisis_ia_modelo import AnalisisIA
+
+    textos, etiquetas = [], []
+    filas = db.query(AnalisisIA.analisis_completo).filter(AnalisisIA.completado == True).yield_per(200)
+    for (analisis,) in filas:
+        for tarea in (analisis or {}).get("subtareas", []):
+            codigo = tarea.get("especialidad")
+            if codigo in ESPECIALIDADES and (tarea.get("titulo") or tarea.get("descripcion")):
+                textos.append(texto_de_tarea(tarea))
+                etiquetas.append(codigo)
+    return textos, etiquetas
+
+
+# ========================================
+# MODELO EN USO
+# ========================================
+
+_modelo: Optional[ModeloEspecialidades] = None
+_cargado = False
+_lock = threading.Lock()
+
+
+def obtener_modelo() -> Optional[ModeloEspecialidades]:
+    """Carga el modelo la primera vez (None si aún no se entrenó)."""
+    global _modelo, _cargado
+    if not _cargado:
+        with _lock:
+            if not _cargado:
+                if os.path.exists(CLASIFICADOR_RUTA):
+                    try:
+                        _modelo = ModeloEspecialidades.cargar(CLASIFICADOR_RUTA)
+                        print(f"🧠 Clasificador de especialidades cargado ({_modelo.metadatos.get('ejemplos')} ejemplos)")
+                    except Exception as e:
+                        print(f"⚠️ No se pudo cargar el clasificador de especialidades: {e}")
+                _cargado = True
+    return _modelo
+
+
+def recargar():
+    """Vuelve a leer el archivo (tras reentrenar)."""
+    global _cargado
+    with _lock:
+        _cargado = False
+    return obtener_modelo()
+
+
+def clasificar_lote(textos: Iterable[str]) -> List[Dict]:
+    """
+    Clasifica varios textos de una vez. Cada resultado trae `especialidad`
+    (código o None), `confianza` (0-1) y `confiable` (confianza >= umbral).
+    """
+    textos = list(textos)
+    modelo = obtener_modelo()
+    if modelo is None:
+        return [{"especialidad": None, "confianza": 0.0, "confiable": False} for _ in textos]
+
+    resultados = modelo.clasificar_lote(textos)
+    for r in resultados:
+        r["confiable"] = r["confianza"] >= CLASIFICADOR_UMBRAL
+        metricas.incrementar("clasificador_especialidades_total", confiable=r["confiable"])
+    return resultados
+
+
+PROMPT_RESPALDO = """Eres un clasificador de especialidades de TI.
+Para cada texto numerado responde el código de su especialidad, uno de:
+{codigos}
+
+Responde SOLO con JSON: {{"especialidades": ["CODIGO", ...]}} en el mismo orden."""
+
+
+async def clasificar_con_respaldo(textos: List[str], cliente_id: Optional[int] = None) -> List[Dict]:
+    """
+    Como clasificar_lote, pero los textos con baja confianza se resuelven con
+    una sola llamada al modelo de lenguaje. `origen` indica quién decidió.
+    """
+    resultados = clasificar_lote(textos)
+    dudosos = [i for i, r in enumerate(resultados) if not r["confiable"]]
+    for r in resultados:
+        r["origen"] = "clasificador"
+    if not dudosos:
+        return resultados
+
+    codigos = "\n".join(f"- {codigo}: {nombre}" for codigo, nombre in ESPECIALIDADES.items())
+    lista = "\n".join(f"{n}. {textos[i][:500]}" for n, i in enumerate(dudosos, 1))
+    try:
+        response = await completar(
+            "clasificar_especialidades",
+            cliente_id=cliente_id,
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": PROMPT_RESPALDO.format(codigos=codigos)},
+                {"role": "user", "content": lista}
+            ],
+            temperature=0,
+            max_tokens=20 * len(dudosos) + 20,
+            response_format={"type": "json_object"}
+        )
+        respuesta = json.loads(response.choices[0].message.content).get("especialidades", [])
+    except Exception as e:
+        print(f"⚠️ Respaldo LLM del clasificador falló: {e}")
+        return resultados
+
+    for i, codigo in zip(dudosos, respuesta):
+        if codigo in ESPECIALIDADES:
+            resultados[i].update({"especialidad": codigo, "origen": "llm"})
+    metricas.incrementar("clasificador_especialidades_respaldo_total", len(dudosos))
+    return resultados
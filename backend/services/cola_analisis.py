@@ -0,0 +1,382 @@
+# backend/services/cola_analisis.py
+"""
+Cola de trabajos del chat de análisis, respaldada por Postgres.
+
+POST /chat-analisis/continuar/trabajo solo inserta un TrabajoAnalisis y
+devuelve su id; un pool de workers (tareas asyncio, en la app o en
+herramientas.worker_analisis) reclama trabajos con FOR UPDATE SKIP LOCKED,
+llama al modelo, persiste el turno (incluida la finalización: sub-tareas,
+AnalisisIA) y guarda la respuesta en el trabajo.
+
+- Los turnos de un mismo proyecto se procesan en orden: un trabajo no se
+  reclama mientras haya otro anterior del mismo proyecto sin terminar. La
+  fila es la de services.coordinacion_turnos, que comparte con los /continuar
+  directos: un trabajo tampoco se adelanta a un turno directo anterior.
+- El worker toma además el candado del proyecto; si está ocupado el trabajo
+  se pospone sin gastar un intento.
+- Con el header Idempotency-Key, encolar otra vez con la misma clave
+  devuelve el mismo trabajo (o el turno directo con esa clave). Sin la clave
+  cada envío es un turno nuevo, aunque repita el texto.
+- Si un worker muere, el trabajo se vuelve a reclamar al vencer su lease.
+  Mientras el worker vive, el lease se renueva cada COLA_LEASE_SEGUNDOS / 3
+  (un turno largo: escalado, reparación, enriquecimiento, no se repite).
+- Los fallos transitorios (5xx, circuito abierto, timeout) se reintentan
+  con backoff hasta max_intentos.
+- Los eventos (inicio, token, finalizado, subtarea, detalle, reinicio, fin, error) se publican a los suscriptores
+  SSE del mismo proceso; los demás ven el resultado consultando la tabla.
+"""
+import os
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+from database import SessionLocal
+from modelos.proyecto_modelo import Proyecto, FaseProyecto
+from modelos.trabajo_analisis_modelo import TrabajoAnalisis, EstadoTrabajo, OrigenTrabajo
+from services import coordinacion_turnos
+from services.chat_analisis_service import chat_analisis_proyecto_stream
+from services.transcripcion_service import TranscripcionService
+from services.turno_analisis_service import cargar_turno, guardar_turno
+
+COLA_ANALISIS_WORKERS = int(os.getenv("COLA_ANALISIS_WORKERS", "4"))
+COLA_INTERVALO_SEGUNDOS = float(os.getenv("COLA_INTERVALO_SEGUNDOS", "1"))
+COLA_LEASE_SEGUNDOS = int(os.getenv("COLA_LEASE_SEGUNDOS", "300"))
+COLA_MAX_INTENTOS = int(os.getenv("COLA_MAX_INTENTOS", "3"))
+COLA_BACKOFF_SEGUNDOS = float(os.getenv("COLA_BACKOFF_SEGUNDOS", "5"))
+
+# Códigos que indican un fallo transitorio (vale la pena reintentar)
+CODIGOS_REINTENTABLES = {500, 502, 503, 504}
+
+ESTADOS_TERMINALES = (EstadoTrabajo.COMPLETADO, EstadoTrabajo.FALLIDO)
+
+
+class ErrorTrabajo(Exception):
+    def __init__(self, mensaje: str, codigo_http: int = 500, reintentar_en: Optional[float] = None):
+        self.codigo_http = codigo_http
+        self.reintentar_en = reintentar_en
+        super().__init__(mensaje)
+
+
+# ========================================
+# ENCOLAR Y CONSULTAR
+# ========================================
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_hay_trabajo: Optional[asyncio.Event] = None
+
+
+def encolar(db, proyecto_id: int, mensaje: str, clave_cliente: Optional[str] = None) -> TrabajoAnalisis:
+    """Valida el proyecto e inserta el trabajo (hace commit). Despierta a los workers locales."""
+    proyecto = db.query(Proyecto).filter(Proyecto.id == proyecto_id).first()
+    if not proyecto:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    if proyecto.fase != FaseProyecto.ANALISIS:
+        raise HTTPException(status_code=400, detail="El proyecto ya no está en fase de análisis")
+
+    trabajo, nuevo = coordinacion_turnos.registrar_turno(
+        db, proyecto, mensaje, clave_cliente, OrigenTrabajo.COLA, max_intentos=COLA_MAX_INTENTOS
+    )
+    if not nuevo:
+        return trabajo
+    print(f"📥 Trabajo {trabajo.id} encolado (proyecto {proyecto_id})")
+
+    if _loop is not None and _hay_trabajo is not None:
+        _loop.call_soon_threadsafe(_hay_trabajo.set)
+    return trabajo
+
+
+def serializar(trabajo: TrabajoAnalisis) -> Dict:
+    return {
+        "trabajo_id": trabajo.id,
+        "proyecto_id": trabajo.proyecto_id,
+        "estado": trabajo.estado.value,
+        "intentos": trabajo.intentos,
+        "resultado": trabajo.resultado,
+        "error": trabajo.error,
+        "codigo_http": trabajo.codigo_http,
+        "created_at": trabajo.created_at,
+        "iniciado_en": trabajo.iniciado_en,
+        "terminado_en": trabajo.terminado_en
+    }
+
+
+def obtener(trabajo_id: int) -> Optional[Dict]:
+    db = SessionLocal()
+    try:
+        trabajo = db.query(TrabajoAnalisis).filter(TrabajoAnalisis.id == trabajo_id).first()
+        return serializar(trabajo) if trabajo else None
+    finally:
+        db.close()
+
+
+# ========================================
+# EVENTOS (suscriptores SSE del proceso)
+# ========================================
+
+_suscriptores: Dict[int, Set[asyncio.Queue]] = {}
+
+
+def suscribir(trabajo_id: int) -> asyncio.Queue:
+    cola = asyncio.Queue()
+    _suscriptores.setdefault(trabajo_id, set()).add(cola)
+    return cola
+
+
+def desuscribir(trabajo_id: int, cola: asyncio.Queue):
+    colas = _suscriptores.get(trabajo_id)
+    if colas:
+        colas.discard(cola)
+        if not colas:
+            del _suscriptores[trabajo_id]
+
+
+def _publicar(trabajo_id: int, evento: str, datos: Dict):
+    for cola in _suscriptores.get(trabajo_id, ()):
+        cola.put_nowait((evento, datos))
+
+
+# ========================================
+# WORKERS
+# ========================================
+
+def _reclamar(worker: str) -> Optional[int]:
+    """Toma el siguiente trabajo disponible (o con lease vencido) y lo marca EN_PROCESO."""
+    db = SessionLocal()
+    try:
+        ahora = datetime.utcnow()
+        trabajo = db.query(TrabajoAnalisis).filter(
+            TrabajoAnalisis.origen == OrigenTrabajo.COLA,
+            or_(
+                and_(TrabajoAnalisis.estado == EstadoTrabajo.PENDIENTE, TrabajoAnalisis.disponible_en <= ahora),
+                and_(TrabajoAnalisis.estado == EstadoTrabajo.EN_PROCESO, TrabajoAnalisis.bloqueado_hasta < ahora)
+            ),
+            ~coordinacion_turnos.hay_anterior_en_fila(ahora)
+        ).order_by(TrabajoAnalisis.id).with_for_update(skip_locked=True).first()
+
+        if trabajo is None:
+            return None
+
+        if trabajo.estado == EstadoTrabajo.EN_PROCESO:
+            print(f"⚠️ Trabajo {trabajo.id}: lease vencido (worker {trabajo.worker}), se reclama de nuevo")
+        if trabajo.intentos >= trabajo.max_intentos:
+            trabajo.estado = EstadoTrabajo.FALLIDO
+            trabajo.error = trabajo.error or "Se agotaron los intentos"
+            trabajo.codigo_http = trabajo.codigo_http or 500
+            trabajo.terminado_en = ahora
+            db.commit()
+            return None
+
+        trabajo.estado = EstadoTrabajo.EN_PROCESO
+        trabajo.intentos += 1
+        trabajo.worker = worker
+        trabajo.iniciado_en = ahora
+        trabajo.bloqueado_hasta = ahora + timedelta(seconds=COLA_LEASE_SEGUNDOS)
+        db.commit()
+        return trabajo.id
+    finally:
+        db.close()
+
+
+def _registrar_fallo(trabajo_id: int, error: Exception) -> bool:
+    """Marca el trabajo para reintento o como FALLIDO. Devuelve True si es definitivo."""
+    codigo = getattr(error, "codigo_http", None) or getattr(error, "status_code", None) or 500
+    detalle = getattr(error, "detail", None) or str(error)
+    db = SessionLocal()
+    try:
+        trabajo = db.query(TrabajoAnalisis).filter(TrabajoAnalisis.id == trabajo_id).first()
+        trabajo.error = str(detalle)
+        trabajo.codigo_http = codigo
+        trabajo.worker = None
+        trabajo.bloqueado_hasta = None
+        # Un 429 con Retry-After (admisión del cliente) también es transitorio;
+        # el de presupuesto agotado no trae reintentar_en y falla
+        reintentar_en = getattr(error, "reintentar_en", None)
+        if (codigo in CODIGOS_REINTENTABLES or reintentar_en) and trabajo.intentos < trabajo.max_intentos:
+            espera = max(COLA_BACKOFF_SEGUNDOS * 2 ** (trabajo.intentos - 1), reintentar_en or 0)
+            trabajo.estado = EstadoTrabajo.PENDIENTE
+            trabajo.disponible_en = datetime.utcnow() + timedelta(seconds=espera)
+            definitivo = False
+            print(f"🔁 Trabajo {trabajo_id}: {detalle} - reintento en {espera:.0f}s")
+        else:
+            trabajo.estado = EstadoTrabajo.FALLIDO
+            trabajo.terminado_en = datetime.utcnow()
+            definitivo = True
+            print(f"❌ Trabajo {trabajo_id} fallido: {detalle}")
+        db.commit()
+        return definitivo
+    finally:
+        db.close()
+
+
+async def _latido(trabajo_id: int, worker: str):
+    """Renueva el lease del trabajo mientras se procesa (se cancela al terminar)."""
+    while True:
+        await asyncio.sleep(COLA_LEASE_SEGUNDOS / 3)
+        try:
+            if not await asyncio.to_thread(
+                coordinacion_turnos.renovar_lease, trabajo_id, worker, COLA_LEASE_SEGUNDOS
+            ):
+                print(f"⚠️ Trabajo {trabajo_id}: el lease ya no es de {worker}")
+                return
+        except Exception as e:
+            print(f"⚠️ Trabajo {trabajo_id}: no se pudo renovar el lease: {e}")
+
+
+def _liberar(trabajo_id: int, espera: float = 0.0):
+    """
+    Devuelve a la cola, sin gastar un intento, un trabajo interrumpido (apagado
+    del worker) o que no pudo tomar el candado del proyecto (dentro de `espera`).
+    """
+    db = SessionLocal()
+    try:
+        db.query(TrabajoAnalisis).filter(
+            TrabajoAnalisis.id == trabajo_id,
+            TrabajoAnalisis.estado == EstadoTrabajo.EN_PROCESO
+        ).update({
+            "estado": EstadoTrabajo.PENDIENTE,
+            "intentos": TrabajoAnalisis.intentos - 1,
+            "worker": None,
+            "bloqueado_hasta": None,
+            "disponible_en": datetime.utcnow() + timedelta(seconds=espera)
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def procesar(trabajo_id: int, worker: str):
+    """
+    Ejecuta un turno de análisis: modelo + persistencia, y guarda la respuesta
+    en el trabajo. La sesión no retiene su conexión durante la llamada al modelo.
+    """
+    db = SessionLocal()
+    proyecto_id = None
+    candado = None
+    latido = asyncio.create_task(_latido(trabajo_id, worker))
+    try:
+        trabajo = await asyncio.to_thread(
+            lambda: db.query(TrabajoAnalisis).filter(TrabajoAnalisis.id == trabajo_id).first()
+        )
+        proyecto_id = trabajo.proyecto_id
+        candado = await asyncio.to_thread(coordinacion_turnos.intentar_candado, proyecto_id)
+        if candado is None:
+            # Un turno del proyecto sigue en curso: se pospone sin contar el intento
+            await asyncio.to_thread(_liberar, trabajo_id, coordinacion_turnos.TURNO_REINTENTAR_EN_SEGUNDOS)
+            print(f"⏳ Trabajo {trabajo_id}: otro turno del proyecto {proyecto_id} en curso, se pospone")
+            return
+        # Con el candado tomado: si el lease venció y otro worker ya lo terminó, no se repite
+        await asyncio.to_thread(db.refresh, trabajo)
+        if trabajo.estado != EstadoTrabajo.EN_PROCESO or trabajo.worker != worker:
+            print(f"⏭️ Trabajo {trabajo_id}: ya no es de {worker} ({trabajo.estado.value}), se omite")
+            return
+        claves, guardada = await asyncio.to_thread(
+            coordinacion_turnos.preparar_turno, db, proyecto_id, trabajo.mensaje, trabajo.clave_cliente
+        )
+
+        resultado = None
+        if guardada is None:
+            proyecto, historial, resumen_previo = await asyncio.to_thread(
+                cargar_turno, db, trabajo.proyecto_id, trabajo.mensaje
+            )
+            await asyncio.to_thread(coordinacion_turnos.soltar_conexion, db)
+
+            async for evento in chat_analisis_proyecto_stream(historial, proyecto.cliente_id, resumen_previo, proyecto.id):
+                if evento["tipo"] == "token":
+                    _publicar(trabajo_id, "token", {"contenido": evento["contenido"]})
+                elif evento["tipo"] == "inicio":
+                    _publicar(trabajo_id, "inicio", {"proyecto_id": proyecto.id, "json": evento["json"]})
+                elif evento["tipo"] == "finalizado":
+                    _publicar(trabajo_id, "finalizado", {"proyecto_id": proyecto.id})
+                elif evento["tipo"] == "subtarea":
+                    _publicar(trabajo_id, "subtarea", {"indice": evento["indice"], "subtarea": evento["subtarea"]})
+                elif evento["tipo"] == "detalle":
+                    _publicar(trabajo_id, "detalle", {"indice": evento["indice"], "subtarea": evento["subtarea"]})
+                elif evento["tipo"] == "reinicio":
+                    _publicar(trabajo_id, "reinicio", {"proyecto_id": proyecto.id})
+                else:
+                    resultado = evento["resultado"]
+
+            if not resultado["exito"]:
+                raise ErrorTrabajo(resultado.get("error"), resultado.get("codigo_http", 500), resultado.get("reintentar_en"))
+
+        def persistir():
+            # El estado COMPLETADO viaja en el mismo commit que el turno:
+            # si el worker muere después, el trabajo no se repite
+            trabajo.estado = EstadoTrabajo.COMPLETADO
+            trabajo.terminado_en = datetime.utcnow()
+            trabajo.error = None
+            trabajo.codigo_http = 200
+            if guardada is not None:
+                respuesta = guardada
+            else:
+                respuesta = guardar_turno(db, proyecto, trabajo.mensaje, resultado, claves)
+            trabajo.resultado = respuesta
+            db.commit()
+            return respuesta
+
+        respuesta = await asyncio.to_thread(persistir)
+        print(f"✅ Trabajo {trabajo_id} completado")
+        _publicar(trabajo_id, "fin", respuesta)
+
+    except asyncio.CancelledError:
+        await asyncio.to_thread(db.rollback)
+        await asyncio.to_thread(_liberar, trabajo_id)
+        print(f"⏸️ Trabajo {trabajo_id} devuelto a la cola")
+        raise
+    except Exception as e:
+        await asyncio.to_thread(db.rollback)
+        if proyecto_id is not None:
+            TranscripcionService.invalidar(proyecto_id)
+        definitivo = await asyncio.to_thread(_registrar_fallo, trabajo_id, e)
+        if definitivo:
+            _publicar(trabajo_id, "error", {
+                "detail": getattr(e, "detail", None) or str(e),
+                "codigo": getattr(e, "codigo_http", None) or getattr(e, "status_code", None) or 500
+            })
+        else:
+            _publicar(trabajo_id, "reintento", {"detail": str(e)})
+    finally:
+        latido.cancel()
+        if candado is not None:
+            await asyncio.to_thread(coordinacion_turnos.soltar_candado, candado, proyecto_id)
+        await asyncio.to_thread(db.close)
+
+
+async def _worker(nombre: str):
+    while True:
+        try:
+            trabajo_id = await asyncio.to_thread(_reclamar, nombre)
+        except Exception as e:
+            print(f"⚠️ {nombre}: no se pudo consultar la cola: {e}")
+            trabajo_id = None
+
+        if trabajo_id is None:
+            try:
+                await asyncio.wait_for(_hay_trabajo.wait(), COLA_INTERVALO_SEGUNDOS)
+            except asyncio.TimeoutError:
+                pass
+            _hay_trabajo.clear()
+            continue
+
+        await procesar(trabajo_id, nombre)
+
+
+def iniciar_workers(cantidad: int = COLA_ANALISIS_WORKERS) -> List[asyncio.Task]:
+    """Arranca `cantidad` workers en el event loop actual (0 = este proceso no procesa la cola)."""
+    global _loop, _hay_trabajo
+    _loop = asyncio.get_running_loop()
+    _hay_trabajo = asyncio.Event()
+    prefijo = f"{socket.gethostname()}:{os.getpid()}"
+    if cantidad:
+        print(f"👷 Cola de análisis: {cantidad} workers ({prefijo})")
+    return [asyncio.create_task(_worker(f"{prefijo}:{i}")) for i in range(cantidad)]
+
+
+async def detener_workers(tareas: List[asyncio.Task]):
+    for tarea in tareas:
+        tarea.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
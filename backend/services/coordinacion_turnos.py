@@ -0,0 +1,511 @@
+# backend/services/coordinacion_turnos.py
+"""
+Coordinación de turnos concurrentes del chat de análisis.
+
+Un doble clic o un reintento del frontend manda dos /continuar del mismo
+proyecto a la vez: sin coordinación ambos arman el historial, llaman al
+modelo y pueden finalizar (sub-tareas duplicadas). Todos los turnos de un
+proyecto, directos (/continuar, /reanalizar, /continuar/stream) o
+encolados (/continuar/trabajo), ocupan un lugar en la misma fila de
+Postgres (TrabajoAnalisis), así que la coordinación vale entre workers:
+
+- Orden: un turno distinto mientras otro está en curso espera su lugar en
+  la fila (sondeando cada TURNO_SONDEO_SEGUNDOS) y se ejecuta después. Solo
+  si la espera supera TURNO_ESPERA_MAX_SEGUNDOS se responde 409 con
+  Retry-After. Al llegar su lugar toma además el candado del proyecto
+  (pg_try_advisory_lock), que lo protege de un lease vencido por error.
+- Single-flight: un turno idéntico a otro que sigue en la fila (mismo
+  proyecto y mensaje, o misma Idempotency-Key) no crea otro lugar: espera la
+  respuesta que el primero guarda en su fila, en el worker que sea.
+- Idempotencia: con el header Idempotency-Key, un reintento de un turno ya
+  respondido devuelve la respuesta guardada (en su fila o en
+  TurnoIdempotente, vale IDEMPOTENCIA_TTL_HORAS). Sin la clave, un turno
+  idéntico a uno ya terminado es un mensaje nuevo (el cliente puede
+  contestar "sí" dos veces seguidas).
+- Los turnos directos mantienen su lugar con un lease corto
+  (TURNO_LEASE_SEGUNDOS) que renueva un latido; si su proceso muere, al
+  vencer dejan de contar en la fila y quien los esperaba recibe 503.
+
+Durante la llamada al modelo el turno solo ocupa la conexión del candado:
+`soltar_conexion` devuelve al pool la de la sesión del endpoint.
+"""
+import os
+import time
+import socket
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, exists, or_, text
+from sqlalchemy.orm import aliased
+
+from database import SessionLocal, engine
+from modelos.proyecto_modelo import Proyecto
+from modelos.trabajo_analisis_modelo import TrabajoAnalisis, EstadoTrabajo, OrigenTrabajo
+from modelos.turno_idempotente_modelo import TurnoIdempotente
+from services import metricas
+
+TURNO_REINTENTAR_EN_SEGUNDOS = int(os.getenv("TURNO_REINTENTAR_EN_SEGUNDOS", "5"))
+TURNO_ESPERA_MAX_SEGUNDOS = float(os.getenv("TURNO_ESPERA_MAX_SEGUNDOS", "60"))
+TURNO_SONDEO_SEGUNDOS = float(os.getenv("TURNO_SONDEO_SEGUNDOS", "0.5"))
+TURNO_LEASE_SEGUNDOS = int(os.getenv("TURNO_LEASE_SEGUNDOS", "30"))
+IDEMPOTENCIA_TTL_HORAS = int(os.getenv("IDEMPOTENCIA_TTL_HORAS", "24"))
+CLAVE_CLIENTE_MAX = 150
+
+# Primer entero de pg_advisory_lock(int, int): separa estos candados de otros usos
+_CLASE_CANDADO = 36001
+_CLASE_ALTA = 36002
+
+ESTADOS_EN_FILA = (EstadoTrabajo.PENDIENTE, EstadoTrabajo.EN_PROCESO)
+
+# Dueño de los turnos directos de este proceso (columna `worker`)
+_IDENTIDAD = f"directo:{socket.gethostname()}:{os.getpid()}"
+
+
+def _huella(mensaje: str) -> str:
+    return hashlib.sha256(mensaje.strip().encode("utf-8")).hexdigest()
+
+
+def _reutilizada(respuesta: Dict) -> Dict:
+    return {**respuesta, "reutilizado": True}
+
+
+def _fila_ocupada() -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail="Otros turnos de este proyecto siguen en curso, intenta de nuevo en unos segundos",
+        headers={"Retry-After": str(TURNO_REINTENTAR_EN_SEGUNDOS)}
+    )
+
+
+# ========================================
+# FILA POR PROYECTO (entre workers)
+# ========================================
+
+def sigue_en_fila(trabajo, ahora: datetime):
+    """
+    Condición SQL: `trabajo` (TrabajoAnalisis o un alias) ocupa su lugar en la
+    fila. Un turno directo con el lease vencido (su proceso murió) ya no cuenta.
+    """
+    return and_(
+        trabajo.estado.in_(ESTADOS_EN_FILA),
+        or_(trabajo.origen == OrigenTrabajo.COLA, trabajo.bloqueado_hasta >= ahora)
+    )
+
+
+def hay_anterior_en_fila(ahora: datetime):
+    """Condición SQL correlacionada: otro turno anterior del mismo proyecto sigue en la fila."""
+    anterior = aliased(TrabajoAnalisis)
+    return exists().where(
+        anterior.proyecto_id == TrabajoAnalisis.proyecto_id,
+        anterior.id < TrabajoAnalisis.id,
+        sigue_en_fila(anterior, ahora)
+    )
+
+
+def validar_clave(clave_cliente: Optional[str]):
+    if clave_cliente and len(clave_cliente) > CLAVE_CLIENTE_MAX:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key admite hasta {CLAVE_CLIENTE_MAX} caracteres")
+
+
+def registrar_turno(
+    db,
+    proyecto: Proyecto,
+    mensaje: str,
+    clave_cliente: Optional[str],
+    origen: OrigenTrabajo,
+    max_intentos: int = 1
+) -> Tuple[TrabajoAnalisis, bool]:
+    """
+    Pone el turno al final de la fila del proyecto (hace commit) y devuelve
+    (trabajo, nuevo). No crea otro lugar si ya hay uno equivalente:
+    - con Idempotency-Key, el de la misma clave (salvo que haya fallado);
+      si la clave se usó con otro mensaje responde 422;
+    - sin clave y en un turno directo, uno idéntico que siga en la fila.
+    """
+    validar_clave(clave_cliente)
+    ahora = datetime.utcnow()
+    # Serializa las altas del proyecto entre workers (se suelta con el commit)
+    db.execute(text("SELECT pg_advisory_xact_lock(:clase, :proyecto_id)"),
+               {"clase": _CLASE_ALTA, "proyecto_id": proyecto.id})
+
+    # Turnos directos cuyo proceso murió sin cerrarlos
+    db.query(TrabajoAnalisis).filter(
+        TrabajoAnalisis.proyecto_id == proyecto.id,
+        TrabajoAnalisis.origen == OrigenTrabajo.DIRECTO,
+        TrabajoAnalisis.estado.in_(ESTADOS_EN_FILA),
+        TrabajoAnalisis.bloqueado_hasta < ahora
+    ).update({
+        "estado": EstadoTrabajo.FALLIDO,
+        "error": "El turno se interrumpió antes de terminar",
+        "codigo_http": 503,
+        "terminado_en": ahora
+    }, synchronize_session=False)
+
+    existente = None
+    anteriores = db.query(TrabajoAnalisis).filter(TrabajoAnalisis.proyecto_id == proyecto.id)
+    if clave_cliente:
+        existente = anteriores.filter(
+            TrabajoAnalisis.clave_cliente == clave_cliente,
+            TrabajoAnalisis.estado != EstadoTrabajo.FALLIDO,
+            TrabajoAnalisis.created_at >= ahora - timedelta(hours=IDEMPOTENCIA_TTL_HORAS)
+        ).order_by(TrabajoAnalisis.id.desc()).first()
+        if existente is not None and existente.mensaje != mensaje:
+            db.rollback()
+            raise HTTPException(status_code=422, detail="La Idempotency-Key ya se usó con otro mensaje")
+    elif origen == OrigenTrabajo.DIRECTO:
+        existente = anteriores.filter(
+            TrabajoAnalisis.origen == OrigenTrabajo.DIRECTO,
+            TrabajoAnalisis.clave_cliente.is_(None),
+            TrabajoAnalisis.mensaje == mensaje,
+            sigue_en_fila(TrabajoAnalisis, ahora)
+        ).order_by(TrabajoAnalisis.id.desc()).first()
+
+    if existente is not None:
+        db.commit()
+        metricas.incrementar("turnos_compartidos_total")
+        print(f"🔗 Turno idéntico al {existente.id} (proyecto {proyecto.id}): se comparte la respuesta")
+        return existente, False
+
+    directo = origen == OrigenTrabajo.DIRECTO
+    trabajo = TrabajoAnalisis(
+        proyecto_id=proyecto.id,
+        cliente_id=proyecto.cliente_id,
+        mensaje=mensaje,
+        origen=origen,
+        clave_cliente=clave_cliente,
+        estado=EstadoTrabajo.PENDIENTE,
+        max_intentos=max_intentos,
+        disponible_en=ahora,
+        worker=_IDENTIDAD if directo else None,
+        bloqueado_hasta=ahora + timedelta(seconds=TURNO_LEASE_SEGUNDOS) if directo else None
+    )
+    db.add(trabajo)
+    db.commit()
+    db.refresh(trabajo)
+    return trabajo, True
+
+
+def renovar_lease(trabajo_id: int, worker: str, segundos: float) -> bool:
+    """Extiende bloqueado_hasta si el trabajo sigue en la fila y es de `worker`. False si ya no lo es."""
+    db = SessionLocal()
+    try:
+        renovados = db.query(TrabajoAnalisis).filter(
+            TrabajoAnalisis.id == trabajo_id,
+            TrabajoAnalisis.estado.in_(ESTADOS_EN_FILA),
+            TrabajoAnalisis.worker == worker
+        ).update({
+            "bloqueado_hasta": datetime.utcnow() + timedelta(seconds=segundos)
+        }, synchronize_session=False)
+        db.commit()
+        return renovados > 0
+    finally:
+        db.close()
+
+
+def _mantener_lease(trabajo_id: int, detener: threading.Event):
+    while not detener.wait(TURNO_LEASE_SEGUNDOS / 3):
+        try:
+            if not renovar_lease(trabajo_id, _IDENTIDAD, TURNO_LEASE_SEGUNDOS):
+                return
+        except Exception as e:
+            print(f"⚠️ Turno {trabajo_id}: no se pudo renovar el lease: {e}")
+
+
+class TurnoEnFila:
+    """
+    Lugar de un turno directo en la fila. El líder espera su lugar, ejecuta el
+    turno y cierra la fila con `terminar`; un seguidor (turno idéntico) espera
+    el resultado que el líder deja en ella.
+    """
+
+    def __init__(self, trabajo_id: int, proyecto_id: int, lider: bool):
+        self.trabajo_id = trabajo_id
+        self.proyecto_id = proyecto_id
+        self.lider = lider
+        self.candado = None
+        self.terminado = not lider
+        self._detener = threading.Event()
+        if lider:
+            threading.Thread(
+                target=_mantener_lease, args=(trabajo_id, self._detener), daemon=True
+            ).start()
+
+    # ----- líder -----
+
+    def _intentar(self) -> bool:
+        """Si es el primero de la fila y el candado está libre, lo toma y marca el turno EN_PROCESO."""
+        db = SessionLocal()
+        try:
+            primero = db.query(TrabajoAnalisis.id).filter(
+                TrabajoAnalisis.id == self.trabajo_id,
+                ~hay_anterior_en_fila(datetime.utcnow())
+            ).first()
+        finally:
+            db.close()
+        if primero is None:
+            return False
+
+        self.candado = intentar_candado(self.proyecto_id)
+        if self.candado is None:
+            return False
+
+        db = SessionLocal()
+        try:
+            db.query(TrabajoAnalisis).filter(TrabajoAnalisis.id == self.trabajo_id).update({
+                "estado": EstadoTrabajo.EN_PROCESO,
+                "intentos": 1,
+                "iniciado_en": datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        return True
+
+    def _en_espera(self):
+        metricas.incrementar("turnos_en_espera_total")
+        print(f"⏳ Turno {self.trabajo_id}: otro turno del proyecto {self.proyecto_id} en curso, espera su lugar")
+
+    def _espera_agotada(self) -> HTTPException:
+        metricas.incrementar("turnos_espera_agotada_total")
+        return _fila_ocupada()
+
+    def esperar_lugar(self):
+        """Espera (hasta TURNO_ESPERA_MAX_SEGUNDOS) a que sea su lugar; si no llega lanza 409."""
+        limite = time.monotonic() + TURNO_ESPERA_MAX_SEGUNDOS
+        if self._intentar():
+            return
+        self._en_espera()
+        while time.monotonic() < limite:
+            time.sleep(TURNO_SONDEO_SEGUNDOS)
+            if self._intentar():
+                return
+        raise self._espera_agotada()
+
+    async def esperar_lugar_async(self):
+        limite = time.monotonic() + TURNO_ESPERA_MAX_SEGUNDOS
+        if await asyncio.to_thread(self._intentar):
+            return
+        self._en_espera()
+        while time.monotonic() < limite:
+            await asyncio.sleep(TURNO_SONDEO_SEGUNDOS)
+            if await asyncio.to_thread(self._intentar):
+                return
+        raise self._espera_agotada()
+
+    def terminar(self, respuesta: Optional[Dict] = None, error: Optional[BaseException] = None):
+        """
+        Deja en la fila la respuesta (o el error) para los seguidores y suelta
+        el candado. Se puede llamar más de una vez: solo cuenta la primera.
+        """
+        if self.terminado:
+            return
+        self.terminado = True
+        self._detener.set()
+        campos = {"terminado_en": datetime.utcnow(), "bloqueado_hasta": None}
+        if error is None:
+            campos.update(estado=EstadoTrabajo.COMPLETADO, resultado=respuesta, codigo_http=200, error=None)
+        else:
+            campos.update(
+                estado=EstadoTrabajo.FALLIDO,
+                # Una cancelación (cliente que cortó) no es un error del servidor
+                codigo_http=getattr(error, "status_code", None) or (500 if isinstance(error, Exception) else 503),
+                error=str(getattr(error, "detail", None) or error or "El turno se interrumpió antes de terminar")
+            )
+        db = SessionLocal()
+        try:
+            db.query(TrabajoAnalisis).filter(TrabajoAnalisis.id == self.trabajo_id).update(
+                campos, synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            print(f"⚠️ Turno {self.trabajo_id}: no se pudo cerrar en la fila: {e}")
+        finally:
+            db.close()
+            if self.candado is not None:
+                soltar_candado(self.candado, self.proyecto_id)
+                self.candado = None
+
+    # ----- seguidor -----
+
+    def _resultado(self) -> Optional[Dict]:
+        """Respuesta del líder si ya terminó; lanza su error si falló; None si sigue en curso."""
+        db = SessionLocal()
+        try:
+            trabajo = db.query(TrabajoAnalisis).filter(TrabajoAnalisis.id == self.trabajo_id).first()
+            vivo = db.query(TrabajoAnalisis.id).filter(
+                TrabajoAnalisis.id == self.trabajo_id,
+                sigue_en_fila(TrabajoAnalisis, datetime.utcnow())
+            ).first()
+        finally:
+            db.close()
+        if trabajo.estado == EstadoTrabajo.COMPLETADO:
+            return _reutilizada(trabajo.resultado)
+        if trabajo.estado == EstadoTrabajo.FALLIDO:
+            codigo = trabajo.codigo_http or 500
+            cabeceras = {"Retry-After": str(TURNO_REINTENTAR_EN_SEGUNDOS)} if codigo in (409, 429, 503) else None
+            raise HTTPException(status_code=codigo, detail=trabajo.error, headers=cabeceras)
+        if vivo is None:
+            raise HTTPException(
+                status_code=503, detail="El turno se interrumpió antes de terminar",
+                headers={"Retry-After": str(TURNO_REINTENTAR_EN_SEGUNDOS)}
+            )
+        return None
+
+    def esperar_resultado(self) -> Dict:
+        """
+        Espera la respuesta del turno idéntico. Sin límite propio: el líder
+        tiene acotada su espera en la fila y su llamada al modelo, y si su
+        proceso muere el lease vence.
+        """
+        while True:
+            respuesta = self._resultado()
+            if respuesta is not None:
+                return respuesta
+            time.sleep(TURNO_SONDEO_SEGUNDOS)
+
+    async def esperar_resultado_async(self) -> Dict:
+        while True:
+            respuesta = await asyncio.to_thread(self._resultado)
+            if respuesta is not None:
+                return respuesta
+            await asyncio.sleep(TURNO_SONDEO_SEGUNDOS)
+
+
+def entrar(proyecto_id: int, mensaje: str, clave_cliente: Optional[str] = None) -> TurnoEnFila:
+    """Registra un turno directo en la fila del proyecto, o lo une al idéntico que ya está en ella."""
+    db = SessionLocal()
+    try:
+        proyecto = db.query(Proyecto).filter(Proyecto.id == proyecto_id).first()
+        if not proyecto:
+            raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+        trabajo, nuevo = registrar_turno(db, proyecto, mensaje, clave_cliente, OrigenTrabajo.DIRECTO)
+        return TurnoEnFila(trabajo.id, proyecto_id, lider=nuevo)
+    finally:
+        db.close()
+
+
+# ========================================
+# CANDADO POR PROYECTO (entre procesos)
+# ========================================
+
+def intentar_candado(proyecto_id: int):
+    """
+    Toma el candado del proyecto en una conexión dedicada (la sesión del
+    endpoint libera su conexión en cada commit) y la devuelve; None si otro
+    turno lo tiene.
+    """
+    conexion = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        tomado = conexion.execute(text("SELECT pg_try_advisory_lock(:clase, :proyecto_id)"),
+                                  {"clase": _CLASE_CANDADO, "proyecto_id": proyecto_id}).scalar()
+    except Exception:
+        conexion.close()
+        raise
+
+    if not tomado:
+        conexion.close()
+        metricas.incrementar("turnos_candado_ocupado_total")
+        return None
+
+    return conexion
+
+
+def soltar_candado(conexion, proyecto_id: int):
+    try:
+        conexion.execute(text("SELECT pg_advisory_unlock(:clase, :proyecto_id)"),
+                         {"clase": _CLASE_CANDADO, "proyecto_id": proyecto_id})
+    finally:
+        conexion.close()
+
+
+def soltar_conexion(db):
+    """
+    Cierra la transacción de lectura de la sesión para que su conexión vuelva
+    al pool mientras se espera al modelo, sin expirar los objetos ya cargados
+    (el candado del proyecto impide que cambien). El próximo uso abre otra.
+    """
+    expirar = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expirar
+
+
+# ========================================
+# IDEMPOTENCIA
+# ========================================
+
+def preparar_turno(
+    db,
+    proyecto_id: int,
+    mensaje: str,
+    clave_cliente: Optional[str] = None
+) -> Tuple[List[str], Optional[Dict]]:
+    """
+    Con el candado tomado: devuelve las claves con las que guardar el turno y,
+    si es un reintento (misma Idempotency-Key) de uno ya respondido, su
+    respuesta guardada. Sin Idempotency-Key no hay claves ni reutilización.
+    """
+    if not clave_cliente:
+        return [], None
+    validar_clave(clave_cliente)
+    huella = _huella(mensaje)
+    buscada = f"{proyecto_id}:k:{clave_cliente}"
+    limite = datetime.utcnow() - timedelta(hours=IDEMPOTENCIA_TTL_HORAS)
+    guardado = db.query(TurnoIdempotente).filter(
+        TurnoIdempotente.clave == buscada,
+        TurnoIdempotente.created_at >= limite
+    ).first()
+    if guardado is None:
+        return [buscada], None
+
+    if guardado.huella != huella:
+        raise HTTPException(status_code=422, detail="La Idempotency-Key ya se usó con otro mensaje")
+
+    metricas.incrementar("turnos_reutilizados_total")
+    print(f"♻️ Turno repetido (proyecto {proyecto_id}): se devuelve la respuesta guardada")
+    return [buscada], _reutilizada(guardado.respuesta)
+
+
+def registrar_respuesta(db, claves: List[str], proyecto_id: int, mensaje: str, respuesta: Dict):
+    """Agrega la respuesta del turno a la sesión (sin commit): se guarda en el mismo commit que el turno."""
+    limite = datetime.utcnow() - timedelta(hours=IDEMPOTENCIA_TTL_HORAS)
+    db.query(TurnoIdempotente).filter(
+        TurnoIdempotente.proyecto_id == proyecto_id,
+        TurnoIdempotente.created_at < limite
+    ).delete(synchronize_session=False)
+    huella = _huella(mensaje)
+    for clave in claves:
+        db.add(TurnoIdempotente(clave=clave, proyecto_id=proyecto_id, huella=huella, respuesta=respuesta))
+
+
+def ejecutar_unico(
+    db,
+    proyecto_id: int,
+    mensaje: str,
+    clave_cliente: Optional[str],
+    turno: Callable[[List[str]], Dict]
+) -> Dict:
+    """
+    Versión síncrona completa: fila + candado + idempotencia.
+    `turno(claves)` ejecuta el turno y debe guardarlo con esas claves.
+    """
+    lugar = entrar(proyecto_id, mensaje, clave_cliente)
+    if not lugar.lider:
+        return lugar.esperar_resultado()
+
+    try:
+        lugar.esperar_lugar()
+        claves, guardada = preparar_turno(db, proyecto_id, mensaje, clave_cliente)
+        respuesta = guardada if guardada is not None else turno(claves)
+    except BaseException as e:
+        lugar.terminar(error=e)
+        raise
+
+    lugar.terminar(respuesta)
+    return respuesta
@@ -0,0 +1,203 @@
+# backend/services/enriquecimiento_wbs.py
+"""
+WBS en dos etapas para el turno que finaliza el análisis.
+
+1. Esqueleto: el turno de finalización (chat_analisis_service) pide el
+   proyecto con sub-tareas compactas (código, título, especialidad,
+   prioridad y dependencias). Es una respuesta corta, así que no se corta
+   por max_tokens ni deja JSON inválido.
+2. Detalle: cada sub-tarea se completa con su propia llamada ("detalla UNA
+   sub-tarea"): descripción, requisitos, estimación y criterios de
+   aceptación. Las llamadas corren en paralelo, con un máximo de
+   WBS_ENRIQUECIMIENTO_CONCURRENCIA a la vez, y cada detalle se fusiona
+   apenas llega. El tiempo total es el de la sub-tarea más lenta y no la
+   suma de todas.
+
+Si una llamada de detalle falla, la sub-tarea queda con lo que trajo el
+esqueleto (descripción = título) y el análisis sigue. Las sub-tareas que ya
+llegan completas (el modelo ignoró el formato esqueleto) no se vuelven a pedir.
+
+Se desactiva con WBS_EN_DOS_ETAPAS=0 (el modelo vuelve a escribir el WBS
+completo en una sola respuesta).
+"""
+import os
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
+
+from services import metricas
+from services.llm_cliente import completar
+
+WBS_EN_DOS_ETAPAS = os.getenv("WBS_EN_DOS_ETAPAS", "1") == "1"
+WBS_ENRIQUECIMIENTO_CONCURRENCIA = int(os.getenv("WBS_ENRIQUECIMIENTO_CONCURRENCIA", "4"))
+WBS_ENRIQUECIMIENTO_MAX_TOKENS = int(os.getenv("WBS_ENRIQUECIMIENTO_MAX_TOKENS", "600"))
+
+INSTRUCCION_ESQUELETO = """📐 FORMATO ESQUELETO DEL WBS:
+Cuando respondas con "finalizado": true, escribe el proyecto completo (título,
+historia de usuario, descripción, requisitos, criterios, presupuesto, tiempo,
+riesgos) pero en "subtareas" incluye SOLO estos campos por sub-tarea:
+"codigo", "titulo", "especialidad", "prioridad" y "dependencias".
+NO escribas descripción, criterios de aceptación ni estimación de las
+sub-tareas: ese detalle se completa después, sub-tarea por sub-tarea.
+Las reglas de cantidad (3 a 8) y de especialidades siguen vigentes."""
+
+SYSTEM_PROMPT_ENRIQUECIMIENTO = """Eres un Ingeniero de Software Senior que detalla UNA sub-tarea de un WBS ya definido.
+
+Recibes en JSON el proyecto (título, descripción y requisitos), la lista de
+sub-tareas del WBS (para no solapar alcances) y la sub-tarea a detallar.
+No cambies su código, título, especialidad ni prioridad.
+
+Estima con Planning Poker (1-8 h simple, 8-20 h media, 20-40 h compleja,
+40-80 h epic) y escribe criterios de aceptación SMART.
+
+Responde SOLO con JSON:
+{
+  "descripcion": "qué se construye y cómo, en 1-3 oraciones",
+  "requisitos_relacionados": ["RF-001", "RNF-002"],
+  "justificacion_prioridad": "...",
+  "estimacion_horas": 24,
+  "metodo_estimacion": "Planning Poker (...)",
+  "criterios_aceptacion": ["...", "..."],
+  "riesgos": ["..."]
+}"""
+
+
+def es_esqueleto(tarea: Dict) -> bool:
+    """True si a la sub-tarea le falta el detalle (descripción o criterios)."""
+    return not tarea.get("descripcion") or not tarea.get("criterios_aceptacion")
+
+
+def _mensaje_subtarea(proyecto: Dict, tarea: Dict) -> str:
+    return json.dumps({
+        "proyecto": {
+            "titulo": proyecto.get("titulo"),
+            "descripcion": proyecto.get("descripcion_completa"),
+            "requisitos_funcionales": proyecto.get("requisitos_funcionales", []),
+            "requisitos_no_funcionales": proyecto.get("requisitos_no_funcionales", [])
+        },
+        "wbs": [{"codigo": t.get("codigo"), "titulo": t.get("titulo")} for t in proyecto.get("subtareas", [])],
+        "subtarea": {
+            campo: tarea.get(campo)
+            for campo in ("codigo", "titulo", "especialidad", "prioridad", "dependencias")
+        }
+    }, ensure_ascii=False)
+
+
+def fusionar_detalle(tarea: Dict, detalle: Dict) -> Dict:
+    """Copia a la sub-tarea los campos de detalle válidos (el esqueleto manda en el resto)."""
+    if isinstance(detalle.get("descripcion"), str) and detalle["descripcion"].strip():
+        tarea["descripcion"] = detalle["descripcion"].strip()
+    for campo in ("requisitos_relacionados", "criterios_aceptacion", "riesgos"):
+        if isinstance(detalle.get(campo), list):
+            tarea[campo] = [str(v) for v in detalle[campo]]
+    for campo in ("justificacion_prioridad", "metodo_estimacion"):
+        if isinstance(detalle.get(campo), str):
+            tarea[campo] = detalle[campo]
+    horas = detalle.get("estimacion_horas")
+    if isinstance(horas, (int, float)) and not isinstance(horas, bool) and horas > 0:
+        tarea["estimacion_horas"] = horas
+    return tarea
+
+
+def _completar_esqueleto(tarea: Dict) -> Dict:
+    """Valores mínimos para que una sub-tarea sin detalle se pueda guardar igual."""
+    tarea["descripcion"] = tarea.get("descripcion") or tarea.get("titulo") or ""
+    tarea.setdefault("criterios_aceptacion", [])
+    return tarea
+
+
+async def _detallar(
+    proyecto: Dict,
+    indice: int,
+    modelo: str,
+    semaforo: asyncio.Semaphore,
+    cliente_id: Optional[int],
+    proyecto_id: Optional[int]
+) -> Dict:
+    tarea = proyecto["subtareas"][indice]
+    async with semaforo:
+        inicio = time.monotonic()
+        try:
+            response = await completar(
+                "enriquecimiento_wbs",
+                cliente_id=cliente_id,
+                proyecto_id=proyecto_id,
+                model=modelo,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT_ENRIQUECIMIENTO},
+                    {"role": "user", "content": _mensaje_subtarea(proyecto, tarea)}
+                ],
+                temperature=0.4,
+                max_tokens=WBS_ENRIQUECIMIENTO_MAX_TOKENS,
+                response_format={"type": "json_object"}
+            )
+            detalle = json.loads(response.choices[0].message.content)
+            if not isinstance(detalle, dict):
+                raise ValueError("el detalle no es un objeto JSON")
+            fusionar_detalle(tarea, detalle)
+            estado, tokens = "ok", response.usage.total_tokens
+        except Exception as e:
+            print(f"⚠️ No se pudo detallar la sub-tarea {tarea.get('codigo')}: {e} (queda el esqueleto)")
+            estado, tokens = "error", 0
+        metricas.observar("wbs_enriquecimiento_segundos", time.monotonic() - inicio, resultado=estado)
+
+    metricas.incrementar("wbs_enriquecimiento_total", resultado=estado)
+    return {"indice": indice, "subtarea": _completar_esqueleto(tarea), "estado": estado, "tokens": tokens}
+
+
+async def enriquecer_a_medida(
+    proyecto: Dict,
+    modelo: str,
+    cliente_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None,
+    resumen: Optional[Dict] = None
+) -> AsyncIterator[Dict]:
+    """
+    Detalla en paralelo las sub-tareas esqueleto de `proyecto` (las modifica
+    en su lugar) y emite {"indice", "subtarea", "estado", "tokens"} por cada
+    una en el orden en que terminan. Estado: "ok", "error" o "completa" (ya
+    venía con detalle y no se pidió). Si se pasa `resumen`, al terminar queda
+    con {"detalladas", "fallidas", "tokens", "segundos"}.
+    """
+    inicio = time.monotonic()
+    resumen = {} if resumen is None else resumen
+    resumen.update({"detalladas": 0, "fallidas": 0, "tokens": 0, "segundos": 0.0})
+    subtareas: List[Dict] = proyecto.get("subtareas") or []
+    semaforo = asyncio.Semaphore(WBS_ENRIQUECIMIENTO_CONCURRENCIA)
+    pendientes = [i for i, tarea in enumerate(subtareas) if es_esqueleto(tarea)]
+    tareas = [
+        asyncio.ensure_future(_detallar(proyecto, i, modelo, semaforo, cliente_id, proyecto_id))
+        for i in pendientes
+    ]
+    try:
+        for i, tarea in enumerate(subtareas):
+            if i not in pendientes:
+                metricas.incrementar("wbs_enriquecimiento_total", resultado="completa")
+                yield {"indice": i, "subtarea": tarea, "estado": "completa", "tokens": 0}
+        for siguiente in asyncio.as_completed(tareas):
+            evento = await siguiente
+            resumen["detalladas" if evento["estado"] == "ok" else "fallidas"] += 1
+            resumen["tokens"] += evento["tokens"]
+            yield evento
+    finally:
+        # Si el consumidor se corta (cliente desconectado) no quedan llamadas huérfanas
+        for tarea in tareas:
+            tarea.cancel()
+        resumen["segundos"] = round(time.monotonic() - inicio, 3)
+
+    fallidas = f", {resumen['fallidas']} con error" if resumen["fallidas"] else ""
+    print(f"🧩 WBS detallado: {resumen['detalladas']} sub-tareas en {resumen['segundos']:.2f}s{fallidas}")
+
+
+async def enriquecer_proyecto(
+    proyecto: Dict,
+    modelo: str,
+    cliente_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None
+) -> Dict:
+    """Detalla todas las sub-tareas y devuelve el resumen {"detalladas", "fallidas", "tokens", "segundos"}."""
+    resumen: Dict = {}
+    async for _ in enriquecer_a_medida(proyecto, modelo, cliente_id, proyecto_id, resumen):
+        pass
+    return resumen
@@ -0,0 +1,189 @@
+# backend/services/enrutador_modelos.py
+"""
+Ruteo de modelos para los turnos del chat de análisis.
+
+Cada turno se clasifica antes de llamar al modelo:
+
+- "conversacion": preguntas de aclaración de los primeros turnos (sin modo
+  JSON). Van a LLM_MODELO_RAPIDO con un tope de tokens corto.
+- "finalizacion": desde TURNOS_MODO_JSON mensajes el modelo puede devolver
+  el WBS completo; va a LLM_MODELO_ANALISIS con el presupuesto grande.
+
+La política es intercambiable (LLM_POLITICA_RUTEO o configurar_politica):
+"fija" (todo al modelo de análisis, como antes), "por_turno" y "latencia",
+que además saca del modelo rápido los turnos de conversación mientras su
+latencia observada supera RUTEO_SLO_CONVERSACION_SEGUNDOS. Por defecto es
+"latencia" solo si LLM_MODELO_RAPIDO es distinto de LLM_MODELO_ANALISIS; con
+un único modelo separar los turnos no acelera nada (solo recorta tokens y
+agrega escalados pagados), así que se usa "fija".
+
+Si un turno de conversación se corta por el tope de tokens (el modelo
+empezó a escribir el proyecto final) se repite con la ruta de finalización
+(ver decision["escalable"]). Cada decisión y su latencia quedan en el log
+y en las métricas llm_ruteo_total / llm_ruteo_latencia_segundos.
+"""
+import os
+import time
+from typing import Dict, List, Optional
+
+from services import metricas
+
+LLM_MODELO_ANALISIS = os.getenv("LLM_MODELO_ANALISIS", "gpt-4o-mini")
+LLM_MODELO_RAPIDO = os.getenv("LLM_MODELO_RAPIDO", LLM_MODELO_ANALISIS)
+LLM_POLITICA_RUTEO = os.getenv("LLM_POLITICA_RUTEO") or (
+    "latencia" if LLM_MODELO_RAPIDO != LLM_MODELO_ANALISIS else "fija"
+)
+RUTEO_MAX_TOKENS_FINALIZACION = int(os.getenv("RUTEO_MAX_TOKENS_FINALIZACION", "2000"))
+RUTEO_MAX_TOKENS_CONVERSACION = int(os.getenv("RUTEO_MAX_TOKENS_CONVERSACION", "600"))
+RUTEO_SLO_CONVERSACION_SEGUNDOS = float(os.getenv("RUTEO_SLO_CONVERSACION_SEGUNDOS", "8"))
+RUTEO_ENFRIAMIENTO_SEGUNDOS = float(os.getenv("RUTEO_ENFRIAMIENTO_SEGUNDOS", "60"))
+RUTEO_MIN_MUESTRAS = 5
+RUTEO_ALFA_EWMA = 0.3
+
+# Mismo umbral con el que chat_analisis_service fuerza el modo JSON
+TURNOS_MODO_JSON = 4
+
+
+def tipo_turno(mensajes_historial: List[Dict[str, str]]) -> str:
+    return "finalizacion" if len(mensajes_historial) >= TURNOS_MODO_JSON else "conversacion"
+
+
+def _ruta_finalizacion(politica: str) -> Dict:
+    return {
+        "ruta": "finalizacion",
+        "modelo": LLM_MODELO_ANALISIS,
+        "max_tokens": RUTEO_MAX_TOKENS_FINALIZACION,
+        "politica": politica,
+        "escalable": False
+    }
+
+
+def _ruta_conversacion(politica: str) -> Dict:
+    return {
+        "ruta": "conversacion",
+        "modelo": LLM_MODELO_RAPIDO,
+        "max_tokens": RUTEO_MAX_TOKENS_CONVERSACION,
+        "politica": politica,
+        "escalable": True
+    }
+
+
+# ========================================
+# POLÍTICAS
+# ========================================
+
+class PoliticaFija:
+    """Todos los turnos al modelo de análisis con el presupuesto completo."""
+    nombre = "fija"
+
+    def elegir(self, contexto: Dict) -> Dict:
+        return _ruta_finalizacion(self.nombre)
+
+    def observar(self, decision: Dict, segundos: float):
+        pass
+
+
+class PoliticaPorTurno(PoliticaFija):
+    """Conversación al modelo rápido, finalización al de análisis."""
+    nombre = "por_turno"
+
+    def elegir(self, contexto: Dict) -> Dict:
+        if contexto["tipo"] == "conversacion":
+            return _ruta_conversacion(self.nombre)
+        return _ruta_finalizacion(self.nombre)
+
+
+class PoliticaLatencia(PoliticaPorTurno):
+    """
+    Como por_turno, pero lleva una media móvil (EWMA) de la latencia de los
+    turnos de conversación en el modelo rápido. Si supera el SLO, esos turnos
+    van al modelo de análisis durante RUTEO_ENFRIAMIENTO_SEGUNDOS y luego se
+    vuelve a probar el rápido.
+    """
+    nombre = "latencia"
+
+    def __init__(self):
+        self.ewma: Optional[float] = None
+        self.muestras = 0
+        self.degradado_hasta = 0.0
+
+    def elegir(self, contexto: Dict) -> Dict:
+        if contexto["tipo"] == "conversacion" and time.monotonic() >= self.degradado_hasta:
+            return _ruta_conversacion(self.nombre)
+        return _ruta_finalizacion(self.nombre)
+
+    def observar(self, decision: Dict, segundos: float):
+        if decision["ruta"] != "conversacion":
+            return
+        self.muestras += 1
+        self.ewma = segundos if self.ewma is None else RUTEO_ALFA_EWMA * segundos + (1 - RUTEO_ALFA_EWMA) * self.ewma
+        metricas.fijar("llm_ruteo_latencia_conversacion_ewma_segundos", round(self.ewma, 3))
+        if self.muestras >= RUTEO_MIN_MUESTRAS and self.ewma > RUTEO_SLO_CONVERSACION_SEGUNDOS:
+            self.degradado_hasta = time.monotonic() + RUTEO_ENFRIAMIENTO_SEGUNDOS
+            self.ewma, self.muestras = None, 0
+            metricas.incrementar("llm_ruteo_degradaciones_total")
+            print(f"🐢 Ruteo: {LLM_MODELO_RAPIDO} supera el SLO de conversación, "
+                  f"se usa {LLM_MODELO_ANALISIS} durante {RUTEO_ENFRIAMIENTO_SEGUNDOS:.0f}s")
+
+
+POLITICAS_RUTEO = {
+    PoliticaFija.nombre: PoliticaFija,
+    PoliticaPorTurno.nombre: PoliticaPorTurno,
+    PoliticaLatencia.nombre: PoliticaLatencia,
+}
+
+_politica = None
+
+
+def registrar_politica(clase):
+    """Agrega una política (clase con `nombre`, `elegir(contexto)` y `observar(decision, segundos)`)."""
+    POLITICAS_RUTEO[clase.nombre] = clase
+
+
+def configurar_politica(nombre: str):
+    """Cambia la política en tiempo de ejecución (benchmarks, replay)."""
+    global _politica
+    if nombre not in POLITICAS_RUTEO:
+        raise ValueError(f"Política de ruteo desconocida: {nombre} (opciones: {', '.join(POLITICAS_RUTEO)})")
+    _politica = POLITICAS_RUTEO[nombre]()
+
+
+def politica_activa():
+    if _politica is None:
+        configurar_politica(LLM_POLITICA_RUTEO)
+    return _politica
+
+
+# ========================================
+# API
+# ========================================
+
+def elegir_ruta(mensajes_historial: List[Dict[str, str]], escalado: bool = False) -> Dict:
+    """
+    Decide modelo y tope de tokens del turno. Con `escalado` (el intento con la
+    ruta de conversación se cortó) va directo a la de finalización.
+    """
+    politica = politica_activa()
+    contexto = {"tipo": tipo_turno(mensajes_historial), "mensajes": len(mensajes_historial)}
+    decision = _ruta_finalizacion(politica.nombre) if escalado else politica.elegir(contexto)
+    decision["tipo_turno"] = contexto["tipo"]
+    decision["escalado"] = escalado
+    metricas.incrementar("llm_ruteo_total", ruta=decision["ruta"], modelo=decision["modelo"], politica=politica.nombre)
+    print(f"🧭 Ruteo ({politica.nombre}): turno de {contexto['tipo']} con {contexto['mensajes']} mensajes → "
+          f"{decision['ruta']} [{decision['modelo']}, max {decision['max_tokens']} tokens]"
+          f"{' (escalado)' if escalado else ''}")
+    return decision
+
+
+def registrar_resultado(decision: Dict, segundos: float, cortado: bool = False):
+    """Latencia de la llamada hecha con `decision` (y si se cortó por max_tokens)."""
+    metricas.observar("llm_ruteo_latencia_segundos", segundos, ruta=decision["ruta"], modelo=decision["modelo"])
+    if cortado:
+        metricas.incrementar("llm_ruteo_cortes_total", ruta=decision["ruta"], modelo=decision["modelo"])
+    politica_activa().observar(decision, segundos)
+    print(f"⏱️ Ruteo: {decision['ruta']} [{decision['modelo']}] respondió en {segundos:.2f}s"
+          f"{' (cortado por max_tokens)' if cortado else ''}")
+
+
+def debe_escalar(decision: Dict, finish_reason: Optional[str]) -> bool:
+    return decision["escalable"] and finish_reason == "length"
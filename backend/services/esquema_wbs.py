@@ -0,0 +1,335 @@
+# backend/services/esquema_wbs.py
+"""
+Validación y reparación local del proyecto (WBS) que devuelve el modelo.
+
+El esquema de `proyecto` y `subtareas` se arma una vez con pydantic en modo
+estricto (pydantic-core lo compila): validar una respuesta cuesta decenas de
+microsegundos. Si no pasa, se repara sin volver a llamar al modelo:
+
+- JSON truncado por max_tokens o rodeado de texto/```: se cierra
+  (json_incremental.cerrar_json) y la sub-tarea a medias se descarta.
+- Tipos: "40 horas" -> 40, "12.000 USD" -> 12000, texto suelto -> lista,
+  prioridad "Alta"/"high" -> "ALTA".
+- Especialidades: nombre exacto sin tildes/mayúsculas, código interno o el
+  nombre más parecido (difflib); si nada se parece, el clasificador local.
+- Valores por defecto: código WBS, dependencias, listas vacías, descripción
+  del proyecto tomada de la historia de usuario.
+
+Solo si después de reparar sigue sin cumplir el esquema (p. ej. no hay
+título ni sub-tareas) el llamador pide una corrección al modelo con
+SYSTEM_PROMPT_REPARACION (chat_analisis_service).
+"""
+import os
+import re
+import json
+import time
+import difflib
+from typing import Annotated, Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from services import metricas
+from services.clasificador_especialidades import clasificar_lote, texto_de_tarea
+from services.json_incremental import cerrar_json
+from services.texto import plegar
+
+# Tope propio: la respuesta que se corrige pudo haberse cortado con el tope del turno
+WBS_REPARACION_MAX_TOKENS = int(os.getenv("WBS_REPARACION_MAX_TOKENS", "2000"))
+WBS_MIN_SUBTAREAS = 3
+ESPECIALIDAD_SIMILITUD_MINIMA = 0.75
+ESPECIALIDAD_POR_DEFECTO = "DESARROLLO_MEDIDA"
+
+PRIORIDADES = {
+    "ALTA": ("alta", "high", "critica", "urgente", "prioritaria"),
+    "MEDIA": ("media", "medium", "normal", "moderada"),
+    "BAJA": ("baja", "low", "opcional"),
+}
+
+SYSTEM_PROMPT_REPARACION = """Eres un validador de JSON. Recibes una respuesta de un análisis de proyecto
+que no cumple el esquema y la lista de errores encontrados.
+
+Devuelve SOLO el JSON corregido con esta forma, conservando todo el contenido
+que se pueda:
+{"finalizado": true, "proyecto": {"titulo", "historia_usuario", "descripcion_completa",
+ "requisitos_funcionales": [], "requisitos_no_funcionales": [], "criterios_aceptacion": [],
+ "presupuesto_estimado": número, "tiempo_estimado_dias": entero,
+ "subtareas": [{"codigo", "titulo", "especialidad", "prioridad": "ALTA|MEDIA|BAJA", "dependencias": []}]}}"""
+
+Texto = Annotated[str, Field(min_length=1)]
+
+
+def _esquema(especialidades: Tuple[str, ...]):
+    """Modelos pydantic del proyecto; las especialidades válidas son nombres y códigos."""
+
+    class _Estricto(BaseModel):
+        model_config = ConfigDict(strict=True, extra="allow")
+
+    class SubTareaWBS(_Estricto):
+        codigo: Texto
+        titulo: Texto
+        especialidad: Literal[especialidades]
+        prioridad: Literal["ALTA", "MEDIA", "BAJA"]
+        dependencias: List[str] = []
+        # Detalle: opcional porque el esqueleto (enriquecimiento_wbs) no lo trae
+        descripcion: Optional[str] = None
+        estimacion_horas: Optional[Annotated[float, Field(gt=0)]] = None
+        criterios_aceptacion: Optional[List[str]] = None
+
+    class ProyectoWBS(_Estricto):
+        titulo: Texto
+        historia_usuario: str
+        descripcion_completa: Texto
+        requisitos_funcionales: List[str]
+        requisitos_no_funcionales: List[str]
+        criterios_aceptacion: List[str]
+        presupuesto_estimado: Annotated[float, Field(ge=0)]
+        tiempo_estimado_dias: Annotated[int, Field(ge=0)]
+        # Regla del prompt: mínimo 3 sub-tareas (un JSON truncado que rescata menos va al modelo)
+        subtareas: Annotated[List[SubTareaWBS], Field(min_length=WBS_MIN_SUBTAREAS)]
+
+    return ProyectoWBS
+
+
+# ========================================
+# CONVERSIONES
+# ========================================
+
+def _numero(valor: Any) -> Optional[float]:
+    """Número dentro de `valor`: 40, "40 horas", "12.000 USD", "1,5" (None si no hay)."""
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return valor
+    if not isinstance(valor, str):
+        return None
+    m = re.search(r"\d[\d.,]*", valor)
+    if m is None:
+        return None
+    cifra = m.group().rstrip(".,")
+    separadores = re.findall(r"[.,]", cifra)
+    if len(separadores) > 1 and len(set(separadores)) == 1:
+        # "1.200.000": separador de miles repetido
+        cifra = cifra.replace(separadores[0], "")
+    elif separadores:
+        # El último separador es decimal salvo que lo sigan exactamente 3 dígitos ("12.000")
+        decimal = separadores[-1]
+        entero, _, fraccion = cifra.rpartition(decimal)
+        entero = re.sub(r"[.,]", "", entero)
+        cifra = entero + fraccion if len(fraccion) == 3 and len(separadores) == 1 else f"{entero}.{fraccion}"
+    numero = float(cifra)
+    return int(numero) if numero.is_integer() else numero
+
+
+def _lista_textos(valor: Any) -> List[str]:
+    if valor is None:
+        return []
+    if isinstance(valor, str):
+        partes = re.split(r"\n|;", valor)
+        return [p.strip().lstrip("-•*").strip() for p in partes if p.strip().lstrip("-•*").strip()]
+    if isinstance(valor, dict):
+        valor = list(valor.values())
+    if isinstance(valor, list):
+        return [v if isinstance(v, str) else json.dumps(v, ensure_ascii=False) for v in valor if v not in (None, "")]
+    return [str(valor)]
+
+
+def _texto(valor: Any) -> str:
+    if valor is None:
+        return ""
+    if isinstance(valor, str):
+        return valor.strip()
+    if isinstance(valor, list):
+        return ", ".join(str(v) for v in valor)
+    return str(valor)
+
+
+def _prioridad(valor: Any) -> str:
+    plegado = plegar(_texto(valor))
+    for prioridad, variantes in PRIORIDADES.items():
+        if any(plegado.startswith(v) for v in variantes):
+            return prioridad
+    return "MEDIA"
+
+
+# ========================================
+# VALIDADOR
+# ========================================
+
+class ValidadorWBS:
+    """
+    Esquema compilado + reparación determinista del proyecto final.
+    `especialidades` es el mapa código -> nombre (ESPECIALIDADES_DETALLADAS).
+    """
+
+    def __init__(self, especialidades: Dict[str, str]):
+        self.especialidades = especialidades
+        self._por_plegado = {plegar(nombre): nombre for nombre in especialidades.values()}
+        self._esquema = _esquema(tuple(especialidades.values()) + tuple(especialidades.keys()))
+
+    # --- validación ---
+
+    def validar(self, proyecto: Any) -> List[str]:
+        """Errores del proyecto contra el esquema ("ruta: mensaje"); lista vacía si es válido."""
+        try:
+            self._esquema.model_validate(proyecto)
+            return []
+        except ValidationError as e:
+            return [f"{'.'.join(str(p) for p in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+    # --- reparación ---
+
+    def especialidad(self, valor: Any, tarea: Dict) -> Tuple[str, str]:
+        """(nombre o código válido, cómo se obtuvo): exacta, codigo, aproximada, clasificador o por_defecto."""
+        texto = _texto(valor)
+        if texto in self.especialidades or texto in self._por_plegado.values():
+            return texto, "exacta"
+        plegado = plegar(texto)
+        if plegado in self._por_plegado:
+            return self._por_plegado[plegado], "exacta"
+        codigo = re.sub(r"\W+", "_", texto.upper()).strip("_")
+        if codigo in self.especialidades:
+            return codigo, "codigo"
+        parecidos = difflib.get_close_matches(plegado, list(self._por_plegado), n=1, cutoff=ESPECIALIDAD_SIMILITUD_MINIMA)
+        if parecidos:
+            return self._por_plegado[parecidos[0]], "aproximada"
+        prediccion = clasificar_lote([texto_de_tarea(tarea)])[0]
+        if prediccion["confiable"]:
+            return prediccion["especialidad"], "clasificador"
+        return ESPECIALIDAD_POR_DEFECTO, "por_defecto"
+
+    def _reparar_subtarea(self, tarea: Dict, i: int, reparaciones: List[str]) -> Dict:
+        ruta = f"subtareas.{i}"
+        for campo in ("titulo", "codigo", "descripcion"):
+            if campo in tarea and not isinstance(tarea[campo], str):
+                tarea[campo] = _texto(tarea[campo])
+                reparaciones.append(f"{ruta}.{campo}: convertido a texto")
+        if not tarea.get("codigo"):
+            tarea["codigo"] = f"WBS-1.{i + 1}"
+            reparaciones.append(f"{ruta}.codigo: generado")
+
+        especialidad, origen = self.especialidad(tarea.get("especialidad"), tarea)
+        if origen != "exacta" or especialidad != tarea.get("especialidad"):
+            reparaciones.append(f"{ruta}.especialidad: {tarea.get('especialidad')!r} -> {especialidad} ({origen})")
+            metricas.incrementar("wbs_especialidades_reparadas_total", origen=origen)
+            tarea["especialidad"] = especialidad
+
+        if tarea.get("prioridad") not in PRIORIDADES:
+            prioridad = _prioridad(tarea.get("prioridad"))
+            reparaciones.append(f"{ruta}.prioridad: {tarea.get('prioridad')!r} -> {prioridad}")
+            tarea["prioridad"] = prioridad
+
+        for campo in ("dependencias", "criterios_aceptacion"):
+            if campo in tarea and not (isinstance(tarea[campo], list) and all(isinstance(v, str) for v in tarea[campo])):
+                tarea[campo] = _lista_textos(tarea[campo])
+                reparaciones.append(f"{ruta}.{campo}: convertido a lista")
+        tarea.setdefault("dependencias", [])
+
+        if "estimacion_horas" in tarea and not (
+            isinstance(tarea["estimacion_horas"], (int, float)) and not isinstance(tarea["estimacion_horas"], bool)
+            and tarea["estimacion_horas"] > 0
+        ):
+            horas = _numero(tarea["estimacion_horas"])
+            reparaciones.append(f"{ruta}.estimacion_horas: {tarea['estimacion_horas']!r} -> {horas}")
+            if horas and horas > 0:
+                tarea["estimacion_horas"] = horas
+            else:
+                # Sin estimación: la pone refinar_subtarea o la etapa de detalle
+                del tarea["estimacion_horas"]
+        return tarea
+
+    def reparar_subtarea(self, tarea: Dict, i: int) -> List[str]:
+        """Repara en su lugar una sub-tarea suelta (la que cierra el lector incremental)."""
+        reparaciones: List[str] = []
+        self._reparar_subtarea(tarea, i, reparaciones)
+        return reparaciones
+
+    def reparar(self, proyecto: Dict) -> List[str]:
+        """Repara `proyecto` en su lugar y devuelve qué se cambió."""
+        reparaciones: List[str] = []
+
+        subtareas = proyecto.get("subtareas")
+        if isinstance(subtareas, dict):
+            subtareas = list(subtareas.values())
+            reparaciones.append("subtareas: objeto convertido a lista")
+        subtareas = subtareas if isinstance(subtareas, list) else []
+        validas = []
+        for i, tarea in enumerate(subtareas):
+            # Una sub-tarea sin título (p. ej. la última de un JSON truncado) no se puede rescatar
+            if not isinstance(tarea, dict) or not _texto(tarea.get("titulo")):
+                reparaciones.append(f"subtareas.{i}: descartada (sin título)")
+                continue
+            validas.append(self._reparar_subtarea(tarea, len(validas), reparaciones))
+        proyecto["subtareas"] = validas
+
+        for campo in ("titulo", "historia_usuario", "descripcion_completa"):
+            if campo in proyecto and not isinstance(proyecto[campo], str):
+                proyecto[campo] = _texto(proyecto[campo])
+                reparaciones.append(f"{campo}: convertido a texto")
+        if not proyecto.get("historia_usuario"):
+            proyecto["historia_usuario"] = _texto(proyecto.get("descripcion_completa"))
+            reparaciones.append("historia_usuario: tomada de la descripción")
+        if not proyecto.get("descripcion_completa"):
+            proyecto["descripcion_completa"] = proyecto["historia_usuario"] or _texto(proyecto.get("titulo"))
+            reparaciones.append("descripcion_completa: tomada de la historia de usuario")
+
+        for campo in ("requisitos_funcionales", "requisitos_no_funcionales", "criterios_aceptacion"):
+            if not (isinstance(proyecto.get(campo), list) and all(isinstance(v, str) for v in proyecto[campo])):
+                proyecto[campo] = _lista_textos(proyecto.get(campo))
+                reparaciones.append(f"{campo}: convertido a lista")
+
+        for campo, tipo in (("presupuesto_estimado", float), ("tiempo_estimado_dias", int)):
+            valor = proyecto.get(campo)
+            if isinstance(valor, bool) or not isinstance(valor, (int, float) if tipo is float else int) or valor < 0:
+                numero = _numero(valor)
+                proyecto[campo] = tipo(numero) if numero is not None else 0
+                reparaciones.append(f"{campo}: {valor!r} -> {proyecto[campo]}")
+
+        return reparaciones
+
+    # --- respuesta completa ---
+
+    def interpretar(self, texto: str, datos: Optional[Any] = None) -> Dict:
+        """
+        Interpreta la respuesta del chat de análisis. `datos` es el JSON ya
+        leído por el lector incremental, si lo hubo. Devuelve {"estado",
+        "datos", "errores", "reparaciones"} con estado:
+
+        - "conversacion": no es un proyecto finalizado
+        - "valido": el proyecto cumple el esquema tal como llegó
+        - "reparado": lo cumple después de la reparación local
+        - "invalido": ni reparado lo cumple (hace falta el modelo)
+        """
+        inicio = time.perf_counter()
+        reparaciones: List[str] = []
+        if not isinstance(datos, dict):
+            try:
+                datos = json.loads(texto)
+            except ValueError:
+                # JSON truncado, entre ``` o con texto alrededor
+                datos = cerrar_json(texto) if "{" in texto else None
+                if isinstance(datos, dict):
+                    reparaciones.append("json: recuperado del texto (cerrado o extraído)")
+
+        if not isinstance(datos, dict) or datos.get("finalizado") not in (True, "true"):
+            return {"estado": "conversacion", "datos": datos, "errores": [], "reparaciones": []}
+
+        proyecto = datos.get("proyecto")
+        if not isinstance(proyecto, dict):
+            estado, errores = "invalido", ["proyecto: falta el proyecto"]
+        else:
+            errores = self.validar(proyecto)
+            estado = "valido" if not errores and not reparaciones else "reparado"
+            if errores:
+                reparaciones += self.reparar(proyecto)
+                errores = self.validar(proyecto)
+                estado = "reparado" if not errores else "invalido"
+
+        microsegundos = (time.perf_counter() - inicio) * 1e6
+        metricas.incrementar("wbs_validacion_total", resultado=estado)
+        if estado == "reparado":
+            print(f"🩹 WBS reparado localmente en {microsegundos:.0f}µs: {len(reparaciones)} cambios")
+            for reparacion in reparaciones:
+                print(f"   · {reparacion}")
+        elif estado == "invalido":
+            print(f"⚠️ WBS inválido después de reparar ({microsegundos:.0f}µs): {'; '.join(errores[:5])}")
+        return {"estado": estado, "datos": datos, "errores": errores, "reparaciones": reparaciones}
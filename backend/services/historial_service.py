@@ -0,0 +1,161 @@
+# backend/services/historial_service.py
+import os
+import json
+from typing import List, Dict, Optional
+
+from services.llm_cliente import completar
+
+# Presupuesto de tokens para los turnos enviados literalmente al modelo
+HISTORIAL_MAX_TOKENS = int(os.getenv("HISTORIAL_MAX_TOKENS", "3000"))
+# Al compactar se baja hasta esta fracción del presupuesto (evita resumir en cada turno)
+HISTORIAL_FRACCION_OBJETIVO = float(os.getenv("HISTORIAL_FRACCION_OBJETIVO", "0.5"))
+# Mensajes recientes que nunca se resumen
+HISTORIAL_MENSAJES_MINIMOS = int(os.getenv("HISTORIAL_MENSAJES_MINIMOS", "4"))
+
+# tiktoken descarga la codificación la primera vez y la deja en TIKTOKEN_CACHE_DIR
+# (en despliegues sin salida a internet hay que precargar ese directorio). Sin
+# ella se estima ~4 caracteres por token, que subestima el español con tildes y el JSON.
+try:
+    import tiktoken
+    _codificador = tiktoken.get_encoding("o200k_base")
+except Exception as e:
+    print(f"⚠️ Conteo de tokens aproximado (~4 caracteres por token): tiktoken no disponible ({e.__class__.__name__})")
+    _codificador = None
+
+
+# ========================================
+# CONTEO DE TOKENS (LOCAL)
+# ========================================
+
+def contar_tokens(texto: str) -> int:
+    """Cuenta tokens con tiktoken si está instalado; si no, ~4 caracteres por token."""
+    if not texto:
+        return 0
+    if _codificador is not None:
+        return len(_codificador.encode(texto))
+    return len(texto) // 4 + 1
+
+
+def contar_tokens_mensajes(mensajes: List[Dict[str, str]]) -> int:
+    # ~4 tokens de formato por mensaje (rol y separadores)
+    return sum(contar_tokens(m["content"]) + 4 for m in mensajes)
+
+
+# ========================================
+# RESUMEN ESTRUCTURADO
+# ========================================
+
+RESUMEN_VACIO = {
+    "objetivo": "",
+    "usuarios_y_roles": [],
+    "requisitos_funcionales": [],
+    "requisitos_no_funcionales": [],
+    "restricciones": [],
+    "integraciones": [],
+    "presupuesto": None,
+    "plazo": None,
+    "decisiones": [],
+    "pendientes": []
+}
+
+PROMPT_RESUMEN = """Eres un analista de requisitos. Mantienes un resumen estructurado de una conversación de levantamiento de requerimientos.
+Recibes el RESUMEN ACTUAL (JSON) y NUEVOS MENSAJES. Devuelve el resumen actualizado incorporando TODA la información nueva
+(requisitos, restricciones, cifras, decisiones) sin perder nada del resumen actual. Marca como pendientes las preguntas sin respuesta.
+Responde ÚNICAMENTE con un JSON con exactamente estas claves:
+""" + json.dumps(RESUMEN_VACIO, ensure_ascii=False)
+
+
+async def _actualizar_resumen(
+    resumen: Dict,
+    mensajes: List[Dict[str, str]],
+    cliente_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None
+) -> Dict:
+    """Incorpora `mensajes` al resumen con una llamada corta al modelo."""
+    transcripcion = "\n".join(
+        f"{'CLIENTE' if m['role'] == 'user' else 'ASISTENTE'}: {m['content']}"
+        for m in mensajes
+    )
+    response = await completar(
+        "resumen_analisis",
+        cliente_id=cliente_id,
+        proyecto_id=proyecto_id,
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": PROMPT_RESUMEN},
+            {"role": "user", "content": f"RESUMEN ACTUAL:\n{json.dumps(resumen, ensure_ascii=False)}\n\nNUEVOS MENSAJES:\n{transcripcion}"}
+        ],
+        temperature=0.2,
+        max_tokens=800,
+        response_format={"type": "json_object"}
+    )
+    nuevo = json.loads(response.choices[0].message.content)
+    return {**RESUMEN_VACIO, **nuevo}
+
+
+def mensaje_resumen(resumen: Dict) -> Dict[str, str]:
+    """Mensaje de sistema que reemplaza a los turnos ya resumidos."""
+    return {
+        "role": "system",
+        "content": "RESUMEN DE LA CONVERSACIÓN PREVIA (requisitos ya capturados):\n"
+                   + json.dumps(resumen, ensure_ascii=False)
+    }
+
+
+async def compactar_historial(
+    mensajes_historial: List[Dict[str, str]],
+    resumen_previo: Optional[Dict] = None,
+    cliente_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None
+) -> Dict:
+    """
+    Mantiene el historial dentro de HISTORIAL_MAX_TOKENS.
+
+    `resumen_previo` es {"resumen": {...}, "turnos_resumidos": n} (o None).
+    Devuelve {"mensajes", "resumen", "turnos_resumidos", "actualizado"} donde
+    `mensajes` es lo que se envía tras el prompt de sistema y `actualizado`
+    indica si hay que persistir el nuevo resumen.
+    """
+    resumen = (resumen_previo or {}).get("resumen")
+    turnos_resumidos = (resumen_previo or {}).get("turnos_resumidos", 0)
+    # Si el historial se acortó (no debería), se ignora el resumen
+    if turnos_resumidos > len(mensajes_historial):
+        resumen, turnos_resumidos = None, 0
+
+    pendientes = mensajes_historial[turnos_resumidos:]
+    actualizado = False
+
+    if contar_tokens_mensajes(pendientes) > HISTORIAL_MAX_TOKENS:
+        objetivo = int(HISTORIAL_MAX_TOKENS * HISTORIAL_FRACCION_OBJETIVO)
+        corte = len(pendientes) - HISTORIAL_MENSAJES_MINIMOS
+        # Conservar literal el mayor sufijo que quepa en el objetivo
+        inicio_literal = len(pendientes)
+        tokens = 0
+        for i in range(len(pendientes) - 1, -1, -1):
+            tokens += contar_tokens(pendientes[i]["content"]) + 4
+            if tokens > objetivo and i < corte:
+                break
+            inicio_literal = i
+
+        if inicio_literal > 0:
+            try:
+                resumen = await _actualizar_resumen(
+                    resumen or dict(RESUMEN_VACIO), pendientes[:inicio_literal], cliente_id, proyecto_id
+                )
+                turnos_resumidos += inicio_literal
+                actualizado = True
+                print(f"🗜️ Historial compactado: {turnos_resumidos} mensajes resumidos")
+            except Exception as e:
+                # Sin resumen nuevo se envía todo lo no resumido (igual que antes)
+                print(f"⚠️ No se pudo actualizar el resumen del historial: {e}")
+
+    mensajes = mensajes_historial[turnos_resumidos:]
+    if resumen:
+        mensajes = [mensaje_resumen(resumen)] + mensajes
+
+    return {
+        "mensajes": mensajes,
+        "resumen": resumen,
+        "turnos_resumidos": turnos_resumidos,
+        "actualizado": actualizado
+    }
@@ -0,0 +1,230 @@
+# backend/services/json_incremental.py
+"""
+Lector incremental de JSON para respuestas del modelo en streaming.
+
+Consume los fragmentos a medida que llegan y avisa apenas se cierra un valor
+de interés, sin esperar al final del documento:
+
+- `valores`: rutas de claves (ej. ("finalizado",)) cuyo valor se emite en
+  cuanto termina de llegar.
+- `arreglos`: rutas de arreglos (ej. ("proyecto", "subtareas")) cuyos objetos
+  se emiten uno a uno al cerrarse.
+
+Solo examina los caracteres estructurales ({ } [ ] " , :) y recorre las
+cadenas con una búsqueda de regex, así que el costo por fragmento es
+proporcional a su largo. Acepta texto antes del JSON (el documento empieza
+en la primera "{") y lo que venga después de cerrarlo se ignora.
+
+`cerrar_json` usa la misma pila de marcos para recuperar respuestas cortadas
+por max_tokens (cierra cadenas, objetos y arreglos abiertos).
+"""
+import re
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_ESTRUCTURA = re.compile(r'[{}\[\]",:]')
+_CADENA = re.compile(r'["\\]')
+
+
+class _Marco:
+    """Objeto o arreglo abierto."""
+    __slots__ = ("tipo", "inicio", "clave", "indice", "inicio_valor")
+
+    def __init__(self, tipo: str, inicio: int):
+        self.tipo = tipo
+        self.inicio = inicio
+        self.clave = None            # objeto: clave del valor en curso
+        self.indice = 0              # arreglo: posición del elemento en curso
+        self.inicio_valor = inicio + 1
+
+
+class LectorJSONIncremental:
+    """
+    Uso:
+        lector = LectorJSONIncremental(valores=[("finalizado",)], arreglos=[("proyecto", "subtareas")])
+        for fragmento in stream:
+            for evento in lector.alimentar(fragmento):
+                ...   # {"tipo": "valor" | "elemento", "ruta", "valor", ["indice"]}
+        datos = lector.documento()
+    """
+
+    def __init__(self, valores: Iterable[Tuple] = (), arreglos: Iterable[Tuple] = ()):
+        self.valores = {tuple(r) for r in valores}
+        self.arreglos = {tuple(r) for r in arreglos}
+        self._texto = ""
+        self._pos = 0
+        self._pila: List[_Marco] = []
+        self._en_cadena = False
+        self._inicio_cadena = 0
+        self.inicio: Optional[int] = None
+        self.fin: Optional[int] = None
+        self.invalido = False
+
+    @property
+    def completo(self) -> bool:
+        return self.fin is not None
+
+    def _ruta(self, hasta: int) -> Tuple:
+        return tuple(m.clave if m.tipo == "{" else m.indice for m in self._pila[:hasta])
+
+    def _cargar(self, inicio: int, fin: int) -> Tuple[bool, Any]:
+        try:
+            return True, json.loads(self._texto[inicio:fin])
+        except ValueError:
+            return False, None
+
+    def _cerrar_valor(self, marco: _Marco, fin: int, eventos: List[Dict]):
+        """Termina el valor en curso del objeto `marco` (en `,` o `}`)."""
+        if marco.tipo != "{" or marco.clave is None or not self.valores:
+            return
+        ruta = self._ruta(len(self._pila) - 1) + (marco.clave,)
+        if ruta in self.valores:
+            ok, valor = self._cargar(marco.inicio_valor, fin)
+            if ok:
+                eventos.append({"tipo": "valor", "ruta": ruta, "valor": valor})
+
+    def alimentar(self, fragmento: str) -> List[Dict]:
+        """Agrega un fragmento y devuelve los eventos que completó."""
+        eventos: List[Dict] = []
+        self._texto += fragmento
+        if self.completo or self.invalido:
+            return eventos
+
+        texto = self._texto
+        n = len(texto)
+        pos = self._pos
+        while pos < n:
+            if self._en_cadena:
+                m = _CADENA.search(texto, pos)
+                if m is None:
+                    pos = n
+                    break
+                if m.group() == "\\":
+                    if m.end() >= n:
+                        # Escape partido entre fragmentos: se retoma con el siguiente
+                        pos = m.start()
+                        break
+                    pos = m.end() + 1
+                    continue
+                self._en_cadena = False
+                pos = m.end()
+                marco = self._pila[-1]
+                if marco.tipo == "{" and marco.clave is None:
+                    marco.clave = json.loads(texto[self._inicio_cadena:pos])
+                continue
+
+            if not self._pila:
+                i = texto.find("{", pos)
+                if i < 0:
+                    pos = n
+                    break
+                self.inicio = i
+                self._pila.append(_Marco("{", i))
+                pos = i + 1
+                continue
+
+            m = _ESTRUCTURA.search(texto, pos)
+            if m is None:
+                pos = n
+                break
+            c, i, pos = m.group(), m.start(), m.end()
+            marco = self._pila[-1]
+
+            if c == '"':
+                self._en_cadena = True
+                self._inicio_cadena = i
+            elif c == "{" or c == "[":
+                self._pila.append(_Marco(c, i))
+            elif c == ":":
+                marco.inicio_valor = pos
+            elif c == ",":
+                self._cerrar_valor(marco, i, eventos)
+                if marco.tipo == "[":
+                    marco.indice += 1
+                    marco.inicio_valor = pos
+                else:
+                    marco.clave = None
+            else:
+                if (c == "}") != (marco.tipo == "{"):
+                    self.invalido = True
+                    break
+                self._cerrar_valor(marco, i, eventos)
+                self._pila.pop()
+                if not self._pila:
+                    self.fin = pos
+                    break
+                padre = self._pila[-1]
+                if c == "}" and padre.tipo == "[" and self._ruta(len(self._pila) - 1) in self.arreglos:
+                    ok, valor = self._cargar(marco.inicio, pos)
+                    if ok:
+                        eventos.append({
+                            "tipo": "elemento",
+                            "ruta": self._ruta(len(self._pila) - 1),
+                            "indice": padre.indice,
+                            "valor": valor
+                        })
+
+        self._pos = pos
+        return eventos
+
+    def documento(self) -> Optional[Any]:
+        """El documento completo, o None si no llegó a cerrarse o no es JSON válido."""
+        if not self.completo:
+            return None
+        ok, valor = self._cargar(self.inicio, self.fin)
+        return valor if ok else None
+
+
+def extraer_json(texto: str) -> Optional[Any]:
+    """Primer objeto JSON completo dentro de `texto` (puede venir rodeado de prosa)."""
+    lector = LectorJSONIncremental()
+    lector.alimentar(texto)
+    return lector.documento()
+
+
+# Cortes que se prueban hacia atrás antes de dar el documento por perdido
+CIERRE_MAX_INTENTOS = 64
+
+
+def _cierres(prefijo: str) -> Optional[str]:
+    """Los } y ] que le faltan a `prefijo`, o None si termina dentro de una cadena o no es JSON."""
+    lector = LectorJSONIncremental()
+    lector.alimentar(prefijo)
+    if lector.inicio is None or lector.invalido or lector.completo or lector._en_cadena:
+        return None
+    return "".join("}" if m.tipo == "{" else "]" for m in reversed(lector._pila))
+
+
+def cerrar_json(texto: str) -> Optional[Any]:
+    """
+    Como extraer_json, pero si el documento quedó truncado (p. ej. por
+    max_tokens) lo cierra: termina la cadena abierta, descarta el último
+    valor a medias y agrega los } y ] que faltan. Devuelve None si no hay
+    un objeto JSON o no se puede cerrar.
+    """
+    lector = LectorJSONIncremental()
+    lector.alimentar(texto)
+    if lector.inicio is None or lector.invalido:
+        return None
+    if lector.completo:
+        return lector.documento()
+
+    cuerpo = texto[lector.inicio:]
+    candidatos = [cuerpo + '"'] if lector._en_cadena else [cuerpo]
+    # Cortes hacia atrás: antes de cada "," o justo después de cada "{" / "["
+    for m in reversed(list(re.finditer(r"[,{\[]", cuerpo))):
+        candidatos.append(cuerpo[:m.start()] if m.group() == "," else cuerpo[:m.end()])
+
+    for candidato in candidatos[:CIERRE_MAX_INTENTOS]:
+        candidato = candidato.rstrip()
+        if candidato.endswith(":"):
+            candidato += " null"
+        candidato = candidato.rstrip(",").rstrip()
+        cierres = _cierres(candidato)
+        if cierres is None:
+            continue
+        try:
+            return json.loads(candidato + cierres)
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,333 @@
+# backend/services/llm_cliente.py
+import os
+import math
+import time
+import asyncio
+import hashlib
+import importlib.util
+from typing import Dict, Optional, AsyncIterator
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+
+from services import llm_resiliencia, llm_telemetria, metricas, admision
+
+# Cargar variables de entorno
+load_dotenv()
+
+# ========================================
+# PROVEEDOR
+# ========================================
+# LLM_PROVEEDOR:
+#   "openai"  -> api.openai.com (por defecto)
+#   "falso"   -> herramientas.proveedor_falso (pruebas offline / benchmarks)
+#   cualquier otro valor -> servidor compatible con chat-completions en LLM_BASE_URL
+PROVEEDORES = {
+    "openai": {"base_url": None, "api_key_env": "OPENAI_API_KEY", "prompt_cache_key": True},
+    "falso": {"base_url": "http://127.0.0.1:8099/v1", "api_key_env": None, "prompt_cache_key": True},
+}
+
+# Enviar prompt_cache_key=<endpoint> a los proveedores que lo aceptan: las
+# peticiones con el mismo prefijo estático caen en el mismo cache de prefijos
+LLM_PROMPT_CACHE_KEY = os.getenv("LLM_PROMPT_CACHE_KEY", "1") == "1"
+
+_proveedor = {
+    "nombre": os.getenv("LLM_PROVEEDOR", "openai"),
+    "base_url": os.getenv("LLM_BASE_URL") or None,
+    "api_key": os.getenv("LLM_API_KEY") or None,
+}
+
+
+
+def configurar_proveedor(nombre: str, base_url: Optional[str] = None, api_key: Optional[str] = None):
+    """
+    Cambia el proveedor en tiempo de ejecución (replay, benchmarks).
+    La siguiente llamada usa (o crea) el cliente de ese proveedor.
+    """
+    _proveedor.update({"nombre": nombre, "base_url": base_url, "api_key": api_key})
+
+
+# ========================================
+# PREFIJO ESTÁTICO (cache de prompts)
+# ========================================
+# El proveedor cachea el inicio del prompt si es idéntico byte a byte entre
+# llamadas. Por eso cada servicio pone primero su prompt de sistema estático
+# y después lo dinámico (resumen, historial, datos del usuario). Aquí se vigila
+# que el primer mensaje de cada endpoint no cambie entre llamadas.
+
+_huellas_prefijo: Dict[str, str] = {}
+
+
+def _vigilar_prefijo(endpoint: str, parametros: dict):
+    mensajes = parametros.get("messages") or []
+    if not mensajes:
+        return
+    huella = hashlib.sha256((mensajes[0].get("content") or "").encode("utf-8")).hexdigest()
+    anterior = _huellas_prefijo.get(endpoint)
+    _huellas_prefijo[endpoint] = huella
+    if anterior is not None and anterior != huella:
+        metricas.incrementar("llm_prefijo_cambios_total", endpoint=endpoint)
+        print(f"⚠️ El prompt de sistema de '{endpoint}' cambió entre llamadas: se pierde el cache de prefijos")
+
+
+def _parametros_con_cache(endpoint: str, parametros: dict) -> dict:
+    _vigilar_prefijo(endpoint, parametros)
+    base = PROVEEDORES.get(_proveedor["nombre"], {})
+    if LLM_PROMPT_CACHE_KEY and base.get("prompt_cache_key") and "prompt_cache_key" not in parametros:
+        return {**parametros, "prompt_cache_key": endpoint}
+    return parametros
+
+
+def tokens_cacheados(usage) -> int:
+    detalles = getattr(usage, "prompt_tokens_details", None)
+    return getattr(detalles, "cached_tokens", 0) or 0
+
+
+def datos_proveedor() -> dict:
+    """Nombre, base_url y api_key efectivos del proveedor configurado."""
+    base = PROVEEDORES.get(_proveedor["nombre"], {"base_url": None, "api_key_env": "OPENAI_API_KEY"})
+    api_key = _proveedor["api_key"]
+    if not api_key and base["api_key_env"]:
+        api_key = os.getenv(base["api_key_env"])
+    return {
+        "nombre": _proveedor["nombre"],
+        "base_url": _proveedor["base_url"] or base["base_url"],
+        "api_key": api_key or "sin-clave",
+    }
+
+
+# ========================================
+# TRANSPORTE HTTP Y REGISTRO DE CLIENTES
+# ========================================
+# Todos los clientes (uno por proveedor) comparten un único pool httpx con
+# keep-alive: las conexiones TLS se reutilizan entre servicios y llamadas en
+# vez de pagar el handshake en cada petición. Con HTTP/2 (paquete h2, incluido
+# en requirements.txt vía httpx[http2]) un puñado de conexiones multiplexa
+# todas las llamadas concurrentes. Las conexiones pertenecen al event loop
+# donde se abrieron: si cambia el loop (herramientas que llaman varias veces
+# a asyncio.run) se arma un pool nuevo. Cada pool tiene una tarea vigía en su
+# loop que lo cierra cuando la cancelan: al terminar asyncio.run (que cancela
+# las tareas pendientes antes de cerrar el loop) o al reemplazar el pool.
+
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+# Holgura sobre los cupos de admisión para las peticiones de hedging
+LLM_POOL_CONEXIONES = int(os.getenv("LLM_POOL_CONEXIONES", str(admision.LLM_MAX_CONCURRENCIA * 2)))
+LLM_KEEPALIVE_SEGUNDOS = float(os.getenv("LLM_KEEPALIVE_SEGUNDOS", "120"))
+LLM_CALENTAR_CONEXIONES = int(os.getenv("LLM_CALENTAR_CONEXIONES", "4"))
+
+_http: Optional[httpx.AsyncClient] = None
+_bucle_http: Optional[asyncio.AbstractEventLoop] = None
+_vigia_http: Optional[asyncio.Task] = None
+_clientes: Dict[tuple, AsyncOpenAI] = {}
+
+
+def http2_activo() -> bool:
+    return LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+async def _cerrar_al_cancelar(http: httpx.AsyncClient):
+    """Vigía del pool: espera sin hacer nada y lo cierra en su propio loop al cancelarse."""
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await http.aclose()
+
+
+def _soltar_transporte():
+    """Cierra el pool actual en su loop (si sigue abierto) y olvida sus clientes."""
+    global _http, _bucle_http, _vigia_http
+    if _vigia_http is not None and not _vigia_http.done() and not _bucle_http.is_closed():
+        _bucle_http.call_soon_threadsafe(_vigia_http.cancel)
+    _http, _bucle_http, _vigia_http = None, None, None
+    _clientes.clear()
+
+
+def _transporte() -> httpx.AsyncClient:
+    global _http, _bucle_http, _vigia_http
+    bucle = asyncio.get_running_loop()
+    if _http is None or _bucle_http is not bucle:
+        # Los clientes del pool anterior quedan atados a su loop
+        _soltar_transporte()
+        # Mismos valores por defecto que el SDK (redirecciones, etc.) salvo el pool
+        _http = DefaultAsyncHttpxClient(
+            http2=http2_activo(),
+            limits=httpx.Limits(
+                max_connections=LLM_POOL_CONEXIONES,
+                max_keepalive_connections=LLM_POOL_CONEXIONES,
+                keepalive_expiry=LLM_KEEPALIVE_SEGUNDOS
+            ),
+            timeout=httpx.Timeout(llm_resiliencia.LLM_DEADLINE_SEGUNDOS, connect=10)
+        )
+        _bucle_http = bucle
+        _vigia_http = bucle.create_task(_cerrar_al_cancelar(_http))
+    return _http
+
+
+def obtener_cliente() -> AsyncOpenAI:
+    """
+    Devuelve el cliente asíncrono del proveedor configurado. Se crea en el
+    primer uso (dentro del event loop) sobre el pool HTTP compartido.
+    """
+    http = _transporte()
+    datos = datos_proveedor()
+    clave = (datos["nombre"], datos["base_url"], datos["api_key"])
+    cliente = _clientes.get(clave)
+    if cliente is None:
+        # Reintentos y timeouts los maneja llm_resiliencia (max_retries=0 evita duplicarlos)
+        cliente = _clientes[clave] = AsyncOpenAI(
+            api_key=datos["api_key"],
+            base_url=datos["base_url"],
+            max_retries=0,
+            timeout=llm_resiliencia.LLM_DEADLINE_SEGUNDOS,
+            http_client=http
+        )
+        print(f"🔌 Cliente LLM: {datos['nombre']} ({datos['base_url'] or 'api.openai.com'}, "
+              f"{'HTTP/2' if http2_activo() else 'HTTP/1.1'}, pool de {LLM_POOL_CONEXIONES})")
+    return cliente
+
+
+async def calentar_conexiones(cantidad: Optional[int] = None):
+    """
+    Abre conexiones al proveedor antes de la primera llamada real (al arrancar
+    la app), con peticiones GET /models que no consumen tokens. Con HTTP/2
+    basta una conexión. Los fallos solo se registran: no frenan el arranque.
+    """
+    cantidad = 1 if http2_activo() else (cantidad or LLM_CALENTAR_CONEXIONES)
+    cliente = obtener_cliente().with_options(timeout=10)
+    inicio = time.monotonic()
+    resultados = await asyncio.gather(
+        *(cliente.models.with_raw_response.list() for _ in range(cantidad)), return_exceptions=True
+    )
+    errores = [r for r in resultados if isinstance(r, Exception)]
+    duracion = time.monotonic() - inicio
+    metricas.observar("llm_calentamiento_segundos", duracion)
+    if errores:
+        print(f"⚠️ Calentamiento de conexiones LLM: {len(errores)}/{cantidad} fallaron ({errores[0]})")
+    else:
+        print(f"🔥 {cantidad} conexiones LLM listas en {duracion:.2f}s")
+
+
+async def cerrar_conexiones():
+    """Cierra el pool HTTP compartido (al apagar la app)."""
+    http, es_de_este_loop = _http, _bucle_http is asyncio.get_running_loop()
+    _soltar_transporte()
+    if http is not None and es_de_este_loop:
+        await http.aclose()
+
+
+def codigo_http_error(error: Exception) -> int:
+    """Código HTTP con el que los routers deben reportar un fallo de la llamada al modelo."""
+    if isinstance(error, (llm_telemetria.PresupuestoExcedido, admision.AdmisionRechazada)):
+        return 429
+    if isinstance(error, llm_resiliencia.CircuitoAbierto):
+        return 503
+    if isinstance(error, llm_resiliencia.TiempoAgotado):
+        return 504
+    if getattr(error, "status_code", None) == 429:
+        # El proveedor siguió limitando después de los reintentos
+        return 429
+    return 500
+
+
+def reintentar_en_error(error: Exception) -> Optional[int]:
+    """Segundos para la cabecera Retry-After (admisión rechazada o circuito abierto)."""
+    espera = getattr(error, "reintentar_en", None)
+    return max(1, math.ceil(espera)) if espera is not None else None
+
+
+def cabeceras_reintento(resultado: Dict) -> Optional[Dict[str, str]]:
+    """Cabeceras para el HTTPException de un resultado fallido que trae "reintentar_en"."""
+    if resultado.get("reintentar_en"):
+        return {"Retry-After": str(resultado["reintentar_en"])}
+    return None
+
+
+async def completar(
+    endpoint: str,
+    cliente_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None,
+    **parametros
+):
+    """
+    Ejecuta chat.completions.create sin bloquear el event loop, con deadline,
+    reintentos y circuit breaker (ver llm_resiliencia).
+    `endpoint` identifica la llamada (p. ej. "chat_analisis") para logs y métricas;
+    con `cliente_id` se aplica su presupuesto de tokens (ver llm_telemetria)
+    y la admisión justa por cliente (ver admision).
+    """
+    await llm_telemetria.verificar_presupuesto(cliente_id, endpoint)
+    parametros = _parametros_con_cache(endpoint, parametros)
+    reserva = await admision.reservar(admision.clave_cliente(cliente_id), admision.estimar_tokens(parametros), endpoint)
+    
+    async def intento():
+        return await obtener_cliente().chat.completions.create(**parametros)
+
+    inicio = time.monotonic()
+    try:
+        async with admision.turno(reserva, endpoint):
+            respuesta = await llm_resiliencia.ejecutar(endpoint, intento)
+    except Exception as e:
+        reserva.ajustar(0)
+        llm_telemetria.registrar(
+            endpoint, parametros.get("model"), None, time.monotonic() - inicio,
+            cliente_id=cliente_id, proyecto_id=proyecto_id, error=e
+        )
+        raise
+    reserva.ajustar(getattr(respuesta.usage, "total_tokens", 0) or 0)
+    llm_telemetria.registrar(
+        endpoint, respuesta.model or parametros.get("model"), respuesta.usage, time.monotonic() - inicio,
+        cliente_id=cliente_id, proyecto_id=proyecto_id
+    )
+    return respuesta
+
+
+async def completar_stream(
+    endpoint: str,
+    cliente_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None,
+    **parametros
+) -> AsyncIterator:
+    """
+    Igual que completar() pero en streaming: produce los chunks a medida que
+    llegan. El último chunk trae `usage` (stream_options.include_usage).
+    Solo se reintenta si el proveedor falla antes del primer chunk.
+    """
+    await llm_telemetria.verificar_presupuesto(cliente_id, endpoint)
+    parametros = _parametros_con_cache(endpoint, parametros)
+    reserva = await admision.reservar(admision.clave_cliente(cliente_id), admision.estimar_tokens(parametros), endpoint)
+    
+    async def abrir():
+        return await obtener_cliente().chat.completions.create(
+            stream=True,
+            stream_options={"include_usage": True},
+            **parametros
+        )
+
+    inicio = time.monotonic()
+    primer_chunk = None
+    usage = None
+    error = None
+    try:
+        async with admision.turno(reserva, endpoint):
+            async for chunk in llm_resiliencia.ejecutar_stream(endpoint, abrir):
+                if primer_chunk is None:
+                    primer_chunk = time.monotonic() - inicio
+                if chunk.usage:
+                    usage = chunk.usage
+                yield chunk
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        reserva.ajustar(getattr(usage, "total_tokens", 0) or 0)
+        if primer_chunk is not None:
+            # Etiquetado según si el proveedor sirvió parte del prompt desde su cache
+            metricas.observar(
+                "llm_primer_token_segundos", primer_chunk,
+                endpoint=endpoint, cache="si" if tokens_cacheados(usage) else "no"
+            )
+        llm_telemetria.registrar(
+            endpoint, parametros.get("model"), usage, time.monotonic() - inicio,
+            cliente_id=cliente_id, proyecto_id=proyecto_id, streaming=True, error=error
+        )
@@ -0,0 +1,364 @@
+# backend/services/llm_resiliencia.py
+"""
+Política de resiliencia para las llamadas al modelo.
+
+- Deadline por intento y deadline total por llamada
+- Reintentos acotados con backoff exponencial "full jitter" en 429, 5xx,
+  timeouts y errores de conexión (respeta Retry-After si viene)
+- Circuit breaker por endpoint: tras N fallos seguidos falla rápido con
+  CircuitoAbierto durante un enfriamiento; luego deja pasar una prueba
+- Hedging opcional (solo sin streaming): si el intento supera el p95 de
+  latencia del endpoint se lanza un segundo request y gana el primero
+
+llm_cliente.completar / completar_stream son los únicos que usan este módulo.
+"""
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import openai
+
+from services import metricas
+
+LLM_TIMEOUT_SEGUNDOS = float(os.getenv("LLM_TIMEOUT_SEGUNDOS", "60"))
+LLM_DEADLINE_SEGUNDOS = float(os.getenv("LLM_DEADLINE_SEGUNDOS", "120"))
+LLM_REINTENTOS = int(os.getenv("LLM_REINTENTOS", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_CIRCUITO_UMBRAL = int(os.getenv("LLM_CIRCUITO_UMBRAL", "5"))
+LLM_CIRCUITO_ENFRIAMIENTO = float(os.getenv("LLM_CIRCUITO_ENFRIAMIENTO", "30"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+LLM_HEDGING_MIN_MUESTRAS = int(os.getenv("LLM_HEDGING_MIN_MUESTRAS", "20"))
+
+# Ajustes por endpoint (se mezclan con los valores por defecto)
+POLITICAS: Dict[str, Dict] = {
+    "resumen_analisis": {"timeout": 30, "deadline": 60},
+    "analizar_requerimiento": {"timeout": 30, "deadline": 60},
+    "sugerir_vendedores": {"timeout": 20, "deadline": 45},
+    "chatbot": {"timeout": 20, "deadline": 45},
+    "clasificar_especialidades": {"timeout": 15, "deadline": 30},
+}
+
+
+class CircuitoAbierto(Exception):
+    """El endpoint falló demasiadas veces seguidas; no se intenta la llamada."""
+
+    def __init__(self, endpoint: str, reintentar_en: float):
+        self.endpoint = endpoint
+        self.reintentar_en = reintentar_en
+        super().__init__(f"Circuito abierto para {endpoint}: reintentar en {reintentar_en:.0f}s")
+
+
+class TiempoAgotado(Exception):
+    """Se agotó el deadline de la llamada al modelo."""
+
+
+def politica(endpoint: str) -> Dict:
+    return {
+        "timeout": LLM_TIMEOUT_SEGUNDOS,
+        "deadline": LLM_DEADLINE_SEGUNDOS,
+        "reintentos": LLM_REINTENTOS,
+        "hedging": LLM_HEDGING,
+        **POLITICAS.get(endpoint, {})
+    }
+
+
+# ========================================
+# CLASIFICACIÓN DE ERRORES
+# ========================================
+
+def es_reintentable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _motivo(error: Exception) -> str:
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "conexion"
+    if isinstance(error, openai.APIStatusError):
+        return str(error.status_code)
+    return type(error).__name__
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    respuesta = getattr(error, "response", None)
+    if respuesta is None:
+        return None
+    valor = respuesta.headers.get("retry-after")
+    try:
+        return float(valor) if valor is not None else None
+    except ValueError:
+        return None
+
+
+def _espera(intento: int, error: Exception) -> float:
+    """Full jitter: U(0, min(max, base * 2^intento)); nunca menos que Retry-After."""
+    espera = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** intento))
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        espera = max(espera, retry_after)
+    return espera
+
+
+# ========================================
+# CIRCUIT BREAKER
+# ========================================
+
+class _Circuito:
+    CERRADO, ABIERTO, SEMI_ABIERTO = 0, 1, 2
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.estado = self.CERRADO
+        self.fallos = 0
+        self.abierto_hasta = 0.0
+        self.prueba_en_curso = False
+
+    def _fijar(self, estado: int):
+        self.estado = estado
+        metricas.fijar("llm_circuito_estado", estado, endpoint=self.endpoint)
+
+    def permitir(self):
+        if self.estado == self.CERRADO:
+            return
+        ahora = time.monotonic()
+        if self.estado == self.ABIERTO and ahora >= self.abierto_hasta:
+            self._fijar(self.SEMI_ABIERTO)
+        if self.estado == self.SEMI_ABIERTO and not self.prueba_en_curso:
+            self.prueba_en_curso = True
+            return
+        raise CircuitoAbierto(self.endpoint, max(0.0, self.abierto_hasta - ahora))
+
+    def exito(self):
+        self.fallos = 0
+        self.prueba_en_curso = False
+        if self.estado != self.CERRADO:
+            print(f"🟢 Circuito de {self.endpoint} cerrado")
+            self._fijar(self.CERRADO)
+
+    def fallo(self):
+        self.fallos += 1
+        self.prueba_en_curso = False
+        if self.estado == self.SEMI_ABIERTO or self.fallos >= LLM_CIRCUITO_UMBRAL:
+            self.abierto_hasta = time.monotonic() + LLM_CIRCUITO_ENFRIAMIENTO
+            if self.estado != self.ABIERTO:
+                print(f"🔴 Circuito de {self.endpoint} abierto tras {self.fallos} fallos")
+                metricas.incrementar("llm_circuito_aperturas_total", endpoint=self.endpoint)
+            self._fijar(self.ABIERTO)
+
+
+_circuitos: Dict[str, _Circuito] = {}
+
+
+def _circuito(endpoint: str) -> _Circuito:
+    if endpoint not in _circuitos:
+        _circuitos[endpoint] = _Circuito(endpoint)
+    return _circuitos[endpoint]
+
+
+# ========================================
+# LATENCIAS (para hedging)
+# ========================================
+
+_latencias: Dict[str, deque] = {}
+
+
+def _registrar_latencia(endpoint: str, segundos: float):
+    _latencias.setdefault(endpoint, deque(maxlen=200)).append(segundos)
+    metricas.observar("llm_intento_latencia_segundos", segundos, endpoint=endpoint)
+
+
+def p95(endpoint: str) -> Optional[float]:
+    muestras = _latencias.get(endpoint)
+    if not muestras or len(muestras) < LLM_HEDGING_MIN_MUESTRAS:
+        return None
+    ordenadas = sorted(muestras)
+    return ordenadas[int(0.95 * (len(ordenadas) - 1))]
+
+
+def estado() -> Dict:
+    """Estado de circuitos y p95 por endpoint (para depurar)."""
+    nombres = {0: "cerrado", 1: "abierto", 2: "semi_abierto"}
+    return {
+        endpoint: {
+            "circuito": nombres[_circuito(endpoint).estado],
+            "fallos_seguidos": _circuito(endpoint).fallos,
+            "p95_segundos": p95(endpoint)
+        }
+        for endpoint in set(_circuitos) | set(_latencias)
+    }
+
+
+# ========================================
+# EJECUCIÓN
+# ========================================
+
+async def _intento_con_hedging(endpoint: str, intento: Callable[[], Awaitable], timeout: float):
+    """Lanza un segundo request si el primero supera el p95; gana el que termine antes."""
+    umbral = p95(endpoint)
+    if umbral is None or umbral >= timeout:
+        return await asyncio.wait_for(intento(), timeout)
+
+    inicio = time.monotonic()
+    tareas = [asyncio.create_task(intento())]
+    try:
+        hechos, _ = await asyncio.wait(tareas, timeout=umbral)
+        if hechos:
+            return tareas[0].result()
+
+        metricas.incrementar("llm_hedging_lanzados_total", endpoint=endpoint)
+        tareas.append(asyncio.create_task(intento()))
+        pendientes = set(tareas)
+        while pendientes:
+            restante = timeout - (time.monotonic() - inicio)
+            if restante <= 0:
+                raise asyncio.TimeoutError()
+            hechos, pendientes = await asyncio.wait(
+                pendientes, timeout=restante, return_when=asyncio.FIRST_COMPLETED
+            )
+            for tarea in hechos:
+                if tarea.exception() is None:
+                    ganador = "secundario" if tarea is tareas[1] else "primario"
+                    metricas.incrementar("llm_hedging_ganador_total", endpoint=endpoint, ganador=ganador)
+                    return tarea.result()
+        # Fallaron los dos: se propaga el error del primario
+        return tareas[0].result()
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+
+async def ejecutar(endpoint: str, intento: Callable[[], Awaitable]):
+    """
+    Ejecuta `intento()` (una llamada al proveedor) aplicando deadline,
+    reintentos, circuit breaker y hedging según la política del endpoint.
+    """
+    config = politica(endpoint)
+    circuito = _circuito(endpoint)
+    limite = time.monotonic() + config["deadline"]
+
+    numero = 0
+    while True:
+        try:
+            circuito.permitir()
+        except CircuitoAbierto:
+            metricas.incrementar("llm_llamadas_total", endpoint=endpoint, resultado="circuito_abierto")
+            raise
+
+        restante = limite - time.monotonic()
+        timeout = min(config["timeout"], restante)
+        inicio = time.monotonic()
+        try:
+            if config["hedging"]:
+                resultado = await _intento_con_hedging(endpoint, intento, timeout)
+            else:
+                resultado = await asyncio.wait_for(intento(), timeout)
+        except Exception as e:
+            if not es_reintentable(e):
+                # Errores del request (400, 401...) no dicen nada de la salud del proveedor
+                circuito.prueba_en_curso = False
+                metricas.incrementar("llm_llamadas_total", endpoint=endpoint, resultado="error")
+                raise
+            circuito.fallo()
+            motivo = _motivo(e)
+            espera = _espera(numero, e)
+            sin_tiempo = time.monotonic() + espera >= limite
+            if numero >= config["reintentos"] or sin_tiempo or circuito.estado == _Circuito.ABIERTO:
+                resultado_final = "tiempo_agotado" if motivo == "timeout" else "error"
+                metricas.incrementar("llm_llamadas_total", endpoint=endpoint, resultado=resultado_final)
+                print(f"❌ {endpoint}: {motivo} tras {numero + 1} intento(s)")
+                if isinstance(e, asyncio.TimeoutError):
+                    raise TiempoAgotado(f"{endpoint}: sin respuesta en {timeout:.0f}s") from e
+                raise
+            numero += 1
+            metricas.incrementar("llm_reintentos_total", endpoint=endpoint, motivo=motivo)
+            print(f"🔁 {endpoint}: {motivo}, reintento {numero} en {espera:.2f}s")
+            await asyncio.sleep(espera)
+            continue
+        except BaseException:
+            # Cancelación (cliente desconectado, wait_for externo): la prueba no
+            # dijo nada del proveedor, pero debe liberarse o el circuito no se cierra nunca
+            circuito.prueba_en_curso = False
+            raise
+
+        _registrar_latencia(endpoint, time.monotonic() - inicio)
+        circuito.exito()
+        metricas.incrementar("llm_llamadas_total", endpoint=endpoint, resultado="ok")
+        return resultado
+
+
+async def ejecutar_stream(endpoint: str, abrir: Callable[[], Awaitable]) -> AsyncIterator:
+    """
+    Variante para streaming. Solo se reintenta mientras no se haya emitido
+    ningún chunk; `timeout` se aplica al primer chunk y a la espera entre chunks.
+    """
+    config = politica(endpoint)
+    circuito = _circuito(endpoint)
+    limite = time.monotonic() + config["deadline"]
+
+    numero = 0
+    while True:
+        try:
+            circuito.permitir()
+        except CircuitoAbierto:
+            metricas.incrementar("llm_llamadas_total", endpoint=endpoint, resultado="circuito_abierto")
+            raise
+
+        inicio = time.monotonic()
+        emitidos = 0
+        stream = None
+        try:
+            timeout = min(config["timeout"], limite - time.monotonic())
+            stream = await asyncio.wait_for(abrir(), timeout)
+            iterador = stream.__aiter__()
+            while True:
+                timeout = min(config["timeout"], limite - time.monotonic())
+                try:
+                    chunk = await asyncio.wait_for(iterador.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                if emitidos == 0:
+                    _registrar_latencia(endpoint, time.monotonic() - inicio)
+                emitidos += 1
+                yield chunk
+        except Exception as e:
+            if not es_reintentable(e):
+                circuito.prueba_en_curso = False
+                metricas.incrementar("llm_llamadas_total", endpoint=endpoint, resultado="error")
+                raise
+            circuito.fallo()
+            motivo = _motivo(e)
+            espera = _espera(numero, e)
+            sin_tiempo = time.monotonic() + espera >= limite
+            if emitidos or numero >= config["reintentos"] or sin_tiempo or circuito.estado == _Circuito.ABIERTO:
+                resultado_final = "tiempo_agotado" if motivo == "timeout" else "error"
+                metricas.incrementar("llm_llamadas_total", endpoint=endpoint, resultado=resultado_final)
+                print(f"❌ {endpoint} (stream): {motivo} tras {numero + 1} intento(s), {emitidos} chunks")
+                if isinstance(e, asyncio.TimeoutError):
+                    raise TiempoAgotado(f"{endpoint}: stream sin datos en {timeout:.0f}s") from e
+                raise
+            numero += 1
+            metricas.incrementar("llm_reintentos_total", endpoint=endpoint, motivo=motivo)
+            print(f"🔁 {endpoint} (stream): {motivo}, reintento {numero} en {espera:.2f}s")
+            await asyncio.sleep(espera)
+            continue
+        except BaseException:
+            # CancelledError o GeneratorExit (el cliente del SSE se fue a mitad del stream)
+            circuito.prueba_en_curso = False
+            raise
+        finally:
+            # Libera la conexión si el consumidor cortó el stream o hubo error
+            if stream is not None and hasattr(stream, "close"):
+                await stream.close()
+
+        circuito.exito()
+        metricas.incrementar("llm_llamadas_total", endpoint=endpoint, resultado="ok")
+        return
@@ -0,0 +1,390 @@
+# backend/services/llm_telemetria.py
+"""
+Telemetría de las llamadas al modelo y presupuestos de tokens por cliente.
+
+Cada llamada (éxito o error) alimenta histogramas de latencia y tokens en
+/metricas y se encola como fila de uso_llm; las filas se insertan por lotes
+desde una tarea de fondo (iniciar_telemetria) para no agregar una escritura
+a la base por cada llamada.
+
+Presupuestos diarios (UTC) por cliente:
+- suave: las llamadas se siguen haciendo, pero con una pausa previa
+  (frena sesiones de análisis desbocadas sin cortarlas)
+- duro:  PresupuestoExcedido -> los routers responden 429
+El consumo del día se lee de uso_llm la primera vez y luego se acumula en
+memoria (aproximado si hay varios workers). Si la lectura falla no se fija
+nada: se vuelve a intentar pasados PRESUPUESTO_REINTENTO_LECTURA_SEGUNDOS
+(mientras tanto la llamada pasa sin el consumo previo del día).
+"""
+import os
+import time
+import asyncio
+import threading
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, case
+
+from database import SessionLocal
+from modelos.uso_llm_modelo import UsoLLM
+from services import metricas
+
+PRESUPUESTO_TOKENS_SUAVE = int(os.getenv("PRESUPUESTO_TOKENS_SUAVE", "200000"))
+PRESUPUESTO_TOKENS_DURO = int(os.getenv("PRESUPUESTO_TOKENS_DURO", "500000"))
+PRESUPUESTO_PAUSA_SUAVE = float(os.getenv("PRESUPUESTO_PAUSA_SUAVE", "2"))
+PRESUPUESTO_REINTENTO_LECTURA_SEGUNDOS = float(os.getenv("PRESUPUESTO_REINTENTO_LECTURA_SEGUNDOS", "30"))
+TELEMETRIA_INTERVALO_SEGUNDOS = float(os.getenv("TELEMETRIA_INTERVALO_SEGUNDOS", "5"))
+TELEMETRIA_LOTE_MAX = int(os.getenv("TELEMETRIA_LOTE_MAX", "200"))
+
+# USD por millón de tokens: (entrada, entrada cacheada, salida)
+PRECIOS_POR_MILLON = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+}
+
+BUCKETS_TOKENS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+class PresupuestoExcedido(Exception):
+    """El cliente superó su presupuesto duro de tokens del día."""
+
+    def __init__(self, cliente_id: int, consumidos: int, limite: int):
+        self.cliente_id = cliente_id
+        self.consumidos = consumidos
+        self.limite = limite
+        manana = datetime.combine(datetime.utcnow().date() + timedelta(days=1), datetime.min.time())
+        self.reintentar_en = max(1, int((manana - datetime.utcnow()).total_seconds()))
+        super().__init__(
+            f"Presupuesto diario de tokens agotado ({consumidos}/{limite}). Intenta de nuevo mañana."
+        )
+
+
+def costo(modelo: Optional[str], tokens_prompt: int, tokens_cacheados: int, tokens_completion: int) -> float:
+    """Costo estimado en USD según PRECIOS_POR_MILLON (gpt-4o-mini si el modelo es desconocido)."""
+    base = next((m for m in sorted(PRECIOS_POR_MILLON, key=len, reverse=True) if (modelo or "").startswith(m)), "gpt-4o-mini")
+    entrada, cacheada, salida = PRECIOS_POR_MILLON[base]
+    return (
+        (tokens_prompt - tokens_cacheados) * entrada
+        + tokens_cacheados * cacheada
+        + tokens_completion * salida
+    ) / 1_000_000
+
+
+# ========================================
+# PRESUPUESTOS
+# ========================================
+
+_consumo_lock = threading.Lock()
+_consumo: Dict[tuple, int] = {}  # (cliente_id, fecha UTC) -> tokens
+_sembrados = set()               # claves ya leídas de uso_llm
+_lectura_fallida: Dict[tuple, float] = {}  # clave -> monotonic del último fallo al leer uso_llm
+
+
+def _consumo_en_base(cliente_id: int, dia: date) -> int:
+    db = SessionLocal()
+    try:
+        inicio = datetime.combine(dia, datetime.min.time())
+        return db.query(func.coalesce(func.sum(UsoLLM.total_tokens), 0)).filter(
+            UsoLLM.cliente_id == cliente_id,
+            UsoLLM.created_at >= inicio,
+            UsoLLM.created_at < inicio + timedelta(days=1)
+        ).scalar() or 0
+    finally:
+        db.close()
+
+
+def _olvidar_dias_anteriores(hoy: date):
+    """Con _consumo_lock tomado: descarta las claves de días ya cerrados."""
+    for clave in [c for c in _consumo if c[1] < hoy]:
+        del _consumo[clave]
+    _sembrados.difference_update([c for c in _sembrados if c[1] < hoy])
+    for clave in [c for c in _lectura_fallida if c[1] < hoy]:
+        del _lectura_fallida[clave]
+
+
+async def consumo_del_dia(cliente_id: int) -> int:
+    clave = (cliente_id, datetime.utcnow().date())
+    if clave in _sembrados:
+        return _consumo.get(clave, 0)
+
+    fallo = _lectura_fallida.get(clave)
+    if fallo is not None and time.monotonic() - fallo < PRESUPUESTO_REINTENTO_LECTURA_SEGUNDOS:
+        return 0
+    try:
+        base = await asyncio.to_thread(_consumo_en_base, cliente_id, clave[1])
+    except Exception as e:
+        # Sin sembrar: un error pasajero no deja el presupuesto del día en cero
+        print(f"⚠️ No se pudo leer el consumo de tokens del cliente {cliente_id}: {e}")
+        metricas.incrementar("llm_presupuesto_lecturas_fallidas_total")
+        _lectura_fallida[clave] = time.monotonic()
+        return 0
+
+    with _consumo_lock:
+        if clave not in _sembrados:
+            _olvidar_dias_anteriores(clave[1])
+            _consumo[clave] = base
+            _sembrados.add(clave)
+            _lectura_fallida.pop(clave, None)
+    return _consumo.get(clave, 0)
+
+
+async def verificar_presupuesto(cliente_id: Optional[int], endpoint: str):
+    """
+    Se llama antes de cada llamada al modelo. Lanza PresupuestoExcedido si se
+    superó el límite duro; si se superó el suave, demora la llamada.
+    """
+    if cliente_id is None:
+        return
+    consumidos = await consumo_del_dia(cliente_id)
+    if consumidos >= PRESUPUESTO_TOKENS_DURO:
+        metricas.incrementar("llm_presupuesto_rechazos_total", endpoint=endpoint)
+        print(f"⛔ Cliente {cliente_id}: presupuesto duro agotado ({consumidos} tokens)")
+        raise PresupuestoExcedido(cliente_id, consumidos, PRESUPUESTO_TOKENS_DURO)
+    if consumidos >= PRESUPUESTO_TOKENS_SUAVE:
+        metricas.incrementar("llm_presupuesto_frenadas_total", endpoint=endpoint)
+        print(f"🐢 Cliente {cliente_id}: sobre el presupuesto suave ({consumidos} tokens), frenando {PRESUPUESTO_PAUSA_SUAVE}s")
+        await asyncio.sleep(PRESUPUESTO_PAUSA_SUAVE)
+
+
+def estado_presupuesto(consumidos: int) -> str:
+    if consumidos >= PRESUPUESTO_TOKENS_DURO:
+        return "bloqueado"
+    if consumidos >= PRESUPUESTO_TOKENS_SUAVE:
+        return "frenado"
+    return "normal"
+
+
+# ========================================
+# REGISTRO
+# ========================================
+
+_pendientes: List[Dict] = []
+_pendientes_lock = threading.Lock()
+
+
+def registrar(
+    endpoint: str,
+    modelo: Optional[str],
+    usage,
+    latencia: float,
+    cliente_id: Optional[int] = None,
+    proyecto_id: Optional[int] = None,
+    streaming: bool = False,
+    error: Optional[Exception] = None
+):
+    """Registra una llamada: métricas inmediatas y fila de uso_llm encolada."""
+    tokens_prompt = getattr(usage, "prompt_tokens", 0) or 0
+    tokens_completion = getattr(usage, "completion_tokens", 0) or 0
+    detalles = getattr(usage, "prompt_tokens_details", None)
+    tokens_cacheados = getattr(detalles, "cached_tokens", 0) or 0
+    total = tokens_prompt + tokens_completion
+    costo_usd = costo(modelo, tokens_prompt, tokens_cacheados, tokens_completion)
+
+    etiquetas = {"endpoint": endpoint, "modelo": modelo or "desconocido"}
+    metricas.observar("llm_latencia_segundos", latencia, **etiquetas)
+    metricas.incrementar("llm_llamadas_registradas_total", resultado="error" if error else "ok", **etiquetas)
+    if usage is not None:
+        metricas.observar("llm_tokens_prompt", tokens_prompt, buckets=BUCKETS_TOKENS, **etiquetas)
+        metricas.observar("llm_tokens_completion", tokens_completion, buckets=BUCKETS_TOKENS, **etiquetas)
+        metricas.incrementar("llm_tokens_total", tokens_prompt, tipo="prompt", **etiquetas)
+        metricas.incrementar("llm_tokens_total", tokens_cacheados, tipo="cacheado", **etiquetas)
+        metricas.incrementar("llm_tokens_total", tokens_completion, tipo="completion", **etiquetas)
+        metricas.incrementar("llm_costo_usd_total", costo_usd, **etiquetas)
+
+    if cliente_id is not None and total:
+        clave = (cliente_id, datetime.utcnow().date())
+        with _consumo_lock:
+            # Si aún no se leyó de la base, la fila ya contará al sembrar
+            if clave in _sembrados:
+                _consumo[clave] += total
+
+    with _pendientes_lock:
+        _pendientes.append({
+            "endpoint": endpoint,
+            "modelo": modelo,
+            "cliente_id": cliente_id,
+            "proyecto_id": proyecto_id,
+            "tokens_prompt": tokens_prompt,
+            "tokens_completion": tokens_completion,
+            "tokens_cacheados": tokens_cacheados,
+            "total_tokens": total,
+            "costo_usd": costo_usd,
+            "latencia_ms": int(latencia * 1000),
+            "streaming": streaming,
+            "exito": error is None,
+            "error": f"{type(error).__name__}: {error}"[:200] if error else None,
+            "created_at": datetime.utcnow()
+        })
+
+
+def volcar_pendientes() -> int:
+    """Inserta en uso_llm las filas encoladas. Devuelve cuántas se insertaron."""
+    with _pendientes_lock:
+        lote = _pendientes[:TELEMETRIA_LOTE_MAX * 10]
+        del _pendientes[:len(lote)]
+    if not lote:
+        return 0
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(UsoLLM, lote)
+        db.commit()
+        return len(lote)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ No se pudo guardar la telemetría ({len(lote)} filas): {e}")
+        return 0
+    finally:
+        db.close()
+
+
+async def _bucle_volcado():
+    while True:
+        await asyncio.sleep(TELEMETRIA_INTERVALO_SEGUNDOS)
+        await asyncio.to_thread(volcar_pendientes)
+
+
+def iniciar_telemetria() -> asyncio.Task:
+    """Arranque de la app: tarea que vuelca la telemetría cada pocos segundos."""
+    return asyncio.create_task(_bucle_volcado())
+
+
+async def detener_telemetria(tarea: asyncio.Task):
+    tarea.cancel()
+    await asyncio.to_thread(volcar_pendientes)
+
+
+# ========================================
+# ROLLUPS
+# ========================================
+
+AGRUPACIONES = {
+    "cliente": lambda: [UsoLLM.cliente_id],
+    "dia": lambda: [func.date(UsoLLM.created_at)],
+    "endpoint": lambda: [UsoLLM.endpoint],
+    "cliente_dia": lambda: [UsoLLM.cliente_id, func.date(UsoLLM.created_at)],
+    "modelo": lambda: [UsoLLM.modelo],
+}
+
+
+def resumen_uso(
+    db,
+    agrupar: str = "dia",
+    cliente_id: Optional[int] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None
+) -> List[Dict]:
+    """Totales de uso_llm agrupados por cliente, día, endpoint o modelo."""
+    columnas = AGRUPACIONES[agrupar]()
+    query = db.query(
+        *columnas,
+        func.count(UsoLLM.id),
+        func.sum(UsoLLM.tokens_prompt),
+        func.sum(UsoLLM.tokens_cacheados),
+        func.sum(UsoLLM.tokens_completion),
+        func.sum(UsoLLM.total_tokens),
+        func.sum(UsoLLM.costo_usd),
+        func.avg(UsoLLM.latencia_ms),
+        func.sum(case((UsoLLM.exito == False, 1), else_=0))  # noqa: E712
+    )
+    if cliente_id is not None:
+        query = query.filter(UsoLLM.cliente_id == cliente_id)
+    if desde is not None:
+        query = query.filter(UsoLLM.created_at >= datetime.combine(desde, datetime.min.time()))
+    if hasta is not None:
+        query = query.filter(UsoLLM.created_at < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    filas = query.group_by(*columnas).order_by(*columnas).all()
+
+    nombres = agrupar.split("_")
+    resultado = []
+    for fila in filas:
+        grupo = {nombre: (str(valor) if nombre == "dia" and valor is not None else valor)
+                 for nombre, valor in zip(nombres, fila[:len(columnas)])}
+        llamadas, prompt, cacheados, completion, total, costo_usd, latencia, errores = fila[len(columnas):]
+        resultado.append({
+            **grupo,
+            "llamadas": llamadas,
+            "tokens_prompt": int(prompt or 0),
+            "tokens_cacheados": int(cacheados or 0),
+            "tokens_completion": int(completion or 0),
+            "total_tokens": int(total or 0),
+            "costo_usd": round(float(costo_usd or 0), 6),
+            "latencia_media_ms": round(float(latencia or 0), 1),
+            "errores": int(errores or 0)
+        })
+    return resultado
+
+
+def _primer_token_medio() -> Dict[str, Dict[str, float]]:
+    """Tiempo medio al primer token (streaming, este proceso) por endpoint, con y sin cache."""
+    medios: Dict[str, Dict[str, float]] = {}
+    for h in metricas.snapshot()["histogramas"]:
+        if h["nombre"] == "llm_primer_token_segundos" and h["total"] and "cache" in h["etiquetas"]:
+            endpoint = h["etiquetas"]["endpoint"]
+            medios.setdefault(endpoint, {})[h["etiquetas"]["cache"]] = round(h["suma"] / h["total"] * 1000, 1)
+    return medios
+
+
+def reporte_cache(
+    db,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None
+) -> List[Dict]:
+    """
+    Aprovechamiento del cache de prompts del proveedor por endpoint: fracción
+    de tokens de entrada servidos desde cache, costo de entrada con y sin
+    cache, y latencia (y primer token) de las llamadas con y sin acierto.
+    """
+    con_cache = case((UsoLLM.tokens_cacheados > 0, 1), else_=0)
+    query = db.query(
+        UsoLLM.endpoint,
+        UsoLLM.modelo,
+        con_cache,
+        func.count(UsoLLM.id),
+        func.sum(UsoLLM.tokens_prompt),
+        func.sum(UsoLLM.tokens_cacheados),
+        func.sum(UsoLLM.latencia_ms)
+    ).filter(UsoLLM.exito == True, UsoLLM.tokens_prompt > 0)  # noqa: E712
+    if desde is not None:
+        query = query.filter(UsoLLM.created_at >= datetime.combine(desde, datetime.min.time()))
+    if hasta is not None:
+        query = query.filter(UsoLLM.created_at < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    filas = query.group_by(UsoLLM.endpoint, UsoLLM.modelo, con_cache).all()
+
+    por_endpoint: Dict[str, Dict] = {}
+    for endpoint, modelo, acierto, llamadas, prompt, cacheados, latencia in filas:
+        e = por_endpoint.setdefault(endpoint, {
+            "endpoint": endpoint, "llamadas": 0, "llamadas_con_cache": 0,
+            "tokens_prompt": 0, "tokens_cacheados": 0,
+            "costo_entrada_usd": 0.0, "costo_entrada_sin_cache_usd": 0.0,
+            "_latencia": {0: [0, 0], 1: [0, 0]}
+        })
+        prompt, cacheados = int(prompt or 0), int(cacheados or 0)
+        e["llamadas"] += llamadas
+        e["llamadas_con_cache"] += llamadas if acierto else 0
+        e["tokens_prompt"] += prompt
+        e["tokens_cacheados"] += cacheados
+        e["costo_entrada_usd"] += costo(modelo, prompt, cacheados, 0)
+        e["costo_entrada_sin_cache_usd"] += costo(modelo, prompt, 0, 0)
+        e["_latencia"][acierto][0] += int(latencia or 0)
+        e["_latencia"][acierto][1] += llamadas
+
+    primer_token = _primer_token_medio()
+    resultado = []
+    for endpoint in sorted(por_endpoint):
+        e = por_endpoint[endpoint]
+        latencias = e.pop("_latencia")
+        e.update({
+            "tasa_tokens_cacheados": round(e["tokens_cacheados"] / e["tokens_prompt"], 4) if e["tokens_prompt"] else 0.0,
+            "tasa_llamadas_con_cache": round(e["llamadas_con_cache"] / e["llamadas"], 4) if e["llamadas"] else 0.0,
+            "costo_entrada_usd": round(e["costo_entrada_usd"], 6),
+            "costo_entrada_sin_cache_usd": round(e["costo_entrada_sin_cache_usd"], 6),
+            "ahorro_usd": round(e["costo_entrada_sin_cache_usd"] - e["costo_entrada_usd"], 6),
+            "latencia_media_ms_con_cache": round(latencias[1][0] / latencias[1][1], 1) if latencias[1][1] else None,
+            "latencia_media_ms_sin_cache": round(latencias[0][0] / latencias[0][1], 1) if latencias[0][1] else None,
+            "primer_token_ms_con_cache": primer_token.get(endpoint, {}).get("si"),
+            "primer_token_ms_sin_cache": primer_token.get(endpoint, {}).get("no"),
+        })
+        resultado.append(e)
+    return resultado
@@ -0,0 +1,158 @@
+# backend/services/lote_requerimientos.py
+"""
+Análisis de requerimientos en lote.
+
+Para importar o re-evaluar muchos textos sin llamar N veces, en serie, a
+/api/openai/analizar-requerimiento:
+
+- Los textos idénticos (tras normalizar) se analizan una sola vez; los
+  repetidos reciben el mismo resultado con "duplicado_de".
+- Como mucho `concurrencia` análisis en curso. El límite es adaptativo
+  (AIMD): cada 429 (del proveedor o de la admisión por cliente, ver
+  admision) o 503 con el circuito abierto lo reduce
+  a la mitad y el ítem vuelve a la cola tras una espera; cada `limite`
+  éxitos seguidos lo sube en uno.
+- Los resultados se emiten en orden de llegada, uno por ítem; un fallo
+  queda en su ítem y no corta el lote.
+"""
+import os
+import time
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
+
+from services import cache_llm, metricas
+from services.llm_cliente import codigo_http_error, reintentar_en_error
+from services.openai_service import analizar_requerimiento
+
+LOTE_MAX_TEXTOS = int(os.getenv("LOTE_MAX_TEXTOS", "500"))
+LOTE_CONCURRENCIA = int(os.getenv("LOTE_CONCURRENCIA", "4"))
+LOTE_CONCURRENCIA_MAX = int(os.getenv("LOTE_CONCURRENCIA_MAX", "16"))
+LOTE_REINTENTOS = int(os.getenv("LOTE_REINTENTOS", "3"))
+LOTE_ESPERA_SEGUNDOS = float(os.getenv("LOTE_ESPERA_SEGUNDOS", "2"))
+TEXTO_MIN_CARACTERES = 10
+
+# Fallos que indican que hay que bajar el ritmo (y reintentar el ítem más tarde)
+CODIGOS_LIMITADOS = {429, 503}
+
+
+class LimiteAdaptativo:
+    """Límite de concurrencia AIMD: baja a la mitad al ser limitado, sube de a uno con éxitos."""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self.limite = maximo
+        self.en_curso = 0
+        self._exitos = 0
+        self._condicion = asyncio.Condition()
+
+    async def adquirir(self):
+        async with self._condicion:
+            await self._condicion.wait_for(lambda: self.en_curso < self.limite)
+            self.en_curso += 1
+
+    async def liberar(self, limitado: bool):
+        async with self._condicion:
+            self.en_curso -= 1
+            if limitado:
+                self.limite = max(1, self.limite // 2)
+                self._exitos = 0
+                print(f"🐢 Lote: proveedor limitando, concurrencia baja a {self.limite}")
+            else:
+                self._exitos += 1
+                if self._exitos >= self.limite and self.limite < self.maximo:
+                    self.limite += 1
+                    self._exitos = 0
+            metricas.fijar("lote_concurrencia_limite", self.limite)
+            self._condicion.notify_all()
+
+
+def concurrencia_efectiva(pedida: Optional[int]) -> int:
+    return max(1, min(pedida or LOTE_CONCURRENCIA, LOTE_CONCURRENCIA_MAX))
+
+
+async def analizar_lote(textos: List[str], concurrencia: Optional[int] = None) -> AsyncIterator[Dict]:
+    """
+    Analiza `textos` y produce {"tipo": "item", "indice", "exito", ...} por
+    cada uno, en orden de llegada, y al final {"tipo": "resumen", ...}.
+    """
+    inicio = time.monotonic()
+    salida: asyncio.Queue = asyncio.Queue()
+    grupos: Dict[str, List[int]] = {}
+    pendientes = 0
+
+    for i, texto in enumerate(textos):
+        if not texto or len(texto.strip()) < TEXTO_MIN_CARACTERES:
+            salida.put_nowait({
+                "tipo": "item", "indice": i, "exito": False, "codigo_http": 400,
+                "error": f"El texto debe tener al menos {TEXTO_MIN_CARACTERES} caracteres"
+            })
+            pendientes += 1
+            continue
+        grupos.setdefault(cache_llm.normalizar_texto(texto), []).append(i)
+
+    cola: asyncio.Queue = asyncio.Queue()
+    for indices in grupos.values():
+        cola.put_nowait((indices, 0))
+    limite = LimiteAdaptativo(concurrencia_efectiva(concurrencia))
+
+    async def analizar(indices: List[int], intento: int):
+        await limite.adquirir()
+        try:
+            resultado = await analizar_requerimiento(textos[indices[0]])
+        except Exception as e:
+            resultado = {
+                "exito": False, "error": str(e),
+                "codigo_http": codigo_http_error(e), "reintentar_en": reintentar_en_error(e)
+            }
+        limitado = not resultado.get("exito") and resultado.get("codigo_http") in CODIGOS_LIMITADOS
+        await limite.liberar(limitado)
+
+        if limitado and intento < LOTE_REINTENTOS:
+            metricas.incrementar("lote_reintentos_total")
+            # Si la admisión o el circuito indican cuándo reintentar, se respeta
+            await asyncio.sleep(max(LOTE_ESPERA_SEGUNDOS * 2 ** intento, resultado.get("reintentar_en") or 0))
+            cola.put_nowait((indices, intento + 1))
+            return
+
+        metricas.incrementar("lote_items_total", resultado="ok" if resultado.get("exito") else "error")
+        for i in indices:
+            item = {"tipo": "item", "indice": i, **resultado}
+            if i != indices[0]:
+                item["duplicado_de"] = indices[0]
+            salida.put_nowait(item)
+
+    async def trabajador():
+        while True:
+            indices, intento = await cola.get()
+            try:
+                await analizar(indices, intento)
+            finally:
+                cola.task_done()
+
+    trabajadores = [asyncio.create_task(trabajador()) for _ in range(limite.maximo)]
+    pendientes += sum(len(indices) for indices in grupos.values())
+    print(f"📦 Lote: {len(textos)} textos, {len(grupos)} únicos, concurrencia {limite.maximo}")
+
+    exitosos = 0
+    try:
+        for _ in range(pendientes):
+            item = await salida.get()
+            exitosos += 1 if item["exito"] else 0
+            yield item
+    finally:
+        # También si el cliente corta el stream: no quedan análisis huérfanos
+        for tarea in trabajadores:
+            tarea.cancel()
+        await asyncio.gather(*trabajadores, return_exceptions=True)
+
+    duracion = time.monotonic() - inicio
+    print(f"✅ Lote terminado: {exitosos}/{len(textos)} en {duracion:.1f}s")
+    yield {
+        "tipo": "resumen",
+        "total": len(textos),
+        "unicos": len(grupos),
+        "exitosos": exitosos,
+        "fallidos": len(textos) - exitosos,
+        "concurrencia_final": limite.limite,
+        "duracion_ms": int(duracion * 1000)
+    }
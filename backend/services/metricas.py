@@ -0,0 +1,101 @@
+# backend/services/metricas.py
+"""
+Registro de métricas en proceso (contadores, gauges e histogramas).
+Se exponen en GET /metricas con formato de texto de Prometheus.
+"""
+import threading
+from bisect import bisect_left
+from typing import Dict, Tuple
+
+# Buckets por defecto pensados para latencias en segundos de llamadas al modelo
+BUCKETS_SEGUNDOS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+_lock = threading.Lock()
+_contadores: Dict[Tuple[str, tuple], float] = {}
+_gauges: Dict[Tuple[str, tuple], float] = {}
+_histogramas: Dict[Tuple[str, tuple], dict] = {}
+
+
+def _clave(nombre: str, etiquetas: dict) -> Tuple[str, tuple]:
+    return nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def incrementar(nombre: str, valor: float = 1, **etiquetas):
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+def fijar(nombre: str, valor: float, **etiquetas):
+    with _lock:
+        _gauges[_clave(nombre, etiquetas)] = valor
+
+
+def observar(nombre: str, valor: float, buckets: tuple = BUCKETS_SEGUNDOS, **etiquetas):
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        h = _histogramas.get(clave)
+        if h is None:
+            h = _histogramas[clave] = {"buckets": buckets, "conteos": [0] * len(buckets), "suma": 0.0, "total": 0}
+        i = bisect_left(h["buckets"], valor)
+        if i < len(h["conteos"]):
+            h["conteos"][i] += 1
+        h["suma"] += valor
+        h["total"] += 1
+
+
+def valor_contador(nombre: str, **etiquetas) -> float:
+    with _lock:
+        return _contadores.get(_clave(nombre, etiquetas), 0)
+
+
+def snapshot() -> dict:
+    """Copia de todas las métricas en formato JSON."""
+    def etiquetas_dict(e):
+        return dict(e)
+    with _lock:
+        return {
+            "contadores": [
+                {"nombre": n, "etiquetas": etiquetas_dict(e), "valor": v}
+                for (n, e), v in _contadores.items()
+            ],
+            "gauges": [
+                {"nombre": n, "etiquetas": etiquetas_dict(e), "valor": v}
+                for (n, e), v in _gauges.items()
+            ],
+            "histogramas": [
+                {
+                    "nombre": n,
+                    "etiquetas": etiquetas_dict(e),
+                    "buckets": dict(zip(h["buckets"], h["conteos"])),
+                    "suma": h["suma"],
+                    "total": h["total"]
+                }
+                for (n, e), h in _histogramas.items()
+            ]
+        }
+
+
+def _formatear_etiquetas(etiquetas: tuple, extra: tuple = ()) -> str:
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+
+def formato_prometheus() -> str:
+    lineas = []
+    with _lock:
+        for (n, e), v in sorted(_contadores.items()):
+            lineas.append(f"{n}{_formatear_etiquetas(e)} {v}")
+        for (n, e), v in sorted(_gauges.items()):
+            lineas.append(f"{n}{_formatear_etiquetas(e)} {v}")
+        for (n, e), h in sorted(_histogramas.items()):
+            acumulado = 0
+            for limite, conteo in zip(h["buckets"], h["conteos"]):
+                acumulado += conteo
+                lineas.append(f"{n}_bucket{_formatear_etiquetas(e, (('le', str(limite)),))} {acumulado}")
+            lineas.append(f"{n}_bucket{_formatear_etiquetas(e, (('le', '+Inf'),))} {h['total']}")
+            lineas.append(f"{n}_sum{_formatear_etiquetas(e)} {h['suma']}")
+            lineas.append(f"{n}_count{_formatear_etiquetas(e)} {h['total']}")
+    return "\n".join(lineas) + "\n"
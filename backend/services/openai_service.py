@@ -1,26 +1,23 @@
 # backend/services/openai_service.py
-import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import AsyncIterator, Optional
+from services.llm_cliente import completar, completar_stream, codigo_http_error, reintentar_en_error
+from services import cache_llm, catalogo_vendedores
+from services.clasificador_especialidades import clasificar_lote, clasificar_con_respaldo
+from services.json_incremental import LectorJSONIncremental, extraer_json
+from modelos.requerimiento_model import EspecialidadEnum
 
-# Cargar variables de entorno
-load_dotenv()
+# Prompts y parámetros de las llamadas cacheadas. La versión de cada plantilla
+# es la huella de estos textos y parámetros: al modificarlos cambia sola y las
+# respuestas guardadas en cache dejan de usarse.
+SISTEMA_ANALIZAR = "Eres un asistente de análisis de proyectos de software. Respondes SOLO con JSON válido."
 
-# Inicializar cliente de OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def analizar_requerimiento(texto_requerimiento: str) -> dict:
-    """
-    Analiza un requerimiento del cliente usando GPT-4o mini
-    y extrae información estructurada.
-    """
-    
-    prompt = f"""
+PROMPT_ANALIZAR = """
 Eres un asistente experto en análisis de proyectos de software. 
 Analiza el siguiente requerimiento de un cliente y extrae la siguiente información en formato JSON:
 
 {{
+  "titulo": "Título breve del requerimiento (máximo 8 palabras)",
   "especialidad": "La especialidad técnica necesaria",
   "tiempo_estimado": "Tiempo estimado (ej: 2-3 meses)",
   "presupuesto_sugerido": "Rango de presupuesto en USD",
@@ -35,18 +32,73 @@ Requerimiento del cliente:
 Responde ÚNICAMENTE con el objeto JSON, sin texto adicional antes o después.
 """
 
+PARAMETROS_ANALIZAR = {
+    "model": "gpt-4o-mini",
+    "temperature": 0.7,
+    "max_tokens": 500,
+    "response_format": {"type": "json_object"}
+}
+
+SISTEMA_VENDEDORES = "Eres un experto en selección de talento técnico. Respondes SOLO con JSON válido."
+
+PROMPT_VENDEDORES = """
+Necesito seleccionar un vendedor/freelancer para un proyecto con estas características:
+- Especialidad: {especialidad}
+- Complejidad: {complejidad}
+
+Genera un objeto JSON con esta estructura:
+{{
+  "experiencia_minima": "X años",
+  "habilidades_clave": ["habilidad1", "habilidad2", "habilidad3"],
+  "criterios_evaluacion": ["criterio1", "criterio2", "criterio3"]
+}}
+
+Responde ÚNICAMENTE con el objeto JSON.
+"""
+
+PARAMETROS_VENDEDORES = {
+    "model": "gpt-4o-mini",
+    "temperature": 0.7,
+    "max_tokens": 300,
+    "response_format": {"type": "json_object"}
+}
+
+VERSION_PROMPT_ANALIZAR = cache_llm.registrar_plantilla(
+    "analizar_requerimiento", [SISTEMA_ANALIZAR, PROMPT_ANALIZAR], PARAMETROS_ANALIZAR
+)
+VERSION_PROMPT_VENDEDORES = cache_llm.registrar_plantilla(
+    "sugerir_vendedores", [SISTEMA_VENDEDORES, PROMPT_VENDEDORES], PARAMETROS_VENDEDORES
+)
+
+
+async def analizar_requerimiento(texto_requerimiento: str) -> dict:
+    """
+    Analiza un requerimiento del cliente usando GPT-4o mini
+    y extrae información estructurada (con cache por contenido).
+    """
+    return await cache_llm.obtener_o_calcular(
+        "analizar_requerimiento",
+        cache_llm.normalizar_texto(texto_requerimiento),
+        PARAMETROS_ANALIZAR,
+        lambda: analizar_requerimiento_sin_cache(texto_requerimiento)
+    )
+
+
+async def analizar_requerimiento_sin_cache(texto_requerimiento: str) -> dict:
+    """Llamada directa al modelo (sin cache)."""
+    
+    prompt = PROMPT_ANALIZAR.format(texto_requerimiento=texto_requerimiento)
+
     try:
         print("🔍 Enviando petición a OpenAI...")
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = await completar(
+            "analizar_requerimiento",
             messages=[
-                {"role": "system", "content": "Eres un asistente de análisis de proyectos de software. Respondes SOLO con JSON válido."},
+                {"role": "system", "content": SISTEMA_ANALIZAR},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7,
-            max_tokens=500,
-            response_format={"type": "json_object"}
+            **PARAMETROS_ANALIZAR
         )
         
         contenido = response.choices[0].message.content
@@ -74,40 +126,46 @@ Responde ÚNICAMENTE con el objeto JSON, sin texto adicional antes o después.
         return {
             "exito": False,
             "error": str(e),
+            "codigo_http": codigo_http_error(e),
+            "reintentar_en": reintentar_en_error(e),
             "analisis": None
         }
 
 
-def sugerir_vendedores(especialidad: str, complejidad: str) -> dict:
+async def sugerir_vendedores(especialidad: str, complejidad: str) -> dict:
     """
     Sugiere criterios para seleccionar vendedores ideales.
+    Primero busca en el catálogo precalculado; solo las combinaciones
+    desconocidas llegan al modelo (con cache por contenido).
     """
+    sugerencias = catalogo_vendedores.buscar(especialidad, complejidad)
+    if sugerencias is not None:
+        return {"exito": True, "sugerencias": sugerencias, "desde_catalogo": True}
     
-    prompt = f"""
-Necesito seleccionar un vendedor/freelancer para un proyecto con estas características:
-- Especialidad: {especialidad}
-- Complejidad: {complejidad}
+    return await cache_llm.obtener_o_calcular(
+        "sugerir_vendedores",
+        {
+            "especialidad": cache_llm.normalizar_texto(especialidad),
+            "complejidad": cache_llm.normalizar_texto(complejidad)
+        },
+        PARAMETROS_VENDEDORES,
+        lambda: sugerir_vendedores_sin_cache(especialidad, complejidad)
+    )
 
-Genera un objeto JSON con esta estructura:
-{{
-  "experiencia_minima": "X años",
-  "habilidades_clave": ["habilidad1", "habilidad2", "habilidad3"],
-  "criterios_evaluacion": ["criterio1", "criterio2", "criterio3"]
-}}
 
-Responde ÚNICAMENTE con el objeto JSON.
-"""
+async def sugerir_vendedores_sin_cache(especialidad: str, complejidad: str) -> dict:
+    """Llamada directa al modelo (sin catálogo ni cache)."""
+    
+    prompt = PROMPT_VENDEDORES.format(especialidad=especialidad, complejidad=complejidad)
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = await completar(
+            "sugerir_vendedores",
             messages=[
-                {"role": "system", "content": "Eres un experto en selección de talento técnico. Respondes SOLO con JSON válido."},
+                {"role": "system", "content": SISTEMA_VENDEDORES},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7,
-            max_tokens=300,
-            response_format={"type": "json_object"}
+            **PARAMETROS_VENDEDORES
         )
         
         contenido = response.choices[0].message.content
@@ -115,13 +173,16 @@ Responde ÚNICAMENTE con el objeto JSON.
         
         return {
             "exito": True,
-            "sugerencias": resultado
+            "sugerencias": resultado,
+            "tokens_usados": response.usage.total_tokens
         }
         
     except Exception as e:
         return {
             "exito": False,
-            "error": str(e)
+            "error": str(e),
+            "codigo_http": codigo_http_error(e),
+            "reintentar_en": reintentar_en_error(e)
         }
 
 
@@ -195,65 +256,139 @@ FORMATO DE RESPUESTA:
 """
 
 
-def chat_requerimiento(mensajes_historial: list) -> dict:
+def _procesar_respuesta_chat(respuesta: str, tokens: int, data: Optional[dict] = None) -> dict:
+    """
+    Detecta si el asistente cerró el requerimiento (JSON con finalizado).
+    `data` es el JSON ya armado por el lector incremental del stream, si lo hubo;
+    si no, se busca el primer objeto JSON completo dentro del texto.
+    """
+    print(f"✅ Respuesta: {respuesta[:100]}...")
+    
+    finalizado = False
+    requerimiento = None
+    
+    if data is None and "finalizado" in respuesta:
+        data = extraer_json(respuesta)
+    
+    if isinstance(data, dict) and data.get("finalizado"):
+        finalizado = True
+        requerimiento = data.get("requerimiento")
+        respuesta = "¡Perfecto! He generado tu requerimiento. 🎉"
+    
+    return {
+        "exito": True,
+        "respuesta": respuesta,
+        "finalizado": finalizado,
+        "requerimiento": requerimiento,
+        "tokens_usados": tokens
+    }
+
+
+async def _clasificar_requerimiento(resultado: dict, cliente_id: Optional[int] = None) -> dict:
+    """
+    Fija el código CPC del requerimiento finalizado: manda el clasificador local
+    si está seguro; si no, se queda el código que dio el chat y, si no es
+    válido, se consulta al modelo con el respaldo del clasificador.
+    """
+    requerimiento = resultado.get("requerimiento")
+    if not resultado.get("finalizado") or not isinstance(requerimiento, dict):
+        return resultado
+    
+    texto = f"{requerimiento.get('titulo', '')}. {requerimiento.get('descripcion', '')}"
+    prediccion = clasificar_lote([texto])[0]
+    if not prediccion["confiable"] and requerimiento.get("especialidad") in CODIGO_A_ESPECIALIDAD:
+        requerimiento["especialidad_origen"] = "chat"
+        return resultado
+    if not prediccion["confiable"]:
+        prediccion = (await clasificar_con_respaldo([texto], cliente_id))[0]
+    
+    if prediccion["especialidad"]:
+        requerimiento["especialidad"] = ESPECIALIDAD_A_CODIGO[EspecialidadEnum[prediccion["especialidad"]].value]
+        requerimiento["especialidad_origen"] = prediccion.get("origen", "clasificador")
+        print(f"🧠 Especialidad del requerimiento: {requerimiento['especialidad']} ({requerimiento['especialidad_origen']})")
+    return resultado
+
+
+def _parametros_chat(mensajes_historial: list) -> dict:
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "system", "content": SYSTEM_PROMPT}] + mensajes_historial,
+        "temperature": 0.8,
+        "max_tokens": 600
+    }
+
+
+async def chat_requerimiento(mensajes_historial: list, cliente_id: Optional[int] = None) -> dict:
     """
     Chat conversacional para crear requerimientos.
     
     Args:
         mensajes_historial: Lista de mensajes [{"role": "user"/"assistant", "content": "..."}]
+        cliente_id: Si se indica, la llamada cuenta contra su presupuesto de tokens
     
     Returns:
         dict con la respuesta del asistente
     """
     try:
-        mensajes_completos = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ] + mensajes_historial
-        
         print(f"💬 Enviando {len(mensajes_historial)} mensajes a OpenAI...")
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=mensajes_completos,
-            temperature=0.8,
-            max_tokens=600
+        response = await completar(
+            "chat_requerimiento", cliente_id=cliente_id, **_parametros_chat(mensajes_historial)
         )
         
-        respuesta = response.choices[0].message.content
-        print(f"✅ Respuesta: {respuesta[:100]}...")
-        
-        finalizado = False
-        requerimiento = None
-        
-        if "finalizado" in respuesta and "{" in respuesta:
-            try:
-                inicio = respuesta.index("{")
-                fin = respuesta.rindex("}") + 1
-                json_str = respuesta[inicio:fin]
-                data = json.loads(json_str)
-                
-                if data.get("finalizado"):
-                    finalizado = True
-                    requerimiento = data.get("requerimiento")
-                    respuesta = "¡Perfecto! He generado tu requerimiento. 🎉"
-            except:
-                pass
-        
-        return {
-            "exito": True,
-            "respuesta": respuesta,
-            "finalizado": finalizado,
-            "requerimiento": requerimiento,
-            "tokens_usados": response.usage.total_tokens
-        }
+        resultado = _procesar_respuesta_chat(
+            response.choices[0].message.content,
+            response.usage.total_tokens
+        )
+        return await _clasificar_requerimiento(resultado, cliente_id)
         
     except Exception as e:
         print(f"❌ Error en chat: {e}")
         return {
             "exito": False,
-            "error": str(e)
+            "error": str(e),
+            "codigo_http": codigo_http_error(e),
+            "reintentar_en": reintentar_en_error(e)
         }
-    # Agregar al final de openai_service.py
+
+
+async def chat_requerimiento_stream(mensajes_historial: list, cliente_id: Optional[int] = None) -> AsyncIterator[dict]:
+    """
+    Variante en streaming de chat_requerimiento.
+    Emite {"tipo": "token", "contenido": ...} por fragmento, {"tipo": "finalizado"}
+    en cuanto el JSON del requerimiento indica finalizado y al final
+    {"tipo": "fin", "resultado": <dict de chat_requerimiento>}.
+    """
+    try:
+        print(f"💬 Enviando {len(mensajes_historial)} mensajes a OpenAI (stream)...")
+        
+        lector = LectorJSONIncremental(valores=[("finalizado",)])
+        partes = []
+        tokens = 0
+        async for chunk in completar_stream(
+            "chat_requerimiento", cliente_id=cliente_id, **_parametros_chat(mensajes_historial)
+        ):
+            if chunk.usage:
+                tokens = chunk.usage.total_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                fragmento = chunk.choices[0].delta.content
+                partes.append(fragmento)
+                yield {"tipo": "token", "contenido": fragmento}
+                for evento in lector.alimentar(fragmento):
+                    if evento["valor"]:
+                        yield {"tipo": "finalizado"}
+        
+        resultado = _procesar_respuesta_chat("".join(partes), tokens, lector.documento())
+        yield {"tipo": "fin", "resultado": await _clasificar_requerimiento(resultado, cliente_id)}
+        
+    except Exception as e:
+        print(f"❌ Error en chat: {e}")
+        yield {"tipo": "fin", "resultado": {
+            "exito": False, "error": str(e), "codigo_http": codigo_http_error(e), "reintentar_en": reintentar_en_error(e)
+        }}
+
+
+# Agregar al final de openai_service.py
 
 CODIGO_A_ESPECIALIDAD = {
     "83111": "Consultoría en desarrollo de sistemas",
@@ -270,6 +405,8 @@ CODIGO_A_ESPECIALIDAD = {
     "83163": "Capacitación en TI"
 }
 
+ESPECIALIDAD_A_CODIGO = {nombre: codigo for codigo, nombre in CODIGO_A_ESPECIALIDAD.items()}
+
 def convertir_codigo_a_nombre(codigo: str) -> str:
     """Convierte código de especialidad a nombre completo"""
     return CODIGO_A_ESPECIALIDAD.get(codigo, "Otro")
\ No newline at end of file
@@ -0,0 +1,103 @@
+# backend/services/palabras_clave.py
+"""
+Búsqueda de muchas palabras clave en una sola pasada (Aho-Corasick).
+
+El autómata se arma una vez con todas las frases clave de todas las
+etiquetas (p. ej. especialidades) y recorre el texto una sola vez, palabra
+por palabra, sin importar cuántas frases haya:
+
+- Texto y frases se pliegan igual (minúsculas y sin tildes), así
+  "aplicación móvil" y "aplicacion movil" coinciden.
+- Trabaja sobre palabras completas, no sobre subcadenas: "app" no coincide
+  con "happy" ni "bi" con "bien". Se aceptan los plurales con "s" o "es"
+  de la última palabra ("apis", "servidores web").
+- Cada frase cuenta una vez por texto aunque aparezca varias veces, y las
+  frases que se solapan cuentan todas ("migración a la nube" también suma
+  "migración" y "nube").
+"""
+import re
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+from services.texto import plegar
+
+_PALABRA = re.compile(r"[a-z0-9]+")
+_SUFIJOS_PLURAL = ("s", "es")
+
+
+def palabras(texto: str) -> List[str]:
+    return _PALABRA.findall(plegar(texto))
+
+
+class AutomataPalabrasClave:
+    """Autómata Aho-Corasick sobre palabras: etiqueta -> frases clave."""
+
+    def __init__(self, frases_por_etiqueta: Dict[Hashable, Iterable[str]]):
+        self.frases: List[Tuple[Hashable, str]] = []      # id de frase -> (etiqueta, frase original)
+        self._transiciones: List[Dict[str, int]] = [{}]
+        self._fallo: List[int] = [0]
+        self._salidas: List[Tuple[int, ...]] = [()]
+
+        salidas: List[set] = [set()]
+        for etiqueta, frases in frases_por_etiqueta.items():
+            for frase in frases:
+                secuencia = palabras(frase)
+                if not secuencia:
+                    continue
+                id_frase = len(self.frases)
+                self.frases.append((etiqueta, frase))
+                for variante in self._variantes(secuencia):
+                    estado = 0
+                    for palabra in variante:
+                        siguiente = self._transiciones[estado].get(palabra)
+                        if siguiente is None:
+                            siguiente = len(self._transiciones)
+                            self._transiciones[estado][palabra] = siguiente
+                            self._transiciones.append({})
+                            self._fallo.append(0)
+                            salidas.append(set())
+                        estado = siguiente
+                    salidas[estado].add(id_frase)
+
+        # Enlaces de fallo en anchura: cada estado hereda las salidas de su sufijo más largo
+        cola = deque(self._transiciones[0].values())
+        while cola:
+            estado = cola.popleft()
+            for palabra, siguiente in self._transiciones[estado].items():
+                fallo = self._fallo[estado]
+                while fallo and palabra not in self._transiciones[fallo]:
+                    fallo = self._fallo[fallo]
+                destino = self._transiciones[fallo].get(palabra, 0)
+                self._fallo[siguiente] = destino if destino != siguiente else 0
+                salidas[siguiente] |= salidas[self._fallo[siguiente]]
+                cola.append(siguiente)
+        self._salidas = [tuple(s) for s in salidas]
+
+    @staticmethod
+    def _variantes(secuencia: List[str]) -> List[List[str]]:
+        ultima = secuencia[-1]
+        return [secuencia] + [secuencia[:-1] + [ultima + sufijo] for sufijo in _SUFIJOS_PLURAL]
+
+    def __len__(self) -> int:
+        return len(self.frases)
+
+    def buscar(self, texto: str) -> set:
+        """Ids (índices en `frases`) de las frases que aparecen en `texto`."""
+        transiciones, fallo, salidas = self._transiciones, self._fallo, self._salidas
+        encontradas = set()
+        estado = 0
+        for palabra in palabras(texto):
+            while estado and palabra not in transiciones[estado]:
+                estado = fallo[estado]
+            estado = transiciones[estado].get(palabra, 0)
+            if salidas[estado]:
+                encontradas.update(salidas[estado])
+        return encontradas
+
+    def contar(self, texto: str) -> Dict[Hashable, int]:
+        """Frases distintas encontradas por etiqueta (solo etiquetas con alguna)."""
+        conteo: Dict[Hashable, int] = {}
+        for id_frase in self.buscar(texto):
+            etiqueta = self.frases[id_frase][0]
+            conteo[etiqueta] = conteo.get(etiqueta, 0) + 1
+        return conteo
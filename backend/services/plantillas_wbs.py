@@ -0,0 +1,322 @@
+# backend/services/plantillas_wbs.py
+"""
+Plantillas de WBS a partir de análisis ya terminados.
+
+Muchos proyectos se parecen (tiendas online, inventarios, landing pages).
+Este módulo mantiene en memoria un índice TF-IDF con la última versión
+completada de cada AnalisisIA (título, historia de usuario y descripción).
+En cada turno del chat de análisis se busca lo que escribió el
+cliente y, si un proyecto terminado se parece lo suficiente
+(PLANTILLAS_SIMILITUD_MINIMA, coseno), su WBS:
+
+- se agrega al prompt como ejemplo breve (`mensaje_plantilla`), para que el
+  modelo no repita preguntas ya resueltas y parta de ese desglose;
+- se ofrece al cliente como plantilla sugerida (solo estructura: títulos,
+  especialidades y horas);
+- presta el detalle de las sub-tareas del esqueleto con el mismo título, que
+  así no necesitan su llamada de enriquecimiento (`aplicar_detalle_plantilla`).
+
+El índice se carga al arrancar (`cargar_indice`) y se actualiza al terminar
+un análisis o un re-análisis (`registrar_analisis`). Cada proceso tiene el
+suyo. Por defecto solo se usan proyectos del mismo cliente
+(PLANTILLAS_SOLO_MISMO_CLIENTE=1). Con 0 también se usan los de otros
+clientes, pero anónimos: sin id, título, presupuesto, plazo ni el detalle de
+las sub-tareas; solo títulos, especialidades, prioridades y horas.
+"""
+import os
+import math
+import asyncio
+import time
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from database import SessionLocal
+from modelos.analisis_ia_modelo import AnalisisIA
+from modelos.proyecto_modelo import Proyecto
+from services import metricas
+from services.clasificador_especialidades import terminos
+from services.texto import plegar
+
+PLANTILLAS_ACTIVAS = os.getenv("PLANTILLAS_ACTIVAS", "1") == "1"
+PLANTILLAS_SIMILITUD_MINIMA = float(os.getenv("PLANTILLAS_SIMILITUD_MINIMA", "0.35"))
+PLANTILLAS_SOLO_MISMO_CLIENTE = os.getenv("PLANTILLAS_SOLO_MISMO_CLIENTE", "1") == "1"
+PLANTILLAS_MAX = int(os.getenv("PLANTILLAS_MAX", "5000"))
+# Las normas de los documentos usan el IDF del momento: se recalculan al crecer un 25 %
+PLANTILLAS_CRECIMIENTO_RECALCULO = 1.25
+
+CAMPOS_DETALLE = (
+    "descripcion", "requisitos_relacionados", "justificacion_prioridad",
+    "estimacion_horas", "metodo_estimacion", "criterios_aceptacion", "riesgos"
+)
+# Lo único que sale del índice cuando la plantilla es de otro cliente
+CAMPOS_ANONIMOS = ("titulo", "especialidad", "prioridad", "estimacion_horas")
+
+
+def _documento(proyecto: Dict) -> str:
+    """Qué pidió el cliente. Los títulos de sub-tareas y requisitos se repiten
+    entre proyectos distintos ("Diseño de arquitectura") y diluyen el parecido."""
+    partes = [proyecto.get(campo) or "" for campo in ("titulo", "historia_usuario", "descripcion_completa")]
+    return ". ".join(str(p) for p in partes if p)
+
+
+def _pesos(texto: str) -> Counter:
+    return Counter(terminos(texto))
+
+
+class IndicePlantillas:
+    """Índice invertido TF-IDF (coseno) de proyectos terminados, uno por proyecto."""
+
+    def __init__(self, maximo: int = PLANTILLAS_MAX):
+        self.maximo = maximo
+        self._entradas: Dict[int, Dict] = {}          # proyecto_id -> entrada (orden de llegada)
+        self._postings: Dict[str, set] = {}           # término -> proyecto_ids
+        self._normas: Dict[int, float] = {}
+        self._n_recalculo = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def _idf(self, termino: str) -> float:
+        return math.log((len(self._entradas) + 1) / (len(self._postings.get(termino, ())) + 1)) + 1
+
+    def _norma(self, tf: Counter) -> float:
+        return math.sqrt(sum((f * self._idf(t)) ** 2 for t, f in tf.items())) or 1.0
+
+    def _quitar(self, proyecto_id: int):
+        entrada = self._entradas.pop(proyecto_id, None)
+        if entrada is None:
+            return
+        self._normas.pop(proyecto_id, None)
+        for termino in entrada["tf"]:
+            ids = self._postings.get(termino)
+            if ids is not None:
+                ids.discard(proyecto_id)
+                if not ids:
+                    del self._postings[termino]
+
+    def agregar(self, proyecto_id: int, cliente_id: Optional[int], proyecto: Dict):
+        """Indexa (o reemplaza) el análisis terminado de `proyecto_id`."""
+        tf = _pesos(_documento(proyecto))
+        if not tf:
+            return
+        with self._lock:
+            self._quitar(proyecto_id)
+            while len(self._entradas) >= self.maximo:
+                self._quitar(next(iter(self._entradas)))
+            self._entradas[proyecto_id] = {
+                "proyecto_id": proyecto_id,
+                "cliente_id": cliente_id,
+                "titulo": proyecto.get("titulo"),
+                "presupuesto_estimado": proyecto.get("presupuesto_estimado"),
+                "tiempo_estimado_dias": proyecto.get("tiempo_estimado_dias"),
+                "subtareas": [
+                    {campo: t.get(campo) for campo in ("titulo", "especialidad", "prioridad", *CAMPOS_DETALLE) if campo in t}
+                    for t in proyecto.get("subtareas") or [] if isinstance(t, dict) and t.get("titulo")
+                ],
+                "tf": tf
+            }
+            for termino in tf:
+                self._postings.setdefault(termino, set()).add(proyecto_id)
+            if len(self._entradas) > self._n_recalculo * PLANTILLAS_CRECIMIENTO_RECALCULO:
+                self._normas = {pid: self._norma(e["tf"]) for pid, e in self._entradas.items()}
+                self._n_recalculo = len(self._entradas)
+            else:
+                self._normas[proyecto_id] = self._norma(tf)
+
+    def buscar(
+        self,
+        texto: str,
+        excluir_proyecto: Optional[int] = None,
+        cliente_id: Optional[int] = None,
+        minimo: float = PLANTILLAS_SIMILITUD_MINIMA
+    ) -> Optional[Dict]:
+        """El proyecto más parecido a `texto` con similitud >= `minimo` (o None)."""
+        consulta = _pesos(texto)
+        if not consulta:
+            return None
+        with self._lock:
+            pesos = {t: f * self._idf(t) for t, f in consulta.items() if t in self._postings}
+            norma_consulta = math.sqrt(sum((f * self._idf(t)) ** 2 for t, f in consulta.items())) or 1.0
+            puntajes: Dict[int, float] = {}
+            for termino, peso in pesos.items():
+                idf = self._idf(termino)
+                for proyecto_id in self._postings[termino]:
+                    puntajes[proyecto_id] = puntajes.get(proyecto_id, 0.0) + peso * self._entradas[proyecto_id]["tf"][termino] * idf
+
+            mejor, similitud = None, 0.0
+            for proyecto_id, puntaje in puntajes.items():
+                entrada = self._entradas[proyecto_id]
+                if proyecto_id == excluir_proyecto:
+                    continue
+                if PLANTILLAS_SOLO_MISMO_CLIENTE and entrada["cliente_id"] != cliente_id:
+                    continue
+                coseno = puntaje / (norma_consulta * self._normas[proyecto_id])
+                if coseno > similitud:
+                    mejor, similitud = entrada, coseno
+
+        if mejor is None or similitud < minimo:
+            return None
+        if cliente_id is not None and mejor["cliente_id"] == cliente_id:
+            plantilla = {k: v for k, v in mejor.items() if k not in ("tf", "cliente_id")}
+            plantilla["propia"] = True
+        else:
+            plantilla = {
+                "proyecto_id": None,
+                "titulo": None,
+                "presupuesto_estimado": None,
+                "tiempo_estimado_dias": None,
+                "subtareas": [
+                    {campo: t[campo] for campo in CAMPOS_ANONIMOS if campo in t} for t in mejor["subtareas"]
+                ],
+                "propia": False
+            }
+        plantilla["similitud"] = round(similitud, 3)
+        return plantilla
+
+
+_indice = IndicePlantillas()
+
+
+# ========================================
+# CARGA Y REGISTRO
+# ========================================
+
+def cargar_indice() -> int:
+    """Indexa la última versión completada del análisis de cada proyecto (los PLANTILLAS_MAX más recientes)."""
+    global _indice
+    inicio = time.monotonic()
+    db = SessionLocal()
+    try:
+        filas = db.query(AnalisisIA.proyecto_id, AnalisisIA.analisis_completo, Proyecto.cliente_id).join(
+            Proyecto, Proyecto.id == AnalisisIA.proyecto_id
+        ).filter(
+            AnalisisIA.completado == True
+        ).order_by(AnalisisIA.proyecto_id, AnalisisIA.version).all()
+    finally:
+        db.close()
+
+    ultimas = {}
+    for proyecto_id, analisis_completo, cliente_id in filas:
+        if isinstance(analisis_completo, dict):
+            ultimas[proyecto_id] = (cliente_id, analisis_completo)
+
+    indice = IndicePlantillas()
+    for proyecto_id in sorted(ultimas)[-PLANTILLAS_MAX:]:
+        cliente_id, analisis_completo = ultimas[proyecto_id]
+        indice.agregar(proyecto_id, cliente_id, analisis_completo)
+    _indice = indice
+    metricas.fijar("plantillas_indexadas", len(indice))
+    print(f"🗂️ Plantillas de WBS: {len(indice)} análisis indexados en {time.monotonic() - inicio:.2f}s")
+    return len(indice)
+
+
+async def iniciar_indice():
+    """Arranque de la app: carga el índice sin frenar el arranque si la base falla."""
+    if not PLANTILLAS_ACTIVAS:
+        return
+    try:
+        await asyncio.to_thread(cargar_indice)
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar el índice de plantillas de WBS: {e}")
+
+
+def registrar_analisis(proyecto_id: int, cliente_id: Optional[int], proyecto: Dict):
+    """Agrega al índice un análisis recién terminado (o su nueva versión)."""
+    if not PLANTILLAS_ACTIVAS:
+        return
+    try:
+        _indice.agregar(proyecto_id, cliente_id, proyecto)
+        metricas.fijar("plantillas_indexadas", len(_indice))
+    except Exception as e:
+        print(f"⚠️ No se pudo indexar el análisis del proyecto {proyecto_id}: {e}")
+
+
+# ========================================
+# USO EN EL CHAT DE ANÁLISIS
+# ========================================
+
+def buscar_plantilla(
+    mensajes_historial: List[Dict[str, str]],
+    proyecto_id: Optional[int] = None,
+    cliente_id: Optional[int] = None
+) -> Optional[Dict]:
+    """Plantilla para la conversación: se busca con lo que escribió el cliente."""
+    if not PLANTILLAS_ACTIVAS or not len(_indice):
+        return None
+    texto = " ".join(m.get("content") or "" for m in mensajes_historial if m.get("role") == "user")
+    plantilla = _indice.buscar(texto, excluir_proyecto=proyecto_id, cliente_id=cliente_id)
+    metricas.incrementar("plantillas_busquedas_total", resultado="encontrada" if plantilla else "sin_coincidencia")
+    if plantilla:
+        origen = f"proyecto {plantilla['proyecto_id']} '{plantilla['titulo']}'" if plantilla["propia"] else "proyecto de otro cliente (anónimo)"
+        print(f"🗂️ Plantilla: {origen} (similitud {plantilla['similitud']:.2f})")
+    return plantilla
+
+
+def plantilla_publica(plantilla: Optional[Dict]) -> Optional[Dict]:
+    """
+    Lo que se le muestra al cliente: estructura del WBS, sin textos del otro
+    proyecto. Si es de otro cliente, id, presupuesto y plazo van en None.
+    """
+    if not plantilla:
+        return None
+    return {
+        "proyecto_id": plantilla["proyecto_id"],
+        "propia": plantilla["propia"],
+        "similitud": plantilla["similitud"],
+        "presupuesto_estimado": plantilla["presupuesto_estimado"],
+        "tiempo_estimado_dias": plantilla["tiempo_estimado_dias"],
+        "subtareas": [
+            {"titulo": t["titulo"], "especialidad": t.get("especialidad"), "estimacion_horas": t.get("estimacion_horas")}
+            for t in plantilla["subtareas"]
+        ]
+    }
+
+
+def mensaje_plantilla(plantilla: Dict) -> str:
+    """Ejemplo breve para el prompt: el WBS del proyecto parecido, una línea por sub-tarea."""
+    lineas = [
+        f"- {t['titulo']} [{t.get('especialidad')}, {t.get('prioridad') or 'MEDIA'}"
+        f"{', ' + str(t['estimacion_horas']) + ' h' if t.get('estimacion_horas') else ''}]"
+        for t in plantilla["subtareas"][:8]
+    ]
+    if plantilla["propia"]:
+        encabezado = (
+            "🗂️ PROYECTO SIMILAR YA ANALIZADO (otro proyecto de este mismo cliente, como referencia):\n"
+            f"\"{plantilla['titulo']}\" — presupuesto {plantilla.get('presupuesto_estimado')} USD, "
+            f"{plantilla.get('tiempo_estimado_dias')} días. WBS:\n"
+        )
+    else:
+        encabezado = "🗂️ WBS DE UN PROYECTO SIMILAR YA ANALIZADO (referencia anónima):\n"
+    return (
+        encabezado + "\n".join(lineas) + "\n"
+        "Úsalo como punto de partida: no preguntes lo que este desglose ya resuelve, "
+        "confirma solo las diferencias con lo que pide el cliente y finaliza en cuanto "
+        "tengas la información. Adapta títulos, especialidades y horas al caso actual."
+    )
+
+
+def aplicar_detalle_plantilla(subtareas: List[Dict], plantilla: Optional[Dict]) -> int:
+    """
+    Copia el detalle de la plantilla a las sub-tareas esqueleto con el mismo
+    título (sin tildes ni mayúsculas). Devuelve cuántas se completaron. Las
+    plantillas de otro cliente no traen detalle, así que no completan ninguna.
+    Va antes de refinar_subtarea, que pone 40 h a las que no traen estimación.
+    """
+    if not plantilla:
+        return 0
+    por_titulo = {plegar(t["titulo"]): t for t in plantilla["subtareas"] if t.get("descripcion")}
+    completadas = 0
+    for tarea in subtareas or []:
+        origen = por_titulo.get(plegar(tarea.get("titulo") or ""))
+        if origen is None or (tarea.get("descripcion") and tarea.get("criterios_aceptacion")):
+            continue
+        for campo in CAMPOS_DETALLE:
+            if campo in origen and not tarea.get(campo):
+                tarea[campo] = origen[campo]
+        completadas += 1
+    if completadas:
+        metricas.incrementar("plantillas_detalle_reutilizado_total", completadas)
+        print(f"🗂️ {completadas} sub-tareas tomaron el detalle de la plantilla (sin llamada de enriquecimiento)")
+    return completadas
@@ -0,0 +1,348 @@
+# backend/services/reanalisis_service.py
+"""
+Re-análisis incremental del WBS de un proyecto.
+
+En vez de volver a generar todo el WBS desde la conversación, se envía al
+modelo el WBS vigente (compacto) y los cambios de alcance que pide el
+cliente, y el modelo devuelve solo los nodos modificados, nuevos y
+eliminados. El resultado se aplica como un diff sobre las SubTarea:
+
+- Las sub-tareas que no aparecen en el diff no se tocan.
+- Las que ya salieron de PENDIENTE (solicitadas, asignadas, en curso...)
+  están "bloqueadas": el modelo las ve marcadas y, si igual propone
+  cambiarlas o eliminarlas, el cambio se omite y se informa.
+- Las eliminadas pasan a CANCELADO (pueden tener solicitudes asociadas).
+- Las nuevas reciben el siguiente código libre del proyecto.
+
+Cada re-análisis guarda una nueva versión de AnalisisIA con el WBS
+resultante y el diff aplicado, y queda en la transcripción del chat.
+"""
+import os
+import json
+import time
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from modelos.proyecto_modelo import Proyecto, FaseProyecto, SubTarea, EstadoSubTarea
+from modelos.analisis_ia_modelo import AnalisisIA
+from modelos.conversacion_chat_modelo import EmisorMensaje
+from services import enrutador_modelos, metricas
+from services.llm_cliente import completar, codigo_http_error, reintentar_en_error
+from services.chat_analisis_service import (
+    ESPECIALIDADES_DETALLADAS, ESPECIALIDADES_PROMPT, refinar_subtarea, resolver_especialidad
+)
+from services.clasificador_especialidades import clasificar_lote, texto_de_tarea
+from services.json_incremental import extraer_json
+from services.transcripcion_service import TranscripcionService
+from services.coordinacion_turnos import registrar_respuesta
+from services.plantillas_wbs import registrar_analisis
+
+REANALISIS_MAX_TOKENS = int(os.getenv("REANALISIS_MAX_TOKENS", "1500"))
+# Caracteres de la descripción de cada nodo que se envían al modelo
+DESCRIPCION_NODO_MAX = 300
+
+BUCKETS_TOKENS = (500, 1000, 2000, 4000, 8000, 16000)
+
+FASES_REANALIZABLES = (FaseProyecto.ANALISIS, FaseProyecto.PUBLICADO, FaseProyecto.EN_PROGRESO)
+
+SYSTEM_PROMPT_REANALISIS = f"""Eres un Ingeniero de Software Senior que mantiene el WBS (Work Breakdown Structure) de un proyecto ya analizado.
+
+Recibes en JSON el proyecto, su WBS vigente y los CAMBIOS de alcance que pide el cliente.
+Devuelve ÚNICAMENTE los nodos que cambian, con este formato JSON:
+
+{{
+  "modificadas": [{{"codigo": "código exacto del WBS", "...": "solo los campos que cambian (titulo, descripcion, especialidad, prioridad, estimacion_horas)"}}],
+  "nuevas": [{{"titulo": "...", "descripcion": "...", "especialidad": "...", "prioridad": "ALTA|MEDIA|BAJA", "estimacion_horas": 40, "dependencias": []}}],
+  "eliminadas": ["código exacto del WBS"],
+  "proyecto": {{"presupuesto_estimado": 0, "tiempo_estimado_dias": 0, "descripcion_completa": "..."}},
+  "resumen_cambios": "1-2 oraciones para el cliente explicando qué cambió en el plan"
+}}
+
+REGLAS:
+- NO repitas sub-tareas que no cambian. Si un cambio no afecta el WBS, devuelve listas vacías.
+- Las sub-tareas con "bloqueada": true ya tienen proveedor: NO las modifiques ni elimines.
+- En "proyecto" incluye solo los campos que cambian (u omítelo).
+- Responde SOLO con el objeto JSON.
+{ESPECIALIDADES_PROMPT}"""
+
+
+def _bloqueada(subtarea: SubTarea) -> bool:
+    return subtarea.vendedor_id is not None or subtarea.estado != EstadoSubTarea.PENDIENTE
+
+
+def _numero_codigo(codigo: str) -> int:
+    try:
+        return int(codigo.rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _nodo(subtarea: SubTarea, descripcion_max: Optional[int] = None) -> Dict:
+    descripcion = subtarea.descripcion or ""
+    if descripcion_max and len(descripcion) > descripcion_max:
+        descripcion = descripcion[:descripcion_max] + "…"
+    return {
+        "codigo": subtarea.codigo,
+        "titulo": subtarea.titulo,
+        "descripcion": descripcion,
+        "especialidad": ESPECIALIDADES_DETALLADAS.get(subtarea.especialidad, subtarea.especialidad),
+        "prioridad": subtarea.prioridad,
+        "estimacion_horas": subtarea.estimacion_horas
+    }
+
+
+# ========================================
+# CARGA
+# ========================================
+
+def cargar_wbs(db: Session, proyecto_id: int) -> Dict:
+    """Proyecto, última versión de AnalisisIA y sub-tareas vigentes (no canceladas)."""
+    proyecto = db.query(Proyecto).filter(Proyecto.id == proyecto_id).first()
+    if not proyecto:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    if proyecto.fase not in FASES_REANALIZABLES:
+        raise HTTPException(status_code=400, detail="El proyecto ya no admite cambios de alcance")
+
+    analisis = db.query(AnalisisIA).filter(
+        AnalisisIA.proyecto_id == proyecto_id
+    ).order_by(AnalisisIA.version.desc(), AnalisisIA.id.desc()).first()
+    if not analisis:
+        raise HTTPException(status_code=400, detail="El proyecto aún no tiene un análisis finalizado")
+
+    subtareas = db.query(SubTarea).filter(SubTarea.proyecto_id == proyecto_id).order_by(SubTarea.id).all()
+    return {"proyecto": proyecto, "analisis": analisis, "subtareas": subtareas}
+
+
+def mensaje_wbs(wbs: Dict, cambios: str) -> str:
+    """Mensaje de usuario: WBS vigente compacto + cambios pedidos (lo estático va en el system prompt)."""
+    proyecto, previo = wbs["proyecto"], wbs["analisis"].analisis_completo or {}
+    nodos = []
+    for subtarea in wbs["subtareas"]:
+        if subtarea.estado == EstadoSubTarea.CANCELADO:
+            continue
+        nodo = _nodo(subtarea, DESCRIPCION_NODO_MAX)
+        if _bloqueada(subtarea):
+            nodo["bloqueada"] = True
+        nodos.append(nodo)
+    datos = {
+        "proyecto": {
+            "titulo": proyecto.titulo,
+            "presupuesto_estimado": previo.get("presupuesto_estimado"),
+            "tiempo_estimado_dias": previo.get("tiempo_estimado_dias")
+        },
+        "wbs": nodos,
+        "cambios": cambios
+    }
+    return json.dumps(datos, ensure_ascii=False, separators=(",", ":"))
+
+
+# ========================================
+# MODELO
+# ========================================
+
+async def pedir_cambios(mensaje_usuario: str, cliente_id: Optional[int], proyecto_id: int) -> Dict:
+    """
+    Pide al modelo el diff del WBS (`mensaje_usuario` viene de mensaje_wbs).
+    Devuelve {"exito", "diff", "tokens_usados", "tokens_prompt", "duracion_ms"}.
+    """
+    inicio = time.monotonic()
+    try:
+        response = await completar(
+            "reanalisis_wbs",
+            cliente_id=cliente_id,
+            proyecto_id=proyecto_id,
+            model=enrutador_modelos.LLM_MODELO_ANALISIS,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT_REANALISIS},
+                {"role": "user", "content": mensaje_usuario}
+            ],
+            temperature=0.3,
+            max_tokens=REANALISIS_MAX_TOKENS,
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        print(f"❌ Error en re-análisis: {e}")
+        return {
+            "exito": False,
+            "error": str(e),
+            "codigo_http": codigo_http_error(e),
+            "reintentar_en": reintentar_en_error(e)
+        }
+
+    diff = extraer_json(response.choices[0].message.content or "")
+    if not isinstance(diff, dict):
+        return {"exito": False, "error": "El modelo no devolvió un diff JSON válido", "codigo_http": 502}
+
+    print(f"🔁 Re-análisis: {response.usage.prompt_tokens} tokens de prompt, "
+          f"{time.monotonic() - inicio:.2f}s")
+    return {
+        "exito": True,
+        "diff": diff,
+        "tokens_usados": response.usage.total_tokens,
+        "tokens_prompt": response.usage.prompt_tokens,
+        "duracion_ms": int((time.monotonic() - inicio) * 1000)
+    }
+
+
+# ========================================
+# APLICAR EL DIFF
+# ========================================
+
+def _lista(valor) -> List:
+    return valor if isinstance(valor, list) else []
+
+
+def _aplicar_campos(subtarea: SubTarea, cambios: Dict, prediccion: Optional[Dict]):
+    if cambios.get("titulo"):
+        subtarea.titulo = str(cambios["titulo"])[:200]
+    if cambios.get("descripcion"):
+        subtarea.descripcion = str(cambios["descripcion"])
+    if cambios.get("especialidad") and prediccion is not None:
+        subtarea.especialidad, _ = resolver_especialidad(str(cambios["especialidad"]), prediccion)
+    if str(cambios.get("prioridad", "")).upper() in ("ALTA", "MEDIA", "BAJA"):
+        subtarea.prioridad = cambios["prioridad"].upper()
+    if isinstance(cambios.get("estimacion_horas"), (int, float)) and cambios["estimacion_horas"] > 0:
+        subtarea.estimacion_horas = int(cambios["estimacion_horas"])
+
+
+def aplicar_cambios(
+    db: Session,
+    wbs: Dict,
+    cambios: str,
+    resultado: Dict,
+    mensaje: str,
+    claves_idempotencia: Optional[List[str]] = None
+) -> Dict:
+    """
+    Aplica el diff del modelo a las sub-tareas, registra la nueva versión de
+    AnalisisIA y el turno en la transcripción. Hace commit y devuelve la
+    respuesta del endpoint.
+    """
+    proyecto, previo, subtareas = wbs["proyecto"], wbs["analisis"], wbs["subtareas"]
+    diff = resultado["diff"]
+    vigentes = {s.codigo: s for s in subtareas if s.estado != EstadoSubTarea.CANCELADO}
+    modificadas, nuevas, eliminadas, omitidas = [], [], [], []
+
+    def editable(codigo) -> Optional[SubTarea]:
+        subtarea = vigentes.get(str(codigo))
+        if subtarea is None:
+            omitidas.append({"codigo": codigo, "motivo": "no existe en el WBS vigente"})
+        elif _bloqueada(subtarea):
+            omitidas.append({"codigo": codigo, "motivo": f"bloqueada ({subtarea.estado.value})"})
+        else:
+            return subtarea
+        return None
+
+    cambios_nodos = [c for c in _lista(diff.get("modificadas")) if isinstance(c, dict)]
+    nuevas_datos = [t for t in _lista(diff.get("nuevas")) if isinstance(t, dict) and t.get("titulo")]
+    # Clasificador local en un solo lote (modificadas con especialidad + nuevas)
+    textos = [
+        texto_de_tarea({**(_nodo(vigentes[c["codigo"]]) if c.get("codigo") in vigentes else {}), **c})
+        for c in cambios_nodos
+    ] + [texto_de_tarea(t) for t in nuevas_datos]
+    predicciones = clasificar_lote(textos) if textos else []
+
+    for i, cambio in enumerate(cambios_nodos):
+        subtarea = editable(cambio.get("codigo"))
+        if subtarea is not None:
+            _aplicar_campos(subtarea, cambio, predicciones[i])
+            modificadas.append(subtarea.codigo)
+
+    for codigo in _lista(diff.get("eliminadas")):
+        subtarea = editable(codigo)
+        if subtarea is not None:
+            subtarea.estado = EstadoSubTarea.CANCELADO
+            del vigentes[subtarea.codigo]
+            eliminadas.append(subtarea.codigo)
+
+    siguiente = max((_numero_codigo(s.codigo) for s in subtareas), default=0) + 1
+    for i, tarea in enumerate(nuevas_datos):
+        tarea = refinar_subtarea(tarea, i, predicciones[len(cambios_nodos) + i], set())
+        subtarea = SubTarea(
+            proyecto_id=proyecto.id,
+            codigo=f"P{proyecto.id}-TASK-{siguiente:03d}",
+            titulo=str(tarea["titulo"])[:200],
+            descripcion=str(tarea.get("descripcion") or tarea["titulo"]),
+            especialidad=tarea["especialidad"],
+            estado=EstadoSubTarea.PENDIENTE,
+            prioridad=tarea["prioridad"],
+            estimacion_horas=int(tarea["estimacion_horas"])
+        )
+        db.add(subtarea)
+        vigentes[subtarea.codigo] = subtarea
+        nuevas.append(subtarea.codigo)
+        siguiente += 1
+
+    # Nueva versión del análisis con el WBS resultante
+    proyecto_data = dict(previo.analisis_completo or {})
+    cambios_proyecto = diff.get("proyecto") if isinstance(diff.get("proyecto"), dict) else {}
+    for campo in ("presupuesto_estimado", "tiempo_estimado_dias", "descripcion_completa"):
+        if cambios_proyecto.get(campo):
+            proyecto_data[campo] = cambios_proyecto[campo]
+    proyecto_data["subtareas"] = [_nodo(s) | {"especialidad": s.especialidad} for s in vigentes.values()]
+    proyecto_data["reanalisis"] = {
+        "version_base": previo.version,
+        "cambios": cambios,
+        "modificadas": modificadas,
+        "nuevas": nuevas,
+        "eliminadas": eliminadas,
+        "omitidas": omitidas
+    }
+
+    analisis = AnalisisIA(
+        proyecto_id=proyecto.id,
+        version=(previo.version or 1) + 1,
+        analisis_completo=proyecto_data,
+        especialidades_detectadas=sorted({s.especialidad for s in vigentes.values()}),
+        presupuesto_estimado=float(proyecto_data.get("presupuesto_estimado") or 0),
+        tiempo_estimado_dias=proyecto_data.get("tiempo_estimado_dias"),
+        completado=True
+    )
+    db.add(analisis)
+
+    if cambios_proyecto.get("descripcion_completa"):
+        proyecto.descripcion = cambios_proyecto["descripcion_completa"]
+    if cambios_proyecto.get("presupuesto_estimado"):
+        proyecto.presupuesto = float(cambios_proyecto["presupuesto_estimado"])
+    proyecto.total_subtareas = len(vigentes)
+
+    resumen_cambios = diff.get("resumen_cambios") or (
+        f"Plan actualizado: {len(modificadas)} sub-tareas modificadas, "
+        f"{len(nuevas)} nuevas y {len(eliminadas)} eliminadas."
+    )
+    TranscripcionService.agregar_turnos(db, proyecto.id, proyecto.cliente_id, [
+        {"emisor": EmisorMensaje.CLIENTE, "mensaje": cambios, "metadatos": {"reanalisis": True}},
+        {
+            "emisor": EmisorMensaje.IA,
+            "mensaje": resumen_cambios,
+            "metadatos": {"reanalisis": True, "version": analisis.version, "tokens_usados": resultado["tokens_usados"]}
+        }
+    ])
+
+    respuesta = {
+        "exito": True,
+        "proyecto_id": proyecto.id,
+        "version": analisis.version,
+        "respuesta_ia": resumen_cambios,
+        "modificadas": modificadas,
+        "nuevas": nuevas,
+        "eliminadas": eliminadas,
+        "omitidas": omitidas,
+        "total_subtareas": len(vigentes),
+        "tokens_usados": resultado["tokens_usados"],
+        "tokens_prompt": resultado["tokens_prompt"],
+        "duracion_ms": resultado["duracion_ms"]
+    }
+    if claves_idempotencia:
+        registrar_respuesta(db, claves_idempotencia, proyecto.id, mensaje, respuesta)
+
+    db.commit()
+    registrar_analisis(proyecto.id, proyecto.cliente_id, proyecto_data)
+
+    metricas.incrementar("reanalisis_total")
+    metricas.observar("reanalisis_tokens_prompt", resultado["tokens_prompt"], buckets=BUCKETS_TOKENS)
+    print(f"✅ Re-análisis del proyecto {proyecto.id} (v{analisis.version}): {len(modificadas)} modificadas, "
+          f"{len(nuevas)} nuevas, {len(eliminadas)} eliminadas, {len(omitidas)} omitidas")
+    return respuesta
@@ -0,0 +1,19 @@
+# backend/services/sse.py
+import json
+from typing import Any
+
+# Cabeceras para que proxies (nginx) no acumulen el stream
+CABECERAS_SSE = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def evento_sse(evento: str, datos: Any) -> str:
+    """Formatea un evento server-sent events (una sola línea `data:` en JSON)."""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+
+def linea_ndjson(datos: Any) -> str:
+    """Una línea de NDJSON (application/x-ndjson), con el mismo formato que evento_sse."""
+    return json.dumps(datos, ensure_ascii=False, default=str) + "\n"
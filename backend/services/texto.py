@@ -0,0 +1,15 @@
+# backend/services/texto.py
+"""Normalización de texto compartida por los servicios que comparan palabras."""
+import re
+import unicodedata
+from typing import Optional
+
+_COMBINANTES = re.compile(r"[\u0300-\u036f]")
+
+
+def plegar(texto: Optional[str]) -> str:
+    """Minúsculas, sin tildes ni espacios en los extremos: ' Migración ' -> 'migracion'."""
+    texto = (texto or "").strip().casefold()
+    if texto.isascii():
+        return texto
+    return _COMBINANTES.sub("", unicodedata.normalize("NFKD", texto))
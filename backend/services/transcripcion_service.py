@@ -0,0 +1,270 @@
+# backend/services/transcripcion_service.py
+import os
+import zlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Optional
+
+from sqlalchemy import JSON, cast, literal
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from modelos.transcripcion_modelo import TranscripcionAnalisis
+from modelos.conversacion_chat_modelo import ConversacionChat, EmisorMensaje, TipoConversacion
+
+# ========================================
+# COMPRESIÓN
+# ========================================
+
+# Diccionario precargado para zlib: los turnos son cortos y cada uno se
+# comprime por separado, así que compartir el vocabulario habitual del
+# análisis mejora mucho la tasa de compresión. NO modificar sin subir FORMATO.
+FORMATO = 1
+_ZDICT = (
+    "proyecto sistema usuario cliente requisitos funcionales no funcionales "
+    "desarrollo software aplicación web móvil plataforma presupuesto tiempo "
+    "días semanas meses pagos inventario reportes seguridad nube servidor "
+    "base de datos integración administrador roles ¿Cuál es el objetivo? "
+    "¿Qué funcionalidades? Perfecto, gracias. Necesito que el sistema permita "
+    '{"finalizado": true, "proyecto": {"titulo": "subtareas": "especialidad": '
+).encode("utf-8")
+
+
+def _comprimir(texto: str) -> bytes:
+    compresor = zlib.compressobj(level=6, zdict=_ZDICT)
+    return compresor.compress(texto.encode("utf-8")) + compresor.flush()
+
+
+def _descomprimir(bloque: bytes) -> str:
+    descompresor = zlib.decompressobj(zdict=_ZDICT)
+    return (descompresor.decompress(bloque) + descompresor.flush()).decode("utf-8")
+
+
+# ========================================
+# CACHE LRU EN PROCESO
+# ========================================
+
+class _EntradaTranscripcion:
+    """Snapshot inmutable de una transcripción ya decodificada."""
+    __slots__ = ("turnos", "indice", "tamano")
+
+    def __init__(self, turnos: List[Dict], indice: List[Dict], tamano: int):
+        self.turnos = turnos
+        self.indice = indice
+        self.tamano = tamano
+
+
+class _CacheTranscripciones:
+    def __init__(self, capacidad: int):
+        self.capacidad = capacidad
+        self._datos: "OrderedDict[int, _EntradaTranscripcion]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, proyecto_id: int) -> Optional[_EntradaTranscripcion]:
+        with self._lock:
+            entrada = self._datos.get(proyecto_id)
+            if entrada is not None:
+                self._datos.move_to_end(proyecto_id)
+            return entrada
+
+    def guardar(self, proyecto_id: int, entrada: _EntradaTranscripcion):
+        with self._lock:
+            self._datos[proyecto_id] = entrada
+            self._datos.move_to_end(proyecto_id)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, proyecto_id: int):
+        with self._lock:
+            self._datos.pop(proyecto_id, None)
+
+
+_cache = _CacheTranscripciones(int(os.getenv("TRANSCRIPCIONES_CACHE_MAX", "256")))
+
+
+# ========================================
+# SERVICIO
+# ========================================
+
+class TranscripcionService:
+
+    @staticmethod
+    def _decodificar(fila: TranscripcionAnalisis) -> _EntradaTranscripcion:
+        datos = bytes(fila.datos or b"")
+        indice = list(fila.indice or [])
+        turnos = []
+        for item in indice:
+            bloque = datos[item["o"]:item["o"] + item["l"]]
+            turnos.append({
+                "emisor": item["e"],
+                "mensaje": _descomprimir(bloque),
+                "timestamp": item["t"],
+                "metadatos": item.get("m")
+            })
+        return _EntradaTranscripcion(turnos, indice, len(datos))
+
+    @staticmethod
+    def _migrar_conversacion(db: Session, proyecto_id: int) -> Optional[TranscripcionAnalisis]:
+        """Convierte (una sola vez) las filas ConversacionChat antiguas a transcripción."""
+        mensajes_db = db.query(ConversacionChat).filter(
+            ConversacionChat.proyecto_id == proyecto_id,
+            ConversacionChat.tipo == TipoConversacion.ANALISIS
+        ).order_by(ConversacionChat.timestamp).all()
+
+        if not mensajes_db:
+            return None
+
+        datos = b""
+        indice = []
+        for msg in mensajes_db:
+            bloque = _comprimir(msg.mensaje)
+            indice.append({
+                "o": len(datos),
+                "l": len(bloque),
+                "e": msg.emisor,
+                "t": (msg.timestamp or datetime.utcnow()).isoformat(),
+                "m": msg.metadatos
+            })
+            datos += bloque
+
+        fila = TranscripcionAnalisis(
+            proyecto_id=proyecto_id,
+            cliente_id=mensajes_db[0].cliente_id,
+            formato=FORMATO,
+            datos=datos,
+            indice=indice,
+            total_turnos=len(indice)
+        )
+        db.add(fila)
+        db.flush()
+        print(f"📦 Transcripción del proyecto {proyecto_id} migrada ({len(indice)} turnos)")
+        return fila
+
+    @staticmethod
+    def obtener_turnos(db: Session, proyecto_id: int) -> List[Dict]:
+        """
+        Devuelve los turnos del análisis de un proyecto.
+        Sirve desde la cache LRU si coincide con total_turnos de la base (otro
+        worker pudo anexar turnos); si no, hace una sola lectura.
+        """
+        entrada = _cache.obtener(proyecto_id)
+        if entrada is not None:
+            total = db.query(TranscripcionAnalisis.total_turnos).filter(
+                TranscripcionAnalisis.proyecto_id == proyecto_id
+            ).scalar()
+            if total == len(entrada.indice):
+                return entrada.turnos
+            _cache.invalidar(proyecto_id)
+
+        fila = db.query(TranscripcionAnalisis).filter(
+            TranscripcionAnalisis.proyecto_id == proyecto_id
+        ).first()
+        if fila is None:
+            fila = TranscripcionService._migrar_conversacion(db, proyecto_id)
+            if fila is None:
+                return []
+
+        entrada = TranscripcionService._decodificar(fila)
+        _cache.guardar(proyecto_id, entrada)
+        return entrada.turnos
+
+    @staticmethod
+    def historial_openai(turnos: List[Dict]) -> List[Dict[str, str]]:
+        """Convierte los turnos al formato de mensajes de OpenAI."""
+        return [
+            {
+                "role": "user" if turno["emisor"] == EmisorMensaje.CLIENTE else "assistant",
+                "content": turno["mensaje"]
+            }
+            for turno in turnos
+        ]
+
+    @staticmethod
+    def agregar_turnos(
+        db: Session,
+        proyecto_id: int,
+        cliente_id: int,
+        turnos: List[Dict]
+    ):
+        """
+        Anexa turnos ({"emisor", "mensaje", "metadatos"}) a la transcripción
+        con un único UPDATE (datos || nuevos_bloques, indice || nuevas_entradas):
+        solo viajan a la base los turnos nuevos. No hace commit.
+        """
+        for intento in range(2):
+            entrada = _cache.obtener(proyecto_id)
+            if entrada is None:
+                TranscripcionService.obtener_turnos(db, proyecto_id)
+                entrada = _cache.obtener(proyecto_id) or _EntradaTranscripcion([], [], 0)
+
+            ahora = datetime.utcnow().isoformat()
+            nuevos_bytes = b""
+            nuevos_indice = []
+            nuevos_turnos = []
+            for turno in turnos:
+                bloque = _comprimir(turno["mensaje"])
+                nuevos_indice.append({
+                    "o": entrada.tamano + len(nuevos_bytes),
+                    "l": len(bloque),
+                    "e": turno["emisor"],
+                    "t": ahora,
+                    "m": turno.get("metadatos")
+                })
+                nuevos_turnos.append({
+                    "emisor": turno["emisor"],
+                    "mensaje": turno["mensaje"],
+                    "timestamp": ahora,
+                    "metadatos": turno.get("metadatos")
+                })
+                nuevos_bytes += bloque
+
+            indice = entrada.indice + nuevos_indice
+
+            if not entrada.indice:
+                existe = db.query(TranscripcionAnalisis.proyecto_id).filter(
+                    TranscripcionAnalisis.proyecto_id == proyecto_id
+                ).first()
+                if existe is None:
+                    db.add(TranscripcionAnalisis(
+                        proyecto_id=proyecto_id,
+                        cliente_id=cliente_id,
+                        formato=FORMATO,
+                        datos=nuevos_bytes,
+                        indice=indice,
+                        total_turnos=len(indice)
+                    ))
+                    db.flush()
+                    _cache.guardar(proyecto_id, _EntradaTranscripcion(
+                        entrada.turnos + nuevos_turnos, indice, entrada.tamano + len(nuevos_bytes)
+                    ))
+                    return
+
+            # Concurrencia optimista: solo anexa si nadie escribió desde nuestra lectura
+            actualizados = db.query(TranscripcionAnalisis).filter(
+                TranscripcionAnalisis.proyecto_id == proyecto_id,
+                TranscripcionAnalisis.total_turnos == len(entrada.indice)
+            ).update({
+                TranscripcionAnalisis.datos: TranscripcionAnalisis.datos.concat(nuevos_bytes),
+                TranscripcionAnalisis.indice: cast(
+                    cast(TranscripcionAnalisis.indice, JSONB).concat(literal(nuevos_indice, JSONB)), JSON
+                ),
+                TranscripcionAnalisis.total_turnos: len(indice),
+                TranscripcionAnalisis.updated_at: datetime.utcnow()
+            }, synchronize_session=False)
+
+            if actualizados:
+                _cache.guardar(proyecto_id, _EntradaTranscripcion(
+                    entrada.turnos + nuevos_turnos, indice, entrada.tamano + len(nuevos_bytes)
+                ))
+                return
+
+            print(f"⚠️ Transcripción {proyecto_id} modificada por otro proceso, recargando...")
+            _cache.invalidar(proyecto_id)
+
+        raise RuntimeError(f"No se pudo anexar a la transcripción del proyecto {proyecto_id}")
+
+    @staticmethod
+    def invalidar(proyecto_id: int):
+        """Descarta la copia en cache (p. ej. tras un rollback)."""
+        _cache.invalidar(proyecto_id)
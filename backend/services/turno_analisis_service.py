@@ -0,0 +1,167 @@
+# backend/services/turno_analisis_service.py
+"""
+Carga y persistencia de un turno del chat de análisis.
+Lo usan los endpoints síncronos, el de streaming y los workers de la cola
+de trabajos (services.cola_analisis).
+"""
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from services.chat_analisis_service import refinar_subtareas, generar_resumen_ejecutivo
+from modelos.proyecto_modelo import Proyecto, FaseProyecto
+from modelos.proyecto_modelo import SubTarea, EstadoSubTarea
+from modelos.conversacion_chat_modelo import EmisorMensaje
+from modelos.analisis_ia_modelo import AnalisisIA
+from modelos.resumen_analisis_modelo import ResumenAnalisis
+from services.transcripcion_service import TranscripcionService
+from services.historial_service import contar_tokens
+from services.coordinacion_turnos import registrar_respuesta
+from services.plantillas_wbs import registrar_analisis
+
+
+def cargar_turno(db: Session, proyecto_id: int, mensaje: str):
+    """Valida el proyecto y arma el historial (y su resumen) para el siguiente turno."""
+    proyecto = db.query(Proyecto).filter(Proyecto.id == proyecto_id).first()
+    if not proyecto:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    
+    if proyecto.fase != FaseProyecto.ANALISIS:
+        raise HTTPException(status_code=400, detail="El proyecto ya no está en fase de análisis")
+    
+    turnos = TranscripcionService.obtener_turnos(db, proyecto_id)
+    historial = TranscripcionService.historial_openai(turnos)
+    historial.append({"role": "user", "content": mensaje})
+    
+    resumen = db.query(ResumenAnalisis).filter(ResumenAnalisis.proyecto_id == proyecto_id).first()
+    resumen_previo = None
+    if resumen:
+        resumen_previo = {"resumen": resumen.resumen, "turnos_resumidos": resumen.turnos_resumidos}
+    
+    return proyecto, historial, resumen_previo
+
+
+def guardar_turno(
+    db: Session,
+    proyecto: Proyecto,
+    mensaje: str,
+    resultado: Dict,
+    claves_idempotencia: Optional[List[str]] = None
+) -> Dict:
+    """
+    Persiste el turno (cliente + IA) y, si el análisis finalizó, crea el
+    AnalisisIA y las sub-tareas. Hace commit y devuelve la respuesta del endpoint.
+    Con `claves_idempotencia` la respuesta se guarda en el mismo commit para
+    que un reintento del turno la reciba sin volver a llamar al modelo.
+    """
+    TranscripcionService.agregar_turnos(db, proyecto.id, proyecto.cliente_id, [
+        {"emisor": EmisorMensaje.CLIENTE, "mensaje": mensaje},
+        {
+            "emisor": EmisorMensaje.IA,
+            "mensaje": resultado["respuesta"],
+            "metadatos": {
+                "tokens_usados": resultado.get("tokens_usados"),
+                "finalizado": resultado.get("finalizado")
+            }
+        }
+    ])
+    
+    if resultado.get("resumen_historial"):
+        db.merge(ResumenAnalisis(
+            proyecto_id=proyecto.id,
+            resumen=resultado["resumen_historial"]["resumen"],
+            turnos_resumidos=resultado["resumen_historial"]["turnos_resumidos"],
+            tokens_resumen=contar_tokens(json.dumps(resultado["resumen_historial"]["resumen"], ensure_ascii=False)),
+            updated_at=datetime.utcnow()
+        ))
+    
+    # Si finalizó, crear sub-tareas y análisis
+    if resultado.get("finalizado"):
+        proyecto_data = resultado["proyecto"]
+        
+        # El stream ya las refina a medida que llegan (chat_analisis_proyecto_stream)
+        if not resultado.get("subtareas_refinadas"):
+            refinado = refinar_subtareas(proyecto_data)
+            if not refinado["exito"]:
+                raise HTTPException(status_code=500, detail="Error refinando sub-tareas")
+            
+            proyecto_data = refinado["proyecto"]
+        
+        # Actualizar proyecto
+        proyecto.titulo = proyecto_data["titulo"]
+        proyecto.descripcion = proyecto_data["descripcion_completa"]
+        proyecto.historia_usuario = proyecto_data["historia_usuario"]
+        proyecto.criterios_aceptacion = proyecto_data["criterios_aceptacion"]
+        proyecto.presupuesto = float(proyecto_data["presupuesto_estimado"])
+        proyecto.total_subtareas = len(proyecto_data["subtareas"])
+        proyecto.fase = FaseProyecto.ANALISIS
+        
+        # Crear análisis IA
+        analisis = AnalisisIA(
+            proyecto_id=proyecto.id,
+            version=1,
+            analisis_completo=proyecto_data,
+            especialidades_detectadas=[t["especialidad"] for t in proyecto_data["subtareas"]],
+            presupuesto_estimado=float(proyecto_data["presupuesto_estimado"]),
+            tiempo_estimado_dias=proyecto_data["tiempo_estimado_dias"],
+            completado=True
+        )
+        db.add(analisis)
+        
+        # Crear sub-tareas con códigos únicos
+        for i, tarea_data in enumerate(proyecto_data["subtareas"]):
+            prioridad = tarea_data.get("prioridad", "MEDIA").upper()
+            if prioridad not in ["ALTA", "MEDIA", "BAJA"]:
+                prioridad = "MEDIA"
+            
+            codigo_unico = f"P{proyecto.id}-TASK-{(i+1):03d}"
+            
+            subtarea = SubTarea(
+                proyecto_id=proyecto.id,
+                codigo=codigo_unico,
+                titulo=tarea_data["titulo"],
+                descripcion=tarea_data["descripcion"],
+                especialidad=tarea_data["especialidad"],
+                estado=EstadoSubTarea.PENDIENTE,
+                prioridad=prioridad,
+                estimacion_horas=tarea_data["estimacion_horas"]
+            )
+            db.add(subtarea)
+        
+        resumen = generar_resumen_ejecutivo(proyecto_data)
+        
+        respuesta = {
+            "exito": True,
+            "respuesta_ia": resultado["respuesta"],
+            "finalizado": True,
+            "proyecto_id": proyecto.id,
+            "proyecto": proyecto_data,
+            "resumen": resumen,
+            "tokens_usados": resultado.get("tokens_usados")
+        }
+    
+    else:
+        respuesta = {
+            "exito": True,
+            "respuesta_ia": resultado["respuesta"],
+            "finalizado": False,
+            "tokens_usados": resultado.get("tokens_usados")
+        }
+    
+    if resultado.get("plantilla") and not resultado.get("finalizado"):
+        respuesta["plantilla_sugerida"] = resultado["plantilla"]
+    
+    if claves_idempotencia:
+        registrar_respuesta(db, claves_idempotencia, proyecto.id, mensaje, respuesta)
+    
+    db.commit()
+    
+    if resultado.get("finalizado"):
+        db.refresh(proyecto)
+        registrar_analisis(proyecto.id, proyecto.cliente_id, proyecto_data)
+        print(f"✅ Análisis completado - {len(respuesta['proyecto']['subtareas'])} sub-tareas creadas")
+    
+    return respuesta
@@ -0,0 +1,6 @@
+# backend/tests/conftest.py
+"""Las pruebas importan los módulos igual que la app (desde backend/)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+# backend/tests/test_chat_analisis_stream.py
+"""
+El endpoint de streaming refina cada sub-tarea a medida que llega: antes
+debe repararla igual que VALIDADOR_WBS repara el WBS completo, o las
+conversiones de tipos y la especialidad aproximada se pierden.
+"""
+import json
+import socket
+import asyncio
+
+import pytest
+
+from herramientas import proveedor_falso
+from services import chat_analisis_service
+from services.llm_cliente import configurar_proveedor
+
+MARCA = "sistema de turnos para la clínica (prueba de stream)"
+
+PROYECTO = {
+    "finalizado": True,
+    "proyecto": {
+        "titulo": "Turnos de clínica",
+        "historia_usuario": "Como paciente, necesito reservar turnos",
+        "descripcion_completa": "Reserva de turnos en línea",
+        "requisitos_funcionales": ["RF-001: Reservar"],
+        "requisitos_no_funcionales": ["RNF-001: Disponibilidad"],
+        "criterios_aceptacion": ["El cliente aprueba"],
+        "presupuesto_estimado": 3000,
+        "tiempo_estimado_dias": 20,
+        "subtareas": [
+            {"codigo": "T-1", "titulo": "Relevamiento de procesos", "especialidad": "consultoria en sofware",
+             "prioridad": "Alta", "estimacion_horas": "60 horas", "dependencias": [],
+             "criterios_aceptacion": "a; b"},
+            {"codigo": "T-2", "titulo": "Backend de reservas", "especialidad": "Desarrollo de software a medida",
+             "prioridad": "MEDIA", "estimacion_horas": 80, "dependencias": ["T-1"]},
+            {"codigo": "T-3", "titulo": "Capacitación del personal", "especialidad": "Capacitación en TI",
+             "prioridad": "BAJA", "estimacion_horas": 16, "dependencias": ["T-2"]},
+        ]
+    }
+}
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def proveedor_guionado(tmp_path_factory):
+    guion = tmp_path_factory.mktemp("guion") / "guion.json"
+    guion.write_text(json.dumps([{"contiene": MARCA, "respuesta": PROYECTO}], ensure_ascii=False), encoding="utf-8")
+    puerto = _puerto_libre()
+    servidor = proveedor_falso.iniciar_en_hilo({"guion": str(guion)}, puerto)
+    configurar_proveedor("falso", base_url=f"http://127.0.0.1:{puerto}/v1")
+    yield
+    servidor.should_exit = True
+
+
+async def _resultado_stream() -> dict:
+    eventos = []
+    async for evento in chat_analisis_service.chat_analisis_proyecto_stream(
+        [{"role": "user", "content": f"Necesito un {MARCA}"}], cliente_id=2001
+    ):
+        eventos.append(evento)
+    return eventos
+
+
+def test_stream_conserva_las_reparaciones_del_validador(proveedor_guionado, monkeypatch):
+    monkeypatch.setattr(chat_analisis_service, "WBS_EN_DOS_ETAPAS", False)
+    eventos = asyncio.run(_resultado_stream())
+
+    resultado = eventos[-1]["resultado"]
+    assert resultado["exito"] and resultado["finalizado"], resultado
+    assert resultado["subtareas_refinadas"]
+    tarea = resultado["proyecto"]["subtareas"][0]
+    assert tarea["especialidad"] == "CONSULTORIA_SOFTWARE"
+    assert tarea["prioridad"] == "ALTA"
+    assert tarea["estimacion_horas"] == 60
+    assert tarea["criterios_aceptacion"] == ["a", "b"]
+    # El evento `subtarea` ya lleva la versión reparada
+    emitida = next(e["subtarea"] for e in eventos if e["tipo"] == "subtarea" and e["indice"] == 0)
+    assert emitida == tarea
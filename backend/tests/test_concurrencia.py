@@ -0,0 +1,76 @@
+# backend/tests/test_concurrencia.py
+"""
+Muchas llamadas lentas al modelo no deben bloquear el event loop: mientras
+están en vuelo contra el proveedor falso, un ticker sigue despertando a
+tiempo y las llamadas se solapan en vez de ejecutarse una tras otra.
+"""
+import time
+import socket
+import asyncio
+import statistics
+
+import pytest
+
+from herramientas import proveedor_falso
+from services import admision
+from services.llm_cliente import configurar_proveedor
+from services.chat_analisis_service import chat_analisis_proyecto
+
+LATENCIA = 1.0
+LLAMADAS = admision.LLM_MAX_CONCURRENCIA
+INTERVALO_TICKER = 0.01
+MAX_RETRASO_P95 = 0.05
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def proveedor_lento():
+    puerto = _puerto_libre()
+    servidor = proveedor_falso.iniciar_en_hilo({"latencia": f"fija:{LATENCIA}"}, puerto)
+    configurar_proveedor("falso", base_url=f"http://127.0.0.1:{puerto}/v1")
+    yield
+    servidor.should_exit = True
+
+
+async def _ticker(retrasos: list, detener: asyncio.Event):
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(INTERVALO_TICKER)
+        retrasos.append(time.perf_counter() - inicio - INTERVALO_TICKER)
+
+
+async def _llamadas_lentas(retrasos: list) -> tuple:
+    detener = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(retrasos, detener))
+    inicio = time.perf_counter()
+    try:
+        # Un cliente por llamada: se mide el event loop, no los límites de admisión por cliente
+        resultados = await asyncio.gather(*(
+            chat_analisis_proyecto(
+                [{"role": "user", "content": f"Necesito un sistema de reservas para hoteles (#{i})"}],
+                cliente_id=1000 + i
+            )
+            for i in range(LLAMADAS)
+        ))
+    finally:
+        detener.set()
+        await ticker
+    return resultados, time.perf_counter() - inicio
+
+
+def test_llamadas_lentas_no_bloquean_el_event_loop(proveedor_lento):
+    retrasos = []
+    resultados, duracion = asyncio.run(_llamadas_lentas(retrasos))
+
+    assert all(r["exito"] for r in resultados), [r.get("error") for r in resultados if not r["exito"]]
+    # En paralelo tardan poco más que una; en serie serían LLAMADAS * LATENCIA
+    assert duracion < 3 * LATENCIA, f"{LLAMADAS} llamadas tardaron {duracion:.2f}s"
+    # El ticker siguió despertando a tiempo mientras las llamadas estaban en vuelo
+    assert len(retrasos) > LATENCIA / INTERVALO_TICKER / 2
+    p95 = statistics.quantiles(retrasos, n=20)[-1]
+    assert p95 < MAX_RETRASO_P95, f"p95 del retraso del event loop: {p95 * 1000:.1f}ms"
@@ -0,0 +1,134 @@
+# backend/tests/test_esquema_wbs.py
+"""
+Reparación determinista del WBS (services.esquema_wbs): números con
+separadores de miles y decimales, prioridades, JSON truncado y la escalera
+de especialidades (exacta, código, aproximada, clasificador, por defecto).
+"""
+import pytest
+
+from services import esquema_wbs
+from services.esquema_wbs import ValidadorWBS, _numero, _prioridad, _lista_textos
+from services.json_incremental import cerrar_json
+from services.chat_analisis_service import ESPECIALIDADES_DETALLADAS
+
+VALIDADOR = ValidadorWBS(ESPECIALIDADES_DETALLADAS)
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    (40, 40),
+    (2.5, 2.5),
+    ("40 horas", 40),
+    ("12.000 USD", 12000),
+    ("12,000", 12000),
+    ("1.200.000", 1200000),
+    ("1,5", 1.5),
+    ("3.5", 3.5),
+    ("100.000,50", 100000.5),
+    ("1,200.50", 1200.5),
+    ("$ 1.234,5", 1234.5),
+    ("unas 8 horas.", 8),
+    ("sin número", None),
+    (None, None),
+    (True, None),
+])
+def test_numero(valor, esperado):
+    assert _numero(valor) == esperado
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("ALTA", "ALTA"),
+    ("Alta", "ALTA"),
+    ("high", "ALTA"),
+    ("Crítica", "ALTA"),
+    ("urgente!", "ALTA"),
+    ("media", "MEDIA"),
+    ("Medium", "MEDIA"),
+    ("Baja", "BAJA"),
+    ("low", "BAJA"),
+    ("opcional", "BAJA"),
+    ("", "MEDIA"),
+    (None, "MEDIA"),
+    ("xyz", "MEDIA"),
+])
+def test_prioridad(valor, esperado):
+    assert _prioridad(valor) == esperado
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("a; b", ["a", "b"]),
+    ("- uno\n- dos\n", ["uno", "dos"]),
+    (["x", None, ""], ["x"]),
+    ({"a": "x", "b": "y"}, ["x", "y"]),
+    (None, []),
+    (3, ["3"]),
+])
+def test_lista_textos(valor, esperado):
+    assert _lista_textos(valor) == esperado
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ('{"a": 1, "b": [1, 2', {"a": 1, "b": [1, 2]}),
+    ('{"a": 1,', {"a": 1}),
+    ('```json\n{"a": "x"}\n```', {"a": "x"}),
+    ('Aquí va: {"a": {"b": "te', {"a": {"b": "te"}}),
+])
+def test_cerrar_json(texto, esperado):
+    assert cerrar_json(texto) == esperado
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("Consultoría en software", ("Consultoría en software", "exacta")),
+    ("consultoria en SOFTWARE", ("Consultoría en software", "exacta")),
+    ("CIBERSEGURIDAD", ("CIBERSEGURIDAD", "exacta")),
+    ("cloud computing", ("CLOUD_COMPUTING", "codigo")),
+    ("Capacitacion TI", ("CAPACITACION_TI", "codigo")),
+    ("Consultoria en sofware", ("Consultoría en software", "aproximada")),
+    ("xyz", ("DESARROLLO_MEDIDA", "por_defecto")),
+    (None, ("DESARROLLO_MEDIDA", "por_defecto")),
+])
+def test_especialidad(valor, esperado):
+    assert VALIDADOR.especialidad(valor, {"titulo": "Tarea"}) == esperado
+
+
+def test_especialidad_usa_el_clasificador_si_esta_seguro(monkeypatch):
+    prediccion = {"especialidad": "CIBERSEGURIDAD", "confianza": 0.9, "confiable": True}
+    monkeypatch.setattr(esquema_wbs, "clasificar_lote", lambda textos: [prediccion] * len(textos))
+    tarea = {"titulo": "Pentest de la red", "descripcion": "auditoría y hardening"}
+    assert VALIDADOR.especialidad("seguridad ofensiva", tarea) == ("CIBERSEGURIDAD", "clasificador")
+
+
+def test_interpretar_repara_el_proyecto():
+    texto = (
+        '{"finalizado": true, "proyecto": {"titulo": "Tienda", "historia_usuario": "", '
+        '"descripcion_completa": "Tienda en línea", "requisitos_funcionales": "RF-1; RF-2", '
+        '"requisitos_no_funcionales": [], "criterios_aceptacion": [], '
+        '"presupuesto_estimado": "12.000 USD", "tiempo_estimado_dias": "30 días", "subtareas": ['
+        '{"titulo": "Catálogo", "especialidad": "desarrollo de software a medida", "prioridad": "high", '
+        '"estimacion_horas": "40 horas"}, '
+        '{"codigo": "T-2", "titulo": "Pagos", "especialidad": "DESARROLLO_MEDIDA", "prioridad": "MEDIA"}, '
+        '{"codigo": "T-3", "titulo": "Hosting", "especialidad": "HOSTING", "prioridad": "BAJA"}, '
+        '{"codigo": "T-4", "titul'
+    )
+    interpretacion = VALIDADOR.interpretar(texto)
+
+    assert interpretacion["estado"] == "reparado", interpretacion["errores"]
+    proyecto = interpretacion["datos"]["proyecto"]
+    assert proyecto["presupuesto_estimado"] == 12000
+    assert proyecto["tiempo_estimado_dias"] == 30
+    assert proyecto["requisitos_funcionales"] == ["RF-1", "RF-2"]
+    assert proyecto["historia_usuario"] == "Tienda en línea"
+    # La sub-tarea truncada se descarta
+    assert [t["titulo"] for t in proyecto["subtareas"]] == ["Catálogo", "Pagos", "Hosting"]
+    primera = proyecto["subtareas"][0]
+    assert primera["codigo"] == "WBS-1.1"
+    assert primera["especialidad"] == "Desarrollo de software a medida"
+    assert primera["prioridad"] == "ALTA"
+    assert primera["estimacion_horas"] == 40
+    assert VALIDADOR.validar(proyecto) == []
+
+
+def test_interpretar_conversacion_y_proyecto_irreparable():
+    assert VALIDADOR.interpretar('{"finalizado": false, "respuesta": "¿Algo más?"}')["estado"] == "conversacion"
+    assert VALIDADOR.interpretar("Hola, ¿en qué te ayudo?")["estado"] == "conversacion"
+    sin_subtareas = '{"finalizado": true, "proyecto": {"titulo": "X", "subtareas": []}}'
+    assert VALIDADOR.interpretar(sin_subtareas)["estado"] == "invalido"
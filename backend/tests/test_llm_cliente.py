@@ -0,0 +1,27 @@
+# backend/tests/test_llm_cliente.py
+"""El pool HTTP compartido se cierra al terminar su event loop o al reemplazarlo."""
+import asyncio
+
+from services import llm_cliente
+
+
+def test_pool_se_cierra_al_terminar_asyncio_run():
+    async def abrir():
+        return llm_cliente._transporte()
+
+    primero = asyncio.run(abrir())
+    assert primero.is_closed
+
+    segundo = asyncio.run(abrir())
+    assert segundo is not primero
+    assert segundo.is_closed
+
+
+def test_cerrar_conexiones_cierra_el_pool():
+    async def escenario():
+        http = llm_cliente._transporte()
+        await llm_cliente.cerrar_conexiones()
+        return http
+
+    assert asyncio.run(escenario()).is_closed
+    assert llm_cliente._http is None
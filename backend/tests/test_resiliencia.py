@@ -0,0 +1,89 @@
+# backend/tests/test_resiliencia.py
+import asyncio
+
+import pytest
+
+from services import llm_resiliencia
+from services.llm_resiliencia import CircuitoAbierto, _Circuito, _circuito, ejecutar, ejecutar_stream
+
+
+def _semi_abierto(endpoint: str) -> _Circuito:
+    """Circuito abierto con el enfriamiento ya vencido: la próxima llamada es la prueba."""
+    llm_resiliencia._circuitos.pop(endpoint, None)
+    circuito = _circuito(endpoint)
+    circuito.estado = _Circuito.ABIERTO
+    circuito.abierto_hasta = 0.0
+    return circuito
+
+
+async def _colgado():
+    await asyncio.sleep(3600)
+
+
+async def _ok():
+    return "ok"
+
+
+def test_prueba_cancelada_libera_el_circuito():
+    circuito = _semi_abierto("prueba_cancelada")
+
+    async def escenario():
+        tarea = asyncio.create_task(ejecutar("prueba_cancelada", _colgado))
+        await asyncio.sleep(0.01)
+        assert circuito.prueba_en_curso
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+        assert not circuito.prueba_en_curso
+        # La siguiente llamada vuelve a ser la prueba y cierra el circuito
+        return await ejecutar("prueba_cancelada", _ok)
+
+    assert asyncio.run(escenario()) == "ok"
+    assert circuito.estado == _Circuito.CERRADO
+
+
+def test_prueba_con_wait_for_externo_libera_el_circuito():
+    circuito = _semi_abierto("prueba_wait_for")
+
+    async def escenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(ejecutar("prueba_wait_for", _colgado), 0.01)
+        return await ejecutar("prueba_wait_for", _ok)
+
+    assert asyncio.run(escenario()) == "ok"
+    assert circuito.estado == _Circuito.CERRADO
+
+
+def test_stream_cortado_por_el_cliente_libera_el_circuito():
+    circuito = _semi_abierto("prueba_stream")
+
+    async def abrir():
+        async def chunks():
+            for i in range(10):
+                yield i
+        return chunks()
+
+    async def escenario():
+        stream = ejecutar_stream("prueba_stream", abrir)
+        assert await stream.__anext__() == 0
+        await stream.aclose()      # GeneratorExit, como un cliente SSE que se desconecta
+        assert not circuito.prueba_en_curso
+        return [c async for c in ejecutar_stream("prueba_stream", abrir)]
+
+    assert asyncio.run(escenario()) == list(range(10))
+    assert circuito.estado == _Circuito.CERRADO
+
+
+def test_segunda_llamada_durante_la_prueba_falla_rapido():
+    _semi_abierto("prueba_concurrente")
+
+    async def escenario():
+        tarea = asyncio.create_task(ejecutar("prueba_concurrente", _colgado))
+        await asyncio.sleep(0.01)
+        try:
+            with pytest.raises(CircuitoAbierto):
+                await ejecutar("prueba_concurrente", _ok)
+        finally:
+            tarea.cancel()
+
+    asyncio.run(escenario())